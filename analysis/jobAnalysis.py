@@ -3,8 +3,8 @@
 """
 
 from analysis import ProbabilityMap
-from commonLib.nerscLib import (getDBInfo, parseFromSQL_LowMem, 
-                                getSelectedDataFromRows)
+from commonLib.DBManager import DB
+from commonLib.nerscLib import getDBInfo, getEpoch
 
 from slurm.trace_gen import extract_records 
 
@@ -81,6 +81,9 @@ def get_jobs_data(hostname, startYear, startMonth, startDay, stopYear,
             - created (list): 作业提交时间的时间戳（epoch秒）
     Raises:
         隐式抛出数据库连接相关异常，当获取数据库信息失败时打印错误信息
+    Notes:
+        作业记录通过DB.streamValuesAsColumns按块读取，只查询需要的列，
+        不再为每个作业创建TaskRecord对象。
     """
     # 获取数据库连接信息并验证凭证
     info = getDBInfo(forceLocal)
@@ -89,26 +92,39 @@ def get_jobs_data(hostname, startYear, startMonth, startDay, stopYear,
     else:
         print("Error retrieving data to connect to DB")
 
-    # 执行低内存消耗的SQL查询，解析时间范围参数
-    rows, start = parseFromSQL_LowMem(
-        dbName=dbName, hostname=hostname, dbHost=dbHost, dbPort=dbPort,
-        userName=user, password=password,
-        year=startYear, month=startMonth, day=startDay,
-        endYear=stopYear, endMonth=stopMonth, endDay=stopDay,
-        orderingField="created")
-
-    # 定义需要提取的核心字段
-    dataFields = ["duration", "totalcores", "wallclock_requested", "created"]
-    classFields = []
+    # 与parseFromSQL_LowMem相同的查询条件：按开始时间筛选时间范围和主机
+    condition = "start>={0} and start<={1}".format(
+        getEpoch(startYear, startMonth, startDay),
+        getEpoch(stopYear, stopMonth, stopDay))
+    if hostname:
+        condition += " and hostname='{0}'".format(hostname)
+
+    # 按块读取需要的列，每块计算对应的作业属性
+    db = DB(dbHost, dbName, user, password, port=dbPort)
+    chunks = dict(duration=[], totalcores=[], wallclock_requested=[],
+                  created=[])
+    for chunk in db.streamValuesAsColumns(
+            "summary", ["wallclock", "numnodes", "cores_per_node",
+                        "wallclock_requested", "created"],
+            condition=condition, orderBy="created"):
+        chunks["duration"].append(chunk["wallclock"])
+        if hostname in ["hopper", "edison"]:
+            chunks["totalcores"].append(chunk["numnodes"] * 24)
+        else:
+            chunks["totalcores"].append(chunk["numnodes"] *
+                                        chunk["cores_per_node"])
+        chunks["wallclock_requested"].append(chunk["wallclock_requested"])
+        chunks["created"].append(chunk["created"])
 
-    # 处理原始查询结果，进行数据结构转换
-    (numberSamples, outputDic, outputAcc,
-     queues, queuesDic, queuesG, queueGDic) = getSelectedDataFromRows(rows,
-                                                                      dataFields, classFields)
+    outputDic = {}
+    for (field, field_chunks) in chunks.items():
+        outputDic[field] = []
+        for values in field_chunks:
+            outputDic[field].extend(values.tolist())
 
     # 输出检索统计信息
     print("Retrieved {0} records from database {1} at {2}:{3}".format(
-        numberSamples, dbName, dbHost, dbPort))
+        len(outputDic["created"]), dbName, dbHost, dbPort))
 
     return outputDic
 
@@ -184,47 +200,66 @@ def _join_var_bins(hist, bin_edges, th_min=0.01, th_acc=0.1):
         composed_hist: 合并处理后的直方图数组
         composed_edges: 合并后的边界数组，长度比composed_hist多1个
     实现逻辑：
-    - 遍历每个分箱，动态合并满足条件的小分箱
-    - 使用累加器记录合并中的分箱总和
-    - 当遇到需要保留的分箱时，将累积结果写入最终输出
+    - 贡献度不超过th_min的连续小分箱组成一段，其余分箱单独保留
+    - 当一段小分箱的总和不超过th_acc时（例如th_min=0时的空分箱），每段合并为
+      一个分箱，完全向量化
+    - 否则在每段内按累积和贪心切分：累加结果将超过th_acc的分箱单独保留，
+      循环次数与输出分箱数成正比
     """
-    composed_hist = []
-    composed_edges = []
+    hist = np.asarray(hist, dtype=float)
+    if hist.shape[0] == 0:
+        return np.array([], dtype=float), [bin_edges[0]]
+    small = hist <= th_min
+    small_total = np.sum(hist[small])
+    # 误差范围内接近th_acc时使用逐段累加，保证与顺序累加的结果一致
+    if small_total == 0 or small_total < th_acc - 1e-9:
+        # 每个大分箱单独成组，连续的小分箱合并为一组
+        new_group = np.ones(hist.shape[0], dtype=bool)
+        new_group[1:] = ~(small[1:] & small[:-1])
+        group_ids = np.cumsum(new_group) - 1
+        composed_hist = np.bincount(group_ids, weights=hist)
+        group_ends = np.flatnonzero(np.append(new_group[1:], True))
+    else:
+        composed_hist, group_ends = _join_var_bins_greedy(hist, small, th_acc)
+    composed_edges = [bin_edges[0]] + [bin_edges[i + 1] for i in group_ends]
+    return np.array(composed_hist, dtype=float), composed_edges
 
-    # 初始化边界数组和累加器
-    max_edge = None
-    composed_edges.append(bin_edges[0])
-    acc = 0
 
-    # 遍历每个分箱及其对应的边界对
-    for (share, edge) in zip(hist, zip(bin_edges[:-1], bin_edges[1:])):
-        # 判断是否需要结束当前合并过程：
-        # 1. 当前分箱超过合并阈值 或
-        # 2. 累加结果将超过允许的最大贡献度
-        if (share > th_min or acc + share > th_acc):
-            # 将之前累积的分箱写入结果（如果有）
-            if max_edge != None:
-                composed_hist.append(acc)
-                composed_edges.append(max_edge)
-                acc = 0
-            # 单独保留当前分箱
-            composed_hist.append(share)
-            composed_edges.append(edge[1])
-            max_edge = None
-            # 满足合并条件，继续累积分箱
+def _join_var_bins_greedy(hist, small, th_acc):
+    """_join_var_bins在小分箱的累积可能超过th_acc时的实现。
+    Returns:
+        composed_hist: 合并后各分箱的贡献度列表
+        group_ends: 每个合并后分箱在hist中的最后一个下标
+    """
+    composed_hist = []
+    group_ends = []
+    big_indexes = np.flatnonzero(~small)
+    n = hist.shape[0]
+    i = 0
+    while i < n:
+        if not small[i]:
+            composed_hist.append(hist[i])
+            group_ends.append(i)
+            i += 1
+            continue
+        # 从i开始，找到累积和不超过th_acc的最长连续小分箱段
+        next_big = np.searchsorted(big_indexes, i)
+        if next_big < big_indexes.shape[0]:
+            run_end = big_indexes[next_big]
         else:
-            acc += share
-            max_edge = edge[1]
-
-    # 处理最后的累积分箱（如果有）
-    if max_edge != None:
-        composed_hist.append(acc)
-        composed_edges.append(max_edge)
-
-        # 转换为numpy数组返回
-    hist = np.array(composed_hist, dtype=float)
-    bin_edges = composed_edges
-    return hist, bin_edges
+            run_end = n
+        acc = np.cumsum(hist[i:run_end])
+        j = i + int(np.searchsorted(acc, th_acc, side="right"))
+        if j > i:
+            composed_hist.append(acc[j - i - 1])
+            group_ends.append(j - 1)
+        if j < run_end:
+            # 加入后会超过th_acc的分箱单独保留
+            composed_hist.append(hist[j])
+            group_ends.append(j)
+            j += 1
+        i = j
+    return composed_hist, group_ends
 
 
 def calculate_probability_map(hist, bin_edges, **kwargs):
@@ -266,7 +301,8 @@ def calculate_probability_map(hist, bin_edges, **kwargs):
 
 def calculate_histogram(data, th_min=0,
                         th_acc=1, range_values=None, interval_size=1,
-                        total_count=None, bins=None):
+                        total_count=None, bins=None, binning="linear",
+                        bin_count=100):
     """
     生成非归一化的非均匀区间直方图，自动合并过小的相邻区间
     通过阈值控制区间合并逻辑，确保合并后的区间满足最小贡献度和最大总贡献限制
@@ -279,6 +315,13 @@ def calculate_histogram(data, th_min=0,
         interval_size: 初始分箱的固定宽度（默认1）
         total_count: 归一化基数，默认使用data的总样本数
         bins: 自定义分箱边界数组，若指定则忽略range_values和interval_size参数
+        binning: 分箱策略（bins指定时忽略）：
+            - "linear": 宽度为interval_size的等宽分箱（默认）
+            - "sparse": 与"linear"结果相同，但只生成非空分箱，相邻非空分箱之间的
+              空白用一个空分箱表示。内存和时间与数据量成正比，与取值范围无关
+            - "log": bin_count个对数间隔分箱，从范围内最小的正值开始
+            - "quantile": 最多bin_count个等频分箱，边界为数据的分位数
+        bin_count: "log"和"quantile"策略的分箱数（默认100）
 
     Returns:
         hist: numpy数组，表示各分箱的归一化贡献度（总和为1）
@@ -286,7 +329,7 @@ def calculate_histogram(data, th_min=0,
 
     实现步骤：
         1. 初始化分箱范围和边界
-        2. 生成初始等宽直方图
+        2. 生成初始直方图
         3. 执行归一化处理
         4. 合并满足条件的小分箱
     """
@@ -296,15 +339,19 @@ def calculate_histogram(data, th_min=0,
     # 扩展最大值边界确保包含数据极值
     range_values = (range_values[0], range_values[1] + interval_size)
 
-    # 生成等宽分箱数组
-    if bins is None:
-        bins = np.arange(range_values[0], range_values[1] + interval_size,
-                         interval_size)
+    if bins is None and binning == "sparse":
+        hist_count, bin_edges = _sparse_histogram(data, range_values,
+                                                  interval_size)
+    else:
+        # 生成分箱数组
+        if bins is None:
+            bins = _get_bin_edges(data, range_values, interval_size, binning,
+                                  bin_count)
 
-    # 计算原始直方图计数
-    hist_count, bin_edges = np.histogram(data,
-                                         density=False, range=range_values,
-                                         bins=bins)
+        # 计算原始直方图计数
+        hist_count, bin_edges = np.histogram(data,
+                                             density=False, range=range_values,
+                                             bins=bins)
 
     # 确定归一化基数
     if total_count is None:
@@ -318,7 +365,79 @@ def calculate_histogram(data, th_min=0,
     return hist, bin_edges
 
 
+def _get_bin_edges(data, range_values, interval_size, binning, bin_count):
+    """返回"linear"、"log"或"quantile"策略的分箱边界数组。
+    range_values的上限已经包含了interval_size的扩展。
+    """
+    if binning == "linear":
+        return np.arange(range_values[0], range_values[1] + interval_size,
+                         interval_size)
+    values = np.asarray(data, dtype=float)
+    values = values[(values >= range_values[0]) & (values <= range_values[1])]
+    if binning == "log":
+        positive = values[values > 0]
+        if positive.shape[0]:
+            start = positive.min()
+        else:
+            start = max(range_values[0], interval_size)
+        edges = np.geomspace(start, range_values[1], bin_count + 1)
+        if range_values[0] < start:
+            edges = np.concatenate([[range_values[0]], edges])
+        return edges
+    if binning == "quantile":
+        edges = np.unique(np.percentile(values,
+                                        np.linspace(0, 100, bin_count + 1)))
+        if edges.shape[0] < 2:
+            edges = np.array([edges[0], edges[0] + interval_size])
+        return edges
+    raise ValueError("Unknown binning strategy: {0}".format(binning))
+
+
+def _sparse_histogram(data, range_values, interval_size):
+    """计算"sparse"策略的直方图计数和边界。
+
+    分箱与np.arange(range_values[0], range_values[1] + interval_size,
+    interval_size)生成的等宽分箱相同，但只保留非空分箱，连续的空分箱合并为
+    一个（经过_join_var_bins后与等宽分箱的结果相同）。
 
-
-
-        
\ No newline at end of file
+    Returns:
+        hist_count: 各分箱的计数数组
+        bin_edges: 分箱边界列表，长度比hist_count多1个元素
+    """
+    low = range_values[0]
+    # 与np.arange生成的边界数量一致
+    edge_count = int(np.ceil((range_values[1] + interval_size - low)
+                             / float(interval_size)))
+    last_bin = edge_count - 2
+    # np.arange按start + i * ((start + step) - start)计算边界
+    interval_size = (low + interval_size) - low
+    top_edge = low + (edge_count - 1) * interval_size
+    values = np.asarray(data, dtype=float)
+    values = values[(values >= low) & (values <= top_edge)]
+    if values.shape[0] == 0 or last_bin < 0:
+        return np.zeros(1), [low, top_edge]
+    # 按分箱边界的取值修正浮点误差，与np.histogram的归属保持一致，
+    # 最后一个分箱包含右边界
+    indexes = np.floor((values - low) / interval_size).astype(np.int64)
+    indexes = np.clip(indexes, 0, last_bin)
+    indexes[values < low + indexes * interval_size] -= 1
+    indexes[(indexes < last_bin) &
+            (values >= low + (indexes + 1) * interval_size)] += 1
+    indexes = np.clip(indexes, 0, last_bin)
+    used_bins, counts = np.unique(indexes, return_counts=True)
+
+    hist_count = []
+    bin_edges = [low]
+    next_bin = 0
+    for (bin_index, count) in zip(used_bins, counts):
+        if bin_index > next_bin:
+            # 空白区域用一个空分箱表示
+            hist_count.append(0)
+            bin_edges.append(low + bin_index * interval_size)
+        hist_count.append(count)
+        bin_edges.append(low + (bin_index + 1) * interval_size)
+        next_bin = bin_index + 1
+    if next_bin <= last_bin:
+        hist_count.append(0)
+        bin_edges.append(top_edge)
+    return np.array(hist_count), bin_edges
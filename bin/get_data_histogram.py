@@ -7,10 +7,31 @@
 import pymysql
 import numpy as np
 import pickle
+import struct
 from io import BytesIO
 import matplotlib.pyplot as plt
 
 
+# stats.Histogram 的二进制编码（版本1）：16字节头部 + 小端序原始浮点数缓冲区
+PACK_MAGIC = b"SCHB"
+PACK_HEADER = struct.Struct("<4sBcBxQ")
+PACK_DTYPES = {b"d": np.dtype("<f8"), b"f": np.dtype("<f4")}
+
+
+def decode_blob(blob):
+    """解码bins或edges字段，兼容二进制格式和旧的pickle格式"""
+    if blob[:4] == PACK_MAGIC:
+        magic, version, dtype_code, container, count = \
+            PACK_HEADER.unpack_from(blob)
+        values = np.frombuffer(blob, dtype=PACK_DTYPES[dtype_code],
+                               count=count, offset=PACK_HEADER.size)
+        if container == 1:
+            return values.tolist()
+        return values
+    # 旧格式：Python 2 cPickle 序列化的数据
+    return pickle.load(BytesIO(blob), encoding='latin1')
+
+
 # 1. 连接数据库
 conn = pymysql.connect(
     host='192.168.217.92',
@@ -32,9 +53,9 @@ try:
 
             try:
 
-                # 使用 pickle 加载二进制数据（返回 Python 列表）
-                bins = pickle.load(BytesIO(bins_blob), encoding='latin1')
-                edges = pickle.load(BytesIO(edges_blob), encoding='latin1')
+                # 解码二进制数据（兼容旧的 pickle 格式）
+                bins = decode_blob(bins_blob)
+                edges = decode_blob(edges_blob)
 
                 # 将bins转换为 NumPy 数组
                 bins = np.array(bins, dtype=np.float64)
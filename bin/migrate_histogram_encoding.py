@@ -0,0 +1,32 @@
+"""
+Re-encodes in place the histograms stored in the central database with the
+old cPickle format into the binary format used by stats.Histogram.
+
+Usage:
+python migrate_histogram_encoding.py [batch_size]
+
+Args:
+- batch_size: number of histogram rows read per query. Default 1000.
+
+Env vars:
+- ANALYSIS_DB_HOST: hostname of the system hosting the database.
+- ANALYSIS_DB_NAME: database name to read from.
+- ANALYSIS_DB_USER: user to be used to access the database.
+- ANALYSIS_DB_PASS: password to be used to used to access the database.
+- ANALYSIS_DB_PORT: port on which the database runs. 
+"""
+
+from orchestration import get_central_db
+from stats import Histogram
+
+import sys
+
+batch_size = 1000
+if len(sys.argv)>=2:
+    batch_size = int(sys.argv[1])
+
+db_obj = get_central_db()
+
+print "Re-encoding histograms, batch size {0}".format(batch_size)
+migrated = Histogram().migrate_encoding(db_obj, batch_size=batch_size)
+print "Histograms re-encoded: {0}".format(migrated)
@@ -0,0 +1,62 @@
+"""
+Copies the traces stored one row per job in the traces table of the central
+database into the trace archive table (compressed columns, one row per trace
+chunk). Traces that are already archived are skipped. The archive table is
+created if it does not exist.
+
+Usage:
+python migrate_trace_archive.py [--delete] [archive_table]
+
+Args:
+- --delete: delete the rows of each trace from the traces table after it has
+  been archived and its job count verified.
+- archive_table: name of the archive table. Default: TRACE_ARCHIVE_TABLE env
+  var or "trace_archive".
+
+Env vars:
+- ANALYSIS_DB_HOST: hostname of the system hosting the database.
+- ANALYSIS_DB_NAME: database name to read from.
+- ANALYSIS_DB_USER: user to be used to access the database.
+- ANALYSIS_DB_PASS: password to be used to used to access the database.
+- ANALYSIS_DB_PORT: port on which the database runs. 
+"""
+
+from orchestration import get_central_db
+from stats.trace import ResultTrace
+
+import os
+import sys
+
+args = sys.argv[1:]
+delete_rows = "--delete" in args
+args = [x for x in args if x != "--delete"]
+archive_table = os.getenv("TRACE_ARCHIVE_TABLE") or "trace_archive"
+if args:
+    archive_table = args[0]
+
+db_obj = get_central_db()
+rt = ResultTrace(archive_table_name=archive_table)
+
+tables = [x[0] for x in db_obj.doQuery("SHOW TABLES")]
+if archive_table not in tables:
+    print "Creating archive table {0}".format(archive_table)
+    rt.create_trace_archive_table(db_obj)
+
+trace_ids = [x[0] for x in db_obj.doQuery(
+                "SELECT DISTINCT trace_id FROM `{0}` ORDER BY trace_id".format(
+                                                            rt._table_name))]
+archived_ids = set([x[0] for x in db_obj.doQuery(
+                "SELECT DISTINCT trace_id FROM `{0}`".format(archive_table))])
+
+print "Archiving {0} traces into {1}".format(
+                len([x for x in trace_ids if x not in archived_ids]),
+                archive_table)
+for trace_id in trace_ids:
+    if trace_id in archived_ids:
+        print "Trace {0} already archived, skipping".format(trace_id)
+        continue
+    job_count = rt.archive_trace(db_obj, trace_id, delete_rows=delete_rows)
+    if job_count is None:
+        print "Trace {0} could not be archived".format(trace_id)
+        sys.exit(1)
+    print "Trace {0} archived: {1} jobs".format(trace_id, job_count)
@@ -3,6 +3,15 @@ Runs analysis on group experiments that have been simulated but not
 analyzed. Data is read and written to a database configured through
 environment vars.
 
+Usage:
+python run_analysis_exp_group.py [trace_id] [--from-summaries]
+
+Args:
+- trace_id: numeric id of the group experiment to analyze. If not set, all
+    pending group experiments are analyzed.
+- --from-summaries: build the group results by merging the summaries stored
+    with the results of the subtraces instead of reloading the subtraces.
+
 Env vars:
 - ANALYSIS_DB_HOST: hostname of the system hosting the database.
 - ANALYSIS_DB_NAME: database name to read from.
@@ -24,12 +33,15 @@ ExperimentRunner.configure(
            scheduler_folder="/home/gonzalo/cscs14038bscVIII",
            manifest_folder="manifests")
 
+from_summaries = "--from-summaries" in sys.argv[1:]
+args = [x for x in sys.argv[1:] if x != "--from-summaries"]
 trace_id=None
-if len(sys.argv)>=2:
-    trace_id=sys.argv[1]
+if len(args)>=1:
+    trace_id=args[0]
 
 central_db_obj = get_central_db()
 
 ew = AnalysisWorker()
 
-ew.do_work_grouped(central_db_obj, trace_id=trace_id)
+ew.do_work_grouped(central_db_obj, trace_id=trace_id,
+                   from_summaries=from_summaries)
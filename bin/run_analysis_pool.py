@@ -0,0 +1,47 @@
+"""
+Runs analysis on experiments that are ready to be analyzed using several
+processes in this host. Each process claims experiments atomically, so several
+pools (and the single process scripts) can run at the same time. Data is read
+and written to a database configured through environment vars.
+
+Usage:
+python run_analysis_pool.py [mode] [--processes N] [--from-summaries]
+
+Args:
+- mode: single (default), second_pass, grouped, grouped_second_pass or delta.
+- --processes N: number of analysis processes. Default: number of cores.
+- --from-summaries: in grouped mode, build the group results by merging the
+    summaries stored with the results of the subtraces.
+
+Ctrl-C (or SIGTERM) stops the processes after their current experiment, a
+second Ctrl-C terminates them. Experiments claimed by a process that did not
+finish are returned to the state they had before being claimed.
+
+Env vars:
+- ANALYSIS_DB_HOST: hostname of the system hosting the database.
+- ANALYSIS_DB_NAME: database name to read from.
+- ANALYSIS_DB_USER: user to be used to access the database.
+- ANALYSIS_DB_PASS: password to be used to used to access the database.
+- ANALYSIS_DB_PORT: port on which the database runs.
+"""
+from orchestration import AnalysisWorker
+from orchestration import get_central_db
+import sys
+
+args = sys.argv[1:]
+from_summaries = "--from-summaries" in args
+args = [x for x in args if x != "--from-summaries"]
+processes = None
+if "--processes" in args:
+    pos = args.index("--processes")
+    processes = int(args[pos+1])
+    args = args[:pos] + args[pos+2:]
+mode = "single"
+if len(args)>=1:
+    mode = args[0]
+
+ew = AnalysisWorker()
+analyzed = ew.do_work_pool(mode, processes=processes,
+                           db_factory=get_central_db,
+                           from_summaries=from_summaries)
+print "Analyzed {0} experiments".format(analyzed)
@@ -0,0 +1,79 @@
+"""
+在hosts.list中的所有工作虚拟机上运行"fresh"状态的实验。一个调度器进程管理所有
+工作节点，代替workers_launch.sh为每个节点启动的run_sim_exp.py进程（见
+orchestration.dispatching）：实验通过队列分派给空闲的节点，不可达的节点上
+运行的实验被放回队列由其他节点运行。
+
+Usage:
+
+python run_dispatcher.py [hosts_file] [--follow] [--status-file FILE]
+    [--log-folder FOLDER]
+
+- hosts_file: 工作节点列表，每行一个主机名，包含"!"的行被忽略。默认为
+    ./hosts.list。
+- --follow: 没有"fresh"实验时不退出，等待新实验。
+- --status-file FILE: 定期将每个节点的状态和当前实验写入FILE。默认为
+    ./log/dispatcher.status。
+- --log-folder FOLDER: 每个节点的实验输出追加到FOLDER/worker.log.<节点>。
+    默认为./log。
+
+Ctrl-C（或SIGTERM）使调度器在运行中的实验结束后退出，第二次Ctrl-C终止运行中
+的实验，它们恢复为"fresh"状态。
+
+Env vars:
+- ANALYSIS_DB_HOST: 中央数据库所在系统的主机名。
+- ANALYSIS_DB_NAME: 写入中心和读取实验信息的数据库名称。
+- ANALYSIS_DB_USER: 访问中心数据库的用户。
+- ANALYSIS_DB_PASS: 用于访问中心数据库的密码。
+- ANALYSIS_DB_PORT: 中心数据库运行的端口。
+- SLURM_DB_NAME: slurm中slurm worker的数据库名称。如果没有设置，则取slurm_acct_db。
+- SLURMDB_USER: 访问slurm数据库的用户。
+- SLURMDB_PASS: 访问slurm数据库的密码。
+- SLURMDB_PORT: slurm数据库运行的端口。
+"""
+import os
+import sys
+
+from commonLib.filemanager import ensureDir
+from orchestration.dispatching import ExperimentDispatcher
+
+
+def pop_option(args, name, default):
+    if name not in args:
+        return default
+    pos = args.index(name)
+    value = args[pos+1]
+    del args[pos:pos+2]
+    return value
+
+args = sys.argv[1:]
+follow = "--follow" in args
+args = [x for x in args if x != "--follow"]
+log_folder = pop_option(args, "--log-folder", "./log")
+status_file = pop_option(args, "--status-file",
+                         os.path.join(log_folder, "dispatcher.status"))
+hosts_file = "./hosts.list"
+if len(args)>=1:
+    hosts_file = args[0]
+
+hostnames = [x.strip() for x in open(hosts_file).readlines()
+             if x.strip() and not "!" in x]
+ensureDir(log_folder)
+
+# 与run_sim_exp.py相同的实验运行器配置，run_hostname由调度器设置
+runner_conf = dict(
+           trace_folder="/tmp/",
+           trace_generation_folder=os.getenv("TRACES_TMP_DIR", "tmp"),
+           local=False,
+           run_user=None,
+           scheduler_conf_dir="/scsf/slurm_conf",
+           local_conf_dir="configs/",
+           scheduler_folder="/scsf/",
+           manifest_folder="manifests")
+
+dispatcher = ExperimentDispatcher(hostnames, runner_conf=runner_conf,
+                                  follow=follow, status_file=status_file,
+                                  log_folder=log_folder)
+done = dispatcher.run()
+print dispatcher.format_status()
+print "Simulated {0} experiments".format(done)
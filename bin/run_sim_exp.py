@@ -6,10 +6,12 @@
 
 Usage:
 
-python run_sim_exp-py [ip_of_simulator] [trace_id]
+python run_sim_exp-py [ip_of_simulator] [trace_id] [--pipelined]
 
 - ip_of_simulator: 运行模拟的机器的IP地址。
 - trace_id: 如果设置，它只运行具有该trace_id的实验，如果没有设置，它将以"fresh"状态运行所有实验。
+- --pipelined: 没有trace_id时，在模拟当前实验的同时生成下一个实验的工作负载、
+    存储上一个实验的结果（见ExperimentWorker.do_work_pipelined）。
 
 Env vars:
 - ANALYSIS_DB_HOST: 中央数据库所在系统的主机名。
@@ -37,16 +39,19 @@ from orchestration.running import ExperimentRunner
 # 设置模拟器的默认IP地址
 simulator_ip = "192.168.56.24"
 
-# 如果命令行提供了至少两个参数，则使用第一个额外参数作为模拟器的IP地址
-if len(sys.argv)>=2:
-    simulator_ip = sys.argv[1]
+pipelined = "--pipelined" in sys.argv[1:]
+args = [x for x in sys.argv[1:] if x != "--pipelined"]
+
+# 如果命令行提供了至少一个参数，则使用第一个参数作为模拟器的IP地址
+if len(args)>=1:
+    simulator_ip = args[0]
     
 # 初始化跟踪ID为None
 trace_id=None
 
-# 如果命令行提供了至少三个参数，则使用第二个额外参数作为跟踪ID
-if len(sys.argv)>=3:
-    trace_id=sys.argv[2]
+# 如果命令行提供了至少两个参数，则使用第二个参数作为跟踪ID
+if len(args)>=2:
+    trace_id=args[1]
 
 # 获取环境变量 SIM_MAX_WAIT 的值，如果存在则用于设置最大等待时间
 mysleep=os.getenv("SIM_MAX_WAIT", None)
@@ -80,4 +85,7 @@ sched_db_obj = get_sim_db(simulator_ip)
 ew = ExperimentWorker()
 
 # 开始执行工作，传递中心数据库对象、模拟器数据库对象以及跟踪ID给do_work方法
-ew.do_work(central_db_obj, sched_db_obj, trace_id=trace_id)
+if pipelined and not trace_id:
+    ew.do_work_pipelined(central_db_obj, sched_db_obj)
+else:
+    ew.do_work(central_db_obj, sched_db_obj, trace_id=trace_id)
@@ -10,5 +10,19 @@ export NERSCDB_PASS="nersc_example-pass"
 export TEST_DB_NAME="scsftest"
 export TEST_DB_USER="testscsf"
 export TEST_DB_PASS="testscsf-pass"
+# Uncomment to use SQLite files in this folder instead of the MySQL server
+# for the analysis and test databases.
+#export SQLITE_DB_DIR="$HOME/scsf_sqlite"
+# Uncomment to store the simulated traces as compressed columns, one row per
+# trace chunk, in this table instead of one row per job in the traces table.
+#export TRACE_ARCHIVE_TABLE="trace_archive"
+# Uncomment to keep the generated workload files in this folder and reuse them
+# when an experiment with the same generation parameters is run again. The
+# size of the cache is bounded by TRACE_CACHE_MAX_MB (default: 10240).
+#export TRACE_CACHE_DIR="$HOME/scsf_trace_cache"
+#export TRACE_CACHE_MAX_MB="10240"
+# Uncomment to import the simulated traces by querying the worker's accounting
+# table remotely instead of exporting it on the worker and copying the export.
+#export TRACE_EXPORT="0"
 
 export TEST_VM_HOST="192.168.217.91"
\ No newline at end of file
@@ -0,0 +1,55 @@
+"""
+Migrates the SQL schema of the workload database to the latest schema
+version: adds the composite indexes used by the trace loads, the worker polls
+and the result lookups (see orchestration.schema). Indexes that already exist
+are not rebuilt, so it is safe to run it more than once. A version is recorded
+only when all its tables exist: running it again after the missing tables are
+created adds their indexes and records the version. It prints the query
+plans of the hot queries before and after the migration and verifies that all
+the indexes of the applied versions are present.
+
+Usage:
+python sql_migrate_db.py [target_version]
+
+Args:
+- target_version: schema version to migrate to. Default: latest version.
+ 
+Env vars:
+- ANALYSIS_DB_HOST: hostname of the system hosting the database.
+- ANALYSIS_DB_NAME: database name to read from.
+- ANALYSIS_DB_USER: user to be used to access the database.
+- ANALYSIS_DB_PASS: password to be used to used to access the database.
+- ANALYSIS_DB_PORT: port on which the database runs. 
+""" 
+
+from orchestration import get_central_db
+from orchestration.schema import (explain_hot_queries, get_latest_version,
+                                  get_schema_version, migrate_schema,
+                                  verify_schema)
+
+import sys
+
+target_version = get_latest_version()
+if len(sys.argv)>=2:
+    target_version = int(sys.argv[1])
+
+db_obj = get_central_db()
+
+print "Schema version: {0}, target: {1}".format(get_schema_version(db_obj),
+                                                target_version)
+plans_before = explain_hot_queries(db_obj)
+applied = migrate_schema(db_obj, target_version=target_version)
+print "Migrations applied: {0}".format(applied)
+plans_after = explain_hot_queries(db_obj)
+for ((description, before), (description, after)) in zip(plans_before,
+                                                         plans_after):
+    print "{0}:".format(description)
+    print "  before: {0}".format(before)
+    print "  after:  {0}".format(after)
+
+problems = verify_schema(db_obj)
+for problem in problems:
+    print "Schema problem: {0}".format(problem)
+if problems:
+    sys.exit(1)
+print "Schema version {0} verified".format(get_schema_version(db_obj))
@@ -7,11 +7,13 @@ Env vars:
 - ANALYSIS_DB_USER: user to be used to access the database.
 - ANALYSIS_DB_PASS: password to be used to used to access the database.
 - ANALYSIS_DB_PORT: port on which the database runs. 
+- TRACE_ARCHIVE_TABLE: if set, the trace archive table is also created.
 """ 
 
 from orchestration import get_central_db
 
 from orchestration.definition import ExperimentDefinition
+from orchestration.schema import migrate_schema
 from stats.trace import ResultTrace
 from stats import Histogram, NumericStats
 
@@ -19,9 +21,13 @@ db_obj = get_central_db()
 
 ExperimentDefinition().create_table(db_obj)
 ResultTrace().create_trace_table(db_obj, ResultTrace()._table_name)
+if ResultTrace()._archive_table_name:
+    ResultTrace().create_trace_archive_table(db_obj)
 Histogram().create_table(db_obj)
 ResultTrace()._get_utilization_result().create_table(db_obj)
 
 NumericStats().create_table(db_obj)
 
+migrate_schema(db_obj)
+
   
@@ -0,0 +1,22 @@
+"""
+Upgrades the SQL schema of an existing workload database: adds the columns
+introduced after the tables were created (e.g., the mergeable summaries of
+the histograms and numericStats tables). Columns that already exist are not
+modified, so it is safe to run it more than once.
+ 
+Env vars:
+- ANALYSIS_DB_HOST: hostname of the system hosting the database.
+- ANALYSIS_DB_NAME: database name to read from.
+- ANALYSIS_DB_USER: user to be used to access the database.
+- ANALYSIS_DB_PASS: password to be used to used to access the database.
+- ANALYSIS_DB_PORT: port on which the database runs. 
+""" 
+
+from orchestration import get_central_db
+
+from stats import Histogram, NumericStats
+
+db_obj = get_central_db()
+
+Histogram().upgrade_table(db_obj)
+NumericStats().upgrade_table(db_obj)
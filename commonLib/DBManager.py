@@ -1,11 +1,472 @@
 import MySQLdb as mdb
 from commonLib.Logging import *
+import atexit
+import functools
 import gc
+from commonLib import sqliteLib
 from commonLib import tunnelLib
 import datetime
+import numpy as np
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
 
 
-class DB:
+# 每个连接池的默认最大连接数
+DEFAULT_POOL_SIZE = 4
+# 空闲超过该秒数的连接在复用前先ping检查
+DEFAULT_PING_INTERVAL = 30
+# MySQL连接断开的错误码（server has gone away, lost connection）
+_CONNECTION_LOST_ERRORS = (2006, 2013)
+# streamValuesAsColumns每个块的默认行数
+DEFAULT_CHUNK_SIZE = 100000
+# bulkInsert每次executemany的默认行数（每批生成一条多行INSERT，需小于
+# max_allowed_packet）
+DEFAULT_BULK_BATCH_SIZE = 5000
+
+
+class ConnectionPool(object):
+    """
+    可复用的MySQL连接池。连接以autocommit模式创建，事务期间由DB关闭
+    autocommit，结束时恢复。
+    - acquire()返回一个空闲连接，没有空闲连接且未达到max_size时新建连接，
+      否则等待其他线程归还。空闲超过ping_interval秒的连接复用前用ping检查，
+      失效的连接被关闭并替换。
+    - release()将连接放回池中，已断开的连接直接关闭。
+    使用SSH隧道时，隧道在第一个连接建立时打开，在close()时关闭。
+    线程安全。
+    """
+    def __init__(self, host, user, password, db_name, port, use_tunnel=False,
+                 max_size=DEFAULT_POOL_SIZE,
+                 ping_interval=DEFAULT_PING_INTERVAL):
+        self._connect_args = (host, user, password, db_name, int(port))
+        self._max_size = max(int(max_size), 1)
+        self._ping_interval = ping_interval
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._tunnel = None
+        if use_tunnel:
+            self._tunnel = tunnelLib.Tunnel()
+        self._stats = dict(created=0, reused=0, discarded=0)
+
+    def acquire(self):
+        """返回一个可用的连接。建立连接失败时抛出mdb.Error。"""
+        while True:
+            con = None
+            with self._cond:
+                while not self._idle and self._size >= self._max_size:
+                    self._cond.wait()
+                if self._idle:
+                    con, last_used = self._idle.pop()
+                else:
+                    self._size += 1
+            if con is None:
+                return self._create()
+            if (time.time() - last_used < self._ping_interval or
+                    self._is_alive(con)):
+                with self._cond:
+                    self._stats["reused"] += 1
+                return con
+            self._discard(con)
+
+    def release(self, con, broken=False):
+        """将con归还到池中。broken为True时关闭连接。"""
+        if broken:
+            self._discard(con)
+            return
+        with self._cond:
+            self._idle.append((con, time.time()))
+            self._cond.notify()
+
+    def close(self):
+        """关闭所有空闲连接。没有正在使用的连接时同时关闭SSH隧道。"""
+        with self._cond:
+            idle = self._idle
+            self._idle = []
+            self._size -= len(idle)
+            close_tunnel = (self._tunnel is not None and
+                            self._tunnel.connected and self._size == 0)
+        for (con, last_used) in idle:
+            self._close_con(con)
+        if close_tunnel:
+            self._tunnel.disconnect()
+            self._tunnel.connected = False
+
+    def set_max_size(self, max_size):
+        with self._cond:
+            self._max_size = max(int(max_size), 1)
+            self._cond.notify_all()
+
+    def get_max_size(self):
+        return self._max_size
+
+    def get_stats(self):
+        """返回创建、复用、丢弃的连接数，以及当前打开和空闲的连接数。"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["open"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["max_size"] = self._max_size
+        return stats
+
+    def _create(self):
+        try:
+            con = self._open()
+        except:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["created"] += 1
+        return con
+
+    def _open(self):
+        """建立一个新的autocommit连接。"""
+        if self._tunnel is not None and not self._tunnel.connected:
+            self._tunnel.connect()
+        (host, user, password, db_name, port) = self._connect_args
+        con = mdb.connect(host, user, password, db_name, port=port,
+                          local_infile=1)
+        con.autocommit(True)
+        return con
+
+    def _discard(self, con):
+        self._close_con(con)
+        with self._cond:
+            self._size -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+
+    def _is_alive(self, con):
+        try:
+            con.ping()
+            return True
+        except mdb.Error:
+            return False
+
+    def _close_con(self, con):
+        try:
+            con.close()
+        except mdb.Error:
+            pass
+
+
+class SQLitePool(ConnectionPool):
+    """
+    SQLiteDB使用的连接池，连接为sqliteLib.SQLiteConnection。
+    内存数据库（":memory:"）的每个连接都是一个独立的数据库，因此其连接池
+    只有一个连接，连接被关闭（close()或被丢弃）时数据随之丢失。
+    """
+    def __init__(self, file_name, max_size=DEFAULT_POOL_SIZE):
+        self._file_name = file_name
+        ConnectionPool.__init__(self, None, None, None, file_name, 0,
+                                max_size=max_size)
+        self.set_max_size(max_size)
+
+    def set_max_size(self, max_size):
+        if self._file_name == ":memory:":
+            max_size = 1
+        ConnectionPool.set_max_size(self, max_size)
+
+    def _open(self):
+        return sqliteLib.SQLiteConnection(self._file_name)
+
+
+def _batches(rows, batch_size):
+    """将可迭代的rows按batch_size行分组，返回行列表的生成器。"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _tsv_value(value):
+    """将一个值转换为LOAD DATA默认转义格式的TSV字段。"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, float):
+        value = repr(value)
+    elif isinstance(value, bool):
+        value = str(int(value))
+    elif isinstance(value, unicode):
+        value = value.encode("utf-8")
+    else:
+        value = str(value)
+    return (value.replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n"))
+
+
+# QueryStats.format_summary默认列出的语句数
+DEFAULT_SUMMARY_SIZE = 20
+# 慢查询日志中语句的最大长度
+_SLOW_LOG_QUERY_LENGTH = 2000
+# 规范化语句时被替换为?的字符串和数字字面量，以及由?组成的列表
+_LITERAL_RE = re.compile(r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|"""
+                         r"""\b\d+(?:\.\d+)?(?:e[-+]?\d+)?\b""", re.S | re.I)
+_ARG_LIST_RE = re.compile(r"\?(?:\s*,\s*\?)+")
+# 查找调用位置时跳过的模块（不含扩展名）
+_INTERNAL_MODULES = set([os.path.splitext(os.path.abspath(x.__file__))[0]
+                         for x in [sys.modules[__name__], sqliteLib]])
+
+
+def _value_bytes(value):
+    """估计一个字段值在网络上传输的字节数。"""
+    if value is None:
+        return 0
+    if isinstance(value, (str, unicode, buffer)):
+        return len(value)
+    return 8
+
+
+def _rows_bytes(rows):
+    """估计查询结果（元组或字典的序列）的字节数。"""
+    total = 0
+    for row in rows:
+        if isinstance(row, dict):
+            row = row.itervalues()
+        for value in row:
+            total += _value_bytes(value)
+    return total
+
+
+class QueryStats(object):
+    """
+    进程内SQL语句的计时统计，默认关闭。开启后DB记录每条语句的耗时、返回
+    或写入的行数、发送和接收的字节数（按字段值估计）以及调用位置（DB之外
+    的第一个栈帧），按规范化语句（字面量替换为?）和调用位置聚合。耗时超过
+    slow_threshold秒的语句写入慢查询日志（slow_log_file，未设置时用Log）。
+    关闭时每条语句只多两次方法调用。线程安全。
+    """
+    def __init__(self):
+        self._enabled = False
+        self._slow_threshold = None
+        self._slow_log_file = None
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def enable(self, slow_threshold=None, slow_log_file=None):
+        """开始记录。slow_threshold为None时不写慢查询日志。"""
+        self._slow_threshold = slow_threshold
+        self._slow_log_file = slow_log_file
+        self._enabled = True
+
+    def disable(self):
+        self._enabled = False
+
+    def is_enabled(self):
+        return self._enabled
+
+    def reset(self):
+        with self._lock:
+            self._entries = {}
+
+    def start(self):
+        """返回语句开始的时间，未开启时返回None。"""
+        if not self._enabled:
+            return None
+        return time.time()
+
+    def finish(self, start, query, rows=None, row_count=None,
+               received_bytes=None, params=None, sent_bytes=None,
+               elapsed=None):
+        """
+        记录一条从start开始的语句，start为None（未开启）时直接返回。
+        Args:
+            start (float): start()的返回值
+            query (str): 执行的语句
+            rows: 查询返回的行，用于计算行数和接收的字节数
+            row_count (int): 行数，rows为None时使用（例如写入的行数）
+            received_bytes (int): 接收的字节数，rows为None时使用
+            params: 语句参数（executemany时为参数列表），计入发送的字节数
+            sent_bytes (int): 发送的字节数，指定时不再根据query和params计算
+            elapsed (float): 耗时，None时为从start到现在的时间
+        """
+        if start is None:
+            return
+        if elapsed is None:
+            elapsed = time.time() - start
+        if rows is not None:
+            row_count = len(rows)
+            received_bytes = _rows_bytes(rows)
+        if sent_bytes is None:
+            sent_bytes = len(query)
+            if params:
+                if isinstance(params[0], (list, tuple)):
+                    sent_bytes += _rows_bytes(params)
+                else:
+                    sent_bytes += _rows_bytes([params])
+        row_count = row_count or 0
+        received_bytes = received_bytes or 0
+        statement = self.normalize(query)
+        site = self._get_site()
+        with self._lock:
+            entry = self._entries.get((statement, site))
+            if entry is None:
+                entry = dict(statement=statement, site=site, count=0,
+                             total_time=0.0, max_time=0.0, rows=0,
+                             sent_bytes=0, received_bytes=0)
+                self._entries[(statement, site)] = entry
+            entry["count"] += 1
+            entry["total_time"] += elapsed
+            entry["max_time"] = max(entry["max_time"], elapsed)
+            entry["rows"] += row_count
+            entry["sent_bytes"] += sent_bytes
+            entry["received_bytes"] += received_bytes
+        if (self._slow_threshold is not None and
+                elapsed >= self._slow_threshold):
+            self._log_slow(statement, site, elapsed, row_count, sent_bytes,
+                           received_bytes)
+
+    @classmethod
+    def normalize(cls, query):
+        """将语句中的字面量替换为?并合并空白，同一语句的不同参数被聚合。"""
+        statement = _ARG_LIST_RE.sub("?, ...", _LITERAL_RE.sub("?", query))
+        return " ".join(statement.split())
+
+    def get_summary(self, top=None):
+        """返回按总耗时降序排列的语句统计字典列表，top不为None时只返回
+        前top条。"""
+        with self._lock:
+            entries = [dict(x) for x in self._entries.values()]
+        entries.sort(key=lambda x: x["total_time"], reverse=True)
+        if top is not None:
+            entries = entries[:top]
+        return entries
+
+    def format_summary(self, top=DEFAULT_SUMMARY_SIZE):
+        """返回总耗时最多的top条语句的文本表格。"""
+        entries = self.get_summary()
+        total_time = sum([x["total_time"] for x in entries])
+        total_count = sum([x["count"] for x in entries])
+        lines = ["DB query summary (pid {0}): {1} statements, {2:.3f}s".format(
+                 os.getpid(), total_count, total_time),
+                 "{0:>9} {1:>7} {2:>9} {3:>10} {4:>12} {5:>12}  {6}".format(
+                 "total_s", "count", "max_s", "rows", "sent_B", "recv_B",
+                 "site / statement")]
+        for entry in entries[:top]:
+            lines.append("{0:9.3f} {1:7d} {2:9.3f} {3:10d} {4:12d} {5:12d}  "
+                         "{6}".format(entry["total_time"], entry["count"],
+                                      entry["max_time"], entry["rows"],
+                                      entry["sent_bytes"],
+                                      entry["received_bytes"], entry["site"]))
+            lines.append(" " * 66 + entry["statement"][:200])
+        return "\n".join(lines)
+
+    def _get_site(self):
+        """返回DB之外的第一个调用栈帧的"文件:行 函数"。"""
+        frame = sys._getframe(2)
+        while frame is not None:
+            code = frame.f_code
+            module = os.path.splitext(os.path.abspath(code.co_filename))[0]
+            if module not in _INTERNAL_MODULES:
+                return "{0}:{1} {2}".format(os.path.basename(code.co_filename),
+                                            frame.f_lineno, code.co_name)
+            frame = frame.f_back
+        return "unknown"
+
+    def _log_slow(self, statement, site, elapsed, row_count, sent_bytes,
+                  received_bytes):
+        msg = ("SLOW QUERY {0:.3f}s rows={1} sent={2}B received={3}B site={4}:"
+               " {5}".format(elapsed, row_count, sent_bytes, received_bytes,
+                             site, statement[:_SLOW_LOG_QUERY_LENGTH]))
+        if self._slow_log_file is None:
+            Log.log(msg)
+            return
+        line = "{0}:{1}:{2}\n".format(datetime.datetime.now().isoformat("-"),
+                                      os.getpid(), msg)
+        with self._lock:
+            with open(self._slow_log_file, "a") as log_file:
+                log_file.write(line)
+
+
+# 进程内所有DB对象共用的语句统计。设置环境变量DB_QUERY_STATS时开启，
+# DB_SLOW_QUERY_S为慢查询阈值（秒，默认1），DB_SLOW_QUERY_LOG为慢查询日志
+# 文件（默认写入Log）。
+query_stats = QueryStats()
+if os.getenv("DB_QUERY_STATS"):
+    query_stats.enable(slow_threshold=float(os.getenv("DB_SLOW_QUERY_S", "1")),
+                       slow_log_file=os.getenv("DB_SLOW_QUERY_LOG"))
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(hostName, dbName, userName, password, port="3306",
+             useTunnel=False, pool_size=None):
+    """返回进程内参数相同的DB对象共享的连接池。fork出的子进程使用自己的
+    连接池，不会复用父进程的连接。pool_size为None时使用DEFAULT_POOL_SIZE，
+    否则连接池大小至少为pool_size。"""
+    key = (os.getpid(), hostName, str(port), dbName, userName, password,
+           useTunnel)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(hostName, userName, password, dbName, port,
+                                  use_tunnel=useTunnel,
+                                  max_size=pool_size or DEFAULT_POOL_SIZE)
+            _pools[key] = pool
+        elif pool_size is not None and pool_size > pool.get_max_size():
+            pool.set_max_size(pool_size)
+    return pool
+
+
+def get_sqlite_pool(fileName, pool_size=None):
+    """返回进程内使用同一个SQLite文件的SQLiteDB对象共享的连接池，规则与
+    get_pool相同。"""
+    if fileName != ":memory:":
+        fileName = os.path.abspath(fileName)
+    key = (os.getpid(), "sqlite", fileName)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SQLitePool(fileName,
+                              max_size=pool_size or DEFAULT_POOL_SIZE)
+            _pools[key] = pool
+        elif pool_size is not None and pool_size > pool.get_max_size():
+            pool.set_max_size(pool_size)
+    return pool
+
+
+def get_db(hostName, dbName, userName, password, port="3306",
+           useTunnel=False, pool_size=None):
+    """
+    返回数据库对象。设置了环境变量SQLITE_DB_DIR时返回使用该目录下
+    "<dbName>.sqlite"文件的SQLiteDB（目录不存在时创建），不需要MySQL服务器；
+    否则返回参数对应的MySQL DB对象。
+    """
+    sqlite_dir = os.getenv("SQLITE_DB_DIR")
+    if sqlite_dir:
+        if not os.path.isdir(sqlite_dir):
+            os.makedirs(sqlite_dir)
+        return SQLiteDB(os.path.join(sqlite_dir, dbName + ".sqlite"),
+                        pool_size=pool_size)
+    return DB(hostName, dbName, userName, password, port=port,
+              useTunnel=useTunnel, pool_size=pool_size)
+
+
+def close_all_pools():
+    """关闭本进程所有连接池的空闲连接和SSH隧道。"""
+    with _pools_lock:
+        pools = [pool for (key, pool) in _pools.items()
+                 if key[0] == os.getpid()]
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_all_pools)
+
+
+class DB(object):
     hostName = "localhost"
     dbName = "nersc"
     userName = "nersc"
@@ -14,7 +475,8 @@ class DB:
 
     #	con=False
 
-    def __init__(self, hostName, dbName, userName, password, port="3306", useTunnel=False):
+    def __init__(self, hostName, dbName, userName, password, port="3306", useTunnel=False,
+                 pool_size=None):
         """
         初始化数据库连接对象
         Parameters:
@@ -24,18 +486,52 @@ class DB:
         password (str): 数据库登录密码
         port (str): 数据库服务器端口号，默认3306（MySQL默认端口）
         useTunnel (bool): 是否启用SSH隧道连接，默认False（直接连接）
+        pool_size (int): 连接池的最大连接数，默认DEFAULT_POOL_SIZE。参数相同的
+            DB对象共享同一个连接池，connect()从池中取连接，disconnect()归还
+        连接、游标和事务状态按线程保存，同一个DB对象可以被多个线程使用。
         """
-        self.con = False
+        self._local = threading.local()
         self.hostName = hostName;
         self.dbName = dbName;
         self.userName = userName;
         self.password = password;
         self.port = port
         self.useTunnel = useTunnel
-        if (useTunnel):
-            self.tunnel = tunnelLib.Tunnel()
-        self._in_transaction = False
-        self._cursor = None
+        self.pool_size = pool_size
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _get_local(self, name, default):
+        return getattr(self._local, name, default)
+
+    def _set_local(self, name, value):
+        setattr(self._local, name, value)
+
+    con = property(lambda self: self._get_local("con", False),
+                   lambda self, value: self._set_local("con", value))
+    _in_transaction = property(
+                   lambda self: self._get_local("in_transaction", False),
+                   lambda self, value: self._set_local("in_transaction",
+                                                       value))
+    _cursor = property(lambda self: self._get_local("cursor", None),
+                       lambda self, value: self._set_local("cursor", value))
+
+    def get_pool(self):
+        """返回该DB对象使用的连接池。"""
+        return get_pool(self.hostName, self.dbName, self.userName,
+                        self.password, self.port, self.useTunnel,
+                        self.pool_size)
+
+    def close(self):
+        """关闭该DB对象所用连接池的空闲连接（以及SSH隧道）。"""
+        self.get_pool().close()
 
     def start_transaction(self):
         """
@@ -73,12 +569,14 @@ class DB:
         try:
             # self.con.rollback()
             self.con.commit()
+            self.con.autocommit(True)
         except mdb.Error as e:
             print("COMMIT FAILED!!", e)
+            self._set_local("broken", True)
         self._in_transaction = False
-        self.disconnect()
         self._cursor.close()
         self._cursor = None
+        self.disconnect()
 
     def get_cursor(self):
         """获取数据库游标实例
@@ -92,28 +590,41 @@ class DB:
         return self._cursor
 
     def connect(self):
+        """从连接池中获取本线程使用的连接。本线程已持有连接时复用该连接，
+        每次connect()对应一次disconnect()。"""
         if self._in_transaction:
             return True
-        # print "DB", self.port
-        if (self.useTunnel):
-            self.tunnel.connect()
-        try:
-            self.con = mdb.connect(self.hostName, self.userName, self.password, self.dbName, port=int(self.port))
-
+        depth = self._get_local("depth", 0)
+        if depth > 0:
+            self._set_local("depth", depth + 1)
             return True
+        try:
+            self.con = self.get_pool().acquire()
         except mdb.Error as e:
             Log.log("Error %d: %s" % (e.args[0], e.args[1]))
-            if (self.useTunnel):
-                self.tunnel.disconnect()
             return False
+        self._set_local("depth", 1)
+        self._set_local("broken", False)
+        return True
 
     def disconnect(self):
+        """将本线程的连接归还到连接池。"""
         if (self.con == False or self._in_transaction):
             return
-        self.con.close()
+        depth = self._get_local("depth", 1) - 1
+        self._set_local("depth", depth)
+        if depth > 0:
+            return
+        con = self.con
         self.con = False
-        if (self.useTunnel):
-            self.tunnel.disconnect()
+        self._cursor = None
+        self.get_pool().release(con, broken=self._get_local("broken", False))
+
+    def _connection_error(self, e):
+        """记录e是否表示连接已断开，断开的连接在归还时被丢弃。"""
+        if (isinstance(e, mdb.OperationalError) and e.args and
+                e.args[0] in _CONNECTION_LOST_ERRORS):
+            self._set_local("broken", True)
 
     def date_to_mysql(self, my_date):
         return my_date.strftime('%Y-%m-%d %H:%M:%S')
@@ -128,10 +639,13 @@ class DB:
         if self.connect():
             try:
                 cur = self.get_cursor()
+                start = query_stats.start()
                 cur.execute(query)
                 rows = cur.fetchall()
+                query_stats.finish(start, query, rows=rows)
             except mdb.Error as e:
                 Log.log("Error %d: %s" % (e.args[0], e.args[1]))
+                self._connection_error(e)
                 rows = False
             self.disconnect()
         return rows
@@ -144,11 +658,14 @@ class DB:
         if self.connect():
             try:
                 cur = self.con.cursor(mdb.cursors.DictCursor)
+                start = query_stats.start()
                 cur.execute(query)
                 rows = cur.fetchall()
+                query_stats.finish(start, query, rows=rows)
 
             except mdb.Error as e:
                 Log.log("Error %d: %s" % (e.args[0], e.args[1]))
+                self._connection_error(e)
                 rows = False
             self.disconnect()
         return rows
@@ -179,15 +696,18 @@ class DB:
             try:
                 cur = self.get_cursor()
 
+                start = query_stats.start()
                 res = cur.execute(update)
                 if get_insert_id:
                     insert_id = self.con.insert_id()
                 if not self._in_transaction:
                     self.con.commit()
+                query_stats.finish(start, update, row_count=res)
 
 
             except mdb.Error as e:
                 Log.log("Error %d: %s" % (e.args[0], e.args[1]))
+                self._connection_error(e)
                 ok = False
             self.disconnect()
         return ok, insert_id
@@ -198,12 +718,15 @@ class DB:
             try:
                 cur = self.get_cursor()
 
+                start = query_stats.start()
                 res = cur.executemany(query, values)
                 if not self._in_transaction:
                     self.con.commit()
+                query_stats.finish(start, query, row_count=res, params=values)
 
             except mdb.Error as e:
                 Log.log("Error %d: %s" % (e.args[0], e.args[1]))
+                self._connection_error(e)
                 ok = False
             self.disconnect()
         return ok
@@ -214,15 +737,18 @@ class DB:
             try:
                 cur = self.get_cursor()
 
+                start = query_stats.start()
                 res = cur.execute(update, params)
                 if res == 0:
                     ok = False
                 if not self._in_transaction:
                     self.con.commit()
+                query_stats.finish(start, update, row_count=res, params=params)
             except mdb.Error as e:
                 print
                 "EEEEERRRRRROOOOOOORRRR", e
                 Log.log("Error %d: %s" % (e.args[0], e.args[1]))
+                self._connection_error(e)
                 ok = False
             self.disconnect()
         return ok
@@ -306,38 +832,155 @@ class DB:
         ok, insert_id = self.doUpdate(query, get_insert_id=get_insert_id)
         return ok, insert_id
 
-    def insertValuesColumns(self, table, columns_dic, fixedFields=None):
-        queryList = []
-        query = ""
-        count = len(columns_dic.values()[0])
+    def insertValuesColumns(self, table, columns_dic, fixedFields=None,
+                            load_data=False):
+        """
+        插入按列组织的数据：columns_dic为{字段: 值列表}，fixedFields为所有行
+        共用的{字段: 值}。通过bulkInsert参数化批量插入。
+        Returns:
+            bool: 插入是否成功
+        """
+        if fixedFields is None:
+            fixedFields = {}
         column_keys = columns_dic.keys()
-        keys = fixedFields.keys() + columns_dic.keys()
-        for i in range(count):
-            values = (fixedFields.values() +
-                      [columns_dic[x][i] for x in column_keys])
-            if (query == ""):
-                query = self.doInsertQueryMany(table, keys, values)
-            queryList.append(tuple(self.cleanFields(values, False)))
-        self.doUpdateMany(query, queryList)
+        keys = fixedFields.keys() + column_keys
+        fixed_values = tuple(fixedFields.values())
+        rows = (fixed_values + values
+                for values in zip(*[columns_dic[x] for x in column_keys]))
+        ok, rows_per_second = self.bulkInsert(table, keys, rows,
+                                              load_data=load_data)
+        return ok
 
     def insertValuesMany(self, table, dicList):
-        queryList = []
-        query = ""
-        #            maxLength=0
-        for dic in dicList:
-            #                print dic.keys()
-            #                if (maxLength!=0):
-            #                    if maxLength!=len(dic.values()):
-
-            #                        print "problem"
-            #                        exit(-1)
-            #                maxLength=max(maxLength, len(dic.values()))
-            if (query == ""):
-                query = self.doInsertQueryMany(table, dic.keys(), dic.values())
-            # queryList.append(self.doInsertQueryMany(table, dic.keys(), dic.values()))
-            queryList.append(tuple(self.cleanFields(dic.values(), False)))
-
-        self.doUpdateMany(query, queryList)
+        """插入字典列表，所有字典的键与第一个字典相同。通过bulkInsert参数化
+        批量插入。"""
+        if not dicList:
+            return True
+        keys = dicList[0].keys()
+        rows = (tuple([dic[key] for key in keys]) for dic in dicList)
+        ok, rows_per_second = self.bulkInsert(table, keys, rows)
+        return ok
+
+    def bulkInsert(self, table, fields, rows, batch_size=DEFAULT_BULK_BATCH_SIZE,
+                   load_data=False, disable_keys=True):
+        """
+        批量插入大量行，值以参数形式传递，不拼接SQL文本。
+        - 默认模式：每batch_size行执行一次executemany（生成一条多行INSERT）。
+        - load_data为True时：将行写入临时TSV文件，用LOAD DATA LOCAL INFILE
+          一次导入。
+        不在事务中时，使用连接池中的一个专用连接，所有行在一个事务中提交，
+        出错时回滚。disable_keys为True时，导入期间关闭唯一性和外键检查，并对
+        支持的存储引擎（MyISAM）执行DISABLE KEYS，导入后恢复。已在事务中时
+        使用事务的连接，不提交。
+        Args:
+            table (str): 表名
+            fields (list[str]): 字段名
+            rows (iterable): 与fields对应的值元组，可以是生成器
+            batch_size (int): 每次executemany的行数
+            load_data (bool): 是否使用LOAD DATA LOCAL INFILE
+            disable_keys (bool): 导入期间是否关闭索引维护和检查
+        Returns:
+            tuple: (ok 是否成功, rows_per_second 每秒插入的行数)
+        """
+        start_time = time.time()
+        stats_start = query_stats.start()
+        sent_bytes = 0
+        in_transaction = self._in_transaction
+        pool = self.get_pool()
+        if in_transaction:
+            con = self.con
+        else:
+            try:
+                con = pool.acquire()
+            except mdb.Error as e:
+                Log.log("Error %d: %s" % (e.args[0], e.args[1]))
+                return False, 0.0
+        ok = False
+        broken = False
+        count = 0
+        cur = con.cursor()
+        try:
+            if not in_transaction:
+                if disable_keys:
+                    self._execute_optional(cur, "ALTER TABLE `{0}` DISABLE KEYS"
+                                           "".format(table))
+                    self._execute_optional(cur, "SET unique_checks=0, "
+                                           "foreign_key_checks=0")
+                con.autocommit(False)
+            if load_data:
+                count = self._load_data_infile(cur, table, fields, rows)
+            else:
+                query = "INSERT INTO `{0}` ({1}) VALUES ({2})".format(
+                            table, self.concatFields(fields, commas=True),
+                            ",".join(["%s"] * len(fields)))
+                for batch in _batches(rows, batch_size):
+                    cur.executemany(query, batch)
+                    count += len(batch)
+                    if stats_start is not None:
+                        sent_bytes += _rows_bytes(batch)
+            if not in_transaction:
+                con.commit()
+            ok = True
+        except mdb.Error as e:
+            Log.log("Error %d: %s" % (e.args[0], e.args[1]))
+            broken = (isinstance(e, mdb.OperationalError) and e.args and
+                      e.args[0] in _CONNECTION_LOST_ERRORS)
+        finally:
+            if not in_transaction:
+                if not broken:
+                    try:
+                        if not ok:
+                            con.rollback()
+                        con.autocommit(True)
+                        if disable_keys:
+                            self._execute_optional(cur, "SET unique_checks=1, "
+                                                   "foreign_key_checks=1")
+                            self._execute_optional(
+                                cur, "ALTER TABLE `{0}` ENABLE KEYS".format(
+                                     table))
+                    except mdb.Error as e:
+                        Log.log("Error %d: %s" % (e.args[0], e.args[1]))
+                        broken = True
+                cur.close()
+                pool.release(con, broken=broken)
+        if not ok:
+            return False, 0.0
+        elapsed = max(time.time() - start_time, 1e-6)
+        query_stats.finish(stats_start, "BULK INSERT INTO `{0}` ({1})".format(
+                           table, self.concatFields(fields)), row_count=count,
+                           sent_bytes=sent_bytes, elapsed=elapsed)
+        rows_per_second = count / elapsed
+        Log.log("Bulk insert into {0}: {1} rows in {2:.2f}s ({3:.0f} rows/s)"
+                "".format(table, count, elapsed, rows_per_second))
+        return ok, rows_per_second
+
+    def _execute_optional(self, cur, query):
+        """执行query，忽略失败（例如存储引擎不支持或缺少ALTER权限）。"""
+        try:
+            cur.execute(query)
+        except mdb.Error:
+            pass
+
+    def _load_data_infile(self, cur, table, fields, rows):
+        """将rows写入临时TSV文件并用LOAD DATA LOCAL INFILE导入table。
+        返回导入的行数。"""
+        tsv_file = tempfile.NamedTemporaryFile(suffix=".tsv", delete=False)
+        count = 0
+        try:
+            for row in rows:
+                tsv_file.write("\t".join([_tsv_value(x) for x in row]))
+                tsv_file.write("\n")
+                count += 1
+            tsv_file.close()
+            cur.execute("LOAD DATA LOCAL INFILE %s INTO TABLE `{0}` "
+                        "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' "
+                        "LINES TERMINATED BY '\\n' ({1})".format(
+                            table, self.concatFields(fields, commas=True)),
+                        [tsv_file.name])
+        finally:
+            tsv_file.close()
+            os.remove(tsv_file.name)
+        return count
 
     def getValuesList(self, table, fields, condition="TRUE"):
         query = "SELECT "
@@ -369,13 +1012,16 @@ class DB:
             try:
                 cur = self.con.cursor(mdb.cursors.DictCursor)
                 # print "CUR EXECUTE NEXT"
+                start = query_stats.start()
                 cur.execute(query)
                 # print "CUR fetchall NEXT"
                 rows = cur.fetchall()
+                query_stats.finish(start, query, rows=rows)
                 cur.close()
                 gc.collect()
             except mdb.Error as e:
                 Log.log("Error %d: %s" % (e.args[0], e.args[1]))
+                self._connection_error(e)
                 rows = False
             self.disconnect()
         return rows
@@ -407,8 +1053,10 @@ class DB:
         if self.connect():
             try:
                 cur = self.con.cursor(mdb.cursors.DictCursor)
+                start = query_stats.start()
                 cur.execute(query)
                 rows = cur.fetchall()
+                query_stats.finish(start, query, rows=rows)
                 for row in rows:
                     for field in fields:
                         columns[field].append(row[field])
@@ -416,10 +1064,189 @@ class DB:
                 gc.collect()
             except mdb.Error as e:
                 Log.log("Error %d: %s" % (e.args[0], e.args[1]))
+                self._connection_error(e)
                 rows = False
             self.disconnect()
         return columns
 
+    def streamValuesAsColumns(self, table, fields, condition="TRUE",
+                              orderBy=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                              dtypes=None, theQuery=None):
+        """
+        以流的方式读取查询结果，每次返回最多chunk_size行，按列组织为NumPy数组。
+        查询使用服务端（无缓冲）游标和连接池中的一个专用连接，内存占用只与
+        chunk_size有关，与结果集的大小无关。
+        Args:
+            table (str): 表名
+            fields (list[str]): 需要读取的字段
+            condition (str): WHERE条件
+            orderBy (str): ORDER BY子句，None表示不排序
+            chunk_size (int): 每个块的最大行数
+            dtypes (dict): {字段: numpy dtype}，未列出的字段由NumPy推断类型
+                （含NULL的列为object类型）
+            theQuery (str): 指定时直接执行该查询，结果列与fields一一对应
+        Yields:
+            dict: {字段: numpy.ndarray}，各数组长度相同
+        Raises:
+            mdb.Error: 连接或查询失败时（记录日志后）抛出
+        生成器未读完就被关闭时，连接会被丢弃而不是归还到连接池，以避免读取
+        剩余的行。
+        """
+        if dtypes is None:
+            dtypes = {}
+        query = theQuery
+        if query is None:
+            query = "SELECT " + self.concatFields(fields, commas=True)
+            query += " FROM `" + table + "`"
+            if condition != None:
+                query += " WHERE " + condition
+            if orderBy != None:
+                query += " ORDER BY " + orderBy
+        pool = self.get_pool()
+        try:
+            con = pool.acquire()
+        except mdb.Error as e:
+            Log.log("Error %d: %s" % (e.args[0], e.args[1]))
+            raise
+        finished = False
+        start = query_stats.start()
+        elapsed = 0.0
+        row_count = 0
+        received_bytes = 0
+        try:
+            cur = con.cursor(mdb.cursors.SSCursor)
+            cur.execute(query)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if start is not None:
+                    # 只计入读取的时间，不计入调用者处理每个块的时间
+                    elapsed += time.time() - start
+                    row_count += len(rows)
+                    received_bytes += _rows_bytes(rows)
+                if not rows:
+                    break
+                columns = zip(*rows)
+                rows = None
+                yield dict([(field, np.array(column, dtype=dtypes.get(field)))
+                            for (field, column) in zip(fields, columns)])
+                start = query_stats.start() if start is not None else None
+            cur.close()
+            finished = True
+            query_stats.finish(start, query, row_count=row_count,
+                               received_bytes=received_bytes, elapsed=elapsed)
+        except mdb.Error as e:
+            Log.log("Error %d: %s" % (e.args[0], e.args[1]))
+            raise
+        finally:
+            pool.release(con, broken=not finished)
+
+    def readValuesIntoArrays(self, table, fields, out, condition="TRUE",
+                             orderBy=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                             theQuery=None):
+        """
+        将查询结果写入预先分配的数组，不产生额外的整表副本。数组的长度可以
+        通过countValues获得。
+        Args:
+            out (dict): {字段: 一维numpy数组}，结果从下标0开始按行写入
+            其余参数与streamValuesAsColumns相同
+        Returns:
+            int: 读取的行数
+        Raises:
+            ValueError: 结果行数超过数组长度时抛出
+        """
+        dtypes = dict([(field, out[field].dtype) for field in fields])
+        capacity = min([len(out[field]) for field in fields])
+        pos = 0
+        for chunk in self.streamValuesAsColumns(table, fields,
+                                                condition=condition,
+                                                orderBy=orderBy,
+                                                chunk_size=chunk_size,
+                                                dtypes=dtypes,
+                                                theQuery=theQuery):
+            count = len(chunk[fields[0]])
+            if pos + count > capacity:
+                raise ValueError("Query returned more than {0} rows".format(
+                                 capacity))
+            for field in fields:
+                out[field][pos:pos + count] = chunk[field]
+            pos += count
+        return pos
+
+    def runConcurrently(self, calls, max_workers=None):
+        """
+        并发执行一组相互独立的数据库读取操作，例如对多个trace_id或多个结果
+        类型的查询。每个工作线程从连接池中取得自己的连接（见connect），
+        最多同时运行max_workers个调用。
+        Args:
+            calls (list): 无参数的可调用对象（例如functools.partial），在
+                工作线程中调用，通常通过self读取数据库
+            max_workers (int): 最大并发数，默认为连接池的最大连接数
+        Returns:
+            list: 各调用的返回值，顺序与calls相同
+        Raises:
+            所有调用结束后，按提交顺序重新抛出第一个调用抛出的异常
+        本线程处于事务中（事务中的读取应使用事务的连接）或并发数为1时，
+        按顺序在本线程中执行。
+        """
+        calls = list(calls)
+        if max_workers is None:
+            max_workers = self.get_pool().get_max_size()
+        worker_count = min(max_workers, len(calls))
+        if worker_count <= 1 or self._in_transaction:
+            return [call() for call in calls]
+        results = [None] * len(calls)
+        errors = [None] * len(calls)
+        pending = iter(range(len(calls)))
+        lock = threading.Lock()
+
+        def work():
+            while True:
+                with lock:
+                    index = next(pending, None)
+                if index is None:
+                    return
+                try:
+                    results[index] = calls[index]()
+                except:
+                    errors[index] = sys.exc_info()
+
+        threads = [threading.Thread(target=work) for i in range(worker_count)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for error in errors:
+            if error is not None:
+                raise error[0], error[1], error[2]
+        return results
+
+    def doQueriesConcurrently(self, queries, dict_rows=False,
+                              max_workers=None):
+        """
+        用runConcurrently并发执行一组相互独立的SELECT语句。
+        Args:
+            queries (list[str]): SQL语句
+            dict_rows (bool): True时结果与doQueryDic相同，否则与doQuery相同
+            max_workers (int): 最大并发数，默认为连接池的最大连接数
+        Returns:
+            list: 各语句的结果行，顺序与queries相同，失败的语句为False
+        """
+        method = self.doQuery
+        if dict_rows:
+            method = self.doQueryDic
+        return self.runConcurrently([functools.partial(method, x)
+                                     for x in queries],
+                                    max_workers=max_workers)
+
+    def countValues(self, table, condition="TRUE"):
+        """返回表中满足condition的行数，查询失败时返回None。"""
+        rows = self.doQuery("SELECT COUNT(*) FROM `{0}` WHERE {1}".format(
+                            table, condition))
+        if not rows:
+            return None
+        return int(rows[0][0])
+
     def getValuesDicList_LowMem(self, table, fields, condition="TRUE", orderBy="None"):
         rows = []
         query = "SELECT "
@@ -444,6 +1271,7 @@ class DB:
             # gc.collect()
             except mdb.Error as e:
                 Log.log("Error %d: %s" % (e.args[0], e.args[1]))
+                self._connection_error(e)
                 rows = False
         # self.disconnect()
         return None
@@ -475,7 +1303,7 @@ class DB:
             fields
             print
             values
-        dstDb.insertListValues(table, fields, valuesList)
+        dstDb.bulkInsert(table, fields, [tuple(x) for x in valuesList])
 
     def dumpFileOnDB(self, file, table, field, idField, id):
         content = ""
@@ -514,3 +1342,37 @@ class DB:
         for row in rows:
             return row[field]
         return ""
+
+
+class SQLiteDB(DB):
+    """
+    与DB接口相同、数据保存在一个SQLite文件中的数据库对象，不需要MySQL服务器，
+    用于离线和单机运行以及单元测试。查询、事务、insert id、流式读取和批量
+    插入使用DB的实现，MySQL语句由sqliteLib转换为SQLite语句（包括
+    ExperimentDefinition、ResultTrace和Result类的CREATE TABLE语句）。
+    多个进程或线程可以同时使用同一个文件，写事务之间互斥。
+    """
+    def __init__(self, fileName, pool_size=None):
+        """
+        Args:
+            fileName (str): SQLite数据库文件，不存在时创建。":memory:"表示
+                内存数据库（只有一个连接，见SQLitePool）
+            pool_size (int): 连接池的最大连接数，默认DEFAULT_POOL_SIZE
+        """
+        DB.__init__(self, "localhost", fileName, None, None, port="0",
+                    pool_size=pool_size)
+        self.fileName = fileName
+
+    def get_pool(self):
+        return get_sqlite_pool(self.fileName, self.pool_size)
+
+    def _load_data_infile(self, cur, table, fields, rows):
+        """SQLite没有LOAD DATA，行在同一个事务中通过executemany插入。"""
+        query = "INSERT INTO `{0}` ({1}) VALUES ({2})".format(
+                    table, self.concatFields(fields, commas=True),
+                    ",".join(["%s"] * len(fields)))
+        count = 0
+        for batch in _batches(rows, DEFAULT_BULK_BATCH_SIZE):
+            cur.executemany(query, batch)
+            count += len(batch)
+        return count
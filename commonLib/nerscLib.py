@@ -349,10 +349,13 @@ def parseFromSQL_LowMem(dbName="nersc", hostname="", userName="nersc", password=
 
 def insertIntoDB(db, listRecords):
     print "inserting Records"
-
+    # 按字段集合分组，每组参数化批量插入
+    groups={}
     for record in listRecords:
-       # print "record", record
-        db.insertValues("summary", record.keys(), record.values())
+        keys=tuple(sorted(record.keys()))
+        groups.setdefault(keys, []).append(tuple([record[k] for k in keys]))
+    for (keys, rows) in groups.items():
+        db.bulkInsert("summary", list(keys), rows)
 
 def insertIntoDBMany(db, listRecords):
     print "inserting Records"
@@ -0,0 +1,516 @@
+"""
+SQLite连接的MySQLdb兼容封装，以及MySQL方言到SQLite的转换，供
+DBManager.SQLiteDB使用。
+
+- SQLiteConnection/SQLiteCursor提供DB用到的MySQLdb连接和游标接口
+  （autocommit、commit、rollback、insert_id、ping、DictCursor、fetchmany），
+  sqlite3的异常被转换为对应的MySQLdb异常，DB中的错误处理不需要修改。
+- translate_query将一条MySQL语句转换为一条或多条SQLite语句:
+  * 字符串字面量（单引号或双引号，MySQL反斜杠转义）和%s占位符都转换为
+    参数，二进制数据（例如MySQLdb.escape_string转义的直方图）原样写入。
+  * CREATE TABLE: AUTO_INCREMENT列转换为INTEGER PRIMARY KEY AUTOINCREMENT，
+    去掉unsigned、ENGINE、CHARSET、COMMENT、#注释等，datetime和timestamp列
+    读取时转换为datetime对象，KEY/INDEX转换为单独的CREATE INDEX。
+  * ALTER TABLE ADD/DROP INDEX、CREATE/DROP INDEX转换为SQLite的索引语句，
+    索引名加上表名前缀。
+  * SHOW COLUMNS、SHOW INDEX、SHOW TABLES转换为对sqlite_master和pragma的
+    查询，返回的列与MySQL相同（前几列）。
+  * EXPLAIN SELECT转换为EXPLAIN QUERY PLAN，返回SQLite的查询计划。
+  * 多表UPDATE（UPDATE a JOIN b ON ... SET ...）转换为UPDATE ... FROM，
+    CREATE/DROP TEMPORARY TABLE转换为SQLite的临时表语句。
+  * DISABLE/ENABLE KEYS、SET、LOCK TABLES等没有对应操作的语句被忽略，
+    FOR UPDATE被去掉（事务以BEGIN IMMEDIATE开始，已经串行化写操作）。
+"""
+import MySQLdb as mdb
+import MySQLdb.cursors
+import datetime
+import re
+import sqlite3
+
+# 等待其他连接释放数据库锁的秒数
+DEFAULT_BUSY_TIMEOUT = 60
+
+# 字符串字面量、反引号标识符、#注释、%占位符
+_TOKEN_RE = re.compile(r"""'(?:[^'\\]|\\.|'')*'"""
+                       r'''|"(?:[^"\\]|\\.|"")*"'''
+                       r"""|`[^`]*`|#[^\n]*|%[s%]""", re.S)
+_MYSQL_ESCAPES = {"0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t",
+                  "Z": "\x1a", "%": "\\%", "_": "\\_"}
+_ESCAPE_RE = re.compile(r"\\(.)", re.S)
+_CREATE_RE = re.compile(r"^\s*CREATE\s+(TEMPORARY\s+)?TABLE\s+"
+                        r"(IF\s+NOT\s+EXISTS\s+)?"
+                        r"(`[^`]+`|\w+)\s*\((.*)\)([^)]*)$", re.S | re.I)
+_ALTER_ADD_RE = re.compile(r"^\s*ALTER\s+TABLE\s+(`[^`]+`|\w+)\s+ADD\s+"
+                           r"(COLUMN\s+)?(.*)$", re.S | re.I)
+_SHOW_COLUMNS_RE = re.compile(r"^\s*(SHOW\s+(FULL\s+)?(COLUMNS|FIELDS)\s+"
+                              r"FROM|DESCRIBE|DESC)\s+(`[^`]+`|\w+)\s*;?\s*$",
+                              re.S | re.I)
+_SHOW_TABLES_RE = re.compile(r"^\s*SHOW\s+TABLES\s*;?\s*$", re.I)
+_IGNORED_RE = re.compile(r"^\s*(ALTER\s+TABLE\s+\S+\s+(DISABLE|ENABLE)\s+KEYS"
+                         r"|SET\s|LOCK\s+TABLES|UNLOCK\s+TABLES)", re.I)
+_FOR_UPDATE_RE = re.compile(r"\s+(FOR\s+UPDATE|LOCK\s+IN\s+SHARE\s+MODE)"
+                            r"\s*;?\s*$", re.I)
+_KEY_RE = re.compile(r"^(UNIQUE\s+|PRIMARY\s+|FULLTEXT\s+)?(?:(KEY|INDEX)\b)?\s*"
+                     r"(`[^`]+`|\w+)?\s*(\(.*\))$", re.S | re.I)
+_COLUMN_DROP_RE = re.compile(r"\b(unsigned|zerofill)\b"
+                             r"|\bON\s+UPDATE\s+CURRENT_TIMESTAMP\b"
+                             r"|\b(CHARACTER\s+SET|CHARSET|COLLATE)\s+\w+"
+                             r"|\bCOMMENT\s+'(?:[^']|'')*'", re.I)
+_DATETIME_TYPE_RE = re.compile(r"^(datetime|timestamp)\b(\s*\(\d+\))?", re.I)
+_ENUM_TYPE_RE = re.compile(r"^(enum|set)\s*\((?:[^)']|'(?:[^']|'')*')*\)",
+                           re.I)
+_AUTO_INCREMENT_RE = re.compile(r"\bAUTO_INCREMENT\b", re.I)
+_ADD_INDEX_RE = re.compile(r"^\s*ALTER\s+TABLE\s+(`[^`]+`|\w+)\s+ADD\s+"
+                           r"(UNIQUE\s+)?(INDEX|KEY)\s+(`[^`]+`|\w+)\s*"
+                           r"(\(.*\))\s*;?\s*$", re.S | re.I)
+_CREATE_INDEX_RE = re.compile(r"^\s*CREATE\s+(UNIQUE\s+)?INDEX\s+"
+                              r"(IF\s+NOT\s+EXISTS\s+)?(`[^`]+`|\w+)\s+ON\s+"
+                              r"(`[^`]+`|\w+)\s*(\(.*\))\s*;?\s*$",
+                              re.S | re.I)
+_DROP_INDEX_RE = re.compile(r"^\s*(ALTER\s+TABLE\s+(`[^`]+`|\w+)\s+DROP\s+"
+                            r"(INDEX|KEY)\s+(`[^`]+`|\w+)|DROP\s+INDEX\s+"
+                            r"(`[^`]+`|\w+)\s+ON\s+(`[^`]+`|\w+))\s*;?\s*$",
+                            re.S | re.I)
+_SHOW_INDEX_RE = re.compile(r"^\s*SHOW\s+(INDEX|INDEXES|KEYS)\s+(FROM|IN)\s+"
+                            r"(`[^`]+`|\w+)\s*;?\s*$", re.S | re.I)
+_EXPLAIN_RE = re.compile(r"^\s*EXPLAIN\s+(?!QUERY\s+PLAN\b)", re.I)
+_DROP_TEMPORARY_RE = re.compile(r"^\s*DROP\s+TEMPORARY\s+TABLE\b", re.I)
+_UPDATE_JOIN_RE = re.compile(r"^\s*UPDATE\s+(`[^`]+`|\w+)"
+                             r"((?:\s+AS)?\s+(?!INNER\b|JOIN\b)\w+)?"
+                             r"\s+(?:INNER\s+)?JOIN\s+(`[^`]+`|\w+)"
+                             r"((?:\s+AS)?\s+(?!ON\b)\w+)?\s+ON\s+(.*?)"
+                             r"\s+SET\s+(.*?)(?:\s+WHERE\s+(.*?))?\s*;?\s*$",
+                             re.S | re.I)
+# SET子句中被赋值的列前的表名或别名，SQLite的UPDATE不允许限定被赋值的列
+_SET_QUALIFIER_RE = re.compile(r"(^|,)\s*(?:`[^`]+`|\w+)\.(`[^`]+`|\w+)\s*=")
+
+# translate_query参数模板中表示“第i个调用参数”的标记
+class _Arg(object):
+    def __init__(self, index):
+        self.index = index
+
+
+def _unescape(literal):
+    """将MySQL字符串字面量（含引号）转换为其值。"""
+    quote = literal[0]
+    value = literal[1:-1].replace(quote * 2, quote)
+    return _ESCAPE_RE.sub(lambda m: _MYSQL_ESCAPES.get(m.group(1),
+                                                       m.group(1)), value)
+
+
+def _sqlite_literal(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _tokenize(query, inline_literals=False, has_args=False):
+    """去掉#注释，并将字符串字面量和%s占位符替换为?。返回(sql, template)，
+    template中的元素为常量值或_Arg。inline_literals为True时（DDL语句不能
+    使用参数）字面量被改写为SQLite格式的字面量。"""
+    template = []
+    arg_count = [0]
+
+    def replace(match):
+        token = match.group(0)
+        first = token[0]
+        if first in "'\"":
+            if inline_literals:
+                return _sqlite_literal(_unescape(token))
+            template.append(_unescape(token))
+            return "?"
+        if first == "#":
+            return ""
+        if first == "`" or not has_args:
+            return token
+        if token == "%%":
+            return "%"
+        template.append(_Arg(arg_count[0]))
+        arg_count[0] += 1
+        return "?"
+
+    return _TOKEN_RE.sub(replace, query), template
+
+
+def _split_top_level(body):
+    """按不在括号内的逗号拆分CREATE TABLE的定义列表。"""
+    parts = []
+    depth = 0
+    start = 0
+    for (pos, char) in enumerate(body):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(body[start:pos])
+            start = pos + 1
+    parts.append(body[start:])
+    return [x.strip() for x in parts if x.strip()]
+
+
+def _split_column(definition):
+    """返回列定义的(列名, 其余部分)。"""
+    if definition.startswith("`"):
+        end = definition.index("`", 1) + 1
+    else:
+        end = len(definition.split(None, 1)[0])
+    return definition[:end], definition[end:].strip()
+
+
+def _strip_name(name):
+    return name.strip("`")
+
+
+def _index_name(table, name):
+    """MySQL的索引名在表内唯一，SQLite的索引名在数据库内唯一，因此SQLite
+    中的索引名加上表名前缀。"""
+    return "{0}_{1}".format(_strip_name(table), _strip_name(name))
+
+
+def _translate_column(rest):
+    """转换列定义中列名之后的部分（类型和属性）。"""
+    rest = _DATETIME_TYPE_RE.sub("DATETIME", rest)
+    rest = _ENUM_TYPE_RE.sub("TEXT", rest)
+    rest = _COLUMN_DROP_RE.sub("", rest)
+    return " ".join(rest.split())
+
+
+def translate_create_table(query):
+    """将MySQL的CREATE TABLE语句转换为SQLite语句列表（建表语句和
+    CREATE INDEX语句）。"""
+    query = _tokenize(query, inline_literals=True)[0].strip().rstrip(";")
+    match = _CREATE_RE.match(query)
+    if not match:
+        return [query]
+    (temporary, if_not_exists, table, body, options) = match.groups()
+    table_name = _strip_name(table)
+    columns = []
+    constraints = []
+    indexes = []
+    primary_key = None
+    auto_column = None
+    for definition in _split_top_level(body):
+        key_match = _KEY_RE.match(definition)
+        upper = definition.upper()
+        if key_match and (key_match.group(1) or key_match.group(2)):
+            (kind, keyword, key_name, key_columns) = key_match.groups()
+            kind = (kind or "").strip().upper()
+            if kind == "PRIMARY":
+                primary_key = key_columns
+            elif kind == "UNIQUE":
+                constraints.append("UNIQUE " + key_columns)
+            elif kind == "":
+                indexes.append("CREATE INDEX {0}`{1}` ON `{2}` {3}".format(
+                               "IF NOT EXISTS " if if_not_exists else "",
+                               _index_name(table_name,
+                                           key_name or str(len(indexes))),
+                               table_name, key_columns))
+            continue
+        if upper.startswith("CONSTRAINT") or upper.startswith("FOREIGN"):
+            constraints.append(definition)
+            continue
+        (name, rest) = _split_column(definition)
+        rest = _translate_column(rest)
+        if _AUTO_INCREMENT_RE.search(rest):
+            auto_column = _strip_name(name)
+            rest = "INTEGER PRIMARY KEY AUTOINCREMENT"
+        columns.append("{0} {1}".format(name, rest))
+    # SQLite的自增列本身就是主键，MySQL中包含自增列的复合主键不再需要
+    if primary_key is not None and auto_column is None:
+        constraints.insert(0, "PRIMARY KEY " + primary_key)
+    statements = ["CREATE {0}TABLE {1}{2} ({3})".format(
+                  "TEMPORARY " if temporary else "",
+                  "IF NOT EXISTS " if if_not_exists else "", table,
+                  ", ".join(columns + constraints))]
+    return statements + indexes
+
+
+def translate_query(query, args=None):
+    """
+    将一条MySQL语句转换为SQLite语句。
+    Args:
+        query (str): MySQL语句
+        args (list): 语句中%s占位符对应的参数，None表示语句不使用参数
+            （与MySQLdb一致，此时%不是格式字符）
+    Returns:
+        list: [(sql, template)]，template为参数模板，由bind_args与调用参数
+            合并为sqlite3的参数列表。被忽略的语句返回空列表。
+    """
+    has_args = args is not None
+    if _IGNORED_RE.match(query):
+        return []
+    match = _SHOW_COLUMNS_RE.match(query)
+    if match:
+        return [("SELECT name, type, CASE WHEN \"notnull\" THEN 'NO' ELSE "
+                 "'YES' END, CASE WHEN pk THEN 'PRI' ELSE '' END, dflt_value, "
+                 "'' FROM pragma_table_info(?)", [_strip_name(match.group(4))])]
+    if _SHOW_TABLES_RE.match(query):
+        return [("SELECT name FROM sqlite_master WHERE type='table' AND "
+                 "name NOT LIKE 'sqlite_%' ORDER BY name", [])]
+    match = _SHOW_INDEX_RE.match(query)
+    if match:
+        table = _strip_name(match.group(3))
+        prefix = table + "_"
+        return [("SELECT ? AS `Table`, NOT il.\"unique\" AS Non_unique, "
+                 "CASE WHEN il.origin='pk' THEN 'PRIMARY' "
+                 "WHEN substr(il.name, 1, ?)=? THEN substr(il.name, ?) "
+                 "ELSE il.name END AS Key_name, "
+                 "ii.seqno+1 AS Seq_in_index, ii.name AS Column_name "
+                 "FROM pragma_index_list(?) il, pragma_index_info(il.name) ii "
+                 "ORDER BY il.name, ii.seqno",
+                 [table, len(prefix), prefix, len(prefix) + 1, table])]
+    if _CREATE_RE.match(query):
+        return [(x, []) for x in translate_create_table(query)]
+    match = _ADD_INDEX_RE.match(query) or _CREATE_INDEX_RE.match(query)
+    if match:
+        if match.re is _ADD_INDEX_RE:
+            (table, unique, keyword, name, columns) = match.groups()
+            if_not_exists = None
+        else:
+            (unique, if_not_exists, name, table, columns) = match.groups()
+        return [("CREATE {0}INDEX {1}`{2}` ON {3} {4}".format(
+                 "UNIQUE " if unique else "",
+                 "IF NOT EXISTS " if if_not_exists else "",
+                 _index_name(table, name), table, columns), [])]
+    match = _DROP_INDEX_RE.match(query)
+    if match:
+        groups = match.groups()
+        if groups[1] is not None:
+            (table, name) = (groups[1], groups[3])
+        else:
+            (name, table) = (groups[4], groups[5])
+        return [("DROP INDEX `{0}`".format(_index_name(table, name)), [])]
+    match = _ALTER_ADD_RE.match(query)
+    if match:
+        sql = _tokenize(query, inline_literals=True)[0]
+        match = _ALTER_ADD_RE.match(sql)
+        (name, rest) = _split_column(match.group(3).strip().rstrip(";"))
+        return [("ALTER TABLE {0} ADD COLUMN {1} {2}".format(
+                 match.group(1), name, _translate_column(rest)), [])]
+    (sql, template) = _tokenize(query, has_args=has_args)
+    sql = _FOR_UPDATE_RE.sub("", sql)
+    sql = _EXPLAIN_RE.sub("EXPLAIN QUERY PLAN ", sql)
+    sql = _DROP_TEMPORARY_RE.sub("DROP TABLE", sql)
+    return [_translate_update_join(sql, template)]
+
+
+def _translate_update_join(sql, template):
+    """将MySQL的多表UPDATE转换为SQLite的UPDATE ... FROM，JOIN的条件与
+    WHERE条件合并。ON条件移到了SET之后，参数模板相应地重新排序。
+    返回(sql, template)。"""
+    match = _UPDATE_JOIN_RE.match(sql)
+    if not match:
+        return sql, template
+    (table, alias, join_table, join_alias, on, assignments,
+     where) = match.groups()
+    on_count = on.count("?")
+    set_count = assignments.count("?")
+    template = (template[on_count:on_count + set_count] +
+                template[:on_count] + template[on_count + set_count:])
+    assignments = _SET_QUALIFIER_RE.sub(r"\1 \2 =", assignments).strip()
+    # SQLite中UPDATE的目标表的别名必须使用AS
+    if alias:
+        alias = " AS " + alias.split()[-1]
+    condition = "({0})".format(on)
+    if where:
+        condition += " AND ({0})".format(where)
+    return ("UPDATE {0}{1} SET {2} FROM {3}{4} WHERE {5}".format(
+            table, alias or "", assignments, join_table, join_alias or "",
+            condition), template)
+
+
+def bind_args(template, args):
+    """由translate_query的参数模板和调用参数生成sqlite3的参数列表。"""
+    if args is None:
+        args = ()
+    params = []
+    for item in template:
+        if isinstance(item, _Arg):
+            params.append(_adapt(args[item.index]))
+        else:
+            params.append(item)
+    return params
+
+
+def _adapt(value):
+    """将MySQLdb接受但sqlite3不接受的参数类型转换为sqlite3类型。"""
+    if isinstance(value, bool):
+        return int(value)
+    if hasattr(value, "dtype") and hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def _convert_datetime(value):
+    """DATETIME列的转换函数。与MySQLdb一致，0或无法解析的值返回None。"""
+    for pattern in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S",
+                    "%Y-%m-%d"):
+        try:
+            return datetime.datetime.strptime(value, pattern)
+        except ValueError:
+            pass
+    return None
+
+
+def _now():
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+sqlite3.register_converter("DATETIME", _convert_datetime)
+
+
+def _to_mysql_error(e):
+    """将sqlite3异常转换为对应的MySQLdb异常，错误码为0。"""
+    if isinstance(e, sqlite3.IntegrityError):
+        error_class = mdb.IntegrityError
+    elif isinstance(e, sqlite3.OperationalError):
+        error_class = mdb.OperationalError
+    elif isinstance(e, sqlite3.ProgrammingError):
+        error_class = mdb.ProgrammingError
+    else:
+        error_class = mdb.DatabaseError
+    return error_class(0, str(e))
+
+
+class SQLiteConnection(object):
+    """
+    具有DB所用MySQLdb连接接口的SQLite连接。以autocommit模式创建，
+    autocommit(False)之后的第一条语句以BEGIN IMMEDIATE开始一个事务，
+    commit()或rollback()结束该事务。文件数据库使用WAL日志模式，读操作不会
+    被写事务阻塞。
+    """
+    def __init__(self, file_name, timeout=DEFAULT_BUSY_TIMEOUT):
+        try:
+            self._con = sqlite3.connect(
+                            file_name, timeout=timeout, isolation_level=None,
+                            detect_types=sqlite3.PARSE_DECLTYPES,
+                            check_same_thread=False)
+            self._con.text_factory = str
+            self._con.create_function("now", 0, _now)
+            if file_name != ":memory:":
+                self._con.execute("PRAGMA journal_mode=WAL")
+                self._con.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.Error as e:
+            raise _to_mysql_error(e)
+        self._autocommit = True
+        self._in_transaction = False
+        self._insert_id = 0
+
+    def cursor(self, cursorclass=None):
+        dict_rows = (cursorclass is not None and
+                     issubclass(cursorclass,
+                                MySQLdb.cursors.CursorDictRowsMixIn))
+        return SQLiteCursor(self, dict_rows)
+
+    def autocommit(self, on):
+        if on and self._in_transaction:
+            self.commit()
+        self._autocommit = bool(on)
+
+    def begin(self):
+        """autocommit关闭且没有进行中的事务时开始一个事务。"""
+        if not self._autocommit and not self._in_transaction:
+            self._execute("BEGIN IMMEDIATE")
+            self._in_transaction = True
+
+    def commit(self):
+        if self._in_transaction:
+            self._in_transaction = False
+            self._execute("COMMIT")
+
+    def rollback(self):
+        if self._in_transaction:
+            self._in_transaction = False
+            self._execute("ROLLBACK")
+
+    def insert_id(self):
+        return self._insert_id
+
+    def ping(self):
+        self._execute("SELECT 1")
+
+    def close(self):
+        try:
+            self._con.close()
+        except sqlite3.Error as e:
+            raise _to_mysql_error(e)
+
+    def _execute(self, sql):
+        try:
+            self._con.execute(sql)
+        except sqlite3.Error as e:
+            raise _to_mysql_error(e)
+
+
+class SQLiteCursor(object):
+    """具有DB所用MySQLdb游标接口的SQLite游标。查询先经过translate_query
+    转换，结果行为元组，dict_rows为True时为{列名: 值}的字典。"""
+    def __init__(self, connection, dict_rows=False):
+        self._connection = connection
+        self._dict_rows = dict_rows
+        self._cur = None
+        self.description = None
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def execute(self, query, args=None):
+        return self._run(query, args, many=False)
+
+    def executemany(self, query, args):
+        return self._run(query, args, many=True)
+
+    def _run(self, query, args, many):
+        statements = translate_query(query, args if not many else ())
+        self._cur = None
+        self.description = None
+        self.rowcount = 0
+        try:
+            self._connection.begin()
+            for (sql, template) in statements:
+                cur = self._connection._con.cursor()
+                if many:
+                    cur.executemany(sql, [bind_args(template, x)
+                                          for x in args])
+                else:
+                    cur.execute(sql, bind_args(template, args))
+                self._cur = cur
+                self.description = cur.description
+                self.rowcount = cur.rowcount
+                if cur.lastrowid:
+                    self.lastrowid = cur.lastrowid
+                    self._connection._insert_id = cur.lastrowid
+        except sqlite3.Error as e:
+            raise _to_mysql_error(e)
+        return self.rowcount
+
+    def _format(self, rows):
+        if self._dict_rows:
+            names = [x[0] for x in self.description]
+            return tuple([dict(zip(names, row)) for row in rows])
+        return tuple(rows)
+
+    def fetchall(self):
+        if self._cur is None or self.description is None:
+            return ()
+        try:
+            return self._format(self._cur.fetchall())
+        except sqlite3.Error as e:
+            raise _to_mysql_error(e)
+
+    def fetchmany(self, size):
+        if self._cur is None or self.description is None:
+            return ()
+        try:
+            return self._format(self._cur.fetchmany(size))
+        except sqlite3.Error as e:
+            raise _to_mysql_error(e)
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        if not rows:
+            return None
+        return rows[0]
+
+    def close(self):
+        if self._cur is not None:
+            self._cur.close()
+            self._cur = None
@@ -0,0 +1,172 @@
+"""
+可重用的背景工作负载与工作流叠加。
+
+同一种子、机器和时间范围的实验常常只在注入的工作流上不同（manifest、份额、
+周期和处理方式）。在周期（period）策略下，工作流由RepeatingAlarmTimer在背景
+作业的时间步上注入，注入本身不使用随机数，所以背景作业流与注入的工作流无关：
+
+- 生成背景工作负载时，BackgroundRecorder记录每个时间步的提交时间、作业ID计数
+  器以及RecordingTraceGenerator收到的背景作业，得到BackgroundStream，它可以
+  保存到文件中并被不同的工作流变体重用。
+- BackgroundStream.replay按时间步将背景作业重新加入一个配置了工作流定时器的
+  WorkloadGenerator，并在每个时间步之后触发这些定时器。工作流作业占用的作业ID
+  使之后的背景作业ID顺延，所以结果与完整生成的工作负载逐字节相同。
+
+重放前应将全局随机生成器设为NoRandomGen：如果注入工作流需要随机数（例如在多个
+manifest之间随机选择），重放抛出RandomNeededError，此时工作流会改变背景作业流，
+调用者应回退到完整生成。按比例（percentage）注入的工作流替代背景作业，过载
+控制器根据包括工作流在内的已提交作业决定提交，这两种情况不能叠加。
+"""
+import cPickle
+
+from generate.pattern import PatternTimer
+from slurm.trace_gen import TraceGenerator
+
+
+class RandomNeededError(Exception):
+    """重放工作流时使用了随机数。"""
+    pass
+
+
+class NoRandomGen(object):
+    """访问任何方法都抛出RandomNeededError的随机生成器。"""
+
+    def __getattr__(self, name):
+        raise RandomNeededError("Random value requested while overlaying "
+                                "workflows: {0}".format(name))
+
+
+class RecordingTraceGenerator(TraceGenerator):
+    """记录每次add_job调用的参数和reset_work调用位置的TraceGenerator。"""
+
+    def __init__(self):
+        super(RecordingTraceGenerator, self).__init__()
+        self._records = []
+        self._reset_pos = None
+
+    def add_job(self, job_id, username, submit_time, duration, wclimit, tasks,
+                cpus_per_task, tasks_per_node, qosname, partition, account,
+                reservation="", dependency="", workflow_manifest=None,
+                cores_s=None, ignore_work=False, real_core_s=None):
+        record = (job_id, username, submit_time, duration, wclimit, tasks,
+                  cpus_per_task, tasks_per_node, qosname, partition, account,
+                  reservation, dependency, workflow_manifest, cores_s,
+                  ignore_work, real_core_s)
+        self._records.append(record)
+        super(RecordingTraceGenerator, self).add_job(*record)
+
+    def reset_work(self):
+        self._reset_pos = len(self._records)
+        super(RecordingTraceGenerator, self).reset_work()
+
+    def get_records(self):
+        return self._records
+
+    def get_reset_pos(self):
+        return self._reset_pos
+
+
+class BackgroundRecorder(PatternTimer):
+    """在每个时间步的最后被触发，记录该时间步结束时背景作业流的位置。必须是
+    WorkloadGenerator中最后注册的定时器，其trace_generator必须是
+    RecordingTraceGenerator。"""
+
+    def __init__(self, workload_generator):
+        super(BackgroundRecorder, self).__init__(None)
+        self._workload_generator = workload_generator
+        self._steps = []
+
+    def do_trigger(self, create_time):
+        self._steps.append(
+                (create_time,
+                 self._workload_generator._job_id_counter,
+                 len(self._workload_generator._trace_generator.get_records())))
+        return 0
+
+    def can_be_purged(self):
+        return False
+
+    def get_stream(self):
+        """返回记录的背景作业流。"""
+        trace_generator = self._workload_generator._trace_generator
+        return BackgroundStream(self._register_timestamp, self._steps,
+                                trace_generator.get_records(),
+                                trace_generator.get_reset_pos())
+
+
+class BackgroundStream(object):
+    """背景作业流：时间步列表和按顺序提交的背景作业。"""
+
+    def __init__(self, start_time, steps, records, reset_pos=None):
+        """
+        Args:
+            start_time (int): 工作负载开始的epoch时间戳
+            steps (list): 每个时间步的(提交时间, 该时间步背景作业之后的作业
+                ID计数器, 该时间步结束时已提交的背景作业数)
+            records (list): 背景作业的TraceGenerator.add_job参数
+            reset_pos (int): 调用TraceGenerator.reset_work时已提交的作业数，
+                没有调用时为None
+        """
+        self._start_time = start_time
+        self._steps = steps
+        self._records = records
+        self._reset_pos = reset_pos
+
+    def replay(self, workload_generator):
+        """
+        将背景作业加入workload_generator的TraceGenerator，并在每个时间步之后
+        触发其注册的定时器。
+        Args:
+            workload_generator (WorkloadGenerator): 只注册了工作流定时器的
+                新工作负载生成器
+        Returns:
+            int: 与WorkloadGenerator.generate_trace相同的生成作业数：每个时间步
+                计一个背景作业，加上定时器提交的作业
+        Raises:
+            RandomNeededError: 全局随机生成器为NoRandomGen且定时器使用了随机数
+        """
+        trace_generator = workload_generator._trace_generator
+        for timer in workload_generator._pattern_timers:
+            timer.register_time(self._start_time)
+        jobs_generated = len(self._steps)
+        pos = 0
+        offset = 0
+        for (create_time, job_id_counter, records_end) in self._steps:
+            pos = self._add_records(trace_generator, pos, records_end, offset)
+            workload_generator._job_id_counter = job_id_counter + offset
+            jobs_generated += (workload_generator.
+                               _pattern_generator_timers_trigger(create_time))
+            offset = workload_generator._job_id_counter - job_id_counter
+        self._add_records(trace_generator, pos, len(self._records), offset)
+        if self._reset_pos == len(self._records):
+            trace_generator.reset_work()
+        print("{0} jobs generated".format(jobs_generated))
+        return jobs_generated
+
+    def _add_records(self, trace_generator, start, end, offset):
+        for pos in range(start, end):
+            if pos == self._reset_pos:
+                trace_generator.reset_work()
+            record = list(self._records[pos])
+            record[0] += offset
+            trace_generator.add_job(*record)
+        return end
+
+    def save(self, file_route):
+        """将背景作业流序列化保存到file_route。"""
+        output = open(file_route, "wb")
+        try:
+            cPickle.dump((self._start_time, self._steps, self._records,
+                          self._reset_pos), output, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            output.close()
+
+    @classmethod
+    def load(cls, file_route):
+        """读取save保存的背景作业流。"""
+        pkl_file = open(file_route, "rb")
+        try:
+            (start_time, steps, records, reset_pos) = cPickle.load(pkl_file)
+        finally:
+            pkl_file.close()
+        return cls(start_time, steps, records, reset_pos)
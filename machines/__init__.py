@@ -181,7 +181,9 @@ class Machine(object):
                                           max_filter=self._inter_times_filter)
         # 计算事件间隔时间的直方图，使用1作为区间大小
         # 区间大小的选择是为了在细节和直方图可读性之间取得平衡
-        bins, edges = calculate_histogram(inter_times, interval_size=1)
+        # 稀疏分箱只生成非空区间，开销与作业数成正比而与间隔的取值范围无关
+        bins, edges = calculate_histogram(inter_times, interval_size=1,
+                                          binning="sparse")
         # 任何数字都可以，包括小数
         # 根据直方图数据计算事件间隔时间的概率映射
         # 使用 "absnormal" 区间策略来处理概率映射计算中的特殊情况
@@ -202,7 +204,8 @@ class Machine(object):
         # 生成核心数的直方图分布数据
         # 使用预设的节点核心容量作为分箱间隔大小，保证结果为该数值的整数倍
         bins, edges = calculate_histogram(cores,
-                                          interval_size=self._cores_per_node)
+                                          interval_size=self._cores_per_node,
+                                          binning="sparse")
 
         # 基于低区间优先策略生成概率映射
         # 强制概率值按节点核心容量进行粒度对齐，保证输出结果的可调度性
@@ -223,7 +226,8 @@ class Machine(object):
 
         # 生成直方图数据：bins表示各区间计数，edges表示区间边界
         # interval_size=1表示使用1分钟作为直方图区间宽度
-        bins, edges = calculate_histogram(wallclock, interval_size=1)
+        bins, edges = calculate_histogram(wallclock, interval_size=1,
+                                          binning="sparse")
         # Any number is good, with decimals
 
         # 根据直方图数据构建概率映射，用于后续的概率抽样
@@ -250,7 +254,8 @@ class Machine(object):
                 continue
             accuracy.append(float(a) / float(r))
 
-        bins, edges = calculate_histogram(accuracy, interval_size=0.01)
+        bins, edges = calculate_histogram(accuracy, interval_size=0.01,
+                                          binning="sparse")
 
         # Any number is good, with decimals
         return calculate_probability_map(bins, edges)
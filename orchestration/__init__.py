@@ -1,4 +1,5 @@
-from commonLib.DBManager import DB
+from commonLib.DBManager import DB, get_db, query_stats
+from commonLib.Logging import Log
 from orchestration.definition import (ExperimentDefinition, 
                                       GroupExperimentDefinition,
                                       DeltaExperimentDefinition)
@@ -7,10 +8,17 @@ from orchestration.running import ExperimentRunner
 from orchestration.analyzing import (AnalysisRunnerSingle,
                                      AnalysisRunnerDelta,
                                      AnalysisGroupRunner)
+from orchestration.scheduling import DependencyScheduler
 from time import sleep
 from stats import  NumericStats
 
+import multiprocessing
 import os
+import Queue
+import signal
+import sys
+import threading
+import traceback
 
 """ orchestration 文件夹通常用于存放与工作流编排、任务调度和协调相关的代码 """
 
@@ -35,12 +43,14 @@ def get_central_db(dbName="workload"):
         ANALYSIS_DB_USER: 数据库账号，未设置时使用root
         ANALYSIS_DB_PASS: 数据库密码，未设置时使用空字符串
         ANALYSIS_DB_PORT: 数据库服务端口，未设置时使用3306
+        SQLITE_DB_DIR: 设置时使用该目录下的SQLite文件代替MySQL服务器
+            （见commonLib.DBManager.get_db）
     """
-    return DB(os.getenv("ANALYSIS_DB_HOST", "127.0.0.1"),
-              os.getenv("ANALYSIS_DB_NAME", dbName),
-              os.getenv("ANALYSIS_DB_USER", "root"),
-              os.getenv("ANALYSIS_DB_PASS", ""),
-              os.getenv("ANALYSIS_DB_PORT", "3306"))
+    return get_db(os.getenv("ANALYSIS_DB_HOST", "127.0.0.1"),
+                  os.getenv("ANALYSIS_DB_NAME", dbName),
+                  os.getenv("ANALYSIS_DB_USER", "root"),
+                  os.getenv("ANALYSIS_DB_PASS", ""),
+                  os.getenv("ANALYSIS_DB_PORT", "3306"))
 
 
 def get_sim_db(hostname="127.0.0.1"):
@@ -61,6 +71,31 @@ def get_sim_db(hostname="127.0.0.1"):
                os.getenv("SLURMDB_USER", None),
                os.getenv("SLURMDB_PASS", None),
                os.getenv("SLURMDB_PORT","3306"))
+
+
+def dump_query_stats(trace_id):
+    """开启了DB语句统计（commonLib.DBManager.query_stats）时，记录本进程
+    自上次调用以来总耗时最多的语句并清空统计。Worker在每个实验结束时调用。
+    """
+    if not query_stats.is_enabled():
+        return
+    Log.log("DB statements of experiment {0}:\n{1}".format(
+            trace_id, query_stats.format_summary()))
+    query_stats.reset()
+
+
+# 分析池的模式：(认领前的状态, 分析中的状态列表)。子进程异常退出时，它认领的
+# 处于分析中状态的实验被恢复到认领前的状态。第二遍分析的三个实验全部完成前
+# 都算作分析中，恢复后整组重新分析。
+ANALYSIS_POOL_MODES = {
+    "single": ("simulation_done", ["pre_analyzing"]),
+    "second_pass": ("analysis_done", ["pre_second_pass", "second_pass_done"]),
+    "grouped": ("pending", ["pre_analyzing"]),
+    "grouped_second_pass": ("analysis_done", ["pre_second_pass",
+                                              "second_pass_done"]),
+    "delta": ("pending", ["pre_analyzing"]),
+}
+
     
 class ExperimentWorker(object):
     """该类检索实验配置、创建相应的工作负载、配置slurm实验运行器、运行实验并将结果存储在分析数据库中。
@@ -98,9 +133,65 @@ class ExperimentWorker(object):
                                                  ed._trace_id)
                 else:
                     print "Exp({0}) Error!".format(
-                    # 如果处理特定的trace_id，则只运行一次实验                                     ed._trace_id)
+                                                 ed._trace_id)
+                dump_query_stats(ed._trace_id)
+            # 如果处理特定的trace_id，则只运行一次实验
             if trace_id:
                 break  
+
+    def do_work_pipelined(self, central_db_obj, sched_db_obj, queue_size=1):
+        """以流水线方式运行所有"fresh"状态的实验。模拟当前实验时，准备线程
+        认领下一个实验、生成并放置其工作负载文件（ExperimentRunner.
+        stage_trace_file），存储线程验证并存储上一个实验的结果轨迹。从调度器
+        数据库导入轨迹在下一次模拟开始前完成，因为下一次模拟会覆盖调度器
+        数据库。
+        Args:
+        - central_db_obj: 配置为访问分析数据库的DB对象.
+        - sched_db_obj: 配置为访问实验工作者的slurm数据库的DB对象.
+        - queue_size: 已准备但未模拟的实验数和已导入但未存储的轨迹数的上限，
+            限制预先认领的实验数和内存中的轨迹数。
+        Returns:
+        - int: 模拟的实验数。
+        出错时已认领但尚未模拟的实验（包括出错时正在重启工作节点的实验）被
+        恢复到"fresh"状态，出错时正在模拟或导入的实验被标记为
+        "simulation_failed"，已导入的轨迹仍被存储，然后重新抛出异常。
+        """
+        prepared = Queue.Queue(queue_size)
+        imported = Queue.Queue(queue_size)
+        stop = threading.Event()
+        preparer = threading.Thread(target=_prepare_experiments,
+                                    args=(central_db_obj, prepared, stop))
+        storer = threading.Thread(target=_store_experiments,
+                                  args=(central_db_obj, imported))
+        preparer.start()
+        storer.start()
+        count = 0
+        try:
+            while True:
+                er = prepared.get()
+                if er is None:
+                    break
+                print "开始运行的实验trace id为：{0}，实验名称为:{1}".format(
+                                er._definition._trace_id, er._definition._name)
+                try:
+                    er.run_staged_simulation(central_db_obj)
+                    result_trace = er.import_trace(sched_db_obj)
+                except:
+                    exc_info = sys.exc_info()
+                    _abort_experiment(er, central_db_obj)
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                imported.put((er, result_trace))
+                count += 1
+        finally:
+            stop.set()
+            preparer.join()
+            while not prepared.empty():
+                er = prepared.get()
+                if er is not None:
+                    _release_staged_experiment(er, central_db_obj)
+            imported.put(None)
+            storer.join()
+        return count
     
     def rescue_exp(self, central_db_obj, sched_db_obj, trace_id=None):
         """从实验工作者的数据库中检索工作跟踪，并将其存储在中央数据库中。
@@ -116,7 +207,8 @@ class ExperimentWorker(object):
                 ed.load(central_db_obj, trace_id)
                 ed.mark_simulation_done(central_db_obj)
             else:
-                there_are_more = ed.load_next_state("simulation_failed",
+                there_are_more = ed.load_next_state(central_db_obj,
+                                                    "simulation_failed",
                                                     "simulation_done")
             if there_are_more:
                 print "About to run resque({0}):{1}".format(
@@ -129,9 +221,119 @@ class ExperimentWorker(object):
                 else:
                     print "Exp({0}) Error!".format(
                                                  ed._trace_id)
+                er.close()
+                dump_query_stats(ed._trace_id)
             if trace_id:
                 break  
 
+def _put_unless_stopped(queue, item, stop):
+    """将item放入有界队列queue，队列满时等待，直到stop被设置。
+    Returns:
+        bool: 放入了队列时为True
+    """
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=1)
+            return True
+        except Queue.Full:
+            pass
+    return False
+
+
+def _release_staged_experiment(er, central_db_obj):
+    """将已认领但没有模拟的实验恢复到"fresh"状态，删除已放置的工作负载。"""
+    try:
+        er.discard_staged_trace_file()
+    except Exception:
+        traceback.print_exc()
+    er.close()
+    er._definition.upate_state(central_db_obj, "fresh")
+
+
+def _abort_experiment(er, central_db_obj):
+    """do_work_pipelined中模拟或导入出错的实验：模拟已经开始时标记为
+    "simulation_failed"，否则恢复到"fresh"状态（见
+    _release_staged_experiment）。"""
+    try:
+        if er._definition._work_state == "simulating":
+            er._definition.mark_simulation_failed(central_db_obj)
+            er.close()
+        else:
+            _release_staged_experiment(er, central_db_obj)
+    except Exception:
+        traceback.print_exc()
+
+
+def _claim_fresh(ed, central_db_obj, skip):
+    """认领trace_id最小、不在skip中的"fresh"实验。
+    Returns:
+        bool: 认领成功时为True，没有可认领的实验时为False
+    """
+    condition = None
+    if skip:
+        condition = "trace_id NOT IN ({0})".format(
+                                    ",".join([str(x) for x in sorted(skip)]))
+    while True:
+        if ed.claim(central_db_obj, "fresh", "pre_simulating",
+                    condition=condition):
+            return True
+        # 认领失败：没有候选实验，或其他worker先认领了
+        if not [x for x in ed.get_exps_in_state(central_db_obj, "fresh")
+                if int(x) not in skip]:
+            return False
+
+
+def _prepare_experiments(central_db_obj, prepared, stop):
+    """ExperimentWorker.do_work_pipelined的准备线程：认领"fresh"实验，生成
+    并放置其工作负载，放入prepared。准备失败的实验被恢复到"fresh"状态并在
+    本次运行中跳过。没有更多实验或出错时放入None。"""
+    skip = set()
+    try:
+        while not stop.is_set():
+            ed = ExperimentDefinition()
+            if not _claim_fresh(ed, central_db_obj, skip):
+                break
+            er = ExperimentRunner(ed)
+            try:
+                er.stage_trace_file()
+            except Exception:
+                traceback.print_exc()
+                print "Error preparing experiment {0}, released".format(
+                                                                ed._trace_id)
+                _release_staged_experiment(er, central_db_obj)
+                skip.add(int(ed._trace_id))
+                continue
+            if not _put_unless_stopped(prepared, er, stop):
+                _release_staged_experiment(er, central_db_obj)
+    except Exception:
+        traceback.print_exc()
+        print "Error preparing experiments, no more experiments will be run"
+    _put_unless_stopped(prepared, None, stop)
+
+
+def _store_experiments(central_db_obj, imported):
+    """ExperimentWorker.do_work_pipelined的存储线程：验证并存储imported中
+    的轨迹，标记实验完成或失败，直到取出None。"""
+    while True:
+        item = imported.get()
+        if item is None:
+            break
+        (er, result_trace) = item
+        ed = er._definition
+        try:
+            if er.finish_run(er.store_trace(result_trace, central_db_obj),
+                             central_db_obj):
+                print "Exp({0}) Done".format(ed._trace_id)
+            else:
+                print "Exp({0}) Error!".format(ed._trace_id)
+        except Exception:
+            traceback.print_exc()
+            ed.mark_simulation_failed(central_db_obj)
+            print "Exp({0}) Error!".format(ed._trace_id)
+        er.close()
+        dump_query_stats(ed._trace_id)
+
+
 class AnalysisWorker(object):
     """该类对不同实验类型的结果进行处理，并将最终结果存储在分析数据库中。
     """
@@ -161,6 +363,7 @@ class AnalysisWorker(object):
                 er = AnalysisRunnerSingle(ed)
                 # 执行完整的分析过程
                 er.do_full_analysis(db_obj)
+                dump_query_stats(ed._trace_id)
             # 如果指定了 trace_id，则在处理完后立即退出循环
             if trace_id:
                 break
@@ -175,10 +378,7 @@ class AnalysisWorker(object):
         """
         there_are_more=True
         while there_are_more:
-            # 初始化三个实验定义对象（主清单/单工作流/多工作流）
             ed_manifest = ExperimentDefinition()
-            ed_single = ExperimentDefinition()
-            ed_multi = ExperimentDefinition()
 
             # 加载实验配置数据：根据pre_trace_id存在性决定加载方式
             if pre_trace_id:
@@ -187,58 +387,66 @@ class AnalysisWorker(object):
                 there_are_more=True
             else:
                 there_are_more = ed_manifest.load_next_ready_for_pass(db_obj)
-                trace_id=int(ed_manifest._trace_id)
             if there_are_more:
-                # 加载关联的连续跟踪ID（+1和+2）的实验配置
-                ed_single.load(db_obj, trace_id+1)
-                ed_multi.load(db_obj, trace_id+2)
-                ed_list=[ed_manifest, ed_single, ed_multi]
-
-                # 验证三个实验的工作流处理类型是否正确
-                print ("Reading workflow info for traces: {0}".format(
-                    [ed._trace_id for ed in ed_list]))
-                if (ed_manifest._workflow_handling!="manifest" or
-                    ed_single._workflow_handling!="single" or
-                    ed_multi._workflow_handling!="multi"):
-                    # 类型校验失败时的错误处理
-                    print ("Incorrect workflow handling for traces"
-                           "({0}, {1}, {2}): ({3}, {4}, {5})",format(
-                               ed_manifest._trace_id,
-                               ed_single._trace_id,
-                               ed_multi._trace_id,
-                               ed_manifest._workflow_handling,
-                               ed_single._workflow_handling,
-                               ed_multi._workflow_handling)
-                           )
-                    print ("Exiting...")
-                    exit()
-
-                # 预处理阶段：标记所有实验进入第二遍处理
-                for ed in ed_list:
-                    ed.mark_pre_second_pass(db_obj)
-                num_workflows=None
-
-                # 确定三个实验中最小的可用工作流数量
-                for ed in ed_list:
-                    exp_wfs=self.get_num_workflows(db_obj, ed._trace_id)
-                    if num_workflows is None:
-                        num_workflows = exp_wfs
-                    else:
-                        num_workflows=min(num_workflows, exp_wfs)
-                print ("Final workflow count: {0}".format(num_workflows))
-
-                # 执行第二遍分析流程
-                for ed in ed_list:
-                    print ("Doing second pass for trace: {0}".format(
-                        ed._trace_id))
-                    er = AnalysisRunnerSingle(ed)
-                    er.do_workflow_limited_analysis(db_obj, num_workflows)
-                print ("Second pass completed for {0}".format(
-                    [ed._trace_id for ed in ed_list]))
+                self._do_second_pass(db_obj, ed_manifest)
 
             # 当存在预指定trace_id时，仅执行单次循环
             if pre_trace_id:
                 break
+
+    def _do_second_pass(self, db_obj, ed_manifest):
+        """对ed_manifest及其后的两个实验（single和multi）做第二遍分析。"""
+        trace_id = int(ed_manifest._trace_id)
+        ed_single = ExperimentDefinition()
+        ed_multi = ExperimentDefinition()
+        # 加载关联的连续跟踪ID（+1和+2）的实验配置
+        ed_single.load(db_obj, trace_id+1)
+        ed_multi.load(db_obj, trace_id+2)
+        ed_list=[ed_manifest, ed_single, ed_multi]
+
+        # 验证三个实验的工作流处理类型是否正确
+        print ("Reading workflow info for traces: {0}".format(
+            [ed._trace_id for ed in ed_list]))
+        if (ed_manifest._workflow_handling!="manifest" or
+            ed_single._workflow_handling!="single" or
+            ed_multi._workflow_handling!="multi"):
+            # 类型校验失败时的错误处理
+            print ("Incorrect workflow handling for traces"
+                   "({0}, {1}, {2}): ({3}, {4}, {5})",format(
+                       ed_manifest._trace_id,
+                       ed_single._trace_id,
+                       ed_multi._trace_id,
+                       ed_manifest._workflow_handling,
+                       ed_single._workflow_handling,
+                       ed_multi._workflow_handling)
+                   )
+            print ("Exiting...")
+            exit()
+
+        # 预处理阶段：标记所有实验进入第二遍处理
+        for ed in ed_list:
+            ed.mark_pre_second_pass(db_obj)
+        num_workflows=None
+
+        # 确定三个实验中最小的可用工作流数量
+        for ed in ed_list:
+            exp_wfs=self.get_num_workflows(db_obj, ed._trace_id)
+            if num_workflows is None:
+                num_workflows = exp_wfs
+            else:
+                num_workflows=min(num_workflows, exp_wfs)
+        print ("Final workflow count: {0}".format(num_workflows))
+
+        # 执行第二遍分析流程
+        for ed in ed_list:
+            print ("Doing second pass for trace: {0}".format(
+                ed._trace_id))
+            er = AnalysisRunnerSingle(ed)
+            er.do_workflow_limited_analysis(db_obj, num_workflows)
+            dump_query_stats(ed._trace_id)
+        print ("Second pass completed for {0}".format(
+            [ed._trace_id for ed in ed_list]))
+
     def get_num_workflows(self, db_obj, trace_id):
         """
         获取指定trace关联的工作流数量
@@ -261,96 +469,122 @@ class AnalysisWorker(object):
         return int(result._get("count"))
 
     def do_work_delta(self, db_obj, trace_id=None, sleep_time=60):
-        """处理增量型实验的分析任务，支持单次处理和持续轮询两种模式
+        """处理增量型实验的分析任务，支持单次处理和批量处理两种模式
         当提供 trace_id 时：处理指定实验一次
-        当未提供 trace_id 时：持续轮询分析数据库中待处理的增量实验
+        当未提供 trace_id 时：分析所有待处理的增量实验，每个实验在其子轨迹
+            就绪后立即分析（见do_work_dependencies）
         Args:
             db_obj (DB): 已配置的分析数据库连接对象
-            trace_id (str, optional): 实验追踪ID。指定时处理单个实验，未指定时持续轮询。默认为None
-            sleep_time (int, optional): 轮询间隔时间（秒），仅在批量处理模式下生效。默认为60秒
+            trace_id (str, optional): 实验追踪ID。指定时处理单个实验，未指定时批量处理。默认为None
+            sleep_time (int, optional): 批量处理模式下等待其他worker时读取
+                子轨迹状态的间隔时间（秒）。默认为60秒
         Returns:
-            None: 本方法无返回值
+            int: 批量处理模式下分析的实验数
         """
-        there_are_more = True
-        # 主处理循环控制逻辑
-        while there_are_more:
-            # 初始化增量实验定义处理器
-            ed = DeltaExperimentDefinition()
-
-            # 根据trace_id选择处理模式
-            if trace_id:
-                # 单次处理模式：加载指定实验并更新状态
-                ed.load(db_obj, trace_id)
-                ed.mark_pre_analyzing(db_obj)
-            else:
-                # 批量处理模式：获取下一个待处理实验
-                there_are_more = ed.load_pending(db_obj)
-
-            # 存在待处理实验时的处理流程
-            if there_are_more:
-                # 执行实验就绪性检查
-                if ed.is_it_ready_to_process(db_obj):
-                    # 创建分析执行器并运行完整分析流程
-                    er = AnalysisRunnerDelta(ed)
-                    er.do_full_analysis(db_obj)
-
-                # 批量模式下进行轮询间隔等待
-                sleep(sleep_time)
-
-            # 单次处理模式退出机制
-            if trace_id:
-                break
-
-    def do_work_grouped(self, db_obj, trace_id=None, sleep_time=60):
+        if not trace_id:
+            return self.do_work_dependencies(db_obj,
+                                             [DeltaExperimentDefinition],
+                                             poll_time=sleep_time)
+        # 单次处理模式：加载指定实验并更新状态
+        ed = DeltaExperimentDefinition()
+        ed.load(db_obj, trace_id)
+        ed.mark_pre_analyzing(db_obj)
+        # 执行实验就绪性检查
+        if ed.is_it_ready_to_process(db_obj):
+            # 创建分析执行器并运行完整分析流程
+            er = AnalysisRunnerDelta(ed)
+            er.do_full_analysis(db_obj)
+            dump_query_stats(ed._trace_id)
+
+    def do_work_grouped(self, db_obj, trace_id=None, sleep_time=60,
+                        from_summaries=False):
         """处理分组类型实验结果的批处理逻辑
 
         支持两种运行模式：
         - 指定trace_id模式：处理特定实验组
-        - 批量模式：持续处理所有待处理实验组，直到没有更多可处理项
+        - 批量模式：处理所有待处理实验组，每个实验组在其子追踪就绪后立即
+          分析（见do_work_dependencies）
 
         Args:
             db_obj (object): 配置好的分析数据库连接对象
             trace_id (str, optional): 指定要处理的实验组跟踪ID。若设置则进入单次处理模式，默认None为批量模式
-            sleep_time (int, optional): 当子追踪未就绪时的重试间隔时间（秒），默认60秒
+            sleep_time (int, optional): 批量模式下等待其他worker时读取子追踪
+                状态的间隔时间（秒），默认60秒
+            from_summaries (bool, optional): 为True时通过合并子追踪已存储结果的
+                摘要进行分析，不重新加载子追踪，默认False
 
         Returns:
-            None: 无返回值
+            int: 批量模式下分析的实验组数
         """
-        there_are_more = True
-
-        # 主处理循环控制
-        while there_are_more:
-            ed = GroupExperimentDefinition()
-
-            # 模式分支：指定trace_id的精确处理
-            if trace_id:
-                # 加载指定实验组并标记为预处理中
-                ed.load(db_obj, trace_id)
-                ed.mark_pre_analyzing(db_obj)
-            # 批量模式：获取下一个待处理实验组
+        if not trace_id:
+            return self.do_work_dependencies(db_obj,
+                                             [GroupExperimentDefinition],
+                                             poll_time=sleep_time,
+                                             from_summaries=from_summaries)
+        # 加载指定实验组并标记为预处理中
+        ed = GroupExperimentDefinition()
+        ed.load(db_obj, trace_id)
+        ed.mark_pre_analyzing(db_obj)
+        if ed.is_it_ready_to_process(db_obj):
+            print "Analyzing grouped experiment {0}".format(ed._trace_id)
+            # 创建分析执行器并运行完整分析
+            er = AnalysisGroupRunner(ed)
+            if from_summaries:
+                er.do_full_analysis_from_summaries(db_obj)
             else:
-                there_are_more = ed.load_pending(db_obj)
-
-            # 存在待处理实验组时的处理逻辑
-            if there_are_more:
-                if ed.is_it_ready_to_process(db_obj):
-                    print
-                    "Analyzing grouped experiment {0}".format(ed._trace_id)
-                    # 创建分析执行器并运行完整分析
-                    er = AnalysisGroupRunner(ed)
-                    er.do_full_analysis(db_obj)
-
-            # 退出条件处理
-            if trace_id:
-                break  # 单次处理模式立即退出
-            elif there_are_more:
-                print("There are grouped experiments to be processed, but,"
-                      "their subtrace are not ready yet. Sleeping for {0}s."
-                      "".format(sleep_time))
-                # sleep(sleep_time)  # 原始代码中睡眠调用被注释
+                er.do_full_analysis(db_obj)
+            dump_query_stats(ed._trace_id)
+
+    def do_work_dependencies(self, db_obj,
+                             definition_classes=(GroupExperimentDefinition,
+                                                 DeltaExperimentDefinition),
+                             poll_time=60, wait=True, from_summaries=False):
+        """分析处于pending状态的分组和增量实验。实验与子轨迹的依赖图由
+        DependencyScheduler维护：每个实验的定义只加载一次，实验在其最后一个
+        子轨迹就绪后立即被认领和分析，它的完成又会通知依赖它的实验。
+        数据库没有变化通知，其他worker造成的子轨迹状态变化在没有就绪的实验
+        时每poll_time秒用一个查询读取，同时加入新的pending实验。
+        Args:
+            db_obj (DB): 已配置的分析数据库连接对象
+            definition_classes: 要分析的聚合实验的定义类
+            poll_time (int): 等待其他worker时读取子轨迹状态的间隔（秒）
+            wait (bool): 为False时没有就绪的实验即返回，否则等待直到所有
+                pending实验都被分析或被阻塞（子轨迹失败或越过了就绪状态，
+                见DependencyScheduler），被阻塞的实验被报告后跳过
+            from_summaries (bool): 分组实验通过合并子追踪的结果摘要分析
+        Returns:
+            int: 分析的实验数
+        """
+        scheduler = DependencyScheduler(definition_classes)
+        scheduler.load(db_obj)
+        analyzed = 0
+        while True:
+            ed = scheduler.pop_ready()
+            if ed is None:
+                if not wait or not scheduler.has_pending():
+                    break
+                sleep(poll_time)
+                scheduler.load(db_obj)
+                continue
+            # 其他worker可能已经认领了这个实验
+            if not ed.claim(db_obj, "pending", "pre_analyzing",
+                            trace_id=ed._trace_id):
+                continue
+            print "Analyzing {0} experiment {1}".format(ed._trace_type,
+                                                        ed._trace_id)
+            if ed._trace_type == "delta":
+                AnalysisRunnerDelta(ed).do_full_analysis(db_obj)
+            elif from_summaries:
+                AnalysisGroupRunner(ed).do_full_analysis_from_summaries(db_obj)
             else:
-                print
-                "No more experiments to process, exiting."
+                AnalysisGroupRunner(ed).do_full_analysis(db_obj)
+            dump_query_stats(ed._trace_id)
+            analyzed += 1
+            scheduler.set_state(ed._trace_id, ed._work_state)
+        for trace_id in scheduler.get_blocked():
+            print ("Skipping blocked experiment {0}, subtraces not ready: "
+                   "{1}".format(trace_id, scheduler.get_missing(trace_id)))
+        return analyzed
 
     def do_mean_utilizatin(self, db_obj, trace_id=None):
         """
@@ -383,6 +617,7 @@ class AnalysisWorker(object):
             ed.load(db_obj, trace_id=trace_id)  # 加载实验配置
             er = AnalysisGroupRunner(ed)    # 创建分析执行器
             er.do_only_mean(db_obj)     # 执行均值计算
+            dump_query_stats(trace_id)
             
                 
                 
@@ -396,62 +631,225 @@ class AnalysisWorker(object):
         there_are_more=True
         while there_are_more:
             ed_manifest = GroupExperimentDefinition()
-            ed_single = GroupExperimentDefinition()
-            ed_multi = GroupExperimentDefinition()
             if pre_trace_id:
                 trace_id=int(pre_trace_id)
                 ed_manifest.load(db_obj, trace_id)
                 there_are_more=True
             else:
                 there_are_more = ed_manifest.load_next_ready_for_pass(db_obj)
-                trace_id=int(ed_manifest._trace_id)
             if there_are_more:
-                ed_single.load(db_obj, trace_id+1)
-                ed_multi.load(db_obj, trace_id+2)
-                ed_list=[ed_manifest, ed_single, ed_multi]
-                print ("Reading workflow info for traces: {0}".format(
-                    [ed._trace_id for ed in ed_list]))
-                if (ed_manifest._workflow_handling!="manifest" or
-                    ed_single._workflow_handling!="single" or
-                    ed_multi._workflow_handling!="multi"):
-                    print ("Incorrect workflow handling for traces"
-                           "({0}, {1}, {2}): ({3}, {4}, {5})",format(
-                               ed_manifest._trace_id,
-                               ed_single._trace_id,
-                               ed_multi._trace_id,
-                               ed_manifest._workflow_handling,
-                               ed_single._workflow_handling,
-                               ed_multi._workflow_handling)
-                           )
-                    print ("Exiting...")
-                    exit()
-
-                for ed in ed_list:  
-                    ed.mark_pre_second_pass(db_obj)
-
-                list_num_workflows=[]
-                for (st_1, st_2, st_3) in zip(ed_manifest._subtraces,
-                                              ed_single._subtraces,
-                                              ed_multi._subtraces):
-                    num_workflows=None
-                    for ed_id in [st_1, st_2, st_3]:
-                        exp_wfs=self.get_num_workflows(db_obj, ed_id)
-                        if num_workflows is None:
-                            num_workflows = exp_wfs
-                        else:
-                            num_workflows=min(num_workflows, exp_wfs)
-                    list_num_workflows.append(num_workflows)
-                
-                print ("Final workflow count: {0}".format(list_num_workflows))
-                for ed in ed_list:
-                    print ("Doing second pass for trace: {0}".format(
-                        ed._trace_id))
-                    er = AnalysisGroupRunner(ed)
-                    er.do_workflow_limited_analysis(db_obj, list_num_workflows)
-                print ("Second pass completed for {0}".format(
-                    [ed._trace_id for ed in ed_list]))
+                self._do_grouped_second_pass(db_obj, ed_manifest)
             if pre_trace_id:
                 break
+
+    def _do_grouped_second_pass(self, db_obj, ed_manifest):
+        """对分组实验ed_manifest及其后的两个分组实验做第二遍分析。"""
+        trace_id = int(ed_manifest._trace_id)
+        ed_single = GroupExperimentDefinition()
+        ed_multi = GroupExperimentDefinition()
+        ed_single.load(db_obj, trace_id+1)
+        ed_multi.load(db_obj, trace_id+2)
+        ed_list=[ed_manifest, ed_single, ed_multi]
+        print ("Reading workflow info for traces: {0}".format(
+            [ed._trace_id for ed in ed_list]))
+        if (ed_manifest._workflow_handling!="manifest" or
+            ed_single._workflow_handling!="single" or
+            ed_multi._workflow_handling!="multi"):
+            print ("Incorrect workflow handling for traces"
+                   "({0}, {1}, {2}): ({3}, {4}, {5})",format(
+                       ed_manifest._trace_id,
+                       ed_single._trace_id,
+                       ed_multi._trace_id,
+                       ed_manifest._workflow_handling,
+                       ed_single._workflow_handling,
+                       ed_multi._workflow_handling)
+                   )
+            print ("Exiting...")
+            exit()
+
+        for ed in ed_list:  
+            ed.mark_pre_second_pass(db_obj)
+
+        list_num_workflows=[]
+        for (st_1, st_2, st_3) in zip(ed_manifest._subtraces,
+                                      ed_single._subtraces,
+                                      ed_multi._subtraces):
+            num_workflows=None
+            for ed_id in [st_1, st_2, st_3]:
+                exp_wfs=self.get_num_workflows(db_obj, ed_id)
+                if num_workflows is None:
+                    num_workflows = exp_wfs
+                else:
+                    num_workflows=min(num_workflows, exp_wfs)
+            list_num_workflows.append(num_workflows)
         
-        
-    
\ No newline at end of file
+        print ("Final workflow count: {0}".format(list_num_workflows))
+        for ed in ed_list:
+            print ("Doing second pass for trace: {0}".format(
+                ed._trace_id))
+            er = AnalysisGroupRunner(ed)
+            er.do_workflow_limited_analysis(db_obj, list_num_workflows)
+            dump_query_stats(ed._trace_id)
+        print ("Second pass completed for {0}".format(
+            [ed._trace_id for ed in ed_list]))
+
+    def analyze_next(self, db_obj, mode, on_claim=None, from_summaries=False):
+        """认领并分析一个mode类型的实验（见ANALYSIS_POOL_MODES）。
+        Args:
+            db_obj: 配置为访问分析数据库的DB对象
+            mode (str): "single", "second_pass", "grouped",
+                "grouped_second_pass"或"delta"
+            on_claim (callable): 认领后、分析前以认领的trace_id列表调用
+            from_summaries (bool): grouped模式下通过合并子追踪的结果摘要分析
+        Returns:
+            bool: 分析了一个实验返回True，没有可认领的实验返回False
+        """
+        if mode in ["second_pass", "grouped_second_pass"]:
+            if mode == "second_pass":
+                ed = ExperimentDefinition()
+            else:
+                ed = GroupExperimentDefinition()
+            if not ed.load_next_ready_for_pass(db_obj):
+                return False
+            trace_id = int(ed._trace_id)
+            if on_claim:
+                on_claim([trace_id, trace_id+1, trace_id+2])
+            if mode == "second_pass":
+                self._do_second_pass(db_obj, ed)
+            else:
+                self._do_grouped_second_pass(db_obj, ed)
+            return True
+
+        if mode == "single":
+            ed = ExperimentDefinition()
+        elif mode == "grouped":
+            ed = GroupExperimentDefinition()
+        elif mode == "delta":
+            ed = DeltaExperimentDefinition()
+        else:
+            raise ValueError("Unknown analysis mode: {0}".format(mode))
+        # 分组和增量实验没有子追踪就绪的实验时，load_pending加载但不认领
+        if not ed.load_pending(db_obj) or ed._owner is None:
+            return False
+        if on_claim:
+            on_claim([ed._trace_id])
+        print "Analyzing experiment {0}".format(ed._trace_id)
+        if mode == "single":
+            AnalysisRunnerSingle(ed).do_full_analysis(db_obj)
+        elif mode == "grouped" and from_summaries:
+            AnalysisGroupRunner(ed).do_full_analysis_from_summaries(db_obj)
+        elif mode == "grouped":
+            AnalysisGroupRunner(ed).do_full_analysis(db_obj)
+        elif ed.is_it_ready_to_process(db_obj):
+            AnalysisRunnerDelta(ed).do_full_analysis(db_obj)
+        else:
+            _release_experiments(db_obj, [ed._trace_id], mode)
+            return False
+        dump_query_stats(ed._trace_id)
+        return True
+
+    def do_work_pool(self, mode, processes=None, db_factory=get_central_db,
+                     from_summaries=False):
+        """用processes个进程并行分析mode类型的实验，直到没有可认领的实验。
+        每个进程通过db_factory创建自己的数据库连接，用analyze_next原子地认领
+        和分析实验。第一次收到SIGINT或SIGTERM时，子进程完成当前实验后退出；
+        第二次收到时立即终止子进程。异常退出的子进程认领但未完成的实验被恢复
+        到认领前的状态（见ANALYSIS_POOL_MODES），子进程不会被重新启动。
+        Args:
+            mode (str): 分析类型，见analyze_next
+            processes (int): 进程数，默认为CPU核数
+            db_factory (callable): 返回配置为访问分析数据库的DB对象的函数
+            from_summaries (bool): 见analyze_next
+        Returns:
+            int: 分析的实验数
+        """
+        if mode not in ANALYSIS_POOL_MODES:
+            raise ValueError("Unknown analysis mode: {0}".format(mode))
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        stop = multiprocessing.Event()
+        analyzed = multiprocessing.Value("i", 0)
+        children = []
+        for i in range(processes):
+            # 子进程当前认领的trace_id，0为空
+            claimed = multiprocessing.Array("l", 3)
+            child = multiprocessing.Process(target=_analysis_pool_child,
+                                            args=(mode, db_factory,
+                                                  from_summaries, stop,
+                                                  analyzed, claimed))
+            child.start()
+            children.append((child, claimed))
+
+        def stop_children(signum, frame):
+            if stop.is_set():
+                print "Terminating analysis processes"
+                for (child, claimed) in children:
+                    if child.is_alive():
+                        child.terminate()
+            else:
+                print ("Stopping analysis processes after their current"
+                       " experiment")
+                stop.set()
+        old_handlers = [(x, signal.signal(x, stop_children))
+                        for x in [signal.SIGINT, signal.SIGTERM]]
+        try:
+            running = list(children)
+            while running:
+                for (child, claimed) in list(running):
+                    child.join(1)
+                    if child.is_alive():
+                        continue
+                    running.remove((child, claimed))
+                    if child.exitcode != 0:
+                        trace_ids = [x for x in claimed if x]
+                        released = _release_experiments(db_factory(),
+                                                        trace_ids, mode)
+                        Log.log("Analysis process {0} exited with code {1}, "
+                                "released experiments {2}".format(
+                                    child.pid, child.exitcode, released))
+        finally:
+            for (signum, handler) in old_handlers:
+                signal.signal(signum, handler)
+        return analyzed.value
+
+
+def _analysis_pool_child(mode, db_factory, from_summaries, stop, analyzed,
+                         claimed):
+    """AnalysisWorker.do_work_pool的子进程。"""
+    # 父进程处理SIGINT（终端中的Ctrl-C也会发给子进程）
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    db_obj = db_factory()
+    worker = AnalysisWorker()
+
+    def on_claim(trace_ids):
+        claimed[:] = (list(trace_ids) + [0] * len(claimed))[:len(claimed)]
+
+    while not stop.is_set():
+        if not worker.analyze_next(db_obj, mode, on_claim=on_claim,
+                                   from_summaries=from_summaries):
+            break
+        claimed[:] = [0] * len(claimed)
+        with analyzed.get_lock():
+            analyzed.value += 1
+    db_obj.close()
+
+
+def _release_experiments(db_obj, trace_ids, mode):
+    """将trace_ids中处于mode的分析中状态的实验恢复到认领前的状态。
+    Returns:
+        list: 被恢复的trace_id
+    """
+    if not trace_ids:
+        return []
+    (state, in_progress) = ANALYSIS_POOL_MODES[mode]
+    table_name = ExperimentDefinition()._table_name
+    condition = "trace_id IN ({0}) and work_state IN ({1})".format(
+                    ",".join([str(int(x)) for x in trace_ids]),
+                    ",".join(["'{0}'".format(x) for x in in_progress]))
+    rows = db_obj.getValuesAsColumns(table_name, ["trace_id"],
+                                     condition=condition)
+    if rows["trace_id"]:
+        db_obj.doUpdate("UPDATE `{0}` SET work_state='{1}', owner='' "
+                        "WHERE {2}".format(table_name, state, condition))
+    return [int(x) for x in rows["trace_id"]]
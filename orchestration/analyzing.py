@@ -1,5 +1,6 @@
 import numpy as np
 
+from stats import merge_stored_results
 from stats.trace import ResultTrace
 from stats.compare import WorkflowDeltas
 from orchestration.definition import ExperimentDefinition
@@ -185,6 +186,40 @@ class AnalysisGroupRunner(AnalysisRunnerSingle):
         # 标记分析任务完成状态
         self._definition.mark_analysis_done(db_obj)
 
+    def do_full_analysis_from_summaries(self, db_obj):
+        """通过合并子跟踪已存储结果的摘要执行分组分析，不重新加载子跟踪的作业数据。
+        作业和工作流结果的计数、均值、标准差和直方图是精确的，百分位数由分位数
+        草图估计。如果某个子跟踪的结果没有摘要（旧版本存储），退回到do_full_analysis。
+
+        Args:
+            db_obj (object): 数据库连接对象，用于数据存取操作
+        """
+        results = merge_stored_results(db_obj, self._definition._subtraces)
+        if results is None:
+            print ("Subtraces of {0} have results without summaries, doing "
+                   "full analysis".format(self._definition._trace_id))
+            return self.do_full_analysis(db_obj)
+
+        # 保存合并后的结果到数据库
+        for (result_type, result) in results.iteritems():
+            result.store(db_obj, self._definition._trace_id, result_type)
+
+        # 计算并存储系统利用率指标
+        result_trace = self.load_trace(db_obj)
+        result_trace.calculate_utilization_median_result(
+            self._definition._subtraces,
+            store=True,
+            db_obj=db_obj,
+            trace_id=self._definition._trace_id)
+        result_trace.calculate_utilization_mean_result(
+            self._definition._subtraces,
+            store=True,
+            db_obj=db_obj,
+            trace_id=self._definition._trace_id)
+
+        # 标记分析任务完成状态
+        self._definition.mark_analysis_done(db_obj)
+
     def do_only_mean(self, db_obj):
         """计算并存储指定跟踪数据的平均利用率结果
 
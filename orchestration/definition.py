@@ -1,8 +1,12 @@
 from machines import Edison2015,Edison
 from datetime import datetime
+import functools
+import os
+import socket
+import uuid
 from generate import TimeController
 from stats.trace import ResultTrace
-from stats import Histogram, NumericStats
+from stats import Histogram, NumericStats, result_cache
 
 class ExperimentDefinition(object):
     """
@@ -450,8 +454,13 @@ class ExperimentDefinition(object):
             4. 数据格式转换处理
         """
         self._trace_id = trace_id
+        self._load_where(db_obj, "trace_id={0}".format(self._trace_id))
+
+    def _load_where(self, db_obj, condition):
+        """加载满足condition的（第一个）实验，见load。"""
         # 定义需要从数据库获取的字段列表（对应数据库表列名）
-        keys = ["name",
+        keys = ["trace_id",
+                "name",
                 "experiment_set",
                 "seed",
                 "machine",
@@ -474,9 +483,8 @@ class ExperimentDefinition(object):
                 "worker"]
 
         # 执行数据库查询（单条记录查询）
-        data_dic = db_obj.getValuesDicList(self._table_name, keys, condition=
-        "trace_id={0}".format(
-            self._trace_id))
+        data_dic = db_obj.getValuesDicList(self._table_name, keys,
+                                           condition=condition)
         # 有效性检查：确保查询到有效数据
         if data_dic == False:
             raise ValueError("Experiment not found!")
@@ -538,10 +546,11 @@ class ExperimentDefinition(object):
     def load_next_state(self, db_obj, state, new_state, check_pending=False,
                         subtraces_state=None):
         """原子化加载并转换实验状态的核心方法
-        本方法实现了一个带事务重试机制的状态转移流程，用于安全地将符合条件的实验从当前状态转换到新状态。
+        本方法通过claim的条件UPDATE将符合条件的实验从当前状态转换到新状态，
+        认领失败（其他worker先认领了）时重试。
         支持子轨迹状态验证，确保并发操作不会处理同一实验。
         参数:
-            db_obj (DBManager): 数据库管理器实例，用于事务操作
+            db_obj (DBManager): 数据库管理器实例
             state (str): 要查询的当前实验状态
             new_state (str): 要转换的目标状态
             check_pending (bool, 可选): 是否验证子轨迹状态，默认关闭
@@ -549,57 +558,118 @@ class ExperimentDefinition(object):
         返回:
             bool: 如果查询状态仍有未处理实验返回True，否则返回False
         实现特性:
-            - 事务隔离: 通过数据库事务保证状态转换的原子性
-            - 重试机制: 最多1000次重试以避免死锁
+            - 原子认领: 单条条件UPDATE保证只有一个worker转换同一实验，不使用事务
+            - 重试机制: 最多1000次重试
             - 状态验证: 可选子轨迹状态校验保证依赖完整性
         """
-        update_ok = False
-        data_left = True
-        count = 1000  # 事务重试计数器
-
-        # 主事务循环
-        while data_left and not update_ok:
-            db_obj.start_transaction()
-
-            # 查询目标状态的实验轨迹ID
-            rows = db_obj.getValuesAsColumns(self._table_name, ["trace_id"],
-                                             condition="work_state='{0}' "
-                                                       "and trace_type='{1}' ".format(
-                                                 state,
-                                                 self._trace_type),
-                                             orderBy="trace_id")
-
-            data_left = len(rows["trace_id"]) > 0  # 检查剩余数据
-
-            if data_left:
-                found_good = False
-                # 遍历候选轨迹
-                for trace_id in rows["trace_id"]:
-                    self.load(db_obj, int(trace_id))
-
-                    # 执行子轨迹状态验证
-                    found_good = (not check_pending
-                                  or self.are_sub_traces_analyzed(
-                                db_obj,
-                                subtraces_state))
-                    if found_good:
-                        break
-
-                # 未找到有效候选时退出
-                if not found_good:
-                    db_obj.end_transaction()
-                    break
-
-                # 尝试状态更新
-                update_ok = self.upate_state(db_obj, new_state)
-
-            db_obj.end_transaction()
+        count = 1000  # 认领重试计数器
+        while True:
+            if not check_pending:
+                # 认领trace_id最小的候选实验，失败时（其他worker先认领了）重试
+                if self.claim(db_obj, state, new_state):
+                    return True
+                if not self.get_exps_in_state(db_obj, state):
+                    return False
+            else:
+                trace_ids = self.get_exps_in_state(db_obj, state)
+                if not trace_ids:
+                    return False
+                ready_ids = self._get_ready_trace_ids(db_obj, trace_ids,
+                                                      subtraces_state)
+                if not ready_ids:
+                    # 没有子轨迹就绪的实验：加载（不认领）最后一个候选实验，
+                    # 调用者通过is_it_ready_to_process检查
+                    self.load(db_obj, int(trace_ids[-1]))
+                    return True
+                for trace_id in ready_ids:
+                    if self.claim(db_obj, state, new_state, trace_id=trace_id):
+                        return True
 
             # 防止无限循环的安全机制
             if count == 0:
                 raise Exception("状态转换尝试次数超过安全限制(1000次)")
             count -= 1
-        return data_left
+
+    def claim(self, db_obj, state, new_state, trace_id=None, condition=None):
+        """
+        用一条条件UPDATE原子地认领一个实验：将一个处于state状态、类型与
+        本对象相同的实验（trace_id为None时为trace_id最小的实验）转换到
+        new_state，同时在owner中记录本worker的主机名和唯一的认领令牌、在
+        ownership_stamp中记录认领时间。认领成功后只加载被认领的实验。
+        多个worker同时认领同一实验时只有一个成功，不需要事务。
+        Args:
+            db_obj (DBManager): 数据库管理器实例
+            state (str): 实验的当前状态
+            new_state (str): 要转换的目标状态
+            trace_id (int): 要认领的实验，默认为trace_id最小的候选实验
+            condition (str): 候选实验需要满足的额外SQL条件
+        Returns:
+            bool: 认领成功返回True，没有可认领的实验或被其他worker先认领
+                返回False
+        """
+        where = "work_state='{0}' and trace_type='{1}'".format(
+                                                    state, self._trace_type)
+        if condition:
+            where += " and " + condition
+        if trace_id is None:
+            # 分组的子查询总是被物化，所以MySQL允许在UPDATE中引用同一个表
+            target = ("(SELECT first_id FROM (SELECT min(trace_id) first_id "
+                      "FROM `{0}` WHERE {1}) as candidate)".format(
+                                                    self._table_name, where))
+        else:
+            target = int(trace_id)
+        token = _get_claim_token()
+        if not db_obj.doUpdateParams(
+                "UPDATE `{0}` SET work_state=%s, owner=%s, "
+                "ownership_stamp=now() WHERE trace_id={1} and {2}".format(
+                                                self._table_name, target,
+                                                where),
+                [new_state, token]):
+            return False
+        self._load_where(db_obj, "owner='{0}'".format(token))
+        self._owner = token
+        return True
+
+    def _get_ready_trace_ids(self, db_obj, trace_ids, subtraces_state):
+        """返回trace_ids中所有子轨迹都处于subtraces_state状态（单个状态或
+        状态列表）的实验，顺序不变。所有实验的子轨迹和子轨迹的状态各用一个
+        查询读取。
+
+        Raises:
+            ValueError: 子轨迹不存在时抛出
+        """
+        # 与are_sub_traces_analyzed相同，单个状态转换为列表，避免子字符串匹配
+        if not type(subtraces_state) is list:
+            subtraces_state = [subtraces_state]
+        id_list = ",".join([str(int(x)) for x in trace_ids])
+        rows = db_obj.getValuesAsColumns(self._table_name,
+                                         ["trace_id", "subtraces"],
+                                         condition="trace_id IN ({0})".format(
+                                                                    id_list))
+        subtraces = dict([(int(x), [int(y) for y in sub.split(",") if y != ""])
+                          for (x, sub) in zip(rows["trace_id"],
+                                              rows["subtraces"])])
+        sub_ids = sorted(set(sum(subtraces.values(), [])))
+        states = {}
+        if sub_ids:
+            rows = db_obj.getValuesAsColumns(
+                        self._table_name, ["trace_id", "work_state"],
+                        condition="trace_id IN ({0})".format(
+                                        ",".join([str(x) for x in sub_ids])))
+            states = dict([(int(x), y) for (x, y) in zip(rows["trace_id"],
+                                                         rows["work_state"])])
+        ready_ids = []
+        for trace_id in trace_ids:
+            ready = True
+            for sub_id in subtraces[int(trace_id)]:
+                if sub_id not in states:
+                    raise ValueError("Subtrace not found!")
+                if not states[sub_id] in subtraces_state:
+                    ready = False
+                    break
+            if ready:
+                ready_ids.append(trace_id)
+        return ready_ids
 
     def get_exps_in_state(self, db_obj, state):
         rows=db_obj.getValuesAsColumns(self._table_name, ["trace_id"], 
@@ -629,67 +699,55 @@ class ExperimentDefinition(object):
             bool: 表示是否还有剩余未处理的数据
 
         功能说明:
-            1. 在事务中循环查找符合要求的实验配置
+            1. 循环查找符合要求的实验配置
             2. 检查关联的其他工作流处理是否完成
-            3. 满足条件时更新状态并退出循环
+            3. 满足条件时通过claim原子地更新状态并退出循环
             4. 包含防止无限循环的安全计数器
         """
-        update_ok = False
-        data_left = True
         count = 100
+        condition = "workflow_handling='{0}'".format(workflow_handling)
 
         """ Changes:
             - it passes over the ones that not good yet
             - does not use subtraces
         """
-        # 主处理循环：在事务中尝试获取并处理符合条件的配置
-        while data_left and not update_ok:
-            db_obj.start_transaction()
-
+        # 主处理循环：查找符合条件的候选配置，检查后原子地认领
+        while True:
             # 获取当前状态符合要求的trace_id列表
             rows = db_obj.getValuesAsColumns(self._table_name, ["trace_id"],
                                              condition="work_state='{0}' "
                                                        "and trace_type='{1}' "
-                                                       "and workflow_handling='{2}'".format(
+                                                       "and {2}".format(
                                                  state,
                                                  self._trace_type,
-                                                 workflow_handling),
+                                                 condition),
                                              orderBy="trace_id")
-
-            data_left = len(rows["trace_id"]) > 0
-            this_is_the_one = False
+            if not rows["trace_id"]:
+                return False
 
             # 遍历找到的trace_id尝试处理
-            if data_left:
-                for trace_id in rows["trace_id"]:
-                    self.load(db_obj, int(trace_id))
-                    other_defs_ok = True
-
-                    # 检查所有关联工作流处理是否就绪
-                    for (other_handling, t_id) in zip(
-                            workflow_handling_list,
-                            [trace_id + x + 1 for x in range(
-                                len(workflow_handling_list))]):
-                        new_def = self.get_exp_def_like_me()
-                        new_def.load(db_obj, t_id)
-                        other_defs_ok = (other_defs_ok and
-                                         new_def._work_state == "analysis_done" and
-                                         new_def._workflow_handling == other_handling and
-                                         new_def.pass_other_second_pass_requirements(db_obj))
-
-                    # 满足所有条件时标记为候选
-                    if (not other_defs_ok or
-                            not self.pass_other_second_pass_requirements(db_obj)):
-                        continue
-                    else:
-                        this_is_the_one = True
-                        break
-
-                # 成功找到候选配置时尝试更新状态
-                if this_is_the_one:
-                    update_ok = self.upate_state(db_obj, new_state)
-
-            db_obj.end_transaction()
+            for trace_id in rows["trace_id"]:
+                self.load(db_obj, int(trace_id))
+                other_defs_ok = True
+
+                # 检查所有关联工作流处理是否就绪
+                for (other_handling, t_id) in zip(
+                        workflow_handling_list,
+                        [trace_id + x + 1 for x in range(
+                            len(workflow_handling_list))]):
+                    new_def = self.get_exp_def_like_me()
+                    new_def.load(db_obj, t_id)
+                    other_defs_ok = (other_defs_ok and
+                                     new_def._work_state == "analysis_done" and
+                                     new_def._workflow_handling == other_handling and
+                                     new_def.pass_other_second_pass_requirements(db_obj))
+
+                # 满足所有条件时认领，被其他worker先认领时继续下一个
+                if (other_defs_ok and
+                        self.pass_other_second_pass_requirements(db_obj) and
+                        self.claim(db_obj, state, new_state, trace_id=trace_id,
+                                   condition=condition)):
+                    return True
 
             # 安全计数器防止无限循环
             if count == 0:
@@ -697,36 +755,38 @@ class ExperimentDefinition(object):
                                  " times and failed!!")
             count -= 1
 
-        return data_left
-
     def get_exp_def_like_me(self):
         return ExperimentDefinition()
     def del_results(self, db_obj):
         """Deletes all analysis results associated with this experiment"""
         field="trace_id"
         value=self._trace_id
-        db_obj.delete_rows(Histogram()._table_name, field, value)
-        db_obj.delete_rows(ResultTrace()._get_utilization_result()._table_name,
-                            field, value)
-        db_obj.delete_rows(NumericStats()._table_name, field, value)
+        table_names = [Histogram()._table_name,
+                       ResultTrace()._get_utilization_result()._table_name,
+                       NumericStats()._table_name]
+        for table_name in table_names:
+            db_obj.delete_rows(table_name, field, value)
+            result_cache.invalidate(table_name, value)
     
     def del_results_like(self, db_obj, like_field="type", like_value="lim_%"):
         """Deletes all analysis results associated with this experiment"""
         field="trace_id"
         value=self._trace_id
-        db_obj.delete_rows(Histogram()._table_name, field, value,
-                           like_field, like_value)
-        db_obj.delete_rows(ResultTrace()._get_utilization_result()._table_name,
-                            field, value, like_field, like_value)
-        db_obj.delete_rows(NumericStats()._table_name, field, value,
-                           like_field, like_value)
+        # 缓存条目只按类型匹配，其他字段的删除使该trace的全部条目失效
+        type_like = None
+        if like_field == "type":
+            type_like = like_value
+        table_names = [Histogram()._table_name,
+                       ResultTrace()._get_utilization_result()._table_name,
+                       NumericStats()._table_name]
+        for table_name in table_names:
+            db_obj.delete_rows(table_name, field, value, like_field,
+                               like_value)
+            result_cache.invalidate(table_name, value, type_like)
         
     def del_trace(self, db_obj):
         """Deletes simulation trace associated with this experiment"""
-        field="trace_id"
-        value=self._trace_id
-        db_obj.delete_rows(ResultTrace()._table_name,
-                            field, value)
+        ResultTrace().delete_trace(db_obj, self._trace_id)
     
     def del_exp(self, db_obj):
         field="trace_id"
@@ -752,12 +812,13 @@ class ExperimentDefinition(object):
         if not type(state) is list:
             state = [state]
 
-        # 遍历所有子追踪ID进行状态验证
-        for trace_id in self._subtraces:
-            # 从数据库获取指定追踪ID的工作状态
-            rows = db_obj.getValuesAsColumns(self._table_name, ["work_state"],
-                                             condition="trace_id={0} ".format(trace_id))
-
+        # 并发查询所有子追踪的工作状态，然后按子追踪的顺序验证
+        rows_list = db_obj.runConcurrently(
+            [functools.partial(db_obj.getValuesAsColumns, self._table_name,
+                               ["work_state"],
+                               condition="trace_id={0} ".format(trace_id))
+             for trace_id in self._subtraces])
+        for rows in rows_list:
             # 校验查询结果有效性
             if len(rows["work_state"]) == 0:
                 raise ValueError("Subtrace not found!")
@@ -830,10 +891,19 @@ class ExperimentDefinition(object):
                                     
     
         
+def _get_claim_token():
+    """返回写入owner列的认领令牌：主机名、进程号和一个随机后缀。"""
+    return "{0}:{1}:{2}".format(socket.gethostname()[:40], os.getpid(),
+                                uuid.uuid4().hex[:12])
+
+
 class GroupExperimentDefinition(ExperimentDefinition):
     """分组实验定义：由多个具有相同调度程序和工作负载特征，但随机种子不同的单个实验组成的实验。
     计算工作流和作业变量的统计信息，将所有跟踪信息放在一起。中位数是根据利用率计算的。
     """
+    # 可以分析本实验时子轨迹需要处于的状态
+    subtrace_ready_states = ["analysis_done", "second_pass_done"]
+
     def __init__(self,
                  name=None,
                  experiment_set=None,
@@ -887,11 +957,12 @@ class GroupExperimentDefinition(ExperimentDefinition):
         self._subtraces.append(trace_id)
     
     def is_it_ready_to_process(self, db_obj):
-        """Returns true is the sub traces have been generated and analyzed."""
+        """Returns true is the sub traces are in one of the
+        subtrace_ready_states (generated and analyzed)."""
         for trace_id in self._subtraces:
             rt = ExperimentDefinition()
             rt.load(db_obj, trace_id)
-            if not (rt._work_state in ["analysis_done", "second_pass_done"]):
+            if not (rt._work_state in self.subtrace_ready_states):
                 return False
         return True
     def pass_other_second_pass_requirements(self, db_obj):
@@ -912,6 +983,9 @@ class DeltaExperimentDefinition(GroupExperimentDefinition):
     configuration. Workflow variables are compared workflow to workflow, and
     statistics calculated over the differences.
     """
+    # The sub traces have to be at least generated.
+    subtrace_ready_states = ["simulation_done", "analysis_done"]
+
     def __init__(self,
                  name=None,
                  experiment_set=None,
@@ -953,16 +1027,6 @@ class DeltaExperimentDefinition(GroupExperimentDefinition):
     def add_compare_pair(self, first_id, second_id):
         self.add_sub_trace(first_id, second_id)
     
-    
-    def is_it_ready_to_process(self, db_obj):
-        """Returns true is the sub traces have been at least generated."""
-        for trace_id in self._subtraces:
-            rt = ExperimentDefinition()
-            rt.load(db_obj, trace_id)
-            if not (rt._work_state in ["simulation_done", "analysis_done"]):
-                return False
-        return True
-    
     def get_exp_def_like_me(self):
         return DeltaExperimentDefinition()
 
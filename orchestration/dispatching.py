@@ -0,0 +1,381 @@
+"""
+模拟实验的中央调度器。
+
+bin/workers_launch.sh为每个工作节点启动一个run_sim_exp.py进程，这些进程轮询
+数据库争抢"fresh"实验。ExperimentDispatcher在一个进程中管理所有工作节点：
+
+- 调度器读取"fresh"实验放入队列。空闲且可达的工作节点从队列头部取出实验，
+  调度器认领（ExperimentDefinition.claim）后在一个子进程中运行它。
+  ExperimentRunner的配置和全局随机生成器都是进程级的，所以每个实验使用一个
+  子进程。认领是原子的，所以调度器可以与run_sim_exp.py进程同时运行。
+- 一个线程池并行地通过ssh检查工作节点是否可达。连续max_failures次不可达的
+  节点被标记为dead：其上运行的实验的子进程被终止，实验恢复为"fresh"并放回
+  队列头部，由其他节点运行。dead节点恢复可达后重新接收实验。
+- 子进程异常退出时，其实验被放回队列，最多运行max_attempts次，之后标记为
+  simulation_failed。
+- format_status返回每个节点的状态、当前实验和统计，运行期间定期写入
+  status_file。
+
+模拟开始前工作节点会重启（ExperimentRunner._refresh_machine），
+health_interval*max_failures应该大于重启所需的时间。
+"""
+from collections import deque
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+from os import path
+
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+from commonLib.Logging import Log
+from orchestration import dump_query_stats, get_central_db, get_sim_db
+from orchestration.definition import ExperimentDefinition
+from orchestration.running import ExperimentRunner
+from tools.ssh import SSH
+
+
+# 子进程收到SIGTERM后被强制终止前等待其退出的秒数
+_STOP_TIMEOUT = 60
+
+
+class WorkerHost(object):
+    """调度器中一个工作节点的状态。
+
+    state为"unknown"（还没有检查过）、"idle"、"running"或"dead"。
+    """
+
+    def __init__(self, hostname):
+        self.hostname = hostname
+        self.state = "unknown"
+        self.trace_id = None
+        # 进入当前状态的时间
+        self.since = time.time()
+        self.last_check = None
+        self.last_seen = None
+        # 连续不可达的次数
+        self.failures = 0
+        # 产生有效轨迹的实验数和失败的实验数
+        self.done = 0
+        self.failed = 0
+        self._process = None
+        self._result = None
+
+    def set_state(self, state, trace_id=None):
+        self.state = state
+        self.trace_id = trace_id
+        self.since = time.time()
+
+
+class ExperimentDispatcher(object):
+    """在一组工作节点上分派和监控模拟实验。"""
+
+    def __init__(self, hostnames, runner_conf=None,
+                 db_factory=get_central_db, sched_db_factory=get_sim_db,
+                 check_host=None, run_target=None, poll_interval=10,
+                 health_interval=60, max_failures=5, max_attempts=2,
+                 refresh_interval=60, follow=False, status_file=None,
+                 log_folder=None):
+        """
+        Args:
+            hostnames (list): 工作节点的主机名
+            runner_conf (dict): 子进程中ExperimentRunner.configure的参数，
+                run_hostname由调度器设置为工作节点
+            db_factory (callable): 返回配置为访问分析数据库的DB对象的函数
+            sched_db_factory (callable): 以工作节点主机名为参数，返回配置为
+                访问其slurm数据库的DB对象的函数
+            check_host (callable): 以主机名为参数，节点可达时返回True的函数，
+                默认通过ssh执行命令（SSH.is_reachable）
+            run_target (callable): 子进程执行的函数，参数与_run_experiment
+                相同
+            poll_interval (float): 检查子进程和分派实验的间隔秒数
+            health_interval (float): 检查同一节点是否可达的间隔秒数
+            max_failures (int): 节点被标记为dead前连续不可达的次数
+            max_attempts (int): 同一实验最多运行的次数
+            refresh_interval (float): 队列为空时从数据库读取新实验的间隔秒数
+            follow (bool): 为True时没有实验也不退出，等待新实验
+            status_file (str): 定期写入format_status的文件
+            log_folder (str): 子进程的输出追加到此文件夹中的
+                worker.log.<主机名>，为None时输出到调度器的标准输出
+        """
+        self._hosts = [WorkerHost(x) for x in hostnames]
+        self._runner_conf = runner_conf or {}
+        self._db_factory = db_factory
+        self._sched_db_factory = sched_db_factory
+        self._check_host = check_host or _check_host
+        self._run_target = run_target or _run_experiment
+        self._poll_interval = poll_interval
+        self._health_interval = health_interval
+        self._max_failures = max_failures
+        self._max_attempts = max_attempts
+        self._refresh_interval = refresh_interval
+        self._follow = follow
+        self._status_file = status_file
+        self._log_folder = log_folder
+        self._queue = deque()
+        self._attempts = {}
+        self._last_refresh = None
+        self._stopping = False
+        self._terminating = False
+        self._db = None
+
+    def run(self):
+        """
+        分派队列中的实验直到没有"fresh"实验且所有实验运行结束（follow为
+        True时一直运行）。所有节点都dead时等待它们恢复。第一次收到SIGINT
+        或SIGTERM时不再分派新的实验，等待运行中的实验结束；第二次收到时
+        终止子进程，它们的实验恢复为"fresh"。
+        Returns:
+            int: 产生了有效轨迹的实验数
+        """
+        self._db = self._db_factory()
+        pool = ThreadPool(len(self._hosts))
+
+        def stop_dispatching(signum, frame):
+            if self._stopping:
+                print "Terminating running experiments"
+                self._terminating = True
+            else:
+                print "Stopping dispatch after the running experiments"
+                self._stopping = True
+        old_handlers = [(x, signal.signal(x, stop_dispatching))
+                        for x in [signal.SIGINT, signal.SIGTERM]]
+        try:
+            while True:
+                self._check_hosts(pool)
+                self._collect()
+                if self._terminating:
+                    for host in self._get_hosts("running"):
+                        self._stop_host(host, "dispatcher terminated",
+                                        count_attempt=False)
+                if not self._stopping:
+                    self._refresh_queue(
+                                    force=not self._get_hosts("running"))
+                    self._assign()
+                self._write_status()
+                if (not self._get_hosts("running") and
+                        (self._stopping or
+                         (not self._queue and not self._follow))):
+                    break
+                time.sleep(self._poll_interval)
+        finally:
+            for (signum, handler) in old_handlers:
+                signal.signal(signum, handler)
+            pool.close()
+            pool.join()
+        self._write_status()
+        return sum([x.done for x in self._hosts])
+
+    def get_status(self):
+        """返回每个节点的状态：{hostname, state, trace_id, since, last_seen,
+        failures, done, failed}的列表。"""
+        return [dict(hostname=x.hostname, state=x.state, trace_id=x.trace_id,
+                     since=x.since, last_seen=x.last_seen,
+                     failures=x.failures, done=x.done, failed=x.failed)
+                for x in self._hosts]
+
+    def format_status(self):
+        """返回调度器状态的文本表格：队列长度和每个节点的状态。"""
+        now = time.time()
+        lines = ["Dispatcher status at {0}: {1} queued, {2} running, "
+                 "{3} dead".format(
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    len(self._queue), len(self._get_hosts("running")),
+                    len(self._get_hosts("dead"))),
+                 "{0:<24} {1:<8} {2:>9} {3:>9} {4:>6} {5:>6} {6:>9}".format(
+                    "host", "state", "trace_id", "for(s)", "done", "failed",
+                    "seen(s)")]
+        for host in self._hosts:
+            seen = "-"
+            if host.last_seen is not None:
+                seen = int(now - host.last_seen)
+            lines.append("{0:<24} {1:<8} {2:>9} {3:>9} {4:>6} {5:>6} "
+                         "{6:>9}".format(host.hostname, host.state,
+                                         host.trace_id or "-",
+                                         int(now - host.since), host.done,
+                                         host.failed, seen))
+        return "\n".join(lines)
+
+    def _get_hosts(self, state):
+        return [x for x in self._hosts if x.state == state]
+
+    def _check_hosts(self, pool):
+        """并行检查到期的节点是否可达，更新它们的状态。连续max_failures次
+        不可达的节点被标记为dead，其运行的实验被放回队列。"""
+        now = time.time()
+        due = [x for x in self._hosts if x.last_check is None or
+               now - x.last_check >= self._health_interval]
+        if not due:
+            return
+        results = pool.map(self._check_host, [x.hostname for x in due])
+        for (host, reachable) in zip(due, results):
+            host.last_check = now
+            if reachable:
+                host.failures = 0
+                host.last_seen = now
+                if host.state in ["unknown", "dead"]:
+                    Log.log("Worker {0} is up".format(host.hostname))
+                    host.set_state("idle")
+                continue
+            host.failures += 1
+            if host.failures >= self._max_failures and host.state != "dead":
+                if host.state == "running":
+                    self._stop_host(host, "worker is not reachable")
+                Log.log("Worker {0} is dead".format(host.hostname))
+                host.set_state("dead")
+
+    def _collect(self):
+        """处理运行结束的子进程。"""
+        for host in self._get_hosts("running"):
+            if host._process.is_alive():
+                continue
+            host._process.join()
+            exitcode = host._process.exitcode
+            if exitcode != 0:
+                self._release(host, "process exited with code {0}".format(
+                                                                exitcode))
+            elif host._result.value == 1:
+                print "Exp({0}) Done on {1}".format(host.trace_id,
+                                                    host.hostname)
+                host.done += 1
+            else:
+                print "Exp({0}) Error on {1}!".format(host.trace_id,
+                                                      host.hostname)
+                host.failed += 1
+            host._process = None
+            host._result = None
+            host.set_state("idle")
+
+    def _stop_host(self, host, reason, count_attempt=True):
+        """终止节点上运行实验的子进程并放回其实验。子进程收到SIGTERM后
+        关闭其ssh会话，_STOP_TIMEOUT秒内没有退出时被强制终止。"""
+        host._process.terminate()
+        host._process.join(_STOP_TIMEOUT)
+        if host._process.is_alive():
+            os.kill(host._process.pid, signal.SIGKILL)
+            host._process.join()
+        host._process = None
+        host._result = None
+        self._release(host, reason, count_attempt=count_attempt)
+        host.set_state("idle")
+
+    def _release(self, host, reason, count_attempt=True):
+        """实验没有正常结束：实验运行次数少于max_attempts时恢复为"fresh"并
+        放回队列头部，否则标记为simulation_failed。"""
+        trace_id = host.trace_id
+        if not count_attempt:
+            self._attempts[trace_id] -= 1
+        ed = ExperimentDefinition()
+        ed.load(self._db, trace_id)
+        if self._attempts[trace_id] < self._max_attempts:
+            ed.upate_state(self._db, "fresh")
+            self._queue.appendleft(trace_id)
+            Log.log("Exp({0}) on {1} requeued: {2}".format(
+                                        trace_id, host.hostname, reason))
+        else:
+            ed.mark_simulation_failed(self._db)
+            host.failed += 1
+            Log.log("Exp({0}) on {1} failed after {2} attempts: {3}".format(
+                            trace_id, host.hostname,
+                            self._attempts[trace_id], reason))
+
+    def _refresh_queue(self, force=False):
+        """队列为空时（force为False时最多每refresh_interval秒一次）将
+        "fresh"实验按trace_id顺序加入队列。"""
+        if self._queue:
+            return
+        now = time.time()
+        if (not force and self._last_refresh is not None and
+                now - self._last_refresh < self._refresh_interval):
+            return
+        self._last_refresh = now
+        running = [x.trace_id for x in self._get_hosts("running")]
+        for trace_id in ExperimentDefinition().get_exps_in_state(self._db,
+                                                                 "fresh"):
+            if int(trace_id) not in running:
+                self._queue.append(int(trace_id))
+
+    def _assign(self):
+        """将队列头部的实验分派给空闲的节点。"""
+        for host in self._get_hosts("idle"):
+            while self._queue:
+                trace_id = self._queue.popleft()
+                ed = ExperimentDefinition()
+                # 实验可能已被其他调度器或run_sim_exp.py认领
+                if ed.claim(self._db, "fresh", "pre_simulating",
+                            trace_id=trace_id):
+                    self._start(host, trace_id)
+                    break
+            if not self._queue:
+                break
+
+    def _start(self, host, trace_id):
+        """在子进程中在host上运行trace_id的实验。"""
+        self._attempts[trace_id] = self._attempts.get(trace_id, 0) + 1
+        result = multiprocessing.Value("i", -1)
+        process = multiprocessing.Process(
+                        target=_child_main,
+                        args=(self._run_target,
+                              (host.hostname, trace_id, self._runner_conf,
+                               self._db_factory, self._sched_db_factory,
+                               self._log_folder, result)))
+        process.start()
+        print "Exp({0}) dispatched to {1}".format(trace_id, host.hostname)
+        host._process = process
+        host._result = result
+        host.set_state("running", trace_id)
+
+    def _write_status(self):
+        if not self._status_file:
+            return
+        tmp_file = self._status_file + ".tmp"
+        status = open(tmp_file, "w")
+        status.write(self.format_status() + "\n")
+        status.close()
+        os.rename(tmp_file, self._status_file)
+
+
+def _check_host(hostname):
+    """节点可以通过ssh执行命令时返回True。"""
+    return SSH(hostname).is_reachable()
+
+
+def _child_main(target, args):
+    """ExperimentDispatcher的子进程：恢复信号处理后执行target。"""
+    # 调度器处理SIGINT（终端中的Ctrl-C也会发给子进程），SIGTERM用于终止
+    # 子进程：引发SystemExit，使ExperimentRunner.do_full_run的finally关闭
+    # 持久ssh会话（主连接和套接字目录）
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    target(*args)
+
+
+def _exit_on_signal(signum, frame):
+    raise SystemExit("Terminated by signal {0}".format(signum))
+
+
+def _run_experiment(hostname, trace_id, runner_conf, db_factory,
+                    sched_db_factory, log_folder, result):
+    """在hostname上运行已认领的trace_id实验，产生有效轨迹时将result设为1，
+    否则为0。"""
+    if log_folder:
+        log_file = open(path.join(log_folder,
+                                  "worker.log.{0}".format(hostname)), "a")
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(log_file.fileno(), sys.stdout.fileno())
+        os.dup2(log_file.fileno(), sys.stderr.fileno())
+    conf = dict(runner_conf)
+    conf["run_hostname"] = hostname
+    ExperimentRunner.configure(**conf)
+    central_db_obj = db_factory()
+    ed = ExperimentDefinition()
+    ed.load(central_db_obj, trace_id)
+    print "开始运行的实验trace id为：{0}，实验名称为:{1}".format(
+                                                    ed._trace_id, ed._name)
+    er = ExperimentRunner(ed)
+    result.value = int(bool(er.do_full_run(sched_db_factory(hostname),
+                                           central_db_obj)))
+    dump_query_stats(trace_id)
@@ -3,22 +3,35 @@ from generate.pattern import (WorkflowGeneratorSingleJob, RepeatingAlarmTimer,
                               WorkflowGeneratorMultijobs, PatternGenerator)
 from generate.special import SpecialGenerators
 from generate.special.machine_filler import filler
+from generate.background import (BackgroundRecorder, BackgroundStream,
+                                 NoRandomGen, RandomNeededError,
+                                 RecordingTraceGenerator)
 from slurm.trace_gen import TraceGenerator
 import os
+import pipes
 import random_control
 import shutil
 import subprocess
+import tempfile
+import threading
 
 from os import path
 from datetime import timedelta
+from commonLib.DBManager import SQLiteDB
 from stats.trace import ResultTrace
 from tools.ssh import SSH
+from orchestration.trace_cache import (TraceCache, get_trace_key,
+                                       get_background_key)
 from time import sleep
 from generate.overload import OverloadTimeController
 
 class ExperimentRunner(object):
     """工作器类，能够接受实验定义、生成其工作负载、运行实验并导入以存储结果。
     """
+    # 同一进程中的ExperimentRunner都操作同一个工作节点（_run_hostname）。
+    # 重启工作节点时持有此锁，流水线模式中放置文件的操作不会与重启重叠。
+    _machine_lock = threading.Lock()
+
     @classmethod
     def configure(cld,
                   trace_folder="/TBD/", #/TBD/ 是一种占位符，通常代表 "To Be Determined"（待定）
@@ -33,7 +46,10 @@ class ExperimentRunner(object):
                   stop_sim_script = "stop_sim.sh",
                   manifest_folder="manifests",
                   scheduler_acc_table="perfdevel_job_table",
-                  drain_time=6*3600):
+                  drain_time=6*3600,
+                  trace_cache_dir=None,
+                  trace_cache_max_mb=None,
+                  trace_export=None):
         """ T他的类方法配置所有experimentunner实例所需的运行时参数。
         Args:
         - trace_folder: 将存储工作负载文件的最终文件系统目的地（本地或远程）.
@@ -55,6 +71,15 @@ class ExperimentRunner(object):
             simulation.
         - manifest_folder: 在这个本地文件夹中，实验者可以找到要在模拟中使用的manifest.
         - scheduler_acc_table: 调度程序数据库中用于存储作业记帐信息的表的名称.
+        - trace_cache_dir: 缓存生成的工作负载文件的本地文件夹（见
+            orchestration.trace_cache）。默认读取环境变量TRACE_CACHE_DIR，
+            未设置或为空字符串时不使用缓存。
+        - trace_cache_max_mb: 工作负载缓存的大小上限（MB）。默认读取环境变量
+            TRACE_CACHE_MAX_MB，未设置时为10240。
+        - trace_export: 为True时import_trace在调度器主机上导出作业表，一次
+            传输压缩的导出文件后在本地读取，而不是远程查询作业表；导出失败
+            时回退到远程查询。默认读取环境变量TRACE_EXPORT，未设置时为True，
+            为"0"时为False。
         """
         cld._trace_folder= trace_folder
         cld._trace_generation_folder = trace_generation_folder
@@ -70,6 +95,17 @@ class ExperimentRunner(object):
         cld._manifest_folder=manifest_folder
         cld._scheduler_acc_table = scheduler_acc_table
         cld._drain_time = drain_time
+        if trace_cache_dir is None:
+            trace_cache_dir = os.getenv("TRACE_CACHE_DIR") or None
+        if trace_cache_max_mb is None:
+            trace_cache_max_mb = int(os.getenv("TRACE_CACHE_MAX_MB", 10240))
+        if trace_export is None:
+            trace_export = os.getenv("TRACE_EXPORT", "1") != "0"
+        cld._trace_export = trace_export
+        cld._trace_cache = None
+        if trace_cache_dir:
+            cld._trace_cache = TraceCache(trace_cache_dir,
+                                          trace_cache_max_mb*1024*1024)
     
     @classmethod
     def get_manifest_folder(cld):
@@ -83,7 +119,20 @@ class ExperimentRunner(object):
         - definition: 定义对象，其中包含由该对象运行的实验的配置.
         """
         self._definition=definition
-    
+        self._ssh = None
+
+    def _get_ssh(self):
+        """返回本对象所有远程操作复用的SSH对象（持久的多路复用会话）。"""
+        if self._ssh is None:
+            self._ssh = SSH(ExperimentRunner._run_hostname,
+                            ExperimentRunner._run_user, persistent=True)
+        return self._ssh
+
+    def close(self):
+        """关闭远程操作的SSH会话。"""
+        if self._ssh is not None:
+            self._ssh.close()
+            self._ssh = None
     
     def do_full_run(self, scheduler_db_obj, store_db_obj):
         """ 创建工作负载跟踪并根据self._definition设置调度器配置。
@@ -93,25 +142,59 @@ class ExperimentRunner(object):
         - store_db_obj: DBManager对象，配置为连接到应该存储结果跟踪的数据库。
             如果模拟生成了有效的跟踪，则返回True。假,否则.
         """
-        # 准备机器状态以进行全新的模拟运行
-        self._refresh_machine()
-        # 创建跟踪文件，用于记录模拟过程中的数据
-        self.create_trace_file()
-        # 执行模拟过程
-        self.do_simulation()
-        # 标记实验状态为正在模拟，并记录执行模拟的主机名
-        self._definition.mark_simulating(store_db_obj,
+        try:
+            # 准备机器状态以进行全新的模拟运行
+            self._refresh_machine()
+            # 创建跟踪文件，用于记录模拟过程中的数据
+            self.create_trace_file()
+            # 执行模拟过程
+            self.do_simulation()
+            # 标记实验状态为正在模拟，并记录执行模拟的主机名
+            self._definition.mark_simulating(store_db_obj,
                                      worker_host=ExperimentRunner._run_hostname)
-        # 等待模拟结束
-        self.wait_for_sim_to_end()
-        # 检查跟踪数据有效性并存储，如果有效则标记模拟完成，否则标记模拟失败
-        if self.check_trace_and_store(scheduler_db_obj, store_db_obj):
+            # 等待模拟结束
+            self.wait_for_sim_to_end()
+            # 检查跟踪数据有效性并存储，如果有效则标记模拟完成，否则标记模拟失败
+            return self.finish_run(
+                    self.check_trace_and_store(scheduler_db_obj, store_db_obj),
+                    store_db_obj)
+        finally:
+            self.close()
+
+    def finish_run(self, status, store_db_obj):
+        """根据结果轨迹的有效性status标记模拟完成（并删除放置的工作负载
+        文件）或失败。返回status。"""
+        if status:
             self._definition.mark_simulation_done(store_db_obj)
             self.clean_trace_file()
-            return True
         else:
             self._definition.mark_simulation_failed(store_db_obj)
-            return False
+        return status
+
+    def stage_trace_file(self):
+        """流水线模式（ExperimentWorker.do_work_pipelined）的第一步：生成
+        工作负载文件，只放置作业提交列表，它的文件名因实验而异，可以在其他
+        实验的模拟运行时放置。放置不与工作节点的重启重叠，并保留本地副本：
+        轨迹目录可能在重启时被清空，run_staged_simulation在重启后检查并在
+        需要时重新放置。用户列表和manifest的目标文件名是固定的，由
+        run_staged_simulation在模拟开始前放置。
+        """
+        file_names = self._generate_trace_files(self._definition)
+        with ExperimentRunner._machine_lock:
+            self._stage_trace_file(file_names[0], move=False)
+
+    def run_staged_simulation(self, store_db_obj):
+        """流水线模式的第二步：重启工作节点，确认stage_trace_file放置的
+        工作负载仍在并放置用户列表和manifest，运行模拟并等待其结束。"""
+        with ExperimentRunner._machine_lock:
+            self._refresh_machine()
+        self._place_staged_trace_file()
+        self._place_manifests()
+        self._place_users_file(self._definition.get_users_file_name())
+        self.do_simulation()
+        self._definition.mark_simulating(store_db_obj,
+                                     worker_host=ExperimentRunner._run_hostname)
+        self.wait_for_sim_to_end()
 
     def check_trace_and_store(self, scheduler_db_obj, store_db_obj):
         """从调度器数据库导入实验结果跟踪数据并存储到中央数据库
@@ -129,11 +212,97 @@ class ExperimentRunner(object):
             2. 验证跟踪数据的完整性和有效性
             3. 将验证后的跟踪数据存入结果存储库
         """
-        # 初始化结果跟踪对象并导入调度器数据库数据
+        return self.store_trace(self.import_trace(scheduler_db_obj),
+                                store_db_obj)
+
+    def import_trace(self, scheduler_db_obj):
+        """从调度器数据库导入实验结果跟踪数据。下一次模拟开始前必须完成。
+        Returns:
+            ResultTrace: 导入的轨迹
+        """
         result_trace = ResultTrace()
+        if (getattr(ExperimentRunner, "_trace_export", False) and
+                not isinstance(scheduler_db_obj, SQLiteDB) and
+                self._import_exported_trace(result_trace, scheduler_db_obj)):
+            return result_trace
         result_trace.import_from_db(scheduler_db_obj,
                                     ExperimentRunner._scheduler_acc_table)
+        return result_trace
 
+    def _import_exported_trace(self, result_trace, scheduler_db_obj):
+        """在调度器所在主机上将作业表导出为压缩文件（见
+        ResultTrace.get_export_command），一次传输到本地后读入result_trace。
+        Returns:
+            bool: 导入成功时为True；失败时为False，此时应远程查询作业表
+        """
+        file_name = "{0}.export.tsv.gz".format(self._definition._trace_id)
+        dest = path.join(ExperimentRunner._trace_folder, file_name)
+        local_route = path.join(ExperimentRunner._trace_generation_folder,
+                                file_name)
+        defaults_dest = path.join(ExperimentRunner._trace_folder,
+                                  "{0}.export.cnf".format(
+                                                self._definition._trace_id))
+        if not self._push_export_defaults(result_trace, scheduler_db_obj,
+                                          defaults_dest):
+            print "Trace export options push failed, importing from the " \
+                  "database"
+            return False
+        command = result_trace.get_export_command(
+                                        ExperimentRunner._scheduler_acc_table,
+                                        dest, defaults_dest)
+        if not self._exec_shell_dest(command):
+            # 命令结束时删除选项文件，没有执行时在这里删除
+            self._exec_shell_dest("rm -f {0}".format(
+                                                pipes.quote(defaults_dest)))
+            print "Trace export failed, importing from the database"
+            return False
+        try:
+            if not self._retrieve_file(dest, local_route):
+                print "Trace export retrieve failed, importing from the " \
+                      "database"
+                return False
+            try:
+                result_trace.import_from_export(local_route)
+            except (IOError, ValueError) as e:
+                print "Trace export could not be read, importing from the " \
+                      "database:", e
+                return False
+            finally:
+                os.remove(local_route)
+        finally:
+            self._del_file_dest(dest)
+        print "Trace imported from export: {0} jobs".format(
+                                len(result_trace._lists_submit["id_job"]))
+        return True
+
+    def _push_export_defaults(self, result_trace, scheduler_db_obj, dest):
+        """将导出使用的mysql选项文件（包含密码，见
+        ResultTrace.get_export_defaults）以0600权限写到调度器所在主机的
+        dest，成功时返回True。"""
+        host = None
+        if (not ExperimentRunner._local and
+                scheduler_db_obj.hostName == ExperimentRunner._run_hostname):
+            # 导出在数据库所在主机上执行：连接本机，对外部地址的授权可能不同
+            host = "localhost"
+        # mkstemp创建0600权限的文件，复制时保留该权限
+        (fd, local_route) = tempfile.mkstemp(
+                                dir=ExperimentRunner._trace_generation_folder)
+        try:
+            os.write(fd, result_trace.get_export_defaults(scheduler_db_obj,
+                                                          host=host))
+            os.close(fd)
+            if ExperimentRunner._local:
+                shutil.copy(local_route, dest)
+                return True
+            return self._get_ssh().push_file(local_route, dest)
+        finally:
+            os.remove(local_route)
+
+    def store_trace(self, result_trace, store_db_obj):
+        """验证import_trace导入的轨迹并将其存入结果存储库。
+        Returns:
+            bool: 模拟产生了有效跟踪数据时为True
+        """
         status = True
         # 获取实验定义的结束时间阈值
         end_time = self._definition.get_end_epoch()
@@ -169,6 +338,35 @@ class ExperimentRunner(object):
         self._place_users_file(file_names[2])
 
     def _generate_trace_files(self, definition, trace_generator=None):
+        """
+        在ExperimentRunner._trace_generation_folder中创建实验定义的工作负载
+        文件。配置了工作负载缓存且没有指定trace_generator时，命中缓存则复制
+        缓存的文件，否则生成文件后将其保存到缓存中。
+        Args:
+            definition (ExperimentDefinition): 实验定义
+            trace_generator (TraceGenerator, optional): 跟踪生成器实例。
+        Returns:
+            list[str]: 跟踪文件、QoS文件和用户文件的文件名
+        """
+        trace_cache = getattr(ExperimentRunner, "_trace_cache", None)
+        if trace_cache is None or trace_generator is not None:
+            return self._create_trace_files(definition, trace_generator)
+        file_names = [definition.get_trace_file_name(),
+                      definition.get_qos_file_name(),
+                      definition.get_users_file_name()]
+        file_routes = [path.join(ExperimentRunner._trace_generation_folder, x)
+                       for x in file_names]
+        key = get_trace_key(definition, ExperimentRunner.get_manifest_folder())
+        if trace_cache.get(key, file_routes):
+            print "Trace files found in cache:", key
+            return file_names
+        file_names = self._overlay_trace_files(definition, trace_cache)
+        if file_names is None:
+            file_names = self._create_trace_files(definition)
+        trace_cache.put(key, file_routes)
+        return file_names
+
+    def _create_trace_files(self, definition, trace_generator=None):
         """
         根据实验定义生成工作负载跟踪文件，并保存到指定路径。
         Args:
@@ -201,12 +399,7 @@ class ExperimentRunner(object):
          filter_core_hours) = machine.get_filter_values()
 
         # 初始化核心工作负载生成器，组合各类配置参数
-        wg = WorkloadGenerator(machine=definition.get_machine(),
-                               trace_generator=trace_generator,
-                               user_list=definition.get_user_list(),
-                               qos_list=definition.get_qos_list(),
-                               partition_list=definition.get_partition_list(),
-                               account_list=definition.get_account_list())
+        wg = self._get_workload_generator(definition, trace_generator)
 
         # 工作流策略处理分支
         if definition._workflow_policy.split("-")[0] == "sp":
@@ -246,26 +439,113 @@ class ExperimentRunner(object):
                 "about to register", wg, overload_time
                 wg.register_pattern_generator_timer(overload_time)
 
-            # 根据工作流处理方式初始化对应生成器
-            manifest_list = [m["manifest"] for m in definition._manifest_list]
-            share_list = [m["share"] for m in definition._manifest_list]
-            if (definition._workflow_handling == "single" or
-                    definition._workflow_handling == "manifest"):
-                flow = WorkflowGeneratorSingleJob(manifest_list, share_list, wg)
-            else:
-                flow = WorkflowGeneratorMultijobs(manifest_list, share_list, wg)
-
-            # 配置工作流触发策略：周期触发或比例触发
-            if definition._workflow_policy == "period":
-                alarm = RepeatingAlarmTimer(flow,
-                                            register_datetime=definition._start_date)
-                alarm.set_alarm_period(definition._workflow_period_s)
-                wg.register_pattern_generator_timer(alarm)
-            elif definition._workflow_policy == "percentage":
-                wg.register_pattern_generator_share(flow,
-                                                    definition._workflow_share / 100)
+            self._register_workflow_generator(definition, wg)
 
         # 初始化等待时间填充处理
+        self._add_initial_wait_jobs(definition, wg, trace_generator, machine)
+
+        # 核心trace生成阶段
+        wg.generate_trace((definition._start_date -
+                           timedelta(0, definition._preload_time_s)),
+                          (definition._preload_time_s +
+                           definition._workload_duration_s))
+
+        return self._dump_trace_files(definition, trace_generator, machine)
+
+    def _overlay_trace_files(self, definition, trace_cache):
+        """
+        使用缓存的背景作业流生成工作负载文件：背景作业流不在缓存中时生成并
+        缓存它，然后将实验定义的工作流叠加到背景作业流上（见
+        generate.background）。结果与_create_trace_files生成的文件相同。
+        Args:
+            definition (ExperimentDefinition): 实验定义
+            trace_cache (TraceCache): 保存背景作业流的缓存
+        Returns:
+            list[str]: 跟踪文件、QoS文件和用户文件的文件名。实验定义的
+                工作流不能叠加时为None，此时应使用_create_trace_files。
+        """
+        if (definition._trace_type != "single" or
+                definition._workflow_policy not in ["period", "no"] or
+                definition.get_overload_factor() > 0.0):
+            return None
+        key = get_background_key(definition)
+        stream_route = path.join(ExperimentRunner._trace_generation_folder,
+                                 definition.get_trace_file_name() +
+                                 ".background")
+        if trace_cache.get(key, [stream_route], entry_files=["background"]):
+            print "Background stream found in cache:", key
+            stream = BackgroundStream.load(stream_route)
+        else:
+            stream = self._generate_background(definition)
+            stream.save(stream_route)
+            trace_cache.put(key, [stream_route], entry_files=["background"])
+        os.remove(stream_route)
+
+        # 注入工作流不能使用随机数，否则其结果与完整生成不同
+        random_control.set_global_random_gen(random_gen=NoRandomGen())
+        try:
+            machine = definition.get_machine()
+            trace_generator = TraceGenerator()
+            wg = self._get_workload_generator(definition, trace_generator)
+            self._register_workflow_generator(definition, wg)
+            stream.replay(wg)
+        except RandomNeededError as e:
+            print "Workflows cannot be overlaid on the background:", e
+            return None
+        finally:
+            random_control.set_global_random_gen(random_gen=None)
+        return self._dump_trace_files(definition, trace_generator, machine)
+
+    def _generate_background(self, definition):
+        """生成并记录实验定义的背景作业流：与_create_trace_files相同，但不
+        注册工作流生成器。"""
+        random_control.set_global_random_gen(seed=definition._seed)
+        machine = definition.get_machine()
+        trace_generator = RecordingTraceGenerator()
+        wg = self._get_workload_generator(definition, trace_generator)
+        wg.config_filter_func(machine.job_can_be_submitted)
+        wg.set_max_interarrival(machine.get_max_interarrival())
+        recorder = BackgroundRecorder(wg)
+        wg.register_pattern_generator_timer(recorder)
+        self._add_initial_wait_jobs(definition, wg, trace_generator, machine)
+        wg.generate_trace((definition._start_date -
+                           timedelta(0, definition._preload_time_s)),
+                          (definition._preload_time_s +
+                           definition._workload_duration_s))
+        trace_generator.free_mem()
+        return recorder.get_stream()
+
+    def _get_workload_generator(self, definition, trace_generator):
+        return WorkloadGenerator(machine=definition.get_machine(),
+                                 trace_generator=trace_generator,
+                                 user_list=definition.get_user_list(),
+                                 qos_list=definition.get_qos_list(),
+                                 partition_list=definition.get_partition_list(),
+                                 account_list=definition.get_account_list())
+
+    def _register_workflow_generator(self, definition, wg):
+        """按照实验定义的工作流策略在wg中注册工作流生成器。"""
+        # 根据工作流处理方式初始化对应生成器
+        manifest_list = [m["manifest"] for m in definition._manifest_list]
+        share_list = [m["share"] for m in definition._manifest_list]
+        if (definition._workflow_handling == "single" or
+                definition._workflow_handling == "manifest"):
+            flow = WorkflowGeneratorSingleJob(manifest_list, share_list, wg)
+        else:
+            flow = WorkflowGeneratorMultijobs(manifest_list, share_list, wg)
+
+        # 配置工作流触发策略：周期触发或比例触发
+        if definition._workflow_policy == "period":
+            alarm = RepeatingAlarmTimer(flow,
+                                        register_datetime=definition._start_date)
+            alarm.set_alarm_period(definition._workflow_period_s)
+            wg.register_pattern_generator_timer(alarm)
+        elif definition._workflow_policy == "percentage":
+            wg.register_pattern_generator_share(flow,
+                                                definition._workflow_share / 100)
+
+    def _add_initial_wait_jobs(self, definition, wg, trace_generator, machine):
+        """实验定义要求强制初始等待时，在工作负载开始前加入填充作业。"""
         target_wait = definition.get_forced_initial_wait()
         if target_wait:
             default_job_separation = 10
@@ -280,12 +560,12 @@ class ExperimentRunner(object):
                    job_separation=separation)
             trace_generator.reset_work()
 
-        # 核心trace生成阶段
-        wg.generate_trace((definition._start_date -
-                           timedelta(0, definition._preload_time_s)),
-                          (definition._preload_time_s +
-                           definition._workload_duration_s))
-
+    def _dump_trace_files(self, definition, trace_generator, machine):
+        """报告生成的工作负载的作业压力，并将其写入
+        ExperimentRunner._trace_generation_folder。
+        Returns:
+            list[str]: 跟踪文件、QoS文件和用户文件的文件名
+        """
         # 计算作业压力指标（系统负载率）
         max_cores = machine.get_total_cores()
         total_submitted_core_s = trace_generator.get_total_submitted_core_s()
@@ -321,19 +601,53 @@ class ExperimentRunner(object):
         Args:
         - filename: string with the name of the workload files.
         """
+        self._stage_trace_file(filename)
+        self._place_manifests()
+
+    def _stage_trace_file(self, filename, move=True):
+        """将作业提交列表从本地生成目录移动（move为False时复制）到调度器的
+        轨迹目录。"""
         source = path.join(
                         ExperimentRunner._trace_generation_folder, filename)
         dest =  path.join(
                         ExperimentRunner._trace_folder, filename)
-        self._copy_file(source, dest, move=True)
-        
+        self._copy_file(source, dest, move=move, compress=True)
+
+    def _place_staged_trace_file(self):
+        """重启后确认stage_trace_file放置的作业提交列表仍在调度器的轨迹
+        目录中，不在时（例如目录在重启时被清空）从本地副本重新放置，然后
+        删除本地副本。"""
+        filename = self._definition.get_trace_file_name()
+        dest = path.join(ExperimentRunner._trace_folder, filename)
+        if self._exists_dest(dest):
+            os.remove(path.join(ExperimentRunner._trace_generation_folder,
+                                filename))
+        else:
+            print "Staged trace file not found after reboot, placing it again"
+            self._stage_trace_file(filename)
+
+    def discard_staged_trace_file(self):
+        """删除没有模拟的实验由stage_trace_file放置的作业提交列表和它的
+        本地副本。"""
+        filename = self._definition.get_trace_file_name()
+        local_route = path.join(ExperimentRunner._trace_generation_folder,
+                                filename)
+        if path.exists(local_route):
+            os.remove(local_route)
+        dest = path.join(ExperimentRunner._trace_folder, filename)
+        with ExperimentRunner._machine_lock:
+            if self._exists_dest(dest):
+                self._del_file_dest(dest)
+
+    def _place_manifests(self):
+        """将实验使用的manifest复制到调度器目录。"""
         for manifest in self._definition._manifest_list:
             man_name=manifest["manifest"]
             man_route_orig=path.join(ExperimentRunner._manifest_folder, 
                                      man_name)
             man_route_dest=path.join(ExperimentRunner._scheduler_folder, 
                                      man_name)
-            self._copy_file(man_route_orig, man_route_dest)
+            self._copy_file(man_route_orig, man_route_dest, compress=True)
     
     def _place_users_file(self, filename):
         """Places the users list in the scheduler configuration folder. It
@@ -350,13 +664,18 @@ class ExperimentRunner(object):
       
 
     def clean_trace_file(self):
-        """Removes the trace file placed in the scheduler.
+        """Removes the trace file placed in the scheduler. In pipelined mode
+        it runs while another experiment may be rebooting the worker: it does
+        not overlap the reboot and uses a new session, the current one may
+        have been opened before the reboot.
         """
         filenames = [self._definition.get_trace_file_name()]
-        for filename in filenames:
-            dest =  path.join(
-                        ExperimentRunner._trace_folder, filename)
-            self._del_file_dest(dest)
+        with ExperimentRunner._machine_lock:
+            self.close()
+            for filename in filenames:
+                dest =  path.join(
+                            ExperimentRunner._trace_folder, filename)
+                self._del_file_dest(dest)
             
     def do_simulation(self):
         """根据实验工作流处理配置配置调度程序。运行模拟。
@@ -372,6 +691,8 @@ class ExperimentRunner(object):
         command=["sudo", "/sbin/shutdown", "-r", "now"] 
         print "About to reboot the machine, waiting 60s"
         self._exec_dest(command)
+        # 重启后主连接失效
+        self.close()
         sleep(60)
         while not "hola" in self._exec_dest(["/bin/echo", "hola"]):
             print "Machine is not ready yet, waiting 30s more..."
@@ -459,22 +780,48 @@ class ExperimentRunner(object):
         # 复制配置文件到目标位置
         self._copy_file(orig, dest)
     
-    def _copy_file(self, orig, dest, move=False):
+    def _copy_file(self, orig, dest, move=False, compress=False):
+        """将本地文件orig复制到调度器所在主机的dest。compress为True时远程
+        复制以压缩流传输并在远程校验后原子地替换dest（见
+        SSH.push_file_compressed），失败时抛出IOError并保留orig。"""
         if ExperimentRunner._local:
             shutil.copy(orig, dest)
+        elif compress:
+            if not self._get_ssh().push_file_compressed(orig, dest):
+                raise IOError("Compressed push of {0} to {1} failed".format(
+                                                                orig, dest))
         else:
-            ssh = SSH(ExperimentRunner._run_hostname,
-                          ExperimentRunner._run_user)
-            ssh.push_file(orig, dest)
+            self._get_ssh().push_file(orig, dest)
         if move:
             os.remove(orig)
+    def _retrieve_file(self, orig, dest):
+        """将调度器所在主机的文件orig复制到本地的dest，成功时返回True。"""
+        if ExperimentRunner._local:
+            shutil.copy(orig, dest)
+            return True
+        return self._get_ssh().retrieve_file(orig, dest)
+
+    def _exec_shell_dest(self, shell_command):
+        """在调度器所在主机上用bash执行shell_command，返回码为0时返回
+        True。"""
+        if ExperimentRunner._local:
+            return subprocess.call(["/bin/bash", "-c", shell_command]) == 0
+        # ssh将参数拼接后交给远程shell解析，所以命令需要再转义一次
+        output, err, rc = self._get_ssh().execute_command(
+                                "/bin/bash", ["-c", pipes.quote(shell_command)])
+        return rc == 0
+
+    def _exists_dest(self, dest):
+        """调度器所在主机上存在文件dest时返回True。"""
+        if ExperimentRunner._local:
+            return path.exists(dest)
+        return self._exec_shell_dest("test -f {0}".format(pipes.quote(dest)))
+
     def _del_file_dest(self, dest):
         if ExperimentRunner._local:
                 os.remove(dest)
         else:
-            ssh = SSH(ExperimentRunner._run_hostname,
-                      ExperimentRunner._run_user)
-            ssh.delete_file(dest)
+            self._get_ssh().delete_file(dest)
     def _exec_dest(self, command, background=False):
         """
         根据实验运行的环境（本地或远程）执行给定的命令。
@@ -503,12 +850,11 @@ class ExperimentRunner(object):
             
         else:
             # 在远程环境下执行命令
-            # 创建SSH对象以连接到远程主机
-            ssh = SSH(ExperimentRunner._run_hostname,
-                      ExperimentRunner._run_user)
-            # 使用SSH对象执行远程命令
-            output, err, rc= ssh.execute_command(command[0], command[1:],
-            # 返回命令的输出结果                                         background=background)
+            # 通过本对象的持久SSH会话执行远程命令
+            output, err, rc = self._get_ssh().execute_command(
+                                                command[0], command[1:],
+                                                background=background)
+        # 返回命令的输出结果
         return output
     def is_simulation_done(self):
         """如果模拟引擎不再运行，则返回True"""
@@ -554,7 +900,7 @@ class ExperimentRunner(object):
         """
         检查模拟环境中的所有关键进程是否都在运行。
 
-        该方法首先检查"sim_mgr"进程是否在运行，然后检查"slurmctld"和"slurmd"进程。
+        该方法读取一次进程列表，检查"sim_mgr"、"slurmctld"和"slurmd"进程。
         如果所有这些进程都在运行，则认为模拟环境正在运行。
 
         如果无法检查进程状态，将捕获SystemError异常，并输出错误信息。
@@ -563,14 +909,16 @@ class ExperimentRunner(object):
             bool: 如果模拟环境中的所有关键进程都在运行，则返回True，否则返回False。
         """
         try:
+            # 一次读取进程列表，用于三个进程的检查
+            ps_output = self._get_process_list()
             # 检查"sim_mgr"进程是否在运行
-            if not self.is_it_running("sim_mgr"):
+            if not self.is_it_running("sim_mgr", ps_output):
                 return False
             # 检查"slurmctld"进程是否在运行
-            if not self.is_it_running("slurmctld"):
+            if not self.is_it_running("slurmctld", ps_output):
                 return False
             # 检查"slurmd"进程是否在运行
-            if not self.is_it_running("slurmd"):
+            if not self.is_it_running("slurmd", ps_output):
                 return False
             # 如果所有关键进程都在运行，返回True
             return True
@@ -580,13 +928,20 @@ class ExperimentRunner(object):
             raise SystemError
             # 即使在发生异常的情况下，也认为模拟环境应该是在运行状态，返回True
             return True
-    def is_it_running(self, proc):
+    def _get_process_list(self):
+        """返回本地或远程主机上"ps -eo comm,state"的输出。"""
+        return self._exec_dest(["/bin/ps", "-eo comm,state"])
+
+    def is_it_running(self, proc, ps_output=None):
         """检查名为proc的进程是否正在本地运行或正在远程执行。
         Args:
         - proc: 包含要检查的进程名称的字符串。
+        - ps_output: _get_process_list的输出。为None时读取进程列表。
         """
         # 执行命令以获取当前正在运行的进程列表
-        output=self._exec_dest(["/bin/ps", "-eo comm,state"])
+        output = ps_output
+        if output is None:
+            output = self._get_process_list()
         # 初始化计数器
         count = 0
         total_count=0
@@ -0,0 +1,163 @@
+"""
+分组和增量实验的依赖调度。
+
+分组实验（GroupExperimentDefinition）和增量实验（DeltaExperimentDefinition）
+依赖于它们的子轨迹：只有所有子轨迹都到达subtrace_ready_states中的状态后才能
+分析。DependencyScheduler维护这些聚合实验与子轨迹构成的依赖图：每个聚合实验
+的定义只加载一次，之后只通过一个查询读取尚未就绪的子轨迹的状态（update_states），
+或者由分析了某个实验的进程直接通知其新状态（set_state）。最后一个子轨迹就绪时，
+聚合实验进入就绪队列（pop_ready）。聚合实验本身也可以是其他聚合实验的子轨迹。
+子轨迹到达不可能再变为就绪的状态（失败，或者已经越过了所有就绪状态）时，
+聚合实验及依赖它的聚合实验被阻塞（get_blocked），不再等待。
+"""
+from orchestration.definition import (ExperimentDefinition,
+                                      GroupExperimentDefinition,
+                                      DeltaExperimentDefinition)
+
+# 实验正常推进时work_state经过的状态，按顺序。
+_STATE_ORDER = ["fresh", "pre_simulating", "simulating", "simulation_done",
+                "pending", "pre_analyzing", "analyzing", "analysis_done",
+                "pre_second_pass", "second_pass_done"]
+
+
+def can_become_ready(state, ready_states):
+    """子轨迹处于state状态时，返回它之后是否还可能到达ready_states中的状态。
+    失败状态（*_failed, *_error）和位于所有就绪状态之后的状态返回False，
+    未知状态返回True。"""
+    if state in ready_states:
+        return True
+    if state.endswith("_failed") or state.endswith("_error"):
+        return False
+    if state not in _STATE_ORDER:
+        return True
+    position = _STATE_ORDER.index(state)
+    return len([x for x in ready_states if x in _STATE_ORDER and
+                _STATE_ORDER.index(x) > position]) > 0
+
+
+class DependencyScheduler(object):
+    """聚合实验对其子轨迹的依赖图。"""
+
+    def __init__(self, definition_classes=(GroupExperimentDefinition,
+                                           DeltaExperimentDefinition)):
+        """
+        Args:
+            definition_classes: load读取的聚合实验的定义类
+        """
+        self._definition_classes = definition_classes
+        # trace_id -> 尚未分析的聚合实验的定义
+        self._pending = {}
+        # trace_id -> 该聚合实验尚未就绪的子轨迹
+        self._missing = {}
+        # 子轨迹 -> 等待它的聚合实验
+        self._dependents = {}
+        # 所有子轨迹已就绪的聚合实验，按就绪顺序
+        self._ready = []
+        # trace_id -> 因子轨迹无法就绪而被阻塞的聚合实验的定义
+        self._blocked = {}
+
+    def load(self, db_obj, state="pending"):
+        """加载处于state状态、尚未加入依赖图的聚合实验，然后更新子轨迹的状态。
+        被阻塞的聚合实验会被重新加载，以便子轨迹被重置后继续等待它们。
+        Returns:
+            list: 因此就绪的聚合实验的trace_id
+        """
+        for definition_class in self._definition_classes:
+            for trace_id in definition_class().get_exps_in_state(db_obj,
+                                                                  state):
+                if int(trace_id) in self._pending:
+                    continue
+                self._blocked.pop(int(trace_id), None)
+                definition = definition_class()
+                definition.load(db_obj, int(trace_id))
+                self.add(definition)
+        return self.update_states(db_obj)
+
+    def add(self, definition):
+        """将聚合实验加入依赖图。没有子轨迹的实验立即就绪。"""
+        trace_id = int(definition._trace_id)
+        self._pending[trace_id] = definition
+        self._missing[trace_id] = set([int(x) for x in definition._subtraces])
+        for sub_id in self._missing[trace_id]:
+            self._dependents.setdefault(sub_id, set()).add(trace_id)
+        if not self._missing[trace_id]:
+            self._ready.append(trace_id)
+
+    def update_states(self, db_obj):
+        """用一个查询读取所有尚未就绪的子轨迹的状态。
+        Returns:
+            list: 因此就绪的聚合实验的trace_id
+        Raises:
+            ValueError: 子轨迹不存在时抛出
+        """
+        if not self._dependents:
+            return []
+        sub_ids = sorted(self._dependents.keys())
+        rows = db_obj.getValuesAsColumns(
+                    ExperimentDefinition()._table_name,
+                    ["trace_id", "work_state"],
+                    condition="trace_id IN ({0})".format(
+                                        ",".join([str(x) for x in sub_ids])))
+        if len(rows["trace_id"]) != len(sub_ids):
+            raise ValueError("Subtrace not found!")
+        ready = []
+        for (sub_id, state) in zip(rows["trace_id"], rows["work_state"]):
+            ready += self.set_state(sub_id, state)
+        return ready
+
+    def set_state(self, trace_id, state):
+        """通知trace_id标识的实验到达了state状态。
+        Returns:
+            list: 因此就绪的聚合实验的trace_id
+        """
+        trace_id = int(trace_id)
+        ready = []
+        for parent_id in sorted(self._dependents.get(trace_id, [])):
+            ready_states = self._pending[parent_id].subtrace_ready_states
+            if not can_become_ready(state, ready_states):
+                self._block(parent_id)
+                continue
+            if state not in ready_states:
+                continue
+            self._missing[parent_id].discard(trace_id)
+            self._dependents[trace_id].discard(parent_id)
+            if not self._missing[parent_id]:
+                self._ready.append(parent_id)
+                ready.append(parent_id)
+        if not self._dependents.get(trace_id, True):
+            del self._dependents[trace_id]
+        return ready
+
+    def _block(self, trace_id):
+        """将聚合实验trace_id及依赖它的聚合实验移出依赖图并标记为阻塞。
+        它们的get_missing保持不变。"""
+        if trace_id not in self._pending:
+            return
+        self._blocked[trace_id] = self._pending.pop(trace_id)
+        for sub_id in self._missing[trace_id]:
+            self._dependents[sub_id].discard(trace_id)
+            if not self._dependents[sub_id]:
+                del self._dependents[sub_id]
+        for parent_id in sorted(self._dependents.get(trace_id, [])):
+            self._block(parent_id)
+
+    def pop_ready(self):
+        """从依赖图中移除并返回下一个就绪的聚合实验的定义，没有时返回None。"""
+        if not self._ready:
+            return None
+        trace_id = self._ready.pop(0)
+        del self._missing[trace_id]
+        return self._pending.pop(trace_id)
+
+    def has_pending(self):
+        """依赖图中还有没有被pop_ready取出、也没有被阻塞的聚合实验时返回
+        True。"""
+        return len(self._pending) > 0
+
+    def get_blocked(self):
+        """返回被阻塞的聚合实验的trace_id列表。"""
+        return sorted(self._blocked.keys())
+
+    def get_missing(self, trace_id):
+        """返回聚合实验trace_id（包括被阻塞的）尚未就绪的子轨迹。"""
+        return sorted(self._missing[int(trace_id)])
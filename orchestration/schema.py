@@ -0,0 +1,206 @@
+"""
+中心数据库的模式版本与索引迁移。
+
+SCHEMA_MIGRATIONS按版本号列出每次迁移要添加的复合索引。数据库当前的版本
+记录在schema_version表中，migrate_schema创建缺失的索引并记录完成的迁移，
+已存在且列相同的索引不会重建，所以可以重复运行。verify_schema检查已应用版本的所有
+索引是否存在，explain_hot_queries返回热点查询的执行计划，用于比较迁移前后
+的变化（见bin/sql_migrate_db.py）。
+"""
+from orchestration.definition import ExperimentDefinition
+from stats.trace import ResultTrace
+from stats import Histogram, NumericStats
+
+_TRACES = ResultTrace()._table_name
+_EXPERIMENT = ExperimentDefinition()._table_name
+_HISTOGRAMS = Histogram()._table_name
+_NUMERIC_STATS = NumericStats()._table_name
+_USAGE = ResultTrace()._get_utilization_result()._table_name
+
+SCHEMA_VERSION_TABLE = "schema_version"
+
+# [(版本号, 说明, [(表名, 索引名, [列名])])]，按版本号升序
+SCHEMA_MIGRATIONS = [
+    (1, "Composite indexes for trace loads, worker polls and result lookups",
+     [(_TRACES, "trace_submit_key", ["trace_id", "time_submit"]),
+      (_TRACES, "trace_start_key", ["trace_id", "time_start"]),
+      (_EXPERIMENT, "state_type_key", ["work_state", "trace_type",
+                                       "trace_id"]),
+      (_HISTOGRAMS, "trace_type_key", ["trace_id", "type"]),
+      (_NUMERIC_STATS, "trace_type_key", ["trace_id", "type"]),
+      (_USAGE, "trace_type_key", ["trace_id", "type"])]),
+]
+
+# [(说明, 查询)]：加载轨迹、worker轮询实验表和读取结果时执行的查询
+HOT_QUERIES = [
+    ("trace load by submit time",
+     "SELECT * FROM `{0}` WHERE trace_id=1 ORDER BY time_submit".format(
+                                                                    _TRACES)),
+    ("trace load by start time",
+     "SELECT * FROM `{0}` WHERE trace_id=1 ORDER BY time_start".format(
+                                                                    _TRACES)),
+    ("worker poll",
+     "SELECT trace_id FROM `{0}` WHERE work_state='fresh' and "
+     "trace_type='single' ORDER BY trace_id".format(_EXPERIMENT)),
+    ("histogram lookup",
+     "SELECT * FROM `{0}` WHERE trace_id=1 and type='jobs_runtime_cdf'".format(
+                                                                _HISTOGRAMS)),
+    ("numeric stats lookup",
+     "SELECT * FROM `{0}` WHERE trace_id=1 and type='jobs_runtime_stats'"
+     "".format(_NUMERIC_STATS)),
+    ("utilization lookup",
+     "SELECT * FROM `{0}` WHERE trace_id=1 and type='usage'".format(_USAGE)),
+]
+
+# 执行计划中用于报告的字段：MySQL的EXPLAIN与SQLite的EXPLAIN QUERY PLAN
+_PLAN_FIELDS = ["table", "type", "key", "rows", "Extra", "detail"]
+
+
+def get_latest_version():
+    """返回SCHEMA_MIGRATIONS中最新的版本号。"""
+    return SCHEMA_MIGRATIONS[-1][0]
+
+
+def get_schema_version(db_obj):
+    """返回数据库当前的模式版本，没有schema_version表时为0。"""
+    if SCHEMA_VERSION_TABLE not in _get_tables(db_obj):
+        return 0
+    rows = db_obj.doQuery("SELECT MAX(version) FROM `{0}`".format(
+                                                        SCHEMA_VERSION_TABLE))
+    if not rows or rows[0][0] is None:
+        return 0
+    return int(rows[0][0])
+
+
+def get_indexes(db_obj, table):
+    """
+    返回表的索引。
+    Args:
+        db_obj (DB): 数据库连接对象
+        table (str): 表名
+    Returns:
+        dict: {索引名: [按索引顺序的列名]}，表不存在时为None
+    """
+    if table not in _get_tables(db_obj):
+        return None
+    indexes = {}
+    rows = db_obj.doQueryDic("SHOW INDEX FROM `{0}`".format(table))
+    for row in sorted(rows, key=lambda x: (x["Key_name"],
+                                           int(x["Seq_in_index"]))):
+        indexes.setdefault(row["Key_name"], []).append(row["Column_name"])
+    return indexes
+
+
+def migrate_schema(db_obj, target_version=None):
+    """
+    创建不超过target_version的迁移中缺失的索引，包括已应用的版本中的索引
+    （例如当时表还不存在），然后在schema_version表中记录比数据库当前版本新
+    的已完成迁移的版本号。已存在且列相同的索引被跳过，同名但列不同的索引被
+    删除后重建。表不存在时跳过该表的索引，该迁移和之后的迁移都不被记录，
+    在表创建后再次运行时完成。
+    Args:
+        db_obj (DB): 数据库连接对象
+        target_version (int): 迁移到的版本，默认为最新版本
+    Returns:
+        list: 本次记录的迁移的版本号
+    """
+    if target_version is None:
+        target_version = get_latest_version()
+    db_obj.doUpdate("""CREATE TABLE IF NOT EXISTS `{0}` (
+                        `version` INT NOT NULL,
+                        `description` varchar(256),
+                        `applied` datetime,
+                        PRIMARY KEY(`version`)) ENGINE = InnoDB""".format(
+                                                        SCHEMA_VERSION_TABLE))
+    current_version = get_schema_version(db_obj)
+    applied = []
+    complete = True
+    for (version, description, indexes) in SCHEMA_MIGRATIONS:
+        if version > target_version:
+            continue
+        for (table, name, columns) in indexes:
+            if not _apply_index(db_obj, table, name, columns):
+                complete = False
+        if version <= current_version or not complete:
+            continue
+        db_obj.doUpdate("INSERT INTO `{0}` (version, description, applied) "
+                        "VALUES ({1}, '{2}', now())".format(
+                                SCHEMA_VERSION_TABLE, version, description))
+        applied.append(version)
+    return applied
+
+
+def _apply_index(db_obj, table, name, columns):
+    """创建表table的索引name，同名但列不同的索引被删除后重建。
+    Returns:
+        bool: 索引存在（或已创建）时为True，表不存在时为False
+    """
+    existing = get_indexes(db_obj, table)
+    if existing is None:
+        return False
+    if existing.get(name) == columns:
+        return True
+    if name in existing:
+        db_obj.doUpdate("ALTER TABLE `{0}` DROP INDEX `{1}`".format(
+                                                                table, name))
+    db_obj.doUpdate("ALTER TABLE `{0}` ADD INDEX `{1}` ({2})".format(
+                    table, name,
+                    ", ".join(["`{0}`".format(x) for x in columns])))
+    return True
+
+
+def verify_schema(db_obj):
+    """
+    检查数据库当前版本及之前的迁移中的索引是否都存在且列正确。
+    Returns:
+        list: 描述每个缺失或不一致的索引的字符串，全部正确时为空
+    """
+    current_version = get_schema_version(db_obj)
+    problems = []
+    for (version, description, indexes) in SCHEMA_MIGRATIONS:
+        if version > current_version:
+            continue
+        for (table, name, columns) in indexes:
+            existing = get_indexes(db_obj, table)
+            if existing is None:
+                problems.append("{0}: table missing".format(table))
+            elif name not in existing:
+                problems.append("{0}.{1}: index missing".format(table, name))
+            elif existing[name] != columns:
+                problems.append("{0}.{1}: columns {2}, expected {3}".format(
+                                table, name, existing[name], columns))
+    return problems
+
+
+def explain_hot_queries(db_obj):
+    """
+    返回HOT_QUERIES中每个查询的执行计划。
+    Returns:
+        list: [(说明, 执行计划字符串)]，表不存在等原因无法解释时执行计划
+            为None
+    """
+    plans = []
+    for (description, query) in HOT_QUERIES:
+        rows = db_obj.doQueryDic("EXPLAIN " + query)
+        if rows is False:
+            plans.append((description, None))
+        else:
+            plans.append((description, _format_plan(rows)))
+    return plans
+
+
+def _format_plan(rows):
+    """将EXPLAIN的结果行转换为一行字符串，每个步骤一段，以' | '分隔。"""
+    steps = []
+    for row in rows:
+        steps.append(" ".join(["{0}={1}".format(x, row[x])
+                               for x in _PLAN_FIELDS
+                               if row.get(x) not in (None, "")]))
+    return " | ".join(steps)
+
+
+def _get_tables(db_obj):
+    rows = db_obj.doQuery("SHOW TABLES")
+    if not rows:
+        return []
+    return [x[0] for x in rows]
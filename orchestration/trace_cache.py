@@ -0,0 +1,222 @@
+"""
+按内容寻址的工作负载文件缓存。
+
+给定实验定义中与生成有关的字段、使用的manifest的内容和生成代码的版本
+（TRACE_GENERATOR_VERSION），ExperimentRunner._generate_trace_files生成的
+.trace、.qos和.users文件是确定的。TraceCache以这些输入的哈希值为键保存这三个
+文件，重置后重新运行的实验或相同的实验定义命中缓存时复制缓存的文件，而不再
+重新生成工作负载。每个条目是缓存文件夹中以键命名的子文件夹；命中时更新其修改
+时间，缓存超过大小上限时删除修改时间最早的条目（LRU）。
+
+同一个缓存还保存与工作流无关的背景作业流（generate.background），其键
+（get_background_key）只包含生成背景作业的输入，所以只在工作流上不同的实验
+共享同一个背景作业流。
+
+修改生成工作负载的代码（generate、slurm.trace_gen、machines）使相同的输入
+生成不同的文件时，必须增加TRACE_GENERATOR_VERSION，使之前的条目失效。
+"""
+from decimal import Decimal
+import hashlib
+import os
+import shutil
+import tempfile
+
+from os import path
+
+# 工作负载生成代码的版本，包含在缓存键中
+TRACE_GENERATOR_VERSION = 1
+
+# 条目中依次保存的文件：工作负载、qos列表、用户列表
+_ENTRY_FILES = ["trace", "qos", "users"]
+
+
+def get_trace_key(definition, manifest_folder="./"):
+    """
+    计算实验定义的工作负载的缓存键。
+    Args:
+        definition (ExperimentDefinition): 实验定义
+        manifest_folder (str): 读取manifest文件的本地文件夹
+    Returns:
+        str: 生成工作负载的所有输入的sha1十六进制摘要
+    """
+    fields = _get_background_fields(definition)
+    fields += [definition._workflow_policy,
+               definition._workflow_period_s,
+               definition._workflow_share,
+               definition._workflow_handling,
+               definition._overload_target,
+               ",".join(definition.get_system_user_list())]
+    for manifest in definition._manifest_list:
+        fields += [manifest["share"], manifest["manifest"],
+                   _get_file_digest(path.join(manifest_folder,
+                                              manifest["manifest"]))]
+    return _get_digest(fields)
+
+
+def get_background_key(definition):
+    """
+    计算实验定义的背景作业流的缓存键。只适用于不使用过载控制器的实验（见
+    generate.background）。
+    Args:
+        definition (ExperimentDefinition): 实验定义
+    Returns:
+        str: 生成背景作业流的所有输入的sha1十六进制摘要
+    """
+    return _get_digest(["background"] + _get_background_fields(definition))
+
+
+class TraceCache(object):
+    """本地文件夹中的工作负载文件缓存，总大小不超过max_bytes。"""
+
+    def __init__(self, cache_dir, max_bytes):
+        """
+        Args:
+            cache_dir (str): 保存缓存条目的本地文件夹，不存在时创建
+            max_bytes (int): 缓存的大小上限（字节）
+        """
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if not path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # 另一个进程同时创建了该文件夹
+                if not path.isdir(cache_dir):
+                    raise
+
+    def get(self, key, dest_files, entry_files=_ENTRY_FILES):
+        """
+        将键为key的条目的文件复制到dest_files。
+        Args:
+            key (str): get_trace_key返回的缓存键
+            dest_files (list): 工作负载、qos和用户文件的目的路径
+            entry_files (list): 条目中与dest_files对应的文件名
+        Returns:
+            bool: 命中时为True，未命中时为False
+        """
+        entry_dir = path.join(self._cache_dir, key)
+        copied = []
+        try:
+            for (name, dest) in zip(entry_files, dest_files):
+                shutil.copyfile(path.join(entry_dir, name), dest)
+                copied.append(dest)
+            os.utime(entry_dir, None)
+        except (IOError, OSError):
+            # 条目不存在，或在复制时被其他进程淘汰
+            for dest in copied:
+                os.remove(dest)
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def put(self, key, orig_files, entry_files=_ENTRY_FILES):
+        """
+        将orig_files保存为键为key的条目，然后淘汰最久未使用的条目直到缓存
+        不超过大小上限。条目先写入临时文件夹再重命名，所以其他进程不会读到
+        不完整的条目。
+        Args:
+            key (str): get_trace_key返回的缓存键
+            orig_files (list): 工作负载、qos和用户文件的路径
+            entry_files (list): 条目中与orig_files对应的文件名
+        """
+        entry_dir = path.join(self._cache_dir, key)
+        if path.isdir(entry_dir):
+            return
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self._cache_dir)
+        for (name, orig) in zip(entry_files, orig_files):
+            shutil.copyfile(orig, path.join(tmp_dir, name))
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # 另一个进程已保存了相同的条目
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """
+        按修改时间从旧到新删除条目，直到缓存的总大小不超过上限。
+        Args:
+            keep (str): 不删除的条目的键（刚保存的条目）
+        Returns:
+            list: 被删除的条目的键
+        """
+        entries = []
+        total = 0
+        for key in os.listdir(self._cache_dir):
+            entry_dir = path.join(self._cache_dir, key)
+            if key.startswith(".") or not path.isdir(entry_dir):
+                continue
+            try:
+                size = sum([path.getsize(path.join(entry_dir, x))
+                            for x in os.listdir(entry_dir)])
+                entries.append((path.getmtime(entry_dir), key, size))
+            except OSError:
+                continue
+            total += size
+        evicted = []
+        for (mtime, key, size) in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(path.join(self._cache_dir, key), ignore_errors=True)
+            total -= size
+            evicted.append(key)
+        return evicted
+
+
+def _get_background_fields(definition):
+    """返回决定背景作业流的字段：生成代码的版本、种子、机器、时间范围、
+    初始等待和作业属性列表。"""
+    fields = [TRACE_GENERATOR_VERSION,
+              definition._seed,
+              definition._machine,
+              definition._trace_type,
+              definition._start_date,
+              definition._preload_time_s,
+              definition._workload_duration_s,
+              definition.get_forced_initial_wait(),
+              ",".join(definition.get_user_list()),
+              ",".join(definition.get_qos_list()),
+              ",".join(definition.get_partition_list()),
+              ",".join(definition.get_account_list())]
+    if definition.get_forced_initial_wait():
+        fields.append(os.getenv("FW_JOB_SEPARATION", "10"))
+    return fields
+
+
+def _get_digest(fields):
+    """返回字段列表的sha1十六进制摘要。"""
+    key = hashlib.sha1()
+    for field in fields:
+        key.update(_normalize(field))
+        key.update("\0")
+    return key.hexdigest()
+
+
+def _get_file_digest(file_route):
+    """返回文件内容的sha1摘要，文件不存在时为空字符串。"""
+    if not path.exists(file_route):
+        return ""
+    digest = hashlib.sha1()
+    f = open(file_route, "rb")
+    try:
+        digest.update(f.read())
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+
+def _normalize(value):
+    """将字段转换为字符串，使从数据库读取的数值（long、Decimal）与构造时
+    的数值得到相同的键。"""
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (int, long, float, Decimal)):
+        return repr(float(value))
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    return str(value)
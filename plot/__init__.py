@@ -3,6 +3,8 @@
 """
 from commonLib.nerscPlot import (paintHistogramMulti, paintBoxPlotGeneral,
                                  paintBarsHistogram)
+import copy
+import functools
 import getopt
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
@@ -11,9 +13,15 @@ from array import array
 from numpy import ndarray, arange, asarray
 from stats.trace import ResultTrace
 from orchestration.definition import ExperimentDefinition
-from stats import  NumericStats
+from stats import  NumericStats, result_cache
 from matplotlib.cbook import unique
 
+# 绘图会话中相同的结果会被多次加载（每个边、每张图各一次），开启进程级缓存。
+# 命中统计可以通过result_cache.get_stats()获得。
+PLOT_RESULT_CACHE_SIZE = 4096
+result_cache.set_max_entries(max(result_cache.get_max_entries(),
+                                 PLOT_RESULT_CACHE_SIZE))
+
 
 def get_args(default_trace_id=1, lim=False):
     """
@@ -1389,11 +1397,13 @@ def extract_grouped_results(db_obj, trace_id_rows_colors, edges, result_type):
         - 从数据库加载或创建默认统计结果
     3. 将结果按层级结构组织返回
     """
+    edge_result_types = [ResultTrace.get_result_type_edge(edge, result_type)
+                         for edge in edges]
+    results_dic = _extract_results_multi(db_obj, trace_id_rows_colors,
+                                         edge_result_types)
     exp_rows={}
-    for edge in edges:
-        exp_rows[edge]=extract_results(db_obj, trace_id_rows_colors,
-                                       ResultTrace.get_result_type_edge(edge,
-                                                               result_type))
+    for (edge, edge_result_type) in zip(edges, edge_result_types):
+        exp_rows[edge]=results_dic[edge_result_type]
     return exp_rows
     
     
@@ -1459,15 +1469,17 @@ def extract_usage(db_obj, trace_id_rows, fill_none=True, factor=1.0,
     res_type="usage"
     if mean:
         res_type="usage_mean"
+    done_trace_ids = _get_analysis_done_trace_ids(db_obj, trace_id_rows)
+    loaded = my._get_utilization_result().load_many(db_obj, done_trace_ids,
+                                                    [res_type])
     for row in trace_id_rows:
         new_row=[]
         exp_rows.append(new_row)
         for trace_id in row:
-            exp=ExperimentDefinition()
-            exp.load(db_obj, trace_id)
             result = my._get_utilization_result()           
-            if exp.is_analysis_done():
-                result.load(db_obj, trace_id,res_type)
+            if trace_id in done_trace_ids:
+                if res_type in loaded.get(int(trace_id), {}):
+                    result = copy.deepcopy(loaded[int(trace_id)][res_type])
             else:
                 result._set("utilization", 0)
                 result._set("waste", 0)
@@ -1495,28 +1507,72 @@ def extract_results(db_obj, trace_id_rows_colors, result_type, factor=None,
     Returns:
         list[list[NumericStats]]: 与输入矩阵同维度的结果矩阵，每个元素为对应的统计对象
     """
-    exp_rows=[]  
-    for row in trace_id_rows_colors:
-        new_row=[]
-        exp_rows.append(new_row)
+    return _extract_results_multi(db_obj, trace_id_rows_colors,
+                                  [result_type], factor=factor,
+                                  fill_none=fill_none,
+                                  second_pass=second_pass)[result_type]
+
+def _extract_results_multi(db_obj, trace_id_rows_colors, result_type_list,
+                           factor=None, fill_none=True, second_pass=False):
+    """extract_results的多结果类型版本：所有结果类型与所有trace_id的
+    NumericStats通过一次批量查询加载。
+
+    Returns:
+        dict: {result_type: 与trace_id_rows_colors同维度的NumericStats矩阵}
+    """
+    done_trace_ids = _get_analysis_done_trace_ids(db_obj,
+                                                  trace_id_rows_colors,
+                                                  second_pass=second_pass)
+    loaded = NumericStats().load_many(db_obj, done_trace_ids,
+                                      [x+"_stats" for x in result_type_list])
+    results_dic = {}
+    for result_type in result_type_list:
+        key=result_type+"_stats"
+        exp_rows=[]
+        results_dic[result_type]=exp_rows
+        for row in trace_id_rows_colors:
+            new_row=[]
+            exp_rows.append(new_row)
+            for trace_id in row:
+                if trace_id in done_trace_ids:
+                    result = NumericStats()
+                    if key in loaded.get(int(trace_id), {}):
+                        result = copy.deepcopy(loaded[int(trace_id)][key])
+                    if factor:
+                        result.apply_factor(factor)
+                else:
+                    result = NumericStats()
+                    result.calculate([0, 0, 0])
+                if fill_none and result._get("median") is None:
+                    result = NumericStats()
+                    result.calculate([0, 0, 0])
+                new_row.append(result)
+    return results_dic
+
+def _get_analysis_done_trace_ids(db_obj, trace_id_rows, second_pass=False):
+    """Returns a set with the trace_ids in the matrix trace_id_rows whose
+    experiment analysis is done."""
+    trace_ids = []
+    checked_trace_ids = set()
+    for row in trace_id_rows:
         for trace_id in row:
-            exp=ExperimentDefinition()
-            exp.load(db_obj, trace_id)
-            
-            if exp.is_analysis_done(second_pass=second_pass):
-                key=result_type+"_stats"
-                result = NumericStats()
-                result.load(db_obj, trace_id, key)
-                if factor:
-                    result.apply_factor(factor)
-            else:
-                result = NumericStats()
-                result.calculate([0, 0, 0])
-            if fill_none and result._get("median") is None:
-                result = NumericStats()
-                result.calculate([0, 0, 0])
-            new_row.append(result)
-    return exp_rows
+            if trace_id in checked_trace_ids:
+                continue
+            checked_trace_ids.add(trace_id)
+            trace_ids.append(trace_id)
+    definitions = db_obj.runConcurrently(
+                    [functools.partial(_load_definition, db_obj, trace_id)
+                     for trace_id in trace_ids])
+    done_trace_ids = set()
+    for (trace_id, exp) in zip(trace_ids, definitions):
+        if exp.is_analysis_done(second_pass=second_pass):
+            done_trace_ids.add(trace_id)
+    return done_trace_ids
+
+def _load_definition(db_obj, trace_id):
+    exp=ExperimentDefinition()
+    exp.load(db_obj, trace_id)
+    return exp
 
 def get_dic_val(dic, val):
     if val in dic.keys():
@@ -1,7 +1,115 @@
-from analysis.jobAnalysis import calculate_histogram
+from analysis.jobAnalysis import calculate_histogram, _join_var_bins
+import copy
 import cPickle
 import MySQLdb
 import numpy as np
+import re
+import struct
+import threading
+from collections import OrderedDict
+
+
+class ResultCache(object):
+    """
+    进程级的结果缓存，位于Result.load之前。键为(table, trace_id, type)，值为
+    解码后的结果数据。缓存大小有上限，超出时按LRU策略淘汰最久未使用的条目。
+    max_entries为0时缓存关闭（默认），绘图会话通过set_max_entries开启。
+    写入或删除某个trace_id的结果时，需要调用invalidate使对应条目失效。
+    """
+    def __init__(self, max_entries=0):
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def set_max_entries(self, max_entries):
+        """设置缓存的最大条目数，0表示关闭缓存。多余的条目按LRU淘汰。"""
+        with self._lock:
+            self._max_entries = max_entries
+            self._evict()
+
+    def get_max_entries(self):
+        return self._max_entries
+
+    def is_enabled(self):
+        return self._max_entries > 0
+
+    def get(self, table_name, trace_id, measurement_type):
+        """返回缓存的结果数据（副本），不存在时返回None。"""
+        key = (table_name, int(trace_id), measurement_type)
+        with self._lock:
+            data = self._entries.pop(key, None)
+            if data is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries[key] = data
+            self._stats["hits"] += 1
+        return copy.deepcopy(data)
+
+    def put(self, table_name, trace_id, measurement_type, data):
+        """保存结果数据的副本，缓存关闭时不做任何操作。"""
+        if not self.is_enabled():
+            return
+        key = (table_name, int(trace_id), measurement_type)
+        data = copy.deepcopy(data)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = data
+            self._evict()
+
+    def invalidate(self, table_name, trace_id, type_like=None):
+        """使table_name中trace_id的缓存条目失效。
+        Args:
+            table_name (str): 结果表名
+            trace_id (int): 追踪记录ID
+            type_like (str|None): SQL LIKE格式的类型模式（如"lim_%"），
+                为None时使该trace_id的全部条目失效
+        """
+        trace_id = int(trace_id)
+        type_re = None
+        if type_like is not None:
+            type_re = _like_to_regex(type_like)
+        with self._lock:
+            for key in list(self._entries.keys()):
+                if (key[0] == table_name and key[1] == trace_id and
+                    (type_re is None or type_re.match(key[2]))):
+                    del self._entries[key]
+                    self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self):
+        self._stats = dict(hits=0, misses=0, evictions=0, invalidations=0)
+
+    def get_stats(self):
+        """返回命中、未命中、淘汰、失效次数以及当前条目数的字典。"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["max_entries"] = self._max_entries
+        return stats
+
+    def _evict(self):
+        while len(self._entries) > max(self._max_entries, 0):
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+
+def _like_to_regex(pattern):
+    """将SQL LIKE模式转换为编译后的正则表达式。"""
+    regex = "".join([".*" if c == "%" else "." if c == "_" else re.escape(c)
+                     for c in pattern])
+    return re.compile(regex + "$", re.DOTALL)
+
+
+# Result.load和Result.load_many共用的进程级缓存
+result_cache = ResultCache()
+
+# 缺少摘要字段（未运行sql_upgrade_db.py）的结果表中存在的字段，
+# 键为(hostName, port, dbName, 表名)
+_stored_keys = {}
 
 
 class Result(object):
@@ -55,12 +163,22 @@ class Result(object):
         keys = ["trace_id", "type"] + keys
         # 在值列表中添加trace_id和measurement_type，以对应新增的键
         values= [trace_id, measurement_type] + values
+        # 未升级的表只写入已存在的字段（摘要字段被丢弃）
+        stored_keys = self._get_stored_keys(db_obj)
+        if stored_keys is not None:
+            values = [x for (x, key) in zip(values, keys)
+                      if key in ["trace_id", "type"] or key in stored_keys]
+            keys = [key for key in keys
+                    if key in ["trace_id", "type"] or key in stored_keys]
         # 使用DBManager对象将键和值插入到表中，并获取插入ID
         ok, insert_id = db_obj.insertValues(self._table_name, keys, values,
                                             get_insert_id=True)
+        if not ok and stored_keys is None and self._find_stored_keys(db_obj):
+            return self.store(db_obj, trace_id, measurement_type)
         # 如果数据插入失败，抛出SystemError异常
         if not ok:
             raise SystemError("Data insertion failed")
+        result_cache.invalidate(self._table_name, trace_id)
         # 返回插入数据的主键ID
         return insert_id
     
@@ -79,10 +197,19 @@ class Result(object):
             - 使用self._keys定义的字段列表进行数据查询
             - 自动对数据库返回值进行解码处理
             - 仅加载符合条件的第一条记录（如果存在多个匹配记录）
+            - result_cache开启时先查询缓存，未命中时将加载结果写入缓存
+            - 未升级的表（缺少摘要字段）只加载已存在的字段
+        Raises:
+            SystemError: 查询失败时抛出
         """
-        keys  = self._keys
+        if result_cache.is_enabled():
+            cached = result_cache.get(self._table_name, trace_id,
+                                      measurement_type)
+            if cached is not None:
+                self._data.update(cached)
+                return
         # 从数据库获取指定条件的字段值字典列表
-        data_dic=db_obj.getValuesDicList(self._table_name, keys, condition=
+        keys, data_dic = self._get_values(db_obj, [], condition=
                                         "trace_id={0} and type='{1}'".format(
                                         trace_id, measurement_type))
         # 如果存在有效查询结果则设置对象属性
@@ -90,6 +217,140 @@ class Result(object):
             # 遍历所有预定义字段进行解码和赋值
             for key in keys:
                 self._set(key, self._decode(data_dic[0][key], key))
+            result_cache.put(self._table_name, trace_id, measurement_type,
+                             dict([(key, self._data[key]) for key in keys]))
+
+    def load_many(self, db_obj, trace_id_list, measurement_type_list):
+        """
+        用一条查询批量加载多个trace_id和多个结果类型的记录
+        查询条件为 trace_id IN (...) AND type IN (...)，每条记录被解码为一个
+        与self同类（同表名、同字段）的新结果对象。self本身不会被修改。
+        Args:
+            db_obj (DBManager): 数据库管理对象，提供数据库访问接口
+            trace_id_list (list[int]): 需要加载的追踪记录ID列表
+            measurement_type_list (list[str]): 需要加载的测量类型列表
+        Returns:
+            dict: 两层字典 {trace_id: {measurement_type: 结果对象}}。数据库中
+                不存在的组合不会出现在字典中。
+        Notes:
+            - 与load一致，同一(trace_id, type)存在多条记录时仅保留第一条
+              （按id排序）
+            - result_cache开启时只查询未命中缓存的trace_id和类型
+            - 未升级的表（缺少摘要字段）只加载已存在的字段
+        Raises:
+            SystemError: 查询失败时抛出
+        """
+        results = {}
+        trace_id_list = sorted(set([int(x) for x in trace_id_list]))
+        measurement_type_list = sorted(set(measurement_type_list))
+        if not trace_id_list or not measurement_type_list:
+            return results
+        if result_cache.is_enabled():
+            missing_trace_ids = set()
+            missing_types = set()
+            for trace_id in trace_id_list:
+                for measurement_type in measurement_type_list:
+                    cached = result_cache.get(self._table_name, trace_id,
+                                              measurement_type)
+                    if cached is None:
+                        missing_trace_ids.add(trace_id)
+                        missing_types.add(measurement_type)
+                        continue
+                    result = self._new_empty()
+                    result._data.update(cached)
+                    results.setdefault(trace_id, {})[measurement_type] = result
+            trace_id_list = sorted(missing_trace_ids)
+            measurement_type_list = sorted(missing_types)
+            if not trace_id_list:
+                return results
+        condition = "trace_id IN ({0}) and type IN ({1})".format(
+            ",".join([str(x) for x in trace_id_list]),
+            ",".join(["'{0}'".format(x) for x in measurement_type_list]))
+        keys, rows = self._get_values(db_obj, ["trace_id", "type"],
+                                      condition=condition, orderBy="id")
+        if not rows:
+            return results
+        loaded = {}
+        for row in rows:
+            trace_id = int(row["trace_id"])
+            if (trace_id, row["type"]) in loaded:
+                continue
+            result = self._new_empty()
+            for key in keys:
+                result._set(key, self._decode(row[key], key))
+            loaded[(trace_id, row["type"])] = result
+        for ((trace_id, measurement_type), result) in loaded.items():
+            trace_results = results.setdefault(trace_id, {})
+            if measurement_type in trace_results:
+                continue
+            trace_results[measurement_type] = result
+            result_cache.put(self._table_name, trace_id, measurement_type,
+                             result._data)
+        return results
+
+    def _get_values(self, db_obj, extra_fields, condition, orderBy=None):
+        """
+        查询self._keys中在表里存在的字段。第一次在未升级的表上查询失败时，
+        记录表中存在的字段并重新查询。
+        Returns: (查询的self._keys字段列表, getValuesDicList返回的行)
+        
+        查询失败时引发SystemError异常。
+        """
+        keys = self._keys
+        stored_keys = self._get_stored_keys(db_obj)
+        if stored_keys is not None:
+            keys = [key for key in keys if key in stored_keys]
+        rows = db_obj.getValuesDicList(self._table_name, extra_fields + keys,
+                                       condition=condition, orderBy=orderBy)
+        if rows is False and stored_keys is None:
+            if self._find_stored_keys(db_obj):
+                return self._get_values(db_obj, extra_fields, condition,
+                                        orderBy=orderBy)
+        if rows is False:
+            raise SystemError("Query on table {0} failed, if it was created "
+                              "by an older version, run "
+                              "bin/sql_upgrade_db.py".format(
+                                                            self._table_name))
+        return keys, rows
+
+    def _get_stored_keys(self, db_obj):
+        """Returns the columns of the table of this class in db_obj if it
+        was found to lack some of the _upgrade_columns, None otherwise."""
+        return _stored_keys.get(self._get_stored_keys_id(db_obj))
+
+    def _find_stored_keys(self, db_obj):
+        """
+        Checks if the table of this class lacks some of the _upgrade_columns,
+        i.e., it was created before them and sql_upgrade_db.py was not run on
+        it. In that case, it records its columns so loads and stores use
+        only them, and returns True.
+        """
+        columns = db_obj.doQuery("SHOW COLUMNS FROM `{0}`".format(
+                                                        self._table_name))
+        if not columns:
+            return False
+        columns = [x[0] for x in columns]
+        missing = [x for (x, definition) in self._upgrade_columns()
+                   if x not in columns]
+        if not missing:
+            return False
+        print ("Table {0} lacks columns {1}, run bin/sql_upgrade_db.py to "
+               "store and load them".format(self._table_name,
+                                            ", ".join(missing)))
+        _stored_keys[self._get_stored_keys_id(db_obj)] = columns
+        return True
+
+    def _get_stored_keys_id(self, db_obj):
+        return tuple([getattr(db_obj, x, None)
+                      for x in ["hostName", "port", "dbName"]] +
+                     [self._table_name])
+
+    def _new_empty(self):
+        """Returns a new object of the same class, table and keys as self,
+        with no data."""
+        new_result = copy.copy(self)
+        new_result._data = {}
+        return new_result
     
     def get_data(self):
         return self._data
@@ -122,12 +383,35 @@ class Result(object):
         - db_obj: DBManager object allows access to a database.
         """
         db_obj.doUpdate(self._create_query())
+        _stored_keys.pop(self._get_stored_keys_id(db_obj), None)
     
     def _create_query(self):
         """Returns a string with the query needed to create a table
         corresponding to this Result class. To be modifed according to the table
         formats required by the child classes."""
         return  ""
+
+    def upgrade_table(self, db_obj):
+        """
+        Adds to an existing table of this Result class the columns that were
+        added after it was created. Columns that already exist are left
+        untouched.
+        Args:
+        - db_obj: DBManager object allows access to a database.
+        """
+        existing = [x[0] for x in db_obj.doQuery(
+                                "SHOW COLUMNS FROM `{0}`".format(
+                                                        self._table_name))]
+        for (column, definition) in self._upgrade_columns():
+            if column not in existing:
+                db_obj.doUpdate("ALTER TABLE `{0}` ADD COLUMN `{1}` {2}".format(
+                                self._table_name, column, definition))
+        _stored_keys.pop(self._get_stored_keys_id(db_obj), None)
+
+    def _upgrade_columns(self):
+        """Returns a list of (column name, column definition) tuples of the
+        columns added to the table of this class after its first version."""
+        return []
     
     def get_list_of_results(self, db_obj, trace_id):
         """Returns a list of the result types corresponding to this Result that
@@ -151,9 +435,11 @@ class Histogram(Result):
     """
     def __init__(self):
         super(Histogram,self).__init__(table_name="histograms",
-                                       keys = ["bins", "edges"])
+                                       keys = ["bins", "edges", "bin_size",
+                                               "bin_offset", "bin_counts"])
     
-    def calculate(self, data_set, bin_size, minmax=None, input_bins=None):
+    def calculate(self, data_set, bin_size, minmax=None, input_bins=None,
+                  binning="sparse"):
         """
         根据输入数据集计算直方图并存储结果
         Args:
@@ -164,6 +450,8 @@ class Histogram(Result):
                 当未提供bin_size参数时必须设置此参数
             input_bins (list[float]|None): 预定义的分箱边界列表。指定后将覆盖bin_size参数，
                 直接使用这些精确的分箱边界
+            binning (str): calculate_histogram的分箱策略。默认"sparse"与等宽分箱
+                结果相同，但开销与数据量成正比而与取值范围无关
         Returns:
             None: 结果通过_set()方法存储在对象的'bins'和'edges'属性中
         Raises:
@@ -175,14 +463,29 @@ class Histogram(Result):
         bins, edges  = calculate_histogram(data_set, th_min=0.0, th_acc=0.0,
                                                range_values=minmax, 
                                                interval_size=bin_size,
-                                               bins=input_bins)
+                                               bins=input_bins,
+                                               binning=binning)
 
         # 持久化计算结果
         self._set("bins", bins)
         self._set("edges", edges)
+
+        # 可合并的摘要：以0为原点、bin_size为宽度的全局网格上的原始计数
+        for key in ["bin_size", "bin_offset", "bin_counts"]:
+            self._data.pop(key, None)
+        if bin_size is not None and input_bins is None:
+            bin_offset, bin_counts = _grid_counts(data_set, bin_size, minmax)
+            self._set("bin_size", float(bin_size))
+            self._set("bin_offset", bin_offset)
+            self._set("bin_counts", bin_counts)
         
     def get_data(self):
         return self._get("bins"), self._get("edges")
+
+    def has_summary(self):
+        """Returns True if the global grid counts are available, i.e., the
+        histogram can be merged with merge_histograms."""
+        return self._get("bin_counts") is not None
     
     def _create_query(self):
         return """create table {0} (
@@ -191,31 +494,144 @@ class Histogram(Result):
                     type VARCHAR(128) NOT NULL,
                     bins LONGBLOB,
                     edges LONGBLOB,
+                    bin_size DOUBLE,
+                    bin_offset BIGINT,
+                    bin_counts LONGBLOB,
                     PRIMARY KEY(id, trace_id, type)
                 )""".format(self._table_name)
+
+    def _upgrade_columns(self):
+        return [("bin_size", "DOUBLE"), ("bin_offset", "BIGINT"),
+                ("bin_counts", "LONGBLOB")]
     
     def _encode(self, data_value, key):
-        """将Python对象序列化并转义为适合MySQL存储的格式
+        """将直方图数组编码为二进制格式并转义为适合MySQL存储的格式
 
-        对数据进行cPickle序列化后执行MySQL特殊字符转义，用于安全存储到BLOB类型字段。
+        编码格式见pack_array：一个固定长度的头部加上小端序的原始浮点数缓冲区。
         注意：参数key在当前实现中未使用，保留作未来扩展。
 
         Args:
-            data_value (any): 需要存储的Python对象，会被序列化为字节流
+            data_value (list|numpy.ndarray): 需要存储的bins或edges
             key (any): 预留参数，当前版本未参与实际处理逻辑
 
         Returns:
-            str: 经过MySQL转义处理的序列化字符串，可直接插入数据库
-
-        实现流程:
-            1. 使用cPickle进行高性能序列化
-            2. 对二进制数据进行数据库安全转义
+            str: 经过MySQL转义处理的二进制字符串，可直接插入数据库
         """
-        pickle_data = cPickle.dumps(data_value)
-        return MySQLdb.escape_string(pickle_data)
+        if key == "bin_size":
+            return repr(float(data_value))
+        if key == "bin_offset":
+            return int(data_value)
+        return MySQLdb.escape_string(pack_array(data_value))
+
     def _decode(self, blob, key):
+        """解码数据库中的bins或edges字段。同时支持pack_array生成的二进制格式
+        和旧版本使用cPickle序列化的记录。摘要字段在旧记录中为NULL，解码为None。"""
+        if blob is None and key in ["bin_size", "bin_offset", "bin_counts"]:
+            return None
+        if key == "bin_size":
+            return float(blob)
+        if key == "bin_offset":
+            return int(blob)
+        if is_packed_array(blob):
+            return unpack_array(blob)
         return cPickle.loads(blob)
 
+    def migrate_encoding(self, db_obj, batch_size=1000):
+        """将表中仍以cPickle格式存储的bins和edges原地重新编码为二进制格式。
+        按id分批读取，每批最多batch_size行，已经是新格式的行将被跳过。
+
+        Args:
+            db_obj (DBManager): 数据库管理对象
+            batch_size (int): 每次查询读取的行数
+
+        Returns:
+            int: 被重新编码的行数
+        """
+        migrated = 0
+        last_id = -1
+        while True:
+            rows = db_obj.doQuery("""SELECT id, bins, edges FROM `{0}`
+                                     WHERE id > {1} ORDER BY id LIMIT {2}
+                                  """.format(self._table_name, last_id,
+                                             batch_size))
+            if not rows:
+                break
+            for (row_id, bins, edges) in rows:
+                last_id = row_id
+                if is_packed_array(bins) and is_packed_array(edges):
+                    continue
+                ok = db_obj.doUpdateParams(
+                    "UPDATE `{0}` SET bins=%s, edges=%s WHERE id=%s".format(
+                                                           self._table_name),
+                    [pack_array(self._decode(bins, "bins")),
+                     pack_array(self._decode(edges, "edges")),
+                     row_id])
+                if not ok:
+                    raise SystemError("Histogram {0} re-encoding failed".format(
+                                                                     row_id))
+                migrated += 1
+        return migrated
+
+# 直方图数组的二进制编码（版本1）。
+# 头部为16字节，小端序:
+# - 4字节魔数 "SCHB"
+# - 1字节格式版本
+# - 1字节数据类型: 'd' (float64) 或 'f' (float32)
+# - 1字节容器类型: 0 表示numpy数组, 1 表示Python列表
+# - 1字节填充
+# - 8字节无符号整数: 元素个数
+# 头部之后是小端序的原始浮点数缓冲区，可用numpy.frombuffer零拷贝解码。
+_PACK_MAGIC = "SCHB"
+_PACK_VERSION = 1
+_PACK_HEADER = struct.Struct("<4sBcBxQ")
+_PACK_DTYPES = {"d": np.dtype("<f8"), "f": np.dtype("<f4")}
+
+def pack_array(data_value):
+    """将列表或numpy数组编码为版本1的二进制格式。float32数组保持float32，
+    其余数据以float64存储。
+
+    Args:
+        data_value (list|numpy.ndarray): 一维数值序列
+
+    Returns:
+        str: 头部加原始数据缓冲区
+    """
+    container = 0
+    if not isinstance(data_value, np.ndarray):
+        container = 1
+    values = np.asarray(data_value)
+    dtype_code = "d"
+    if values.dtype == np.float32:
+        dtype_code = "f"
+    values = np.ascontiguousarray(values.ravel(),
+                                  dtype=_PACK_DTYPES[dtype_code])
+    header = _PACK_HEADER.pack(_PACK_MAGIC, _PACK_VERSION, dtype_code,
+                               container, values.shape[0])
+    return header + values.tobytes()
+
+def is_packed_array(blob):
+    """Returns True if blob was produced by pack_array."""
+    return (blob is not None and len(blob) >= _PACK_HEADER.size
+            and blob[:len(_PACK_MAGIC)] == _PACK_MAGIC)
+
+def unpack_array(blob):
+    """解码pack_array生成的二进制数据。numpy数组以只读视图的形式
+    零拷贝返回，原为列表的数据返回列表。
+
+    Raises:
+        ValueError: 格式版本或数据类型未知时抛出
+    """
+    (magic, version, dtype_code, container,
+     count) = _PACK_HEADER.unpack_from(blob)
+    if version != _PACK_VERSION or dtype_code not in _PACK_DTYPES:
+        raise ValueError("Unknown histogram encoding: version {0}, "
+                         "dtype {1}".format(version, dtype_code))
+    values = np.frombuffer(blob, dtype=_PACK_DTYPES[dtype_code], count=count,
+                           offset=_PACK_HEADER.size)
+    if container == 1:
+        return values.tolist()
+    return values
+
 class NumericList(Result):
     
     def _create_query(self):
@@ -262,11 +678,14 @@ class NumericStats(Result):
             * p50: 第50百分位数（中位数）
             * p75: 第75百分位数（第三四分位数）
             * p95: 第95百分位数
+            * sum, sum_sq, sketch: 可合并的摘要（总和、平方和、分位数草图），
+              不包含在get_data的返回值中
         返回值：None
         """
         super(NumericStats,self).__init__(table_name="numericStats",
             keys = ["min", "max", "mean", "std", "count", "median",
-                    "p05", "p25", "p50", "p75", "p95" ])
+                    "p05", "p25", "p50", "p75", "p95",
+                    "sum", "sum_sq", "sketch"])
     
     def apply_factor(self, factor):
         """
@@ -283,6 +702,13 @@ class NumericStats(Result):
                     "p05", "p25", "p50", "p75", "p95" ]:
             # 获取原值->应用因子->设置新值的完整更新流程
             self._set(key, float(self._get(key))*float(factor))
+        # 摘要随统计量一起缩放：总和乘以因子，平方和乘以因子的平方
+        if self.has_summary():
+            factor = float(factor)
+            self._set("sum", self._get("sum")*factor)
+            self._set("sum_sq", self._get("sum_sq")*factor*factor)
+            means, weights = _split_sketch(self._get("sketch"))
+            self._set("sketch", np.concatenate([means*factor, weights]))
             
     def calculate(self, data_set):
         """对数据集执行多项统计指标计算，并将结果存储在类属性中
@@ -309,11 +735,57 @@ class NumericStats(Result):
         self._set("median", percentlie_values[2])
         for (key, per) in zip(percentile_name, percentlie_values):
             self._set(key, per)
-        
+
+        # 可合并的摘要
+        means, weights = _digest_compress(x, np.ones(x.shape[0]))
+        self._set("sum", float(np.sum(x)))
+        self._set("sum_sq", float(np.sum(x*x)))
+        self._set("sketch", np.concatenate([means, weights]))
+
+    def get_data(self):
+        """Returns a dictionary with the statistics (summary excluded)."""
+        return dict([(key, value) for (key, value) in self._data.iteritems()
+                     if key not in ["sum", "sum_sq", "sketch"]])
+
+    def has_summary(self):
+        """Returns True if the mergeable summary (sum, sum of squares and
+        quantile sketch) is available, i.e., the object can be merged with
+        merge_numeric_stats."""
+        return (self._get("sum") is not None and
+                self._get("sum_sq") is not None and
+                self._get("sketch") is not None)
+
+    def _set_from_summary(self, count, total, total_sq, min_val, max_val,
+                          means, weights):
+        """Sets all the statistics from a summary. Percentiles are estimated
+        from the quantile sketch (means, weights)."""
+        mean = total/float(count)
+        self._set("min", float(min_val))
+        self._set("max", float(max_val))
+        self._set("mean", mean)
+        self._set("std", np.sqrt(max(total_sq/float(count) - mean*mean, 0.0)))
+        self._set("count", int(count))
+        percentile_name=["p05", "p25", "p50", "p75", "p95"]
+        percentlie_values = _digest_percentiles(means, weights, min_val,
+                                                max_val, [5, 25, 50, 75, 95])
+        self._set("median", percentlie_values[2])
+        for (key, per) in zip(percentile_name, percentlie_values):
+            self._set(key, per)
+        self._set("sum", float(total))
+        self._set("sum_sq", float(total_sq))
+        self._set("sketch", np.concatenate([means, weights]))
 
     def _encode(self, data_value, key):
+        if key == "sketch":
+            return MySQLdb.escape_string(pack_array(data_value))
+        if key in ["sum", "sum_sq"]:
+            return repr(float(data_value))
         return data_value
     def _decode(self, blob, key):
+        if blob is None and key in ["sum", "sum_sq", "sketch"]:
+            return None
+        if key == "sketch":
+            return unpack_array(blob)
         return float(blob) 
     
     def _create_query(self):
@@ -332,8 +804,15 @@ class NumericStats(Result):
                     p50 DOUBLE,
                     p75 DOUBLE,
                     p95 DOUBLE,
+                    sum DOUBLE,
+                    sum_sq DOUBLE,
+                    sketch LONGBLOB,
                     PRIMARY KEY(id, trace_id, type)
                 )""".format(self._table_name)
+
+    def _upgrade_columns(self):
+        return [("sum", "DOUBLE"), ("sum_sq", "DOUBLE"),
+                ("sketch", "LONGBLOB")]
     
     def get_values_boxplot(self):
         data_names = "median", "p25", "p75", "min", "max" 
@@ -408,31 +887,225 @@ def load_results(field_list, db_obj, trace_id):
             值为对应的Histogram或NumericStats对象实例
 
     处理流程：
-    1. 根据输入字段列表生成带_cdf和_stats后缀的查询字段
-    2. 遍历所有字段组合，从数据库加载对应数据
-    3. 将成功加载的结果对象存入返回字典
+    委托给load_results_bulk，每个结果表只执行一次查询。
     """
-    results = {}
+    return load_results_bulk(field_list, db_obj, [trace_id])[int(trace_id)]
+
+def load_results_bulk(field_list, db_obj, trace_id_list):
+    """批量加载多个trace的统计结果
+
+    每个结果表（histograms、numericStats）只执行一次
+    trace_id IN (...) AND type IN (...) 查询，而不是对每个(trace_id, 类型)
+    执行一次查询。
+
+    Args:
+        field_list (list[str]): 原始字段名称列表，自动生成"_cdf"和"_stats"后缀
+        db_obj (DBManager): 已配置的数据库管理对象
+        trace_id_list (list[int]): 需要加载的trace ID列表
 
-    # 生成带不同后缀的查询字段列表
+    Returns:
+        dict: {trace_id: {带后缀的字段名: Histogram或NumericStats对象}}。
+            与load_results一致，数据库中不存在的结果以空对象填充。
+    """
     cdf_field_list = [x+"_cdf" for x in field_list]
     stats_field_list = [x+"_stats" for x in field_list]
 
-    # 遍历所有字段组合加载数据
-    for (cdf_field, stats_field) in zip(cdf_field_list, stats_field_list):
-        # 加载并存储直方图数据
-        cdf = Histogram()
-        cdf.load(db_obj, trace_id, cdf_field)
-        if cdf is not None:
-            results[cdf_field] = cdf
-
-        # 加载并存储数值统计信息
-        stats = NumericStats()
-        stats.load(db_obj, trace_id, stats_field)
-        if stats is not None:
-            results[stats_field] = stats
+    cdf_loaded = Histogram().load_many(db_obj, trace_id_list, cdf_field_list)
+    stats_loaded = NumericStats().load_many(db_obj, trace_id_list,
+                                            stats_field_list)
+    results = {}
+    for trace_id in trace_id_list:
+        trace_id = int(trace_id)
+        trace_results = {}
+        trace_cdfs = cdf_loaded.get(trace_id, {})
+        trace_stats = stats_loaded.get(trace_id, {})
+        for (cdf_field, stats_field) in zip(cdf_field_list, stats_field_list):
+            trace_results[cdf_field] = trace_cdfs.get(cdf_field, Histogram())
+            trace_results[stats_field] = trace_stats.get(stats_field,
+                                                         NumericStats())
+        results[trace_id] = trace_results
     return results
-        
-        
-    
-    
+
+# 可合并摘要使用的分位数草图：合并式t-digest（k1尺度函数）。草图是一组
+# 按均值排序的质心(means, weights)，最多约_DIGEST_COMPRESSION+1个。
+_DIGEST_COMPRESSION = 200
+
+def _digest_compress(means, weights, compression=_DIGEST_COMPRESSION):
+    """将一组加权点（或质心）压缩为t-digest质心。质心数量不超过compression
+    时保留全部点，此时分位数是精确的。
+
+    Args:
+        means (numpy.ndarray): 点的值或质心均值
+        weights (numpy.ndarray): 对应的权重
+        compression (int): 压缩参数，质心数量的上限
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray): 按均值排序的质心均值和权重
+    """
+    means = np.asarray(means, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    order = np.argsort(means, kind="mergesort")
+    means = means[order]
+    weights = weights[order]
+    if means.shape[0] <= compression:
+        return means, weights
+    # 每个点所属的质心由其左侧分位数在k1尺度上的整数部分决定。
+    q_left = (np.cumsum(weights) - weights)/np.sum(weights)
+    k = np.floor(compression*(np.arcsin(2*q_left - 1)/np.pi + 0.5))
+    ids = np.unique(k, return_inverse=True)[1]
+    new_weights = np.bincount(ids, weights=weights)
+    new_means = np.bincount(ids, weights=weights*means)/new_weights
+    return new_means, new_weights
+
+def _digest_percentiles(means, weights, min_val, max_val, percentiles):
+    """根据t-digest质心估计百分位数。与np.percentile一样在排序后的秩上线性
+    插值，质心全部为单点时结果与np.percentile相同。"""
+    cum = np.cumsum(weights)
+    total = cum[-1]
+    # 质心覆盖的秩为[cum-w, cum-1]，其中心为cum-w/2-0.5
+    centers = cum - weights/2.0 - 0.5
+    positions = np.concatenate([[0.0], centers, [total - 1]])
+    values = np.concatenate([[min_val], means, [max_val]])
+    ranks = np.array(percentiles, dtype=float)/100.0*(total - 1)
+    return np.interp(ranks, positions, values)
+
+def _split_sketch(sketch):
+    """Returns the (means, weights) stored in a NumericStats sketch."""
+    half = len(sketch)//2
+    return np.asarray(sketch[:half]), np.asarray(sketch[half:])
+
+def _grid_counts(data_set, bin_size, minmax=None):
+    """统计data_set在以0为原点、宽度为bin_size的全局网格上的计数。
+    指定minmax时与calculate_histogram一样只统计[min, max+bin_size]内的值。
+
+    Returns:
+        (int, numpy.ndarray): 第一个非空格子的序号及从该格子起的连续计数
+    """
+    x = np.asarray(data_set, dtype=float)
+    last_index = None
+    if minmax is not None:
+        x = x[(x >= minmax[0]) & (x <= minmax[1] + bin_size)]
+        # 与np.histogram一样，最后一个格子包含其右边界
+        last_index = int(np.floor((minmax[1] + bin_size)/bin_size)) - 1
+    if x.shape[0] == 0:
+        return 0, np.zeros(0)
+    indexes = np.floor(x/bin_size).astype(np.int64)
+    if last_index is not None:
+        indexes = np.minimum(indexes, last_index)
+    first = int(indexes.min())
+    return first, np.bincount(indexes - first).astype(float)
+
+def merge_numeric_stats(stats_list):
+    """合并多个NumericStats的摘要，得到这些数据集合并后的统计信息。
+    计数、总和、平方和、最小值和最大值是精确的，百分位数由合并后的分位数草图估计。
+
+    Args:
+        stats_list (list[NumericStats]): 带有摘要的统计对象
+
+    Returns:
+        NumericStats: 合并后的统计对象（同样带有摘要）
+
+    Raises:
+        ValueError: 某个对象没有摘要时抛出
+    """
+    for stats in stats_list:
+        if not stats.has_summary():
+            raise ValueError("NumericStats without summary cannot be merged")
+    sketches = [_split_sketch(x._get("sketch")) for x in stats_list]
+    means, weights = _digest_compress(
+                                np.concatenate([x[0] for x in sketches]),
+                                np.concatenate([x[1] for x in sketches]))
+    merged = NumericStats()
+    merged._set_from_summary(sum([int(x._get("count")) for x in stats_list]),
+                             sum([x._get("sum") for x in stats_list]),
+                             sum([x._get("sum_sq") for x in stats_list]),
+                             min([x._get("min") for x in stats_list]),
+                             max([x._get("max") for x in stats_list]),
+                             means, weights)
+    return merged
+
+def merge_histograms(hist_list):
+    """合并多个Histogram的全局网格计数，得到这些数据集合并后的直方图。
+    分箱与Histogram.calculate使用相同的bin_size、以0为原点的minmax计算的结果相同。
+
+    Args:
+        hist_list (list[Histogram]): 带有摘要且bin_size相同的直方图
+
+    Returns:
+        Histogram: 合并后的直方图（同样带有摘要）
+
+    Raises:
+        ValueError: 某个直方图没有摘要或bin_size不一致时抛出
+    """
+    for hist in hist_list:
+        if not hist.has_summary():
+            raise ValueError("Histogram without summary cannot be merged")
+    bin_size = hist_list[0]._get("bin_size")
+    if [x for x in hist_list if x._get("bin_size") != bin_size]:
+        raise ValueError("Histograms with different bin sizes cannot be "
+                         "merged")
+    first = min([x._get("bin_offset") for x in hist_list])
+    last = max([x._get("bin_offset") + len(x._get("bin_counts"))
+                for x in hist_list])
+    counts = np.zeros(last - first)
+    for hist in hist_list:
+        offset = hist._get("bin_offset") - first
+        hist_counts = hist._get("bin_counts")
+        counts[offset:offset + len(hist_counts)] += hist_counts
+    edges = list((first + np.arange(len(counts) + 1))*bin_size)
+    shares = list(counts/float(np.sum(counts)))
+    # 用空格子补齐原直方图覆盖的范围，_join_var_bins会把它们合并为一个分箱
+    low_edge = min([x._get("edges")[0] for x in hist_list])
+    high_edge = max([x._get("edges")[-1] for x in hist_list])
+    if low_edge < edges[0]:
+        edges = [low_edge] + edges
+        shares = [0.0] + shares
+    if high_edge > edges[-1]:
+        edges = edges + [high_edge]
+        shares = shares + [0.0]
+    bins, edges = _join_var_bins(shares, edges, th_min=0.0, th_acc=0.0)
+    merged = Histogram()
+    merged._set("bins", bins)
+    merged._set("edges", edges)
+    merged._set("bin_size", bin_size)
+    merged._set("bin_offset", first)
+    merged._set("bin_counts", counts)
+    return merged
+
+def merge_stored_results(db_obj, trace_id_list, exclude_prefix="lim_"):
+    """加载多个trace存储的所有_cdf和_stats结果，并按结果类型合并它们的摘要。
+    每个表只执行一次类型查询和一次结果查询。
+
+    Args:
+        db_obj (DBManager): 已配置的数据库管理对象
+        trace_id_list (list[int]): 需要合并的trace ID列表
+        exclude_prefix (str): 以此前缀开头的结果类型不参与合并（默认排除
+            第二阶段分析的"lim_"结果）
+
+    Returns:
+        dict|None: {结果类型: 合并后的Histogram或NumericStats}。如果某个已存储
+            的结果没有摘要（旧版本存储的记录），返回None。
+    """
+    types = db_obj.getValuesAsColumns(
+                NumericStats()._table_name, ["type"],
+                condition="trace_id IN ({0})".format(
+                                ",".join([str(int(x)) for x in trace_id_list])),
+                groupBy="type")["type"]
+    field_list = [x[:-len("_stats")] for x in types
+                  if x.endswith("_stats") and
+                  not (exclude_prefix and x.startswith(exclude_prefix))]
+    loaded = load_results_bulk(field_list, db_obj, trace_id_list)
+    merged = {}
+    for field in field_list:
+        stats_list = [loaded[int(x)][field+"_stats"] for x in trace_id_list]
+        stats_list = [x for x in stats_list if x._get("count") is not None]
+        hist_list = [loaded[int(x)][field+"_cdf"] for x in trace_id_list]
+        hist_list = [x for x in hist_list if x._get("edges") is not None]
+        if ([x for x in stats_list if not x.has_summary()] or
+            [x for x in hist_list if not x.has_summary()]):
+            return None
+        if stats_list:
+            merged[field+"_stats"] = merge_numeric_stats(stats_list)
+        if hist_list:
+            merged[field+"_cdf"] = merge_histograms(hist_list)
+    return merged
@@ -1,12 +1,22 @@
 """
 此包包含许多用于导入和操作调度日志跟踪的类。
 """
+import functools
+import gzip
 import numpy as np
+import os
+import pipes
+import re
+import struct
+import zlib
 
 from stats import (calculate_results, load_results, NumericList)
 from stats.workflow import WorkflowsExtractor
 from commonLib.nerscUtilization import UtilizationEngine
 
+# 归档表中每行（块）最多保存的作业数，限制单行大小低于max_allowed_packet
+DEFAULT_ARCHIVE_CHUNK_JOBS = 100000
+
 
 class ResultTrace(object):
     """ 该类存储调度仿真结果跟踪。
@@ -16,15 +26,20 @@ class ResultTrace(object):
     它还处理跟踪，检索跟踪分析所需的值，并运行相应的分析。
     结果也可以存储在相应的数据库中（也已加载）。
     
-    跟踪存储所需的数据库表在create_trace_table中描述。
+    跟踪存储所需的数据库表在create_trace_table中描述。设置了归档表时，
+    跟踪以压缩的列存储在归档表中，每个跟踪块一行（见
+    create_trace_archive_table）。
     """
 
-    def __init__(self, table_name="traces"):
+    def __init__(self, table_name="traces", archive_table_name=None):
         """初始化跟踪数据存储对象
         构造函数用于创建存储作业跟踪数据的实例，并初始化相关数据结构。
         Args:
             table_name (str, optional): 存储跟踪数据的数据库表名称。默认为 "traces"。
                 该表用于持久化作业调度过程中的状态变更记录。
+            archive_table_name (str, optional): 跟踪归档表的名称。默认读取
+                环境变量TRACE_ARCHIVE_TABLE，未设置或为空字符串时不使用
+                归档表。
         Attributes:
             _lists_submit (dict): 按提交时间分类存储作业对象的字典，键为时间戳
             _lists_start (dict): 按启动时间分类存储作业对象的字典，键为时间戳
@@ -40,12 +55,17 @@ class ResultTrace(object):
 
         # 配置底层存储表结构和字段定义
         self._table_name = table_name
+        if archive_table_name is None:
+            archive_table_name = os.getenv("TRACE_ARCHIVE_TABLE") or None
+        self._archive_table_name = archive_table_name
 
         # 定义数据表字段结构，包含作业ID、资源需求、状态时间戳等核心字段
         self._fields = ["job_db_inx", "account", "cpus_req", "cpus_alloc",
                         "job_name", "id_job", "id_qos", "id_resv", "id_user",
                         "nodes_alloc", "partition", "priority", "state", "timelimit",
                         "time_submit", "time_start", "time_end"]
+        # 文本类型的字段，其余字段为整数
+        self._text_fields = ["account", "job_name", "partition"]
 
         # 初始化后续计算模块的占位符
         self._wf_extractor = None
@@ -55,42 +75,35 @@ class ResultTrace(object):
 
     def _clean_db_duplicates(self, db_obj, table_name):
         """
-        清理指定数据库表中同一id_job的重复记录，保留最大的job_db_inx记录
+        清理指定数据库表中同一id_job的重复记录，保留最大的job_db_inx记录。
+        所有重复记录在一个事务中由一条DELETE语句删除。
 
         参数:
-        - db_obj: 数据库连接对象，需包含getValuesAsColumns和doUpdate方法
+        - db_obj: 数据库连接对象
         - table_name: str 要清理的目标表名称
 
         返回值:
-        - 无
-        """
-
-        # 构造重复记录查询语句（分组统计+最大索引筛选）
-        query = """SELECT id_job, dup, inx from 
-              (SELECT `id_job`,count(*) dup, max(job_db_inx) inx 
-               FROM {0}  GROUP BY id_job) as grouped
-              WHERE dup>1""".format(table_name)
-        # 获取当前重复数据（包含id_job、重复次数、最大索引值）
-        duplicates = db_obj.getValuesAsColumns(
-            table_name, ["id_job", "dup", "inx"],
-            theQuery=query)
-        print
-        "Cleaning duplicated entries"
-        print
-        "Duplicated entries before:", len(duplicates["id_job"])
-
-        # 遍历删除除最大索引外的重复记录
-        for (id_job, job_db_inx) in zip(duplicates["id_job"], duplicates["inx"]):
-            query = """DELETE FROM `{0}` 
-                       WHERE `id_job`={1} and `job_db_inx`!={2}
-            """.format(table_name, id_job, job_db_inx)
-            db_obj.doUpdate(query)
-        # 验证清理后的重复状态
-        duplicates = db_obj.getValuesAsColumns(
-            table_name, ["id_job", "dup", "inx"],
-            theQuery=query)
-        print
-        "Duplicated entries after:", len(duplicates["id_job"])
+        - int: 删除的行数
+        """
+        db_obj.start_transaction()
+        (jobs_before, extra_before) = _count_duplicates(db_obj, table_name)
+        print "Cleaning duplicated entries"
+        print "Duplicated entries before: {0} jobs, {1} extra rows".format(
+                                                    jobs_before, extra_before)
+        deleted = 0
+        if jobs_before:
+            rows_before = db_obj.countValues(table_name)
+            # 分组的子查询总是被物化，所以MySQL允许在DELETE中引用同一个表
+            db_obj.doUpdate("""DELETE FROM `{0}` WHERE `job_db_inx` NOT IN
+                        (SELECT inx FROM
+                           (SELECT max(job_db_inx) inx FROM `{0}`
+                            GROUP BY id_job) as grouped)""".format(table_name))
+            deleted = rows_before - db_obj.countValues(table_name)
+        (jobs_after, extra_after) = _count_duplicates(db_obj, table_name)
+        db_obj.end_transaction()
+        print "Duplicated entries after: {0} jobs, {1} extra rows, {2} rows " \
+              "deleted".format(jobs_after, extra_after, deleted)
+        return deleted
 
     def import_from_db(self, db_obj, table_name, start=None, end=None):
         """从数据库导入调度器模拟跟踪数据到当前对象
@@ -124,6 +137,96 @@ class ResultTrace(object):
             condition=_get_limit("time_start", start, end),
             orderBy="time_start")
 
+    def get_export_command(self, table_name, dest_route, defaults_route):
+        """
+        返回在调度器数据库所在主机上执行的shell命令：用mysql客户端导出
+        table_name中的作业（同一id_job只保留job_db_inx最大的记录，与
+        _clean_db_duplicates相同，但不修改该表），按提交时间排序写成gzip
+        压缩的TSV文件dest_route，由import_from_export读取。文件先写入
+        dest_route旁的临时文件，导出成功后重命名。连接参数和密码从选项文件
+        defaults_route（get_export_defaults）读取，不出现在命令行中，命令
+        结束时删除该文件。
+        Args:
+            table_name (str): 作业表名称
+            dest_route (str): 导出文件在该主机上的路径
+            defaults_route (str): 选项文件在该主机上的路径
+        Returns:
+            str: 需要bash执行的命令
+        """
+        tmp_route = pipes.quote(dest_route + ".part")
+        defaults_route = pipes.quote(defaults_route)
+        return ("set -o pipefail; mysql --defaults-extra-file={0} --batch "
+                "--skip-column-names --quick -e {1} "
+                "| gzip -c > {2} && mv -f {2} {3}; rc=$?; rm -f {2} {0}; "
+                "exit $rc".format(defaults_route,
+                                  pipes.quote(self.get_export_query(
+                                                            table_name)),
+                                  tmp_route, pipes.quote(dest_route)))
+
+    def get_export_defaults(self, db_obj, host=None):
+        """
+        返回get_export_command使用的mysql选项文件的内容。没有设置用户或
+        密码时不写入对应的选项，与MySQLdb相同，mysql使用登录用户。
+        Args:
+            db_obj (DBManager): 配置为连接到Slurm记账数据库的对象
+            host (str): 代替db_obj.hostName连接的主机，例如在数据库所在
+                主机上执行时为"localhost"
+        Returns:
+            str: 选项文件的内容，包含密码，应以0600权限写入
+        """
+        options = [("host", host or db_obj.hostName),
+                   ("port", db_obj.port),
+                   ("user", db_obj.userName),
+                   ("password", db_obj.password),
+                   ("database", db_obj.dbName)]
+        return "[mysql]\n" + "".join(
+                    ["{0}=\"{1}\"\n".format(name, _escape_option(value))
+                     for (name, value) in options if value is not None])
+
+    def get_export_query(self, table_name):
+        """返回get_export_command执行的查询：table_name中每个id_job
+        job_db_inx最大的记录，按提交时间排序。"""
+        return ("SELECT {0} FROM `{1}` t JOIN "
+                "(SELECT max(job_db_inx) inx FROM `{1}` GROUP BY id_job) g "
+                "ON t.job_db_inx=g.inx "
+                "ORDER BY t.time_submit, t.job_db_inx".format(
+                    ", ".join(["t.`{0}`".format(x) for x in self._fields]),
+                    table_name))
+
+    def import_from_export(self, file_route):
+        """
+        读取get_export_command导出的文件，填充_lists_submit和
+        _lists_start。按开始时间排序的列表在本地由提交时间排序的列表得到
+        （稳定排序，与store_trace_archive相同），不需要第二次查询。
+        Args:
+            file_route (str): 本地的导出文件
+        Raises:
+            ValueError: 文件的列数与self._fields不同或值无法解析时抛出
+        """
+        export_file = gzip.open(file_route, "rb")
+        try:
+            rows = [line.rstrip("\n").split("\t") for line in export_file]
+        finally:
+            export_file.close()
+        columns = zip(*rows)
+        if not rows:
+            columns = [()] * len(self._fields)
+        if len(columns) != len(self._fields):
+            raise ValueError("Trace export {0} has {1} columns, expected "
+                             "{2}".format(file_route, len(columns),
+                                          len(self._fields)))
+        lists_submit = {}
+        for (field, values) in zip(self._fields, columns):
+            if field in self._text_fields:
+                lists_submit[field] = [_parse_export_text(x) for x in values]
+            else:
+                lists_submit[field] = [None if x == "NULL" else int(x)
+                                       for x in values]
+        start_order = _get_start_order(lists_submit).tolist()
+        self._lists_submit = lists_submit
+        self._lists_start = dict([(field, [values[i] for i in start_order])
+                                  for (field, values) in lists_submit.items()])
+
     def import_from_pbs_db(self, db_obj, table_name, start=None, end=None,
                            machine=None):
         """
@@ -216,24 +319,31 @@ class ResultTrace(object):
 
         return slurm_list
 
-    def store_trace(self, db_obj, trace_name):
+    def store_trace(self, db_obj, trace_name, load_data=False):
         """将跟踪数据存储到数据库的指定表中。
 
         通过DBManager对象将self._lists_submit定义的数据列和值，
-        与跟踪标识符关联后插入数据库表。
+        与跟踪标识符关联后插入数据库表。所有作业在一个事务中参数化批量插入，
+        插入速度（行/秒）记录在日志中。设置了归档表时改为写入归档表（见
+        store_trace_archive）。
 
         Args:
             db_obj (DBManager): 数据库连接管理器对象
                 - 需配置连接至包含self._table_name表的数据库
                 - 表结构需符合create_trace_table定义的格式
             trace_name (str): 跟踪记录的唯一标识符
+            load_data (bool): 为True时通过临时TSV文件和LOAD DATA LOCAL INFILE
+                导入，适用于非常大的跟踪（需要服务器开启local_infile）
 
         Returns:
-            None: 本方法无返回值
+            bool: 插入是否成功
         """
-        db_obj.insertValuesColumns(self._table_name,
-                                   self._lists_submit,
-                                   {"trace_id": trace_name})
+        if self._archive_table_name:
+            return self.store_trace_archive(db_obj, trace_name)
+        return db_obj.insertValuesColumns(self._table_name,
+                                          self._lists_submit,
+                                          {"trace_id": trace_name},
+                                          load_data=load_data)
 
     def load_trace(self, db_obj, trace_id, append=False):
         """
@@ -255,11 +365,9 @@ class ResultTrace(object):
             self._load_trace_count += 1
             time_offset = self._lists_submit["time_submit"][-1]
 
-        # 从数据库中获取符合trace_id条件的记录，并按提交时间排序
-        new_lists_submit = db_obj.getValuesAsColumns(
-            self._table_name, self._fields,
-            condition="trace_id={0}".format(trace_id),
-            orderBy="time_submit")
+        # 从数据库中获取符合trace_id条件的记录，分别按提交时间和开始时间排序
+        new_lists_submit, new_lists_start = self._load_trace_lists(db_obj,
+                                                                   trace_id)
         # 获取新加载跟踪的初始时间值
         first_time_value = new_lists_submit["time_submit"][0]
         # 根据时间偏移量调整新加载的跟踪时间
@@ -269,12 +377,7 @@ class ResultTrace(object):
         self._lists_submit = ResultTrace.join_dics_of_lists(
             self._lists_submit, new_lists_submit)
 
-        # 从数据库中获取符合trace_id条件的记录，并按开始时间排序
-        new_lists_start = db_obj.getValuesAsColumns(
-            self._table_name, self._fields,
-            condition="trace_id={0}".format(trace_id),
-            orderBy="time_start")
-        # 同样，根据时间偏移量调整新加载的跟踪时间
+        # 同样，根据时间偏移量调整按开始时间排序的跟踪时间
         ResultTrace.apply_offset_trace(new_lists_start, time_offset,
                                        first_time_value)
         # 将新加载的按开始时间排序的跟踪信息与现有信息合并
@@ -282,6 +385,178 @@ class ResultTrace(object):
             self._lists_start,
             new_lists_start)
 
+    def _load_trace_lists(self, db_obj, trace_id):
+        """返回trace_id的作业，分别按提交时间和开始时间排序的两个
+        {字段: 值列表}。设置了归档表且跟踪已归档时从归档表读取，否则从
+        self._table_name读取。"""
+        if self._archive_table_name:
+            lists = self.load_trace_archive(db_obj, trace_id)
+            if lists is not None:
+                return lists
+        return (self._load_columns(db_obj, trace_id, "time_submit"),
+                self._load_columns(db_obj, trace_id, "time_start"))
+
+    def store_trace_archive(self, db_obj, trace_id, lists=None,
+                            chunk_size=DEFAULT_ARCHIVE_CHUNK_JOBS):
+        """
+        将跟踪以压缩的列存储到归档表中：按提交时间排序的作业每chunk_size个
+        一行，每个字段一个压缩的列数据块，另有一列保存按开始时间排序的作业
+        顺序。trace_id已有的归档行先被删除。
+        Args:
+            db_obj (DBManager): 数据库连接管理器对象
+            trace_id (int): 跟踪的ID
+            lists (dict): 按提交时间排序的{字段: 值列表}，默认为
+                self._lists_submit
+            chunk_size (int): 每行的最大作业数
+        Returns:
+            bool: 写入是否成功
+        """
+        if lists is None:
+            lists = self._lists_submit
+        job_count = len(lists["time_submit"])
+        start_order = _get_start_order(lists)
+        fields = ["trace_id", "chunk", "job_count", "start_order"] + \
+                 self._fields
+        rows = []
+        for (chunk, first) in enumerate(range(0, max(job_count, 1),
+                                              chunk_size)):
+            last = min(first + chunk_size, job_count)
+            row = [trace_id, chunk, last - first,
+                   _pack_column(start_order[first:last], False)]
+            for field in self._fields:
+                row.append(_pack_column(lists[field][first:last],
+                                        field in self._text_fields))
+            rows.append(row)
+        db_obj.delete_rows(self._archive_table_name, "trace_id", trace_id)
+        ok, rows_per_second = db_obj.bulkInsert(self._archive_table_name,
+                                                fields, rows, batch_size=1,
+                                                disable_keys=False)
+        return ok
+
+    def load_trace_archive(self, db_obj, trace_id):
+        """
+        从归档表中读取跟踪。
+        Args:
+            db_obj (DBManager): 数据库连接管理器对象
+            trace_id (int): 跟踪的ID
+        Returns:
+            tuple: (lists_submit, lists_start)，分别为按提交时间和开始时间
+                排序的{字段: 值列表}；跟踪未归档时为None
+        """
+        rows = db_obj.doQuery("SELECT {0} FROM `{1}` WHERE trace_id={2} "
+                              "ORDER BY chunk".format(
+                              db_obj.concatFields(["start_order"] +
+                                                  self._fields),
+                              self._archive_table_name, trace_id))
+        if not rows:
+            return None
+        lists_submit = dict([(field, []) for field in self._fields])
+        start_order = []
+        for row in rows:
+            start_order.extend(_unpack_column(row[0]))
+            for (field, blob) in zip(self._fields, row[1:]):
+                lists_submit[field].extend(_unpack_column(blob))
+        lists_start = dict([(field, [values[i] for i in start_order])
+                            for (field, values) in lists_submit.items()])
+        return lists_submit, lists_start
+
+    def archive_trace(self, db_obj, trace_id, delete_rows=False,
+                      chunk_size=DEFAULT_ARCHIVE_CHUNK_JOBS):
+        """
+        将self._table_name中trace_id的作业复制到归档表。
+        Args:
+            db_obj (DBManager): 数据库连接管理器对象
+            trace_id (int): 跟踪的ID
+            delete_rows (bool): 为True时，归档并验证作业数后删除原表中的行
+            chunk_size (int): 归档表每行的最大作业数
+        Returns:
+            int: 归档的作业数，失败时为None
+        """
+        lists = self._load_columns(db_obj, trace_id, "time_submit")
+        job_count = len(lists["time_submit"])
+        if not self.store_trace_archive(db_obj, trace_id, lists=lists,
+                                        chunk_size=chunk_size):
+            return None
+        archived = self.load_trace_archive(db_obj, trace_id)
+        if archived is None or len(archived[0]["time_submit"]) != job_count:
+            return None
+        if delete_rows:
+            db_obj.delete_rows(self._table_name, "trace_id", trace_id)
+        return job_count
+
+    def update_time_starts(self, db_obj, trace_id, time_starts):
+        """
+        批量修改trace_id中作业的开始时间。time_starts写入一个临时表，然后
+        在一个事务中用一条UPDATE ... JOIN语句更新所有作业。跟踪已归档时，
+        改为修改归档的列后重写归档。
+        Args:
+            db_obj (DBManager): 数据库连接管理器对象
+            trace_id (int): 跟踪的ID
+            time_starts (dict): {id_job: 新的开始时间}
+        Returns:
+            int: 修改的作业数，失败时为None
+        """
+        if not time_starts:
+            return 0
+        if self._archive_table_name:
+            lists = self.load_trace_archive(db_obj, trace_id)
+            if lists is not None:
+                lists_submit = lists[0]
+                count = 0
+                for (pos, id_job) in enumerate(lists_submit["id_job"]):
+                    if id_job in time_starts:
+                        lists_submit["time_start"][pos] = time_starts[id_job]
+                        count += 1
+                if not self.store_trace_archive(db_obj, trace_id,
+                                                lists=lists_submit):
+                    return None
+                return count
+        db_obj.start_transaction()
+        db_obj.doUpdate("DROP TEMPORARY TABLE IF EXISTS `tmp_time_start`")
+        db_obj.doUpdate("""CREATE TEMPORARY TABLE `tmp_time_start` (
+                           `id_job` int(10) unsigned NOT NULL,
+                           `time_start` int(10) unsigned NOT NULL,
+                           PRIMARY KEY (`id_job`))""")
+        ok, rows_per_second = db_obj.bulkInsert("tmp_time_start",
+                                                ["id_job", "time_start"],
+                                                sorted(time_starts.items()))
+        count = None
+        if ok:
+            rows = db_obj.doQuery("""SELECT count(*) FROM `{0}` t
+                                     JOIN `tmp_time_start` n
+                                     ON t.id_job=n.id_job
+                                     WHERE t.trace_id={1}""".format(
+                                                self._table_name, trace_id))
+            ok, insert_id = db_obj.doUpdate("""UPDATE `{0}` t
+                                     JOIN `tmp_time_start` n
+                                     ON t.id_job=n.id_job
+                                     SET t.time_start=n.time_start
+                                     WHERE t.trace_id={1}""".format(
+                                                self._table_name, trace_id))
+            if rows and ok:
+                count = int(rows[0][0])
+        db_obj.doUpdate("DROP TEMPORARY TABLE IF EXISTS `tmp_time_start`")
+        db_obj.end_transaction()
+        return count
+
+    def delete_trace(self, db_obj, trace_id):
+        """删除trace_id的作业，设置了归档表时也删除其归档行。"""
+        db_obj.delete_rows(self._table_name, "trace_id", trace_id)
+        if self._archive_table_name:
+            db_obj.delete_rows(self._archive_table_name, "trace_id", trace_id)
+
+    def _load_columns(self, db_obj, trace_id, order_by):
+        """按order_by排序读取trace_id的所有作业，返回{字段: 值列表}。
+        使用流式查询按块读取，避免一次性生成整个结果集的行字典。"""
+        lists = dict([(field, []) for field in self._fields])
+        for chunk in db_obj.streamValuesAsColumns(
+                self._table_name, self._fields,
+                condition="trace_id={0}".format(trace_id),
+                orderBy=order_by):
+            for field in self._fields:
+                lists[field].extend(chunk[field].tolist())
+        return lists
+
     @classmethod
     def apply_offset_trace(cls, lists, offset=0, first_time_value=0,
                            time_fields=["time_start", "time_end", "time_submit"]
@@ -1486,6 +1761,13 @@ class ResultTrace(object):
         self._integrated_ut = res.get_data()["utilization"]
         self._corrected_integrated_ut = res.get_data()["corrected_utilization"]
 
+    def _load_utilization_traces(self, db_obj, trace_id_list):
+        """并发加载trace_id_list中每个追踪的利用率结果，返回与
+        trace_id_list顺序相同的ResultTrace列表。"""
+        return db_obj.runConcurrently(
+                    [functools.partial(_load_utilization_trace, db_obj, x)
+                     for x in trace_id_list])
+
     def calculate_utilization_median_result(self, trace_id_list, store, db_obj,
                                             trace_id):
         """计算并存储跟踪列表中的中间利用率和浪费值。
@@ -1503,10 +1785,8 @@ class ResultTrace(object):
         wasted_values = []
         corrected_integrated_values = []
 
-        # 遍历所有子追踪ID，加载每个追踪的利用率结果
-        for sub_trace_id in trace_id_list:
-            rt = ResultTrace()
-            rt.load_utilization_results(db_obj, sub_trace_id)
+        # 并发加载每个子追踪的利用率结果
+        for rt in self._load_utilization_traces(db_obj, trace_id_list):
             integrated_values.append(rt._integrated_ut)
             wasted_values.append(rt._acc_waste)
             corrected_integrated_values.append(rt._corrected_integrated_ut)
@@ -1533,9 +1813,7 @@ class ResultTrace(object):
         integrated_values = []
         wasted_values = []
         corrected_integrated_values = []
-        for sub_trace_id in trace_id_list:
-            rt = ResultTrace()
-            rt.load_utilization_results(db_obj, sub_trace_id)
+        for rt in self._load_utilization_traces(db_obj, trace_id_list):
             integrated_values.append(rt._integrated_ut)
             wasted_values.append(rt._acc_waste)
             corrected_integrated_values.append(rt._corrected_integrated_ut)
@@ -1577,6 +1855,24 @@ class ResultTrace(object):
          """.format(table_name)
         db_obj.doUpdate(query)
 
+    def create_trace_archive_table(self, db_obj, table_name=None):
+        """创建跟踪归档表，默认表名为self._archive_table_name。每行保存
+        一个跟踪块：start_order和每个字段各一个压缩的列数据块。"""
+        if table_name is None:
+            table_name = self._archive_table_name
+        query = """
+           CREATE TABLE `{0}` (
+           `trace_id` INT(10) NOT NULL,
+           `chunk` INT NOT NULL,
+           `job_count` INT NOT NULL,
+           `start_order` LONGBLOB NOT NULL,
+           {1},
+           PRIMARY KEY (`trace_id`, `chunk`))
+         """.format(table_name,
+                    ",\n".join(["`{0}` LONGBLOB NOT NULL".format(x)
+                                for x in self._fields]))
+        db_obj.doUpdate(query)
+
     def create_import_table(self, db_obj, table_name):
         """ For testing """
         query = """
@@ -1604,6 +1900,100 @@ class ResultTrace(object):
         db_obj.doUpdate(query)
 
 
+def _load_utilization_trace(db_obj, trace_id):
+    rt = ResultTrace()
+    rt.load_utilization_results(db_obj, trace_id)
+    return rt
+
+
+# 归档列数据块的头部：魔数、类型（_COLUMN_INT或_COLUMN_TEXT）、值的个数
+_COLUMN_MAGIC = "RTCL"
+_COLUMN_HEADER = struct.Struct("<4sBQ")
+_COLUMN_INT = 0
+_COLUMN_TEXT = 1
+
+
+def _pack_column(values, is_text):
+    """将一列值编码为zlib压缩的二进制数据块。整数列以int64的差分存储
+    （时间等有序的列压缩率更高），文本列以每个值的长度（None为-1）加上
+    所有值拼接的内容存储。"""
+    if is_text:
+        lengths = np.array([-1 if x is None else len(x) for x in values],
+                           dtype="<i4")
+        payload = (_COLUMN_HEADER.pack(_COLUMN_MAGIC, _COLUMN_TEXT,
+                                       len(lengths)) + lengths.tobytes() +
+                   "".join([x for x in values if x is not None]))
+    else:
+        array = np.asarray(values, dtype="<i8")
+        payload = (_COLUMN_HEADER.pack(_COLUMN_MAGIC, _COLUMN_INT,
+                                       len(array)) +
+                   np.diff(array, prepend=np.int64(0)).astype("<i8").tobytes())
+    return zlib.compress(payload)
+
+
+def _unpack_column(blob):
+    """解码_pack_column生成的数据块，返回值的列表。
+
+    Raises:
+        ValueError: 数据块的格式未知时抛出
+    """
+    payload = zlib.decompress(blob)
+    (magic, kind, count) = _COLUMN_HEADER.unpack_from(payload)
+    if magic != _COLUMN_MAGIC or kind not in (_COLUMN_INT, _COLUMN_TEXT):
+        raise ValueError("Unknown trace archive column encoding")
+    offset = _COLUMN_HEADER.size
+    if kind == _COLUMN_INT:
+        return np.cumsum(np.frombuffer(payload, dtype="<i8", count=count,
+                                       offset=offset)).tolist()
+    lengths = np.frombuffer(payload, dtype="<i4", count=count, offset=offset)
+    offset += lengths.nbytes
+    values = []
+    for length in lengths.tolist():
+        if length < 0:
+            values.append(None)
+        else:
+            values.append(payload[offset:offset + length])
+            offset += length
+    return values
+
+
+def _get_start_order(lists):
+    """返回按开始时间排序作业的下标数组。稳定排序：开始时间相同的作业保持
+    提交顺序。"""
+    return np.argsort(np.asarray(lists["time_start"], dtype=np.int64),
+                      kind="mergesort")
+
+
+# mysql --batch输出中转义的字符
+_EXPORT_ESCAPES = {"n": "\n", "t": "\t", "0": "\0", "\\": "\\"}
+_EXPORT_ESCAPE_RE = re.compile(r"\\(.)")
+
+
+def _parse_export_text(value):
+    """将mysql --batch输出的文本值还原：NULL为None，并去除转义。"""
+    if value == "NULL":
+        return None
+    if "\\" not in value:
+        return value
+    return _EXPORT_ESCAPE_RE.sub(
+                lambda m: _EXPORT_ESCAPES.get(m.group(1), m.group(1)), value)
+
+
+def _escape_option(value):
+    """转义mysql选项文件中双引号内的值。"""
+    return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace("\r", "\\r"))
+
+
+def _count_duplicates(db_obj, table_name):
+    """返回table_name中重复的id_job的个数和多余（非最大job_db_inx）的行数。"""
+    rows = db_obj.doQuery("""SELECT count(*), sum(dup-1) FROM
+                               (SELECT count(*) dup FROM `{0}` GROUP BY id_job
+                                HAVING count(*)>1) as grouped""".format(
+                                                                table_name))
+    return int(rows[0][0]), int(rows[0][1] or 0)
+
+
 def _get_limit(order_field, start=None, end=None):
     """
     生成SQL条件表达式，用于限定排序字段的范围
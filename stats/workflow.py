@@ -1041,7 +1041,7 @@ class WasteExtractor(object):
             self._allocation_changes[pos]+= cores
         else:
             # 插入新时间节点并记录资源变更
-            elf._time_stamps.insert(pos, time_stamp)
+            self._time_stamps.insert(pos, time_stamp)
             self._allocation_changes.insert(pos, cores)
         
             
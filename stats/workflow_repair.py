@@ -15,6 +15,8 @@ class StartTimeCorrector(object):
         Args:
             db_obj: 数据库连接对象，用于执行数据加载和更新操作
             trace_id: 需要修正的跟踪记录唯一标识符
+        Returns:
+            int: 修正的作业数，更新失败时为None
         """
         self._experiment = ExperimentDefinition()
         self._experiment.load(db_obj, trace_id)
@@ -28,15 +30,29 @@ class StartTimeCorrector(object):
         print ("Found {0} jobs which start time was 0, but had ended.".format(
                                             len(modified_start_times)))
         print ("About to update times")
-        self.apply_new_times(db_obj, modified_start_times)    
-    
+        return self.apply_new_times(db_obj, modified_start_times)
+
+    def correct_traces(self, db_obj, trace_id_list=None):
+        """修正多个跟踪的开始时间，默认为get_traces_with_bad_time_starts
+        返回的所有跟踪。返回{trace_id: 修正的作业数}。"""
+        if trace_id_list is None:
+            trace_id_list = self.get_traces_with_bad_time_starts(db_obj)
+        corrected = {}
+        for trace_id in trace_id_list:
+            corrected[trace_id] = self.correct_times(db_obj, trace_id)
+        return corrected
+
     def apply_new_times(self, db_obj, modified_start_times):
+        """在一条语句中将modified_start_times（{id_job: 开始时间}）写入
+        当前实验的跟踪，并丢弃已加载的（已过时的）跟踪。返回修正的作业数，
+        失败时为None。"""
         trace_id=self._experiment._trace_id
-        for id_job in modified_start_times.keys():
-            time_start=modified_start_times[id_job]
-            print ("updating trace_id({0}), id_job({1}) with time_start: {2}"
-                   "".format(trace_id, id_job, time_start))
-            self.update_time_start(db_obj,trace_id, id_job, time_start)
+        corrected = ResultTrace().update_time_starts(db_obj, trace_id,
+                                                     modified_start_times)
+        self._trace = None
+        print ("Corrected time_start of {0} jobs in trace_id({1})".format(
+                                                        corrected, trace_id))
+        return corrected
     
     def update_time_start(self, db_obj, trace_id, id_job, time_start):
         """
@@ -1,11 +1,11 @@
-from commonLib.DBManager import DB
+from commonLib.DBManager import get_db
 from orchestration.definition import ExperimentDefinition
 
 import os
 
 # 创建数据库对象，连接测试数据库
 # 使用环境变量提供的数据库信息，如果没有提供，则使用默认值
-db_obj  = DB(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+db_obj  = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
                    os.getenv("TEST_DB_NAME", "test"),
                    os.getenv("TEST_DB_USER", "root"),
                    os.getenv("TEST_DB_PASS", ""))
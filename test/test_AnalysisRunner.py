@@ -7,7 +7,7 @@
  
 """
 
-from commonLib.DBManager import DB
+from commonLib.DBManager import get_db
 from stats.trace import ResultTrace
 import datetime
 import os
@@ -28,7 +28,7 @@ class TestAnalysisRunnerSingle(unittest.TestCase):
         如果环境变量未设置，则使用默认值连接到数据库。
         """
         # 初始化数据库连接
-        self._db  = DB(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+        self._db  = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
                    os.getenv("TEST_DB_NAME", "test"),
                    os.getenv("TEST_DB_USER", "root"),
                    os.getenv("TEST_DB_PASS", ""))
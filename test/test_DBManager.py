@@ -0,0 +1,345 @@
+"""UNIT TESTS for the DB class: connection pool and streaming queries, and
+for the SQLite backend (SQLiteDB), that does not need a MySQL server.
+
+ python -m unittest test_DBManager
+
+"""
+
+from commonLib.DBManager import DB, QueryStats, SQLiteDB, get_db, query_stats
+from orchestration.definition import ExperimentDefinition
+from stats import Histogram, NumericStats
+
+import datetime
+import numpy as np
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+class TestDBManager(unittest.TestCase):
+    def setUp(self):
+        self._db  = DB(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+                       os.getenv("TEST_DB_NAME", "test"),
+                       os.getenv("TEST_DB_USER", "root"),
+                       os.getenv("TEST_DB_PASS", ""))
+    def _del_table(self, table_name):
+        ok = self._db.doUpdate("drop table "+table_name+"")
+        self.assertTrue(ok, "Table was not created!")
+
+    def test_reuse_connection(self):
+        self._db.doQuery("SELECT 1")
+        created = self._db.get_pool().get_stats()["created"]
+        for i in range(20):
+            self.assertEqual(self._db.doQuery("SELECT 1"), ((1,),))
+        other_db = DB(self._db.hostName, self._db.dbName, self._db.userName,
+                      self._db.password)
+        self.assertEqual(other_db.doQuery("SELECT 1"), ((1,),))
+        self.assertIs(other_db.get_pool(), self._db.get_pool())
+        self.assertEqual(self._db.get_pool().get_stats()["created"], created)
+
+    def test_threads(self):
+        pool = self._db.get_pool()
+        results = []
+        def do_queries():
+            for i in range(20):
+                results.append(self._db.doQuery("SELECT 1"))
+        threads = [threading.Thread(target=do_queries) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [((1,),)]*160)
+        stats = pool.get_stats()
+        self.assertLessEqual(stats["open"], stats["max_size"])
+        self.assertEqual(stats["open"], stats["idle"])
+
+    def test_transaction(self):
+        self.addCleanup(self._del_table, "pool_test")
+        self._db.doUpdate("create table pool_test (id INT NOT NULL)")
+        self._db.start_transaction()
+        self._db.doUpdate("insert into pool_test (id) values (1)")
+        self._db.doUpdate("insert into pool_test (id) values (2)")
+        self._db.end_transaction()
+        self.assertEqual(self._db.doQuery("SELECT SUM(id) FROM pool_test"),
+                         ((3,),))
+        self.assertEqual(self._db.doQuery("SELECT @@autocommit"), ((1,),))
+
+    def test_close(self):
+        self._db.doQuery("SELECT 1")
+        self._db.close()
+        self.assertEqual(self._db.get_pool().get_stats()["idle"], 0)
+        self.assertEqual(self._db.doQuery("SELECT 1"), ((1,),))
+
+    def _create_stream_table(self, row_count):
+        self.addCleanup(self._del_table, "stream_test")
+        self._db.doUpdate("create table stream_test (id INT NOT NULL PRIMARY KEY, "
+                          "value DOUBLE, name VARCHAR(16))")
+        self._db.doUpdateMany(
+            "insert into stream_test (id, value, name) values (%s, %s, %s)",
+            [(i, i * 0.5, "job{0}".format(i)) for i in range(row_count)])
+
+    def test_stream_values_as_columns(self):
+        self._create_stream_table(10)
+        chunks = list(self._db.streamValuesAsColumns(
+                        "stream_test", ["id", "value", "name"],
+                        condition="id>=2", orderBy="id", chunk_size=3,
+                        dtypes={"id": np.int32}))
+        self.assertEqual([len(x["id"]) for x in chunks], [3, 3, 2])
+        self.assertEqual(chunks[0]["id"].dtype, np.int32)
+        self.assertEqual(chunks[0]["value"].dtype, np.float64)
+        self.assertEqual(list(np.concatenate([x["id"] for x in chunks])),
+                         range(2, 10))
+        self.assertEqual(chunks[2]["name"].tolist(), ["job8", "job9"])
+        self.assertEqual(list(self._db.streamValuesAsColumns(
+                        "stream_test", ["id"], condition="id>100")), [])
+
+    def test_stream_values_abandoned(self):
+        self._create_stream_table(10)
+        pool = self._db.get_pool()
+        discarded = pool.get_stats()["discarded"]
+        stream = self._db.streamValuesAsColumns("stream_test", ["id"],
+                                                chunk_size=2)
+        next(stream)
+        stream.close()
+        self.assertEqual(pool.get_stats()["discarded"], discarded + 1)
+        self.assertEqual(self._db.countValues("stream_test"), 10)
+
+    def test_read_values_into_arrays(self):
+        self._create_stream_table(10)
+        count = self._db.countValues("stream_test", condition="id<7")
+        self.assertEqual(count, 7)
+        out = dict(id=np.zeros(count, dtype=np.int64),
+                   value=np.zeros(count))
+        self.assertEqual(self._db.readValuesIntoArrays(
+                            "stream_test", ["id", "value"], out,
+                            condition="id<7", orderBy="id", chunk_size=2), 7)
+        self.assertEqual(list(out["id"]), range(7))
+        self.assertEqual(list(out["value"]), [x * 0.5 for x in range(7)])
+        self.assertRaises(ValueError, self._db.readValuesIntoArrays,
+                          "stream_test", ["id", "value"], out)
+
+    def test_bulk_insert(self):
+        self._create_stream_table(0)
+        rows = [(i, i * 0.25, "job\t{0}".format(i)) for i in range(12)]
+        rows.append((12, None, None))
+        ok, rows_per_second = self._db.bulkInsert(
+                    "stream_test", ["id", "value", "name"], iter(rows),
+                    batch_size=5)
+        self.assertTrue(ok)
+        self.assertGreater(rows_per_second, 0)
+        self.assertEqual(self._db.doQuery("SELECT id, value, name FROM "
+                                          "stream_test ORDER BY id"),
+                         tuple(rows))
+        self.assertEqual(self._db.doQuery("SELECT @@unique_checks, "
+                                          "@@autocommit"), ((1, 1),))
+
+        ok, rows_per_second = self._db.bulkInsert(
+                    "stream_test", ["id", "value"],
+                    [(13, 1.0), (13, 2.0)], batch_size=1)
+        self.assertFalse(ok)
+        self.assertEqual(self._db.countValues("stream_test"), 13)
+
+    def test_bulk_insert_load_data(self):
+        local_infile = self._db.doQuery("SHOW VARIABLES LIKE 'local_infile'")
+        if not local_infile or local_infile[0][1] != "ON":
+            self.skipTest("local_infile is disabled in the server")
+        self._create_stream_table(0)
+        rows = [(1, 0.1, "a\\b\tc\nd"), (2, None, None), (3, 1e-20, "e")]
+        ok, rows_per_second = self._db.bulkInsert(
+                    "stream_test", ["id", "value", "name"], rows,
+                    load_data=True)
+        self.assertTrue(ok)
+        self.assertEqual(self._db.doQuery("SELECT id, value, name FROM "
+                                          "stream_test ORDER BY id"),
+                         tuple(rows))
+
+
+class TestSQLiteDB(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._dir)
+        self._db = SQLiteDB(os.path.join(self._dir, "test.sqlite"))
+        self.addCleanup(self._db.close)
+
+    def test_get_db(self):
+        os.environ["SQLITE_DB_DIR"] = os.path.join(self._dir, "dbs")
+        try:
+            db_obj = get_db("127.0.0.1", "test", "root", "")
+        finally:
+            del os.environ["SQLITE_DB_DIR"]
+        self.addCleanup(db_obj.close)
+        self.assertIsInstance(db_obj, SQLiteDB)
+        self.assertEqual(db_obj.doQuery("SELECT 1"), ((1,),))
+        self.assertTrue(os.path.exists(os.path.join(self._dir, "dbs",
+                                                    "test.sqlite")))
+        self.assertNotIsInstance(get_db("127.0.0.1", "test", "root", ""),
+                                 SQLiteDB)
+
+    def test_queries(self):
+        self._db.doUpdate("""create table `sq_test` (
+                `id` INT(10) unsigned NOT NULL AUTO_INCREMENT,
+                `name` varchar(64) DEFAULT "",  # the name
+                `value` DOUBLE,
+                `data` LONGBLOB,
+                PRIMARY KEY(`id`),
+                KEY `name_key` (`name`)) ENGINE = InnoDB;""")
+        ok, insert_id = self._db.insertValues("sq_test", ["name", "value"],
+                                              ["job1", 0.5],
+                                              get_insert_id=True)
+        self.assertTrue(ok)
+        self.assertEqual(insert_id, 1)
+        ok, insert_id = self._db.insertValues("sq_test", ["value"], [1.5],
+                                              get_insert_id=True)
+        self.assertEqual(insert_id, 2)
+        self.assertEqual(self._db.doQuery("SELECT id, name, value FROM sq_test "
+                                          "ORDER BY id"),
+                         ((1, "job1", 0.5), (2, "", 1.5)))
+        self.assertEqual(self._db.getValuesDicList("sq_test", ["id", "name"],
+                                                   condition="value>1"),
+                         ({"id": 2, "name": ""},))
+        self.assertEqual(self._db.getValuesAsColumns("sq_test", ["id"],
+                                                     orderBy="id DESC"),
+                         {"id": [2, 1]})
+        blob = "\x00\\'\"\n\xff" * 10
+        self.assertTrue(self._db.doUpdateParams(
+                        "UPDATE sq_test SET data=%s WHERE id=%s", [blob, 1]))
+        self.assertEqual(self._db.retoreFieldToStringFromDB(
+                         "sq_test", "data", "id", "1"), blob)
+        self.assertEqual([x[0] for x in self._db.doQuery(
+                                        "SHOW COLUMNS FROM `sq_test`")],
+                         ["id", "name", "value", "data"])
+        self.assertEqual([x[2] for x in self._db.doQuery(
+                                        "SHOW INDEX FROM sq_test")],
+                         ["name_key"])
+        self.assertEqual(self._db.doQuery("SELECT * FROM missing_table"),
+                         False)
+
+    def test_transaction(self):
+        self._db.doUpdate("create table sq_test (id INT NOT NULL PRIMARY KEY)")
+        self._db.start_transaction()
+        self._db.doUpdate("insert into sq_test (id) values (1)")
+        self._db.doUpdate("insert into sq_test (id) values (2)")
+        other_db = SQLiteDB(self._db.fileName, pool_size=2)
+        self.assertEqual(other_db.countValues("sq_test"), 0)
+        self._db.end_transaction()
+        self.assertEqual(other_db.countValues("sq_test"), 2)
+
+        ok, rows_per_second = self._db.bulkInsert("sq_test", ["id"],
+                                                  [(3,), (1,)])
+        self.assertFalse(ok)
+        self.assertEqual(self._db.countValues("sq_test"), 2)
+        ok, rows_per_second = self._db.bulkInsert("sq_test", ["id"],
+                                                  [(x,) for x in range(3, 10)],
+                                                  load_data=True)
+        self.assertTrue(ok)
+        chunks = list(self._db.streamValuesAsColumns("sq_test", ["id"],
+                                                     orderBy="id",
+                                                     chunk_size=4))
+        self.assertEqual([list(x["id"]) for x in chunks],
+                         [[1, 2, 3, 4], [5, 6, 7, 8], [9]])
+
+    def test_run_concurrently(self):
+        self._db.doUpdate("create table sq_test (id INT NOT NULL PRIMARY KEY)")
+        self._db.bulkInsert("sq_test", ["id"], [(x,) for x in range(10)])
+        db_obj = SQLiteDB(self._db.fileName, pool_size=3)
+        self.addCleanup(db_obj.close)
+        queries = ["SELECT id FROM sq_test WHERE id={0}".format(x)
+                   for x in range(10)]
+        self.assertEqual(db_obj.doQueriesConcurrently(queries),
+                         [((x,),) for x in range(10)])
+        self.assertEqual(db_obj.doQueriesConcurrently(queries[:2],
+                                                      dict_rows=True,
+                                                      max_workers=2),
+                         [({"id": 0},), ({"id": 1},)])
+        self.assertEqual(db_obj.runConcurrently([]), [])
+
+        def fail():
+            raise ValueError("failed")
+        calls = [lambda: db_obj.countValues("sq_test"), fail]
+        self.assertRaises(ValueError, db_obj.runConcurrently, calls)
+
+        threads = []
+        calls = [lambda: threads.append(threading.current_thread())] * 4
+        db_obj.start_transaction()
+        db_obj.runConcurrently(calls)
+        db_obj.end_transaction()
+        self.assertEqual(set(threads), set([threading.current_thread()]))
+
+    def test_experiment_and_results(self):
+        definition = ExperimentDefinition()
+        definition.create_table(self._db)
+        Histogram().create_table(self._db)
+        NumericStats().create_table(self._db)
+        exp = ExperimentDefinition(seed="AAAA", machine="edison",
+                                   start_date=datetime.datetime(2016, 1, 1))
+        trace_id = exp.store(self._db)
+        self.assertEqual(trace_id, 1)
+        new_exp = ExperimentDefinition()
+        self.assertTrue(new_exp.load_fresh(self._db))
+        self.assertEqual(new_exp._trace_id, trace_id)
+        self.assertEqual(new_exp._start_date, datetime.datetime(2016, 1, 1))
+        self.assertEqual(new_exp._work_state, "pre_simulating")
+        self.assertTrue(new_exp.update_simulating_start(self._db))
+        new_exp.load(self._db, trace_id)
+        self.assertIsInstance(new_exp._simulating_start, datetime.datetime)
+        self.assertIsNone(new_exp._simulating_end)
+
+        hist = Histogram()
+        hist.calculate([1, 2, 2, 3, 5], 1)
+        hist.store(self._db, trace_id, "lala")
+        new_hist = Histogram()
+        new_hist.load(self._db, trace_id, "lala")
+        self.assertEqual(list(new_hist._get("bins")), list(hist._get("bins")))
+        self.assertEqual(list(new_hist._get("edges")),
+                         list(hist._get("edges")))
+
+
+class TestQueryStats(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._dir)
+        self._db = SQLiteDB(os.path.join(self._dir, "test.sqlite"))
+        self.addCleanup(self._db.close)
+        query_stats.reset()
+        self.addCleanup(query_stats.reset)
+        self.addCleanup(query_stats.disable)
+
+    def test_normalize(self):
+        self.assertEqual(QueryStats.normalize(
+                         "SELECT a FROM t1 WHERE trace_id=12 and type='lala'"
+                         "  and id IN (1, 2,3) and v>1.5e3"),
+                         "SELECT a FROM t1 WHERE trace_id=? and type=? and "
+                         "id IN (?, ...) and v>?")
+
+    def test_disabled(self):
+        self._db.doQuery("SELECT 1")
+        self.assertEqual(query_stats.get_summary(), [])
+
+    def test_summary(self):
+        slow_log = os.path.join(self._dir, "slow.log")
+        query_stats.enable(slow_threshold=0, slow_log_file=slow_log)
+        for i in range(3):
+            self._db.doQuery("SELECT {0}".format(i))
+        self._db.doUpdate("create table st (id INT NOT NULL, name TEXT)")
+        ok, rows_per_second = self._db.bulkInsert(
+                    "st", ["id", "name"], [(x, "abcd") for x in range(10)])
+        chunks = list(self._db.streamValuesAsColumns("st", ["id", "name"],
+                                                     chunk_size=4))
+        summary = dict([(x["statement"], x)
+                        for x in query_stats.get_summary()])
+        select = summary["SELECT ?"]
+        self.assertEqual(select["count"], 3)
+        self.assertEqual(select["rows"], 3)
+        self.assertEqual(select["received_bytes"], 24)
+        self.assertTrue(select["site"].startswith("test_DBManager.py:"))
+        self.assertEqual(summary["BULK INSERT INTO `st` (id,name)"]["rows"],
+                         10)
+        stream = summary["SELECT `id`,`name` FROM `st` WHERE TRUE"]
+        self.assertEqual((stream["count"], stream["rows"],
+                          stream["received_bytes"]), (1, 10, 120))
+        self.assertEqual(len(query_stats.get_summary(top=2)), 2)
+        self.assertIn("SELECT ?", query_stats.format_summary())
+        with open(slow_log) as log_file:
+            self.assertEqual(len(log_file.readlines()), 6)
+
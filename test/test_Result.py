@@ -5,9 +5,13 @@
  
 """
 
-from commonLib.DBManager import DB
-from stats import Result, Histogram, NumericStats, NumericList
+from commonLib.DBManager import get_db
+from stats import (Result, Histogram, NumericStats, NumericList,
+                   load_results_bulk, pack_array, unpack_array,
+                   is_packed_array, merge_numeric_stats, merge_histograms,
+                   merge_stored_results, ResultCache, result_cache)
 
+import cPickle
 import numpy as np
 import os
 import unittest
@@ -15,10 +19,10 @@ import unittest
 class TestResult(unittest.TestCase):
     
     def setUp(self):
-        self._db  = DB(os.getenv("TEST_DB_HOST", "127.0.0.1"),
-                       os.getenv("TEST_DB_NAME", "test"),
-                       os.getenv("TEST_DB_USER", "root"),
-                       os.getenv("TEST_DB_PASS", ""))
+        self._db  = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+                           os.getenv("TEST_DB_NAME", "test"),
+                           os.getenv("TEST_DB_USER", "root"),
+                           os.getenv("TEST_DB_PASS", ""))
     
     def _del_table(self, table_name):
         ok = self._db.doUpdate("drop table "+table_name+"")
@@ -78,10 +82,10 @@ class TestResult(unittest.TestCase):
                     
 class TestHistogram(unittest.TestCase):
     def setUp(self):
-        self._db  = DB(os.getenv("TEST_DB_HOST", "127.0.0.1"),
-                       os.getenv("TEST_DB_NAME", "test"),
-                       os.getenv("TEST_DB_USER", "root"),
-                       os.getenv("TEST_DB_PASS", ""))
+        self._db  = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+                           os.getenv("TEST_DB_NAME", "test"),
+                           os.getenv("TEST_DB_USER", "root"),
+                           os.getenv("TEST_DB_PASS", ""))
     def _del_table(self, table_name):
         ok = self._db.doUpdate("drop table "+table_name+"")
         self.assertTrue(ok, "Table was not created!")
@@ -116,12 +120,127 @@ class TestHistogram(unittest.TestCase):
         self.assertEqual(hist_new._get("edges"), [1, 2, 3, 4, 5, 6])
         self.assertEqual(list(hist_new._get("bins")), [0.2, 0.2, 0.4, 0, 0.2])    
     
+    def test_encode_decode(self):
+        hist = Histogram()
+        blob = pack_array(np.array([0.2, 0.2, 0.4, 0, 0.2]))
+        self.assertTrue(is_packed_array(blob))
+        bins = hist._decode(blob, "bins")
+        self.assertIsInstance(bins, np.ndarray)
+        self.assertEqual(list(bins), [0.2, 0.2, 0.4, 0, 0.2])
+        
+        edges = hist._decode(pack_array([1, 2, 3]), "edges")
+        self.assertEqual(edges, [1, 2, 3])
+        
+        bins = unpack_array(pack_array(np.array([0.5, 0.25],
+                                                dtype=np.float32)))
+        self.assertEqual(bins.dtype, np.float32)
+        self.assertEqual(list(bins), [0.5, 0.25])
+        
+    def test_decode_pickle(self):
+        hist = Histogram()
+        self.assertEqual(hist._decode(cPickle.dumps([1, 2, 3]), "edges"),
+                         [1, 2, 3])
+        bins = hist._decode(cPickle.dumps(np.array([0.2, 0.8])), "bins")
+        self.assertEqual(list(bins), [0.2, 0.8])
+    
+    def test_migrate_encoding(self):
+        hist = Histogram()
+        self.addCleanup(self._del_table, "histograms")
+        hist.create_table(self._db)
+        self._db.doUpdateParams(
+            "INSERT INTO histograms (trace_id, type, bins, edges)"
+            " VALUES (1, 'MyHist', %s, %s)",
+            [cPickle.dumps(np.array([0.2, 0.8])), cPickle.dumps([1, 2, 3])])
+        hist.calculate([1, 2, 3, 3, 5], 1)
+        hist.store(self._db, 2, "MyHist")
+        
+        self.assertEqual(hist.migrate_encoding(self._db, batch_size=1), 1)
+        self.assertEqual(hist.migrate_encoding(self._db), 0)
+        rows = self._db.doQuery("SELECT bins, edges FROM histograms")
+        for (bins, edges) in rows:
+            self.assertTrue(is_packed_array(bins))
+            self.assertTrue(is_packed_array(edges))
+        hist_new = Histogram()
+        hist_new.load(self._db, 1, "MyHist")
+        self.assertEqual(hist_new._get("edges"), [1, 2, 3])
+        self.assertEqual(list(hist_new._get("bins")), [0.2, 0.8])
+    
+    def test_merge(self):
+        data_1 = [10, 70, 130, 130, 200]
+        data_2 = [65, 400, 3000]
+        hist_1 = Histogram()
+        hist_1.calculate(data_1, 60, minmax=(0, 3600))
+        hist_2 = Histogram()
+        hist_2.calculate(data_2, 60, minmax=(0, 3600))
+        self.assertEqual(hist_1._get("bin_offset"), 0)
+        self.assertEqual(list(hist_1._get("bin_counts")), [1, 1, 2, 1])
+        
+        merged = merge_histograms([hist_1, hist_2])
+        hist = Histogram()
+        hist.calculate(data_1 + data_2, 60, minmax=(0, 3600))
+        self.assertEqual(merged._get("edges"), list(hist._get("edges")))
+        for (v1, v2) in zip(merged._get("bins"), hist._get("bins")):
+            self.assertAlmostEqual(v1, v2)
+        
+        hist_2.calculate(data_2, 30, minmax=(0, 3600))
+        self.assertRaises(ValueError, merge_histograms, [hist_1, hist_2])
+        hist_2.calculate(data_2, 60, minmax=(0, 3600),
+                         input_bins=[0, 100, 4000])
+        self.assertFalse(hist_2.has_summary())
+        self.assertRaises(ValueError, merge_histograms, [hist_1, hist_2])
+    
+    def test_merge_stored_results(self):
+        hist = Histogram()
+        self.addCleanup(self._del_table, "histograms")
+        hist.create_table(self._db)
+        num = NumericStats()
+        self.addCleanup(self._del_table, "numericStats")
+        num.create_table(self._db)
+        
+        for (trace_id, data) in [(1, range(0, 50)), (2, range(50, 101))]:
+            hist.calculate(data, 1, minmax=(0, 100))
+            hist.store(self._db, trace_id, "jobs_runtime_cdf")
+            num.calculate(data)
+            num.store(self._db, trace_id, "jobs_runtime_stats")
+            num.store(self._db, trace_id, "lim_jobs_runtime_stats")
+        
+        results = merge_stored_results(self._db, [1, 2])
+        self.assertEqual(sorted(results.keys()),
+                         ["jobs_runtime_cdf", "jobs_runtime_stats"])
+        hist.calculate(range(0, 101), 1, minmax=(0, 100))
+        self.assertEqual(results["jobs_runtime_cdf"]._get("edges"),
+                         list(hist._get("edges")))
+        data = results["jobs_runtime_stats"].get_data()
+        self.assertEqual(data["count"], 101)
+        self.assertEqual(data["median"], 50)
+        self.assertEqual(data["p95"], 95)
+        
+        self._db.doUpdate("update numericStats set sketch=NULL")
+        self.assertEqual(merge_stored_results(self._db, [1, 2]), None)
+    
+    def test_upgrade_table(self):
+        self.addCleanup(self._del_table, "histograms")
+        self._db.doUpdate("""create table histograms (
+                    id INT NOT NULL AUTO_INCREMENT,
+                    trace_id INT(10) NOT NULL,
+                    type VARCHAR(128) NOT NULL,
+                    bins LONGBLOB,
+                    edges LONGBLOB,
+                    PRIMARY KEY(id, trace_id, type))""")
+        hist = Histogram()
+        hist.upgrade_table(self._db)
+        hist.upgrade_table(self._db)
+        columns = [x[0] for x in self._db.doQuery("show columns from "
+                                                  "histograms")]
+        self.assertEqual(columns, ["id", "trace_id", "type", "bins", "edges",
+                                   "bin_size", "bin_offset", "bin_counts"])
+
 class TestNumericStats(unittest.TestCase):
     def setUp(self):
-        self._db  = DB(os.getenv("TEST_DB_HOST", "127.0.0.1"),
-                       os.getenv("TEST_DB_NAME", "test"),
-                       os.getenv("TEST_DB_USER", "root"),
-                       os.getenv("TEST_DB_PASS", ""))
+        self._db  = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+                           os.getenv("TEST_DB_NAME", "test"),
+                           os.getenv("TEST_DB_USER", "root"),
+                           os.getenv("TEST_DB_PASS", ""))
     def _del_table(self, table_name):
         ok = self._db.doUpdate("drop table "+table_name+"")
         self.assertTrue(ok, "Table was not created!")
@@ -142,7 +261,44 @@ class TestNumericStats(unittest.TestCase):
         self.assertEqual(data["p50"], 50)
         self.assertEqual(data["p75"], 75)
         self.assertEqual(data["p95"], 95)
+        self.assertNotIn("sketch", data)
+        self.assertEqual(num._get("sum"), 5050)
+        self.assertEqual(num._get("sum_sq"), sum([x*x for x in range(0,101)]))
+    
+    def test_merge(self):
+        data_1 = [float(x) for x in range(0, 60)]
+        data_2 = [float(x*x) for x in range(0, 41)]
+        num_1 = NumericStats()
+        num_1.calculate(data_1)
+        num_2 = NumericStats()
+        num_2.calculate(data_2)
+        merged = merge_numeric_stats([num_1, num_2])
+        num = NumericStats()
+        num.calculate(data_1 + data_2)
+        for key in num.get_data().keys():
+            self.assertAlmostEqual(merged.get_data()[key],
+                                   num.get_data()[key])
         
+        num_1._set("sketch", None)
+        self.assertRaises(ValueError, merge_numeric_stats, [num_1, num_2])
+    
+    def test_merge_large(self):
+        data = np.random.RandomState(0).exponential(1000, 100000)
+        num_list = []
+        for chunk in np.array_split(data, 10):
+            num_chunk = NumericStats()
+            num_chunk.calculate(chunk)
+            num_list.append(num_chunk)
+        merged = merge_numeric_stats(num_list)
+        self.assertLessEqual(len(merged._get("sketch")), 2*201)
+        num = NumericStats()
+        num.calculate(data)
+        self.assertEqual(merged._get("count"), 100000)
+        self.assertAlmostEqual(merged._get("mean"), num._get("mean"))
+        self.assertAlmostEqual(merged._get("std"), num._get("std"), places=4)
+        for key in ["p05", "p25", "p50", "p75", "p95"]:
+            self.assertAlmostEqual(merged._get(key)/num._get(key), 1.0,
+                                   places=2)
     
     def test_save_load(self):
         num = NumericStats()
@@ -167,6 +323,185 @@ class TestNumericStats(unittest.TestCase):
         self.assertEqual(data["p75"], 75)
         self.assertEqual(data["p95"], 95)
 
+    def test_not_upgraded_table(self):
+        self.addCleanup(self._del_table, "numericStats")
+        self._db.doUpdate("""create table numericStats (
+                    id INT NOT NULL AUTO_INCREMENT,
+                    trace_id INT(10) NOT NULL,
+                    type VARCHAR(128) NOT NULL,
+                    min DOUBLE,
+                    max DOUBLE,
+                    mean DOUBLE,
+                    std DOUBLE,
+                    count int,
+                    median DOUBLE,
+                    p05 DOUBLE,
+                    p25 DOUBLE,
+                    p50 DOUBLE,
+                    p75 DOUBLE,
+                    p95 DOUBLE,
+                    PRIMARY KEY(id, trace_id, type))""")
+        num = NumericStats()
+        num.calculate(range(0, 101))
+        num.store(self._db, 1, "jobs_runtime_stats")
+        num.store(self._db, 2, "jobs_runtime_stats")
+        
+        new_num = NumericStats()
+        new_num.load(self._db, 1, "jobs_runtime_stats")
+        self.assertEqual(new_num.get_data(), num.get_data())
+        self.assertFalse(new_num.has_summary())
+        loaded = NumericStats().load_many(self._db, [1, 2],
+                                          ["jobs_runtime_stats"])
+        self.assertEqual(loaded[2]["jobs_runtime_stats"].get_data(),
+                         num.get_data())
+        
+        num.upgrade_table(self._db)
+        num.store(self._db, 3, "jobs_runtime_stats")
+        new_num = NumericStats()
+        new_num.load(self._db, 3, "jobs_runtime_stats")
+        self.assertTrue(new_num.has_summary())
+        missing = NumericStats()
+        missing._table_name = "missing_table"
+        self.assertRaises(SystemError, missing.load, self._db, 1,
+                          "jobs_runtime_stats")
+
+class TestLoadBulk(unittest.TestCase):
+    def setUp(self):
+        self._db  = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+                           os.getenv("TEST_DB_NAME", "test"),
+                           os.getenv("TEST_DB_USER", "root"),
+                           os.getenv("TEST_DB_PASS", ""))
+    def _del_table(self, table_name):
+        ok = self._db.doUpdate("drop table "+table_name+"")
+        self.assertTrue(ok, "Table was not created!")
+    
+    def test_load_many(self):
+        num = NumericStats()
+        self.addCleanup(self._del_table, "numericStats")
+        num.create_table(self._db)
+        num.calculate(range(0,101))
+        num.store(self._db, 1, "MyStats")
+        num.store(self._db, 2, "MyStats")
+        num.calculate(range(0,11))
+        num.store(self._db, 2, "OtherStats")
+        num.store(self._db, 3, "MyStats")
+        
+        results = NumericStats().load_many(self._db, [1, 2],
+                                           ["MyStats", "OtherStats"])
+        self.assertEqual(sorted(results.keys()), [1, 2])
+        self.assertEqual(results[1].keys(), ["MyStats"])
+        self.assertEqual(sorted(results[2].keys()), ["MyStats", "OtherStats"])
+        self.assertEqual(results[1]["MyStats"].get_data()["count"], 101)
+        self.assertEqual(results[2]["MyStats"].get_data()["count"], 101)
+        self.assertEqual(results[2]["OtherStats"].get_data()["count"], 11)
+        self.assertIsNot(results[1]["MyStats"], results[2]["MyStats"])
+        
+        self.assertEqual(NumericStats().load_many(self._db, [], ["MyStats"]),
+                         {})
+    
+    def test_load_results_bulk(self):
+        hist = Histogram()
+        self.addCleanup(self._del_table, "histograms")
+        hist.create_table(self._db)
+        num = NumericStats()
+        self.addCleanup(self._del_table, "numericStats")
+        num.create_table(self._db)
+        
+        hist.calculate([1, 2, 3, 3, 5], 1)
+        hist.store(self._db, 1, "jobs_runtime_cdf")
+        num.calculate(range(0,101))
+        num.store(self._db, 1, "jobs_runtime_stats")
+        num.store(self._db, 2, "jobs_runtime_stats")
+        
+        results = load_results_bulk(["jobs_runtime"], self._db, [1, 2])
+        self.assertEqual(
+            results[1]["jobs_runtime_cdf"]._get("edges"), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(
+            results[1]["jobs_runtime_stats"].get_data()["count"], 101)
+        self.assertEqual(
+            results[2]["jobs_runtime_stats"].get_data()["count"], 101)
+        self.assertEqual(results[2]["jobs_runtime_cdf"]._get("edges"), None)
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self._db  = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+                           os.getenv("TEST_DB_NAME", "test"),
+                           os.getenv("TEST_DB_USER", "root"),
+                           os.getenv("TEST_DB_PASS", ""))
+    def _del_table(self, table_name):
+        ok = self._db.doUpdate("drop table "+table_name+"")
+        self.assertTrue(ok, "Table was not created!")
+
+    def _enable_cache(self, max_entries):
+        old_max_entries = result_cache.get_max_entries()
+        result_cache.clear()
+        result_cache.reset_stats()
+        result_cache.set_max_entries(max_entries)
+        self.addCleanup(result_cache.clear)
+        self.addCleanup(result_cache.set_max_entries, old_max_entries)
+
+    def test_lru(self):
+        cache = ResultCache(max_entries=2)
+        cache.put("t", 1, "a", {"v": [1]})
+        cache.put("t", 1, "b", {"v": [2]})
+        self.assertEqual(cache.get("t", 1, "a"), {"v": [1]})
+        cache.put("t", 2, "a", {"v": [3]})
+        self.assertEqual(cache.get("t", 1, "b"), None)
+        self.assertEqual(cache.get("t", 1, "a"), {"v": [1]})
+        self.assertEqual(cache.get("t", 2, "a"), {"v": [3]})
+        cache.get("t", 1, "a")["v"].append(5)
+        self.assertEqual(cache.get("t", 1, "a"), {"v": [1]})
+        self.assertEqual(cache.get_stats(),
+                         dict(hits=5, misses=1, evictions=1, invalidations=0,
+                              entries=2, max_entries=2))
+
+        cache.set_max_entries(0)
+        cache.put("t", 1, "a", {"v": [1]})
+        self.assertEqual(cache.get_stats()["entries"], 0)
+
+    def test_invalidate(self):
+        cache = ResultCache(max_entries=10)
+        for trace_id in [1, 2]:
+            for result_type in ["lim_a", "lim_b", "a"]:
+                cache.put("t", trace_id, result_type, {})
+        cache.put("u", 1, "a", {})
+        cache.invalidate("t", 1, "lim_%")
+        self.assertEqual(cache.get("t", 1, "lim_a"), None)
+        self.assertEqual(cache.get("t", 1, "lim_b"), None)
+        self.assertEqual(cache.get("t", 1, "a"), {})
+        self.assertEqual(cache.get("t", 2, "lim_a"), {})
+        cache.invalidate("t", 2)
+        self.assertEqual(cache.get("t", 2, "a"), None)
+        self.assertEqual(cache.get("u", 1, "a"), {})
+        self.assertEqual(cache.get_stats()["invalidations"], 5)
+
+    def test_load_cached(self):
+        self._enable_cache(10)
+        num = NumericStats()
+        self.addCleanup(self._del_table, "numericStats")
+        num.create_table(self._db)
+        num.calculate(range(0,101))
+        num.store(self._db, 1, "MyStats")
+        num.store(self._db, 2, "MyStats")
+
+        new_num = NumericStats()
+        new_num.load(self._db, 1, "MyStats")
+        self._db.doUpdate("delete from numericStats")
+        cached_num = NumericStats()
+        cached_num.load(self._db, 1, "MyStats")
+        self.assertEqual(cached_num.get_data()["count"], 101)
+        self.assertEqual(result_cache.get_stats()["hits"], 1)
+
+        results = NumericStats().load_many(self._db, [1, 2], ["MyStats"])
+        self.assertEqual(results.keys(), [1])
+        self.assertEqual(results[1]["MyStats"].get_data()["count"], 101)
+
+        num.calculate(range(0,11))
+        num.store(self._db, 1, "MyStats")
+        reloaded_num = NumericStats()
+        reloaded_num.load(self._db, 1, "MyStats")
+        self.assertEqual(reloaded_num.get_data()["count"], 11)
+
 def assertEqualResult(test_obj, r_old, r_new, field):        
     d_old = r_old.get_data()
     d_new = r_new.get_data()
@@ -179,10 +514,10 @@ def assertEqualResult(test_obj, r_old, r_new, field):
         
 class TestNumericList(unittest.TestCase):
     def setUp(self):
-        self._db  = DB(os.getenv("TEST_DB_HOST", "127.0.0.1"),
-                       os.getenv("TEST_DB_NAME", "test"),
-                       os.getenv("TEST_DB_USER", "root"),
-                       os.getenv("TEST_DB_PASS", ""))
+        self._db  = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+                           os.getenv("TEST_DB_NAME", "test"),
+                           os.getenv("TEST_DB_USER", "root"),
+                           os.getenv("TEST_DB_PASS", ""))
     def _del_table(self, table_name):
         ok = self._db.doUpdate("drop table "+table_name+"")
         self.assertTrue(ok, "Table was not created!")
@@ -10,17 +10,19 @@
  
 """
 
-from commonLib.DBManager import DB
+from commonLib.DBManager import DB, get_db
+from commonLib.filemanager import ensureDir
 from stats.trace import ResultTrace
 from stats import Histogram, NumericStats
 
+import gzip
 import numpy as np
 import os
 import unittest
 
 class TestResultTrace(unittest.TestCase):
     def setUp(self):
-        self._db  = DB(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+        self._db  = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
                    os.getenv("TEST_DB_NAME", "test"),
                    os.getenv("TEST_DB_USER", "root"),
                    os.getenv("TEST_DB_PASS", ""))
@@ -177,7 +179,12 @@ class TestResultTrace(unittest.TestCase):
         
         rt = ResultTrace()
         rt.import_from_db(self._db, "import_table")     
-        print  rt._lists_submit   
+        print  rt._lists_submit
+        self.assertEqual(self._db.getValuesAsColumns("import_table",
+                                                     ["job_db_inx"],
+                                                     orderBy="job_db_inx"),
+                         {"job_db_inx": [1, 3]})
+        self.assertEqual(rt._clean_db_duplicates(self._db, "import_table"), 0)   
         compare_data= {
              "job_db_inx":[1,3],
              "account": ["account1", "account2"],
@@ -321,6 +328,149 @@ class TestResultTrace(unittest.TestCase):
         self.assertEqual(rt._lists_start, new_rt._lists_start)
         self.assertEqual(rt._lists_submit, new_rt._lists_submit)
         
+    def test_store_load_trace_archive(self):
+        self._create_tables()
+        rt = ResultTrace(archive_table_name="trace_archive")
+        self.addCleanup(self._del_table, "trace_archive")
+        rt.create_trace_archive_table(self._db)
+        rt._lists_submit = {
+             "job_db_inx":[1,2,3],
+             "account": ["account1", None, "account3"],
+             "cpus_req": [48, 96, 24],
+             "cpus_alloc": [48, 96, 24],
+             "job_name":["jobName1", "jobName2", "job\tName3"],
+             "id_job": [1,2,3],
+             "id_qos": [2,3,4],
+             "id_resv": [3,4,5],
+             "id_user": [4,5,6],
+             "nodes_alloc": [2,4,1],
+             "partition": ["partition1", "partition2", ""],
+             "priority": [99, 199, 299],
+             "state": [3,2,3],
+             "timelimit": [100,200,300],
+             "time_submit": [3000,3003,3003],
+             "time_start": [3002,3001,3001],
+             "time_end": [3002,3005,3005]
+             }
+        lists_start = dict([(field, [values[1], values[2], values[0]])
+                            for (field, values) in rt._lists_submit.items()])
+        for chunk_size in [1, 2, 10]:
+            self.assertTrue(rt.store_trace_archive(self._db, 1,
+                                                   chunk_size=chunk_size))
+            self.assertEqual(self._db.countValues("trace_archive"),
+                             (3 + chunk_size - 1) // chunk_size)
+            new_rt = ResultTrace(archive_table_name="trace_archive")
+            new_rt.load_trace(self._db, 1)
+            self.assertEqual(new_rt._lists_submit, rt._lists_submit)
+            self.assertEqual(new_rt._lists_start, lists_start)
+        self.assertEqual(self._db.countValues("traces"), 0)
+        self.assertIsNone(rt.load_trace_archive(self._db, 2))
+
+        row_rt = ResultTrace(archive_table_name="")
+        row_rt._lists_submit = rt._lists_submit
+        row_rt.store_trace(self._db, 2)
+        new_rt = ResultTrace(archive_table_name="trace_archive")
+        new_rt.load_trace(self._db, 2)
+        self.assertEqual(new_rt._lists_submit, rt._lists_submit)
+        self.assertEqual(new_rt.archive_trace(self._db, 2, delete_rows=True),
+                         3)
+        self.assertEqual(self._db.countValues("traces"), 0)
+        new_rt.load_trace(self._db, 2)
+        self.assertEqual(new_rt._lists_submit, rt._lists_submit)
+        self.assertEqual(new_rt._lists_start["id_job"], [2, 3, 1])
+
+        self.assertEqual(new_rt.update_time_starts(self._db, 2,
+                                                   {1: 3004, 3: 3000, 9: 1}), 2)
+        new_rt.load_trace(self._db, 2)
+        self.assertEqual(new_rt._lists_submit["time_start"], [3004, 3001, 3000])
+        self.assertEqual(new_rt._lists_start["id_job"], [3, 2, 1])
+
+        row_rt.store_trace(self._db, 1)
+        self.assertEqual(row_rt.update_time_starts(self._db, 1,
+                                                   {1: 3004, 9: 1}), 1)
+        row_rt.load_trace(self._db, 1)
+        self.assertEqual(row_rt._lists_submit["time_start"], [3004, 3001, 3001])
+        self.assertEqual(row_rt.update_time_starts(self._db, 1, {}), 0)
+
+        new_rt.delete_trace(self._db, 2)
+        self.assertEqual(self._db.countValues("trace_archive"), 1)
+
+    def test_import_from_export(self):
+        ensureDir("./tmp")
+        export_route = "tmp/import_table.export.tsv.gz"
+        self.addCleanup(os.remove, export_route)
+        export_file = gzip.open(export_route, "wb")
+        export_file.write(
+            "1\taccount1\t48\t48\tjobName1\t1\t2\t3\t4\t2\tpartition1\t"
+            "99\t3\t100\t3000\t3002\t3002\n"
+            "2\tNULL\t96\t96\tjob\\tName\\\\2\t2\t3\t4\t5\t4\t\t"
+            "199\t2\t200\t3003\t3001\t3005\n"
+            "3\taccount3\t24\t24\tjobName3\t3\t4\t5\t6\t1\tpartition3\t"
+            "299\t3\t300\t3003\t3001\t3005\n")
+        export_file.close()
+        rt = ResultTrace()
+        rt.import_from_export(export_route)
+        self.assertEqual(rt._lists_submit["job_db_inx"], [1, 2, 3])
+        self.assertEqual(rt._lists_submit["account"],
+                         ["account1", None, "account3"])
+        self.assertEqual(rt._lists_submit["job_name"],
+                         ["jobName1", "job\tName\\2", "jobName3"])
+        self.assertEqual(rt._lists_submit["partition"],
+                         ["partition1", "", "partition3"])
+        self.assertEqual(rt._lists_submit["time_end"], [3002, 3005, 3005])
+        self.assertEqual(rt._lists_start["id_job"], [2, 3, 1])
+        self.assertEqual(rt._lists_start["time_start"], [3001, 3001, 3002])
+
+        export_file = gzip.open(export_route, "wb")
+        export_file.close()
+        rt.import_from_export(export_route)
+        self.assertEqual(rt._lists_submit["id_job"], [])
+        self.assertEqual(rt._lists_start["time_start"], [])
+
+        export_file = gzip.open(export_route, "wb")
+        export_file.write("1\taccount1\n")
+        export_file.close()
+        self.assertRaises(ValueError, rt.import_from_export, export_route)
+
+    def test_get_export_command(self):
+        rt = ResultTrace()
+        db_obj = DB("192.168.56.24", "slurm_acct_db", None, "pa\\ss\"word",
+                    port="3307")
+        self.assertEqual(rt.get_export_defaults(db_obj, host="localhost"),
+                         "[mysql]\n"
+                         "host=\"localhost\"\n"
+                         "port=\"3307\"\n"
+                         "password=\"pa\\\\ss\"word\"\n"
+                         "database=\"slurm_acct_db\"\n")
+        self.assertIn("user=\"slurm\"",
+                      rt.get_export_defaults(DB("host", "db", "slurm", None)))
+        command = rt.get_export_command("import_table", "/tmp/exp.tsv.gz",
+                                        "/tmp/exp.cnf")
+        self.assertNotIn("pa\\ss", command)
+        self.assertIn("--defaults-extra-file=/tmp/exp.cnf", command)
+        self.assertIn("rm -f /tmp/exp.tsv.gz.part /tmp/exp.cnf", command)
+
+    def test_get_export_query(self):
+        self._create_tables()
+        for (job_db_inx, id_job, time_submit) in [(1, 1, 3000), (2, 2, 2000),
+                                                  (3, 1, 3001)]:
+            self._db.doUpdate(
+            """insert into  import_table
+              (`job_db_inx`, `account`, `cpus_req`, `cpus_alloc`,
+               `job_name`, `id_job`, `id_qos`, `id_resv`, `id_user`,
+               `nodes_alloc`, `partition`, `priority`, `state`, `timelimit`,
+               `time_submit`, `time_start`, `time_end`) VALUES (
+               {0}, "account1", 48, 48,
+               "jobName1", {1}, 2, 3, 4,
+               2, "partition1", 99, 3, 100,
+               {2}, 3002, 3002
+               )""".format(job_db_inx, id_job, time_submit))
+        rt = ResultTrace()
+        rows = self._db.doQuery(rt.get_export_query("import_table"))
+        self.assertEqual([(int(x[0]), int(x[5])) for x in rows],
+                         [(2, 2), (3, 1)])
+        self.assertEqual(self._db.countValues("import_table"), 3)
+
     def test_multi_load_trace(self):
         self._create_tables()
         rt = ResultTrace()
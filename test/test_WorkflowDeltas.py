@@ -8,7 +8,7 @@
 import os
 import unittest
 
-from commonLib.DBManager import DB
+from commonLib.DBManager import get_db
 from stats.compare import WorkflowDeltas
 from stats import Histogram, NumericStats
 from stats.trace import ResultTrace
@@ -16,7 +16,7 @@ from test_Result import assertEqualResult
 
 class TestWorkflowDeltas(unittest.TestCase):
     def setUp(self):
-        self._db  = DB(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+        self._db  = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
                    os.getenv("TEST_DB_NAME", "test"),
                    os.getenv("TEST_DB_USER", "root"),
                    os.getenv("TEST_DB_PASS", ""))
@@ -4,7 +4,7 @@
  已测试成功
  
 """
-from commonLib.DBManager import DB
+from commonLib.DBManager import get_db
 from stats.workflow import TaskTracker, WorkflowTracker, WorkflowsExtractor,\
     WasteExtractor, _fuse_delta_lists
 from stats import Histogram, NumericStats
@@ -17,7 +17,7 @@ import unittest
 class TestWorkflowsExtractor(unittest.TestCase):
     
     def setUp(self):
-        self._db  = DB(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+        self._db  = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
                    os.getenv("TEST_DB_NAME", "test"),
                    os.getenv("TEST_DB_USER", "root"),
                    os.getenv("TEST_DB_PASS", ""))
@@ -0,0 +1,88 @@
+"""UNIT TESTS for the reusable background workload and the workflow overlay.
+
+ python -m unittest test_background
+
+"""
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from commonLib.filemanager import ensureDir
+from orchestration.definition import ExperimentDefinition
+from orchestration.running import ExperimentRunner
+from orchestration.trace_cache import TraceCache
+
+
+class TestWorkflowOverlay(unittest.TestCase):
+    def setUp(self):
+        ensureDir("./tmp")
+        self._cache_dir = tempfile.mkdtemp(prefix="trace_cache", dir="./tmp")
+        self.addCleanup(shutil.rmtree, self._cache_dir, True)
+        ExperimentRunner.configure("tmp/trace_folder", "tmp", True,
+                                   "myhost", "myUser", drain_time=0)
+        self._cache = TraceCache(self._cache_dir, 100*1024*1024)
+
+    def _get_definition(self, **kwargs):
+        values = dict(seed="seeeed",
+                      machine="edison",
+                      trace_type="single",
+                      manifest_list=[{"share": 1.0,
+                                      "manifest": "manifestSim.json"}],
+                      workflow_policy="period",
+                      workflow_period_s=5,
+                      workflow_handling="single",
+                      preload_time_s=20,
+                      start_date=datetime(2016, 1, 1),
+                      workload_duration_s=400)
+        values.update(kwargs)
+        return ExperimentDefinition(**values)
+
+    def _read_files(self, file_names):
+        contents = []
+        for file_name in file_names:
+            route = os.path.join("tmp", file_name)
+            contents.append(open(route, "rb").read())
+            os.remove(route)
+        return contents
+
+    def _check_overlay(self, definition):
+        er = ExperimentRunner(definition)
+        expected = self._read_files(er._create_trace_files(definition))
+        file_names = er._overlay_trace_files(definition, self._cache)
+        self.assertEqual(file_names, [definition.get_trace_file_name(),
+                                      definition.get_qos_file_name(),
+                                      definition.get_users_file_name()])
+        contents = self._read_files(file_names)
+        for (content, expected_content) in zip(contents, expected):
+            self.assertEqual(content, expected_content)
+
+    def test_overlay(self):
+        self._check_overlay(self._get_definition())
+        self.assertEqual((self._cache.hits, self._cache.misses), (0, 1))
+        self._check_overlay(self._get_definition(workflow_period_s=60,
+                                                 workflow_handling="multi"))
+        self._check_overlay(self._get_definition(workflow_policy="no"))
+        self.assertEqual((self._cache.hits, self._cache.misses), (2, 1))
+
+    def test_overlay_initial_wait(self):
+        self._check_overlay(self._get_definition(overload_target=100000.0))
+        self.assertEqual(self._cache.misses, 1)
+
+    def test_overlay_not_possible(self):
+        ed = self._get_definition(workflow_policy="percentage",
+                                  workflow_share=10.0)
+        self.assertEqual(ExperimentRunner(ed)._overlay_trace_files(
+                                                    ed, self._cache), None)
+        ed = self._get_definition(manifest_list=[
+                                    {"share": 0.5,
+                                     "manifest": "manifestSim.json"},
+                                    {"share": 0.5,
+                                     "manifest": "manifestSim.json"}])
+        self.assertEqual(ExperimentRunner(ed)._overlay_trace_files(
+                                                    ed, self._cache), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,7 @@
  
 
 """
-from commonLib.DBManager import DB
+from commonLib.DBManager import get_db
 from orchestration.definition import (ExperimentDefinition,
                                         GroupExperimentDefinition,
                                         DeltaExperimentDefinition)
@@ -18,7 +18,7 @@ import unittest
 
 class TestExperimentDefinition(unittest.TestCase):
     def setUp(self):
-        self._db  = DB(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+        self._db  = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
                    os.getenv("TEST_DB_NAME", "test"),
                    os.getenv("TEST_DB_USER", "root"),
                    os.getenv("TEST_DB_PASS", ""))
@@ -229,6 +229,42 @@ class TestExperimentDefinition(unittest.TestCase):
         ed_f_2.load_fresh(self._db)
         self.assertEqual(ed_f_2._trace_id, 2)
 
+    def test_claim(self):
+        """测试claim原子地认领实验：只认领处于给定状态的实验，记录owner，
+        没有可认领的实验时返回False。"""
+        ed = ExperimentDefinition()
+        self.addCleanup(self._del_table, "experiment")
+        ed.create_table(self._db)
+        ed.store(self._db)
+        ed.store(self._db)
+        ed.store(self._db)
+
+        ed_2 = ExperimentDefinition()
+        self.assertTrue(ed_2.claim(self._db, "fresh", "pre_simulating",
+                                   trace_id=2))
+        self.assertEqual(ed_2._trace_id, 2)
+        self.assertEqual(ed_2._work_state, "pre_simulating")
+        self.assertNotEqual(ed_2._owner, "")
+        self.assertFalse(ExperimentDefinition().claim(self._db, "fresh",
+                                                      "pre_simulating",
+                                                      trace_id=2))
+
+        ed_c = ExperimentDefinition()
+        self.assertTrue(ed_c.claim(self._db, "fresh", "pre_simulating"))
+        self.assertEqual(ed_c._trace_id, 1)
+        ed_c = ExperimentDefinition()
+        self.assertTrue(ed_c.claim(self._db, "fresh", "pre_simulating"))
+        self.assertEqual(ed_c._trace_id, 3)
+        self.assertFalse(ExperimentDefinition().claim(self._db, "fresh",
+                                                      "pre_simulating"))
+        self.assertFalse(ExperimentDefinition().load_fresh(self._db))
+
+        rows = self._db.getValuesAsColumns("experiment",
+                                           ["work_state", "owner"],
+                                           condition="trace_id=2")
+        self.assertEqual(rows["work_state"], ["pre_simulating"])
+        self.assertEqual(rows["owner"], [ed_2._owner])
+
     # 测试获取新鲜的待处理实验定义功能
     def test_get_fresh_pending(self):
         # 添加清理操作，测试结束后删除"experiment"表
@@ -278,6 +314,31 @@ class TestExperimentDefinition(unittest.TestCase):
         self.assertEqual(one_g._trace_id, ed_g1._trace_id)
 
 
+    def test_load_next_state_subtraces_str(self):
+        # subtraces_state为单个状态时按状态比较，而不是子字符串
+        self.addCleanup(self._del_table, "experiment")
+        ExperimentDefinition().create_table(self._db)
+        ed_1 = ExperimentDefinition()
+        trace_id_1 = ed_1.store(self._db)
+        ed_1.upate_state(self._db, "simulating")
+        ed_g = GroupExperimentDefinition()
+        ed_g.add_sub_trace(trace_id_1)
+        ed_g.store(self._db)
+
+        one_g = GroupExperimentDefinition()
+        self.assertTrue(one_g.load_next_state(self._db, "pending",
+                                              "pre_analyzing",
+                                              check_pending=True,
+                                              subtraces_state="pre_simulating"))
+        self.assertEqual(one_g._work_state, "pending")
+
+        ed_1.upate_state(self._db, "pre_simulating")
+        self.assertTrue(one_g.load_next_state(self._db, "pending",
+                                              "pre_analyzing",
+                                              check_pending=True,
+                                              subtraces_state="pre_simulating"))
+        self.assertEqual(one_g._work_state, "pre_analyzing")
+
     def test_is_it_ready_to_process(self):
         ed = ExperimentDefinition()
         self.addCleanup(self._del_table, "experiment")
@@ -0,0 +1,142 @@
+"""UNIT TESTS for the central experiment dispatcher.
+
+ python -m unittest test_dispatching
+
+"""
+from commonLib.DBManager import get_db
+from commonLib.filemanager import ensureDir
+from orchestration.definition import ExperimentDefinition
+from orchestration.dispatching import ExperimentDispatcher
+
+import os
+import time
+import unittest
+
+
+def _get_test_db():
+    return get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+                  os.getenv("TEST_DB_NAME", "test"),
+                  os.getenv("TEST_DB_USER", "root"),
+                  os.getenv("TEST_DB_PASS", ""))
+
+
+def _fake_run(hostname, trace_id, runner_conf, db_factory, sched_db_factory,
+              log_folder, result):
+    """Marks the experiment as simulated. Experiments listed in runner_conf
+    "crash" raise, experiments run on runner_conf "hang" hosts never end and
+    write their trace_id to runner_conf "closed_file" when terminated."""
+    if trace_id in runner_conf.get("crash", []):
+        raise Exception("Simulation crashed")
+    if hostname in runner_conf.get("hang", []):
+        try:
+            time.sleep(60)
+        finally:
+            # A terminated child runs its finally blocks (e.g., ssh close)
+            open(runner_conf["closed_file"], "a").write(
+                                                    "{0}\n".format(trace_id))
+    db_obj = db_factory()
+    ed = ExperimentDefinition()
+    ed.load(db_obj, trace_id)
+    ed.update_worker(db_obj, hostname)
+    ed.mark_simulation_done(db_obj)
+    result.value = 1
+
+
+class TestExperimentDispatcher(unittest.TestCase):
+    def setUp(self):
+        self._db = _get_test_db()
+        ExperimentDefinition().create_table(self._db)
+        self.addCleanup(self._del_table, "experiment")
+        self._trace_ids = []
+        for i in range(3):
+            exp = ExperimentDefinition()
+            exp.store(self._db)
+            self._trace_ids.append(exp._trace_id)
+        self._checks = {}
+
+    def _del_table(self, table_name):
+        self._db.doUpdate("drop table `{0}`".format(table_name))
+
+    def _get_dispatcher(self, runner_conf, down_after=None, **kwargs):
+        """down_after: {hostname: number of successful checks before the
+        host stops answering}."""
+        down_after = down_after or {}
+
+        def check_host(hostname):
+            self._checks[hostname] = self._checks.get(hostname, 0) + 1
+            return (hostname not in down_after or
+                    self._checks[hostname] <= down_after[hostname])
+        return ExperimentDispatcher(["host1", "host2"],
+                                    runner_conf=runner_conf,
+                                    db_factory=_get_test_db,
+                                    check_host=check_host,
+                                    run_target=_fake_run,
+                                    poll_interval=0.05, health_interval=0,
+                                    **kwargs)
+
+    def _get_state(self, trace_id):
+        ed = ExperimentDefinition()
+        ed.load(self._db, trace_id)
+        return ed._work_state, ed._worker
+
+    def test_run(self):
+        ensureDir("./tmp")
+        status_file = "tmp/dispatcher.status"
+        self.addCleanup(os.remove, status_file)
+        dispatcher = self._get_dispatcher({}, status_file=status_file)
+        self.assertEqual(dispatcher.run(), 3)
+        workers = set()
+        for trace_id in self._trace_ids:
+            (state, worker) = self._get_state(trace_id)
+            self.assertEqual(state, "simulation_done")
+            workers.add(worker)
+        self.assertEqual(workers, set(["host1", "host2"]))
+        status = dispatcher.get_status()
+        self.assertEqual([x["state"] for x in status], ["idle", "idle"])
+        self.assertEqual(sum([x["done"] for x in status]), 3)
+        content = open(status_file).read()
+        self.assertIn("0 queued, 0 running, 0 dead", content)
+        self.assertIn("host2", content)
+
+    def test_dead_worker(self):
+        ensureDir("./tmp")
+        closed_file = "tmp/dispatcher.closed"
+        self.addCleanup(os.remove, closed_file)
+        dispatcher = self._get_dispatcher({"hang": ["host1"],
+                                           "closed_file": closed_file},
+                                          down_after={"host1": 2},
+                                          max_failures=2)
+        self.assertEqual(dispatcher.run(), 3)
+        self.assertEqual(len(open(closed_file).readlines()), 1)
+        for trace_id in self._trace_ids:
+            self.assertEqual(self._get_state(trace_id),
+                             ("simulation_done", "host2"))
+        status = dispatcher.get_status()
+        self.assertEqual(status[0]["state"], "dead")
+        self.assertEqual(status[0]["done"], 0)
+        self.assertEqual(status[1]["done"], 3)
+        self.assertIn("1 dead", dispatcher.format_status())
+
+    def test_crash(self):
+        crashing = self._trace_ids[0]
+        dispatcher = self._get_dispatcher({"crash": [crashing]},
+                                          max_attempts=2)
+        self.assertEqual(dispatcher.run(), 2)
+        self.assertEqual(self._get_state(crashing)[0], "simulation_failed")
+        self.assertEqual(dispatcher._attempts[crashing], 2)
+        self.assertEqual(sum([x["failed"] for x in dispatcher.get_status()]),
+                         1)
+        for trace_id in self._trace_ids[1:]:
+            self.assertEqual(self._get_state(trace_id)[0], "simulation_done")
+
+    def test_claimed_elsewhere(self):
+        ExperimentDefinition().claim(self._db, "fresh", "pre_simulating",
+                                     trace_id=self._trace_ids[1])
+        dispatcher = self._get_dispatcher({})
+        self.assertEqual(dispatcher.run(), 2)
+        self.assertEqual(self._get_state(self._trace_ids[1])[0],
+                         "pre_simulating")
+
+
+if __name__ == '__main__':
+    unittest.main()
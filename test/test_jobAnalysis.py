@@ -41,6 +41,56 @@ class TestJobAnalysis(unittest.TestCase):
         self.assertEqual(edges, 
                          [0,1,2,3,4,5,6,7])
         
+    def test_calculate_histogram_sparse(self):
+        values = [1, 2, 2, 3, 5]
+        bins, edges = calculate_histogram(values, th_min=0,
+                                          th_acc=1,
+                                          range_values=(0,6),
+                                          interval_size=1,
+                                          binning="sparse")
+        self.assertEqual(list(bins),
+                         [0,0.2,0.4,0.2,0,0.2,0.0])
+        self.assertEqual(edges,
+                         [0,1,2,3,4,5,6,7])
+
+        values = [0.5, 0.5, 10000.2, 3.0, 0.29, 0.07]
+        for (interval_size, th_min, th_acc) in [(1, 0, 0), (0.01, 0, 1),
+                                                (60, 0.2, 0.5)]:
+            bins, edges = calculate_histogram(values, th_min=th_min,
+                                              th_acc=th_acc,
+                                              interval_size=interval_size,
+                                              binning="sparse")
+            ref_bins, ref_edges = calculate_histogram(
+                                              values, th_min=th_min,
+                                              th_acc=th_acc,
+                                              interval_size=interval_size)
+            self.assertEqual(list(bins), list(ref_bins))
+            self.assertEqual(list(edges), list(ref_edges))
+            self.assertLessEqual(len(edges), 12)
+
+    def test_calculate_histogram_log(self):
+        values = [0, 1, 10, 100, 1000, 1000]
+        bins, edges = calculate_histogram(values, range_values=(0, 999),
+                                          binning="log", bin_count=3)
+        self.assertAlmostEqual(sum(bins), 1.0)
+        self.assertEqual(len(edges), 5)
+        self.assertEqual(edges[0], 0)
+        self.assertAlmostEqual(edges[1], 1.0)
+        self.assertAlmostEqual(edges[2], 10.0)
+        self.assertAlmostEqual(edges[3], 100.0)
+        self.assertAlmostEqual(edges[4], 1000.0)
+        self.assertEqual(list(bins), [1.0/6, 1.0/6, 1.0/6, 0.5])
+
+    def test_calculate_histogram_quantile(self):
+        values = range(100) + [1000]*100
+        bins, edges = calculate_histogram(values, binning="quantile",
+                                          bin_count=4)
+        self.assertAlmostEqual(sum(bins), 1.0)
+        self.assertEqual(list(edges), [0, 49.75, 549.5, 1000])
+        self.assertEqual(list(bins), [0.25, 0.25, 0.5])
+        with self.assertRaises(ValueError):
+            calculate_histogram(values, binning="unknown")
+
     def test_join_var_bins(self):
         hist = [0.01, 0.01, 0.2, 0.3, 0.07, 0.09]
         bin_edges = [0, 1, 2, 3, 4, 5, 6]
@@ -85,7 +135,20 @@ class TestJobAnalysis(unittest.TestCase):
                          "they are at the end of the list of bins")
         self.assertEqual(list(composed_edges),
                          [0, 1, 3, 4, 6])
-        
+
+        # Small bins overflowing th_acc
+        hist = [0.04, 0.04, 0.04, 0.5, 0.04, 0.04, 0.3]
+        bin_edges = [0, 1, 2, 3, 4, 5, 6, 7]
+        composed_hist, composed_edges = _join_var_bins(
+                            hist,
+                            bin_edges,
+                            th_min=0.1,
+                            th_acc=0.1)
+        self.assertEqual(list(composed_hist),
+                         [0.08, 0.04, 0.5, 0.08, 0.3])
+        self.assertEqual(list(composed_edges),
+                         [0, 2, 3, 4, 6, 7])
+
     def test_calculate_probability_map(self):
         hist = [0.01, 0, 0, 0.3, 0, 0.69]
         bin_edges = [0, 1, 2, 3, 4, 5, 6]
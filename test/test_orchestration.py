@@ -7,14 +7,15 @@
 
 import datetime
 import os
+import time
 import unittest
 
-from commonLib.DBManager import DB
+from commonLib.DBManager import get_db
 from commonLib.nerscUtilization import UtilizationEngine
 from orchestration import AnalysisWorker
 from orchestration import ExperimentWorker
 from orchestration import get_central_db, get_sim_db
-from orchestration.analyzing import AnalysisRunnerSingle
+from orchestration.analyzing import AnalysisRunnerSingle, AnalysisGroupRunner
 from orchestration.definition import (ExperimentDefinition,
                                       DeltaExperimentDefinition,
                                       GroupExperimentDefinition)
@@ -28,10 +29,10 @@ from stats.trace import ResultTrace
 class TestOrchestration(unittest.TestCase):
     def setUp(self):  # 每个测试方法执行前都会执行这个进行初始化，self参数是这个类实例化的第一个对象
         # 初始化数据库连接，使用环境变量来配置数据库的主机、名称、用户和密码
-        self._db = DB(os.getenv("TEST_DB_HOST", "127.0.0.1"),
-                      os.getenv("TEST_DB_NAME", "test"),
-                      os.getenv("TEST_DB_USER", "root"),
-                      os.getenv("TEST_DB_PASS", ""))
+        self._db = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+                          os.getenv("TEST_DB_NAME", "test"),
+                          os.getenv("TEST_DB_USER", "root"),
+                          os.getenv("TEST_DB_PASS", ""))
         # 初始化虚拟机IP地址，使用环境变量配置，默认为192.168.56.24
         self._vm_ip = os.getenv("TEST_VM_HOST", "192.168.56.24")
 
@@ -383,6 +384,239 @@ class TestOrchestration(unittest.TestCase):
         self._check_results_are_there(self._db, exp3, wf=True,
                                       manifest_list=["manifestsim.json"])
 
+    def _store_simulated_exps(self, count):
+        """存储count个处于simulation_done状态的单个实验。"""
+        for i in range(count):
+            exp = ExperimentDefinition()
+            exp.store(self._db)
+            exp.upate_state(self._db, "simulation_done")
+
+    def _get_exp_states(self):
+        rows = self._db.getValuesAsColumns(ExperimentDefinition()._table_name,
+                                           ["work_state"], orderBy="trace_id")
+        return rows["work_state"]
+
+    def _patch_full_analysis(self, analysis):
+        original = AnalysisRunnerSingle.do_full_analysis
+        AnalysisRunnerSingle.do_full_analysis = analysis
+        self.addCleanup(setattr, AnalysisRunnerSingle, "do_full_analysis",
+                        original)
+
+    def test_analysis_pool(self):
+        """do_work_pool的进程认领并分析所有待分析的实验。"""
+        self._store_simulated_exps(6)
+
+        def mark_done(runner, db_obj):
+            runner._definition.mark_analysis_done(db_obj)
+        self._patch_full_analysis(mark_done)
+
+        ew = AnalysisWorker()
+        analyzed = ew.do_work_pool("single", processes=3,
+                                   db_factory=lambda: self._db)
+        self.assertEqual(analyzed, 6)
+        self.assertEqual(self._get_exp_states(), ["analysis_done"] * 6)
+        self.assertEqual(ew.do_work_pool("single", processes=2,
+                                         db_factory=lambda: self._db), 0)
+
+    def test_analysis_pool_crash(self):
+        """子进程崩溃时，它认领的实验被恢复到simulation_done状态。"""
+        self._store_simulated_exps(2)
+
+        def crash(runner, db_obj):
+            raise ValueError("Analysis crashed")
+        self._patch_full_analysis(crash)
+
+        ew = AnalysisWorker()
+        analyzed = ew.do_work_pool("single", processes=2,
+                                   db_factory=lambda: self._db)
+        self.assertEqual(analyzed, 0)
+        self.assertEqual(self._get_exp_states(), ["simulation_done"] * 2)
+        self.assertRaises(ValueError, ew.do_work_pool, "unknown")
+
+    def test_dependencies(self):
+        """do_work_dependencies只分析子轨迹已就绪的分组实验。"""
+        self._store_simulated_exps(3)
+        exp = ExperimentDefinition()
+        exp.load(self._db, 1)
+        exp.upate_state(self._db, "analysis_done")
+        ready = GroupExperimentDefinition(subtraces=[1])
+        ready.store(self._db)
+        waiting = GroupExperimentDefinition(subtraces=[1, 2])
+        waiting.store(self._db)
+
+        def mark_done(runner, db_obj):
+            runner._definition.mark_analysis_done(db_obj)
+        original = AnalysisGroupRunner.do_full_analysis
+        AnalysisGroupRunner.do_full_analysis = mark_done
+        self.addCleanup(setattr, AnalysisGroupRunner, "do_full_analysis",
+                        original)
+
+        ew = AnalysisWorker()
+        self.assertEqual(ew.do_work_dependencies(self._db, wait=False), 1)
+        self.assertEqual(self._get_exp_states()[3:],
+                         ["analysis_done", "pending"])
+        exp.load(self._db, 2)
+        exp.upate_state(self._db, "analysis_done")
+        self.assertEqual(ew.do_work_dependencies(self._db, wait=False), 1)
+        self.assertEqual(self._get_exp_states()[3:],
+                         ["analysis_done", "analysis_done"])
+
+    def test_dependencies_blocked(self):
+        """wait=True时，剩余的实验都有失败的子轨迹时do_work_dependencies
+        返回。"""
+        self._store_simulated_exps(2)
+        exp = ExperimentDefinition()
+        exp.load(self._db, 1)
+        exp.upate_state(self._db, "analysis_done")
+        exp.load(self._db, 2)
+        exp.upate_state(self._db, "simulation_failed")
+        GroupExperimentDefinition(subtraces=[1]).store(self._db)
+        GroupExperimentDefinition(subtraces=[1, 2]).store(self._db)
+
+        def mark_done(runner, db_obj):
+            runner._definition.mark_analysis_done(db_obj)
+        original = AnalysisGroupRunner.do_full_analysis
+        AnalysisGroupRunner.do_full_analysis = mark_done
+        self.addCleanup(setattr, AnalysisGroupRunner, "do_full_analysis",
+                        original)
+
+        ew = AnalysisWorker()
+        self.assertEqual(ew.do_work_dependencies(self._db, poll_time=0,
+                                                 wait=True), 1)
+        self.assertEqual(self._get_exp_states()[2:],
+                         ["analysis_done", "pending"])
+
+    def test_pipelined(self):
+        """do_work_pipelined运行所有fresh实验，下一个实验的工作负载在当前
+        模拟运行时准备。"""
+        for i in range(3):
+            ExperimentDefinition().store(self._db)
+        events = []
+
+        def stage(runner):
+            events.append(("stage", runner._definition._trace_id))
+
+        def run(runner, db_obj):
+            runner._definition.mark_simulating(db_obj)
+            time.sleep(0.2)
+            events.append(("run", runner._definition._trace_id))
+
+        def import_trace(runner, sched_db_obj):
+            return ResultTrace()
+
+        def store_trace(runner, result_trace, db_obj):
+            return True
+
+        def clean_trace_file(runner):
+            pass
+        for (name, method) in [("stage_trace_file", stage),
+                               ("run_staged_simulation", run),
+                               ("import_trace", import_trace),
+                               ("store_trace", store_trace),
+                               ("clean_trace_file", clean_trace_file)]:
+            self.addCleanup(setattr, ExperimentRunner, name,
+                            getattr(ExperimentRunner, name))
+            setattr(ExperimentRunner, name, method)
+
+        ew = ExperimentWorker()
+        self.assertEqual(ew.do_work_pipelined(self._db, None), 3)
+        self.assertEqual(self._get_exp_states(), ["simulation_done"] * 3)
+        self.assertLess(events.index(("stage", 2)), events.index(("run", 1)))
+        self.assertLess(events.index(("stage", 3)), events.index(("run", 2)))
+
+    def test_pipelined_stage_error(self):
+        """准备失败的实验被恢复到fresh状态，流水线继续运行其他实验。"""
+        for i in range(3):
+            ExperimentDefinition().store(self._db)
+        discarded = []
+
+        def stage(runner):
+            if runner._definition._trace_id == 2:
+                raise IOError("Compressed push failed")
+
+        def run(runner, db_obj):
+            runner._definition.mark_simulating(db_obj)
+
+        def import_trace(runner, sched_db_obj):
+            return ResultTrace()
+
+        def store_trace(runner, result_trace, db_obj):
+            return True
+
+        def clean_trace_file(runner):
+            pass
+
+        def discard_staged_trace_file(runner):
+            discarded.append(runner._definition._trace_id)
+        for (name, method) in [("stage_trace_file", stage),
+                               ("run_staged_simulation", run),
+                               ("import_trace", import_trace),
+                               ("store_trace", store_trace),
+                               ("clean_trace_file", clean_trace_file),
+                               ("discard_staged_trace_file",
+                                discard_staged_trace_file)]:
+            self.addCleanup(setattr, ExperimentRunner, name,
+                            getattr(ExperimentRunner, name))
+            setattr(ExperimentRunner, name, method)
+
+        ew = ExperimentWorker()
+        self.assertEqual(ew.do_work_pipelined(self._db, None), 2)
+        self.assertEqual(self._get_exp_states(),
+                         ["simulation_done", "fresh", "simulation_done"])
+        self.assertEqual(discarded, [2])
+
+    def test_pipelined_run_error(self):
+        """模拟开始前出错的实验被恢复到fresh状态，模拟开始后出错的实验被
+        标记为simulation_failed，然后异常被重新抛出。"""
+        for i in range(3):
+            ExperimentDefinition().store(self._db)
+        discarded = []
+        failing = {}
+
+        def stage(runner):
+            pass
+
+        def run(runner, db_obj):
+            if failing.get("run") == runner._definition._trace_id:
+                raise IOError("Worker not reachable")
+            runner._definition.mark_simulating(db_obj)
+
+        def import_trace(runner, sched_db_obj):
+            if failing.get("import") == runner._definition._trace_id:
+                raise ValueError("Trace import failed")
+            return ResultTrace()
+
+        def store_trace(runner, result_trace, db_obj):
+            return True
+
+        def clean_trace_file(runner):
+            pass
+
+        def discard_staged_trace_file(runner):
+            discarded.append(runner._definition._trace_id)
+        for (name, method) in [("stage_trace_file", stage),
+                               ("run_staged_simulation", run),
+                               ("import_trace", import_trace),
+                               ("store_trace", store_trace),
+                               ("clean_trace_file", clean_trace_file),
+                               ("discard_staged_trace_file",
+                                discard_staged_trace_file)]:
+            self.addCleanup(setattr, ExperimentRunner, name,
+                            getattr(ExperimentRunner, name))
+            setattr(ExperimentRunner, name, method)
+
+        ew = ExperimentWorker()
+        failing["run"] = 1
+        self.assertRaises(IOError, ew.do_work_pipelined, self._db, None)
+        self.assertEqual(self._get_exp_states(), ["fresh"] * 3)
+        self.assertIn(1, discarded)
+
+        failing["run"] = None
+        failing["import"] = 1
+        self.assertRaises(ValueError, ew.do_work_pipelined, self._db, None)
+        self.assertEqual(self._get_exp_states(),
+                         ["simulation_failed", "fresh", "fresh"])
+
     def _check_trace_is_there(self, db_obj, exp):
         """
             验证指定的跟踪记录是否存在，并且检查相关的状态和时间戳。
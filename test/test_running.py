@@ -5,9 +5,12 @@
 """
 from datetime import datetime
 import os
+import shutil
+import subprocess
+import threading
 import unittest
 
-from commonLib.DBManager import DB
+from commonLib.DBManager import DB, get_db
 from commonLib.filemanager import ensureDir
 from generate import TimeController
 from machines import Edison2015
@@ -15,11 +18,12 @@ from orchestration.definition import ExperimentDefinition
 from orchestration.running import ExperimentRunner
 import slurm.trace_gen as trace_gen
 from stats.trace import ResultTrace
+from tools.ssh import SSH, get_file_sha1, get_unpack_command, write_compressed
 
 
 class TestExperimentRunner(unittest.TestCase):
     def setUp(self):
-        self._db  = DB(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+        self._db  = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
                    os.getenv("TEST_DB_NAME", "test"),
                    os.getenv("TEST_DB_USER", "root"),
                    os.getenv("TEST_DB_PASS", ""))
@@ -409,6 +413,62 @@ class TestExperimentRunner(unittest.TestCase):
                         "tmp/dest/edison-single-m1.0manifestSim.json"
                          "-period-p5-0.0-single-t-0d-0d-O1.1"
                          "-sseeeed.users"))
+    def test_stage_trace_file_reboot(self):
+        """stage_trace_file保留本地副本，重启清空轨迹目录后
+        _place_staged_trace_file重新放置工作负载。"""
+        ExperimentRunner.configure("tmp/dest", "tmp/orig", True,
+                                   "myhost", "myUser",
+                                   manifest_folder="manifests")
+        ensureDir("./tmp/orig")
+        ensureDir("./tmp/dest")
+        ed = ExperimentDefinition(
+                 seed="seeeed",
+                 machine="edison",
+                 trace_type="single",
+                 manifest_list=[{"share": 1.0, "manifest": "manifestSim.json"}],
+                 workflow_policy="period",
+                 workflow_period_s=5,
+                 workflow_handling="single",
+                 preload_time_s = 20,
+                 start_date = datetime(2016,1,1),
+                 workload_duration_s = 41)
+        er = ExperimentRunner(ed)
+        local_route = os.path.join("tmp/orig", ed.get_trace_file_name())
+        dest_route = os.path.join("tmp/dest", ed.get_trace_file_name())
+        self.addCleanup(os.remove,
+                        os.path.join("tmp/orig", ed.get_users_file_name()))
+        self.addCleanup(os.remove,
+                        os.path.join("tmp/orig", ed.get_qos_file_name()))
+        er.stage_trace_file()
+        self.assertTrue(os.path.exists(local_route))
+        content = open(dest_route).read()
+
+        os.remove(dest_route)
+        er._place_staged_trace_file()
+        self.assertEqual(open(dest_route).read(), content)
+        self.assertFalse(os.path.exists(local_route))
+
+        shutil.copy(dest_route, local_route)
+        er._place_staged_trace_file()
+        self.assertTrue(os.path.exists(dest_route))
+        self.assertFalse(os.path.exists(local_route))
+
+        shutil.copy(dest_route, local_route)
+        er.discard_staged_trace_file()
+        self.assertFalse(os.path.exists(dest_route))
+        self.assertFalse(os.path.exists(local_route))
+        er.discard_staged_trace_file()
+
+        # clean_trace_file不与其他实验的重启重叠
+        open(dest_route, "w").write(content)
+        cleaner = threading.Thread(target=er.clean_trace_file)
+        with ExperimentRunner._machine_lock:
+            cleaner.start()
+            cleaner.join(0.2)
+            self.assertTrue(os.path.exists(dest_route))
+        cleaner.join()
+        self.assertFalse(os.path.exists(dest_route))
+
     def test_place_trace_files_remote_and_clean(self):
         """
         测试将追踪文件放置到远程位置并清理功能。
@@ -600,6 +660,85 @@ class TestExperimentRunner(unittest.TestCase):
         er = ExperimentRunner(ed)
         self.assertRaises(SystemError, er.is_it_running, "python")
         
+    def test_is_sim_running_one_ps_call(self):
+        """is_sim_running只读取一次进程列表来检查三个进程。"""
+        ExperimentRunner.configure(
+                                   "/tmp/tests/tmp/dest",
+                                   "/tmp/tests/tmp/orig", 
+                                   True,
+                                   "locahost", None,
+                                   scheduler_conf_dir="tmp/conf",
+                                   local_conf_dir="tmp/conf_orig")
+        ed = ExperimentDefinition(
+                 seed="seeeed",
+                 machine="edison",
+                 trace_type="single",
+                 manifest_list=[{"share": 1.0, "manifest": "manifestSim.json"}],
+                 workflow_policy="period",
+                 workflow_period_s=5,
+                 workflow_handling="single",
+                 preload_time_s = 20,
+                 start_date = datetime(2016,1,1),
+                 workload_duration_s = 41)
+        er = ExperimentRunner(ed)
+        calls = []
+        processes = ["COMMAND S", "init S", "bash S", "sshd S", "sim_mgr S",
+                     "slurmctld S", "slurmd R"]
+
+        def get_process_list():
+            calls.append(1)
+            return "\n".join(processes)
+        er._get_process_list = get_process_list
+        self.assertTrue(er.is_sim_running())
+        self.assertEqual(len(calls), 1)
+        processes[-1] = "slurmd Z"
+        self.assertFalse(er.is_sim_running())
+        self.assertEqual(len(calls), 2)
+
+    def test_ssh_persistent_session(self):
+        """持久SSH会话的ssh和scp调用使用同一个主连接套接字。"""
+        ssh = SSH("fakehost.fake.com", "aUSer", persistent=True)
+        options = ssh._get_options()
+        self.assertIn("ControlMaster=auto", options)
+        self.assertEqual(options, ssh._get_options())
+        control_dir = ssh._control_dir
+        self.assertTrue(os.path.isdir(control_dir))
+        ssh.close()
+        self.assertFalse(os.path.exists(control_dir))
+        self.assertEqual(SSH("fakehost.fake.com", "aUSer")._get_options(), [])
+
+    def test_compressed_push_unpack(self):
+        """压缩推送的远程命令解压并校验文件，校验失败时不替换目的文件。"""
+        orig = "tmp/compressed_orig.trace"
+        dest = "tmp/compressed_dest.trace"
+        f = open(orig, "wb")
+        for job_id in range(1000):
+            f.write(trace_gen.get_job_trace(job_id, "user1", 1000+job_id,
+                                            60, 2, 24, 1, 24, "qos1", "main",
+                                            "account1"))
+        f.close()
+        self.addCleanup(os.remove, orig)
+        gz_route = "tmp/compressed_orig.trace.gz"
+        write_compressed(orig, open(gz_route, "wb"))
+        self.addCleanup(os.remove, gz_route)
+        self.assertGreater(os.path.getsize(orig),
+                           10*os.path.getsize(gz_route))
+
+        for (digest, rc, content) in [("0"*40, 1, "old"),
+                                      (get_file_sha1(orig), 0,
+                                       open(orig, "rb").read())]:
+            f = open(dest, "w")
+            f.write("old")
+            f.close()
+            p = subprocess.Popen(["sh", "-c",
+                                  get_unpack_command(dest, digest)],
+                                 stdin=subprocess.PIPE)
+            write_compressed(orig, p.stdin)
+            self.assertEqual(p.wait() != 0, rc != 0)
+            self.assertEqual(open(dest, "rb").read(), content)
+            self.assertFalse(os.path.exists(dest + ".part"))
+        os.remove(dest)
+
     def test_run_simulation(self):
         """
         测试运行模拟的功能。
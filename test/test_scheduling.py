@@ -0,0 +1,122 @@
+"""UNIT TESTS for the dependency scheduler of grouped and delta experiments.
+
+ python -m unittest test_scheduling
+
+"""
+from commonLib.DBManager import get_db
+from orchestration.definition import (ExperimentDefinition,
+                                      GroupExperimentDefinition,
+                                      DeltaExperimentDefinition)
+from orchestration.scheduling import DependencyScheduler
+
+import os
+import unittest
+
+
+class TestDependencyScheduler(unittest.TestCase):
+    def setUp(self):
+        self._db = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+                          os.getenv("TEST_DB_NAME", "test"),
+                          os.getenv("TEST_DB_USER", "root"),
+                          os.getenv("TEST_DB_PASS", ""))
+        ExperimentDefinition().create_table(self._db)
+        self.addCleanup(self._del_table, "experiment")
+
+    def _del_table(self, table_name):
+        self._db.doUpdate("drop table `{0}`".format(table_name))
+
+    def _store_single(self, state):
+        exp = ExperimentDefinition()
+        exp.store(self._db)
+        exp.upate_state(self._db, state)
+        return exp._trace_id
+
+    def test_set_state(self):
+        group = GroupExperimentDefinition(subtraces=[1, 2])
+        group._trace_id = 10
+        delta = DeltaExperimentDefinition(subtraces=[1, 3])
+        delta._trace_id = 11
+        empty = GroupExperimentDefinition(subtraces=[])
+        empty._trace_id = 12
+        scheduler = DependencyScheduler()
+        for exp in [group, delta, empty]:
+            scheduler.add(exp)
+
+        self.assertEqual(scheduler.pop_ready(), empty)
+        self.assertEqual(scheduler.pop_ready(), None)
+        self.assertEqual(scheduler.set_state(1, "simulation_done"), [])
+        self.assertEqual(scheduler.get_missing(10), [1, 2])
+        self.assertEqual(scheduler.get_missing(11), [3])
+        self.assertEqual(scheduler.set_state(3, "analysis_done"), [11])
+        self.assertEqual(scheduler.set_state(1, "analysis_done"), [])
+        self.assertEqual(scheduler.set_state(2, "analysis_done"), [10])
+        self.assertEqual(scheduler.pop_ready(), delta)
+        self.assertTrue(scheduler.has_pending())
+        self.assertEqual(scheduler.pop_ready(), group)
+        self.assertFalse(scheduler.has_pending())
+
+    def test_nested(self):
+        group = GroupExperimentDefinition(subtraces=[1])
+        group._trace_id = 2
+        outer = GroupExperimentDefinition(subtraces=[2])
+        outer._trace_id = 3
+        scheduler = DependencyScheduler()
+        scheduler.add(group)
+        scheduler.add(outer)
+        self.assertEqual(scheduler.set_state(1, "analysis_done"), [2])
+        self.assertEqual(scheduler.pop_ready(), group)
+        self.assertEqual(scheduler.set_state(2, "analysis_done"), [3])
+        self.assertEqual(scheduler.pop_ready(), outer)
+
+    def test_blocked(self):
+        group = GroupExperimentDefinition(subtraces=[1, 2])
+        group._trace_id = 10
+        delta = DeltaExperimentDefinition(subtraces=[2, 3])
+        delta._trace_id = 11
+        outer = GroupExperimentDefinition(subtraces=[10])
+        outer._trace_id = 12
+        scheduler = DependencyScheduler()
+        for exp in [group, delta, outer]:
+            scheduler.add(exp)
+
+        self.assertEqual(scheduler.set_state(1, "simulation_failed"), [])
+        self.assertEqual(scheduler.get_blocked(), [10, 12])
+        self.assertEqual(scheduler.get_missing(10), [1, 2])
+        self.assertTrue(scheduler.has_pending())
+        self.assertEqual(scheduler.set_state(3, "second_pass_done"), [])
+        self.assertEqual(scheduler.get_blocked(), [10, 11, 12])
+        self.assertFalse(scheduler.has_pending())
+        self.assertEqual(scheduler.set_state(2, "analysis_done"), [])
+        self.assertEqual(scheduler.pop_ready(), None)
+
+    def test_load_update_states(self):
+        id1 = self._store_single("analysis_done")
+        id2 = self._store_single("simulation_done")
+        id3 = self._store_single("fresh")
+        group = GroupExperimentDefinition(subtraces=[id1, id2])
+        group.store(self._db)
+        delta = DeltaExperimentDefinition(subtraces=[id1, id2])
+        delta.store(self._db)
+        other = GroupExperimentDefinition(subtraces=[id3])
+        other.store(self._db)
+
+        scheduler = DependencyScheduler()
+        self.assertEqual(scheduler.load(self._db), [delta._trace_id])
+        self.assertEqual(scheduler.pop_ready()._trace_id, delta._trace_id)
+        self.assertEqual(scheduler.get_missing(group._trace_id), [id2])
+        self.assertEqual(scheduler.update_states(self._db), [])
+
+        ExperimentDefinition().claim(self._db, "simulation_done",
+                                     "analysis_done", trace_id=id2)
+        self.assertEqual(scheduler.update_states(self._db), [group._trace_id])
+        self.assertEqual(scheduler.pop_ready()._trace_id, group._trace_id)
+        self.assertEqual(scheduler.get_missing(other._trace_id), [id3])
+
+    def test_subtrace_not_found(self):
+        GroupExperimentDefinition(subtraces=[100]).store(self._db)
+        scheduler = DependencyScheduler()
+        self.assertRaises(ValueError, scheduler.load, self._db)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""UNIT TESTS for the schema version and index migrations of the central
+database.
+
+ python -m unittest test_schema
+
+"""
+from commonLib.DBManager import get_db
+from orchestration.definition import ExperimentDefinition
+from orchestration.schema import (explain_hot_queries, get_indexes,
+                                  get_latest_version, get_schema_version,
+                                  migrate_schema, verify_schema,
+                                  HOT_QUERIES, SCHEMA_VERSION_TABLE)
+from stats import Histogram, NumericStats
+from stats.trace import ResultTrace
+
+import os
+import unittest
+
+
+class TestSchema(unittest.TestCase):
+    def setUp(self):
+        self._db = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+                          os.getenv("TEST_DB_NAME", "test"),
+                          os.getenv("TEST_DB_USER", "root"),
+                          os.getenv("TEST_DB_PASS", ""))
+        rt = ResultTrace()
+        rt.create_trace_table(self._db, rt._table_name)
+        ExperimentDefinition().create_table(self._db)
+        Histogram().create_table(self._db)
+        NumericStats().create_table(self._db)
+        rt._get_utilization_result().create_table(self._db)
+        for table in [rt._table_name, "experiment", "histograms",
+                      "numericStats", "usage_values", SCHEMA_VERSION_TABLE]:
+            self.addCleanup(self._del_table, table)
+
+    def _del_table(self, table_name):
+        self._db.doUpdate("drop table `{0}`".format(table_name))
+
+    def test_migrate_schema(self):
+        self.assertEqual(get_schema_version(self._db), 0)
+        plans_before = explain_hot_queries(self._db)
+        self.assertEqual(len(plans_before), len(HOT_QUERIES))
+        for (description, plan) in plans_before:
+            self.assertIsNotNone(plan)
+
+        self.assertEqual(migrate_schema(self._db), [get_latest_version()])
+        self.assertEqual(get_schema_version(self._db), get_latest_version())
+        self.assertEqual(verify_schema(self._db), [])
+        self.assertEqual(get_indexes(self._db, "traces")["trace_submit_key"],
+                         ["trace_id", "time_submit"])
+        self.assertEqual(get_indexes(self._db, "experiment")["state_type_key"],
+                         ["work_state", "trace_type", "trace_id"])
+        for (description, plan) in explain_hot_queries(self._db):
+            self.assertIsNotNone(plan)
+
+        self.assertEqual(migrate_schema(self._db), [])
+        self.assertEqual(get_schema_version(self._db), get_latest_version())
+
+    def test_verify_schema(self):
+        migrate_schema(self._db)
+        self._db.doUpdate("ALTER TABLE `histograms` DROP INDEX "
+                          "`trace_type_key`")
+        self._db.doUpdate("ALTER TABLE `histograms` ADD INDEX "
+                          "`trace_type_key` (`trace_id`)")
+        self._db.doUpdate("ALTER TABLE `traces` DROP INDEX "
+                          "`trace_start_key`")
+        self.assertEqual(verify_schema(self._db),
+                         ["traces.trace_start_key: index missing",
+                          "histograms.trace_type_key: columns ['trace_id'], "
+                          "expected ['trace_id', 'type']"])
+        self.assertIsNone(get_indexes(self._db, "missing_table"))
+
+        self._db.doUpdate("DELETE FROM `{0}`".format(SCHEMA_VERSION_TABLE))
+        self.assertEqual(migrate_schema(self._db), [get_latest_version()])
+        self.assertEqual(verify_schema(self._db), [])
+
+    def test_migrate_missing_table(self):
+        self._db.doUpdate("drop table `usage_values`")
+        self.assertEqual(migrate_schema(self._db), [])
+        self.assertEqual(get_schema_version(self._db), 0)
+        self.assertEqual(verify_schema(self._db), [])
+        self.assertEqual(get_indexes(self._db, "traces")["trace_submit_key"],
+                         ["trace_id", "time_submit"])
+
+        ResultTrace()._get_utilization_result().create_table(self._db)
+        self.assertEqual(migrate_schema(self._db), [get_latest_version()])
+        self.assertEqual(verify_schema(self._db), [])
+        self.assertEqual(get_indexes(self._db,
+                                     "usage_values")["trace_type_key"],
+                         ["trace_id", "type"])
+
+        self._db.doUpdate("ALTER TABLE `usage_values` DROP INDEX "
+                          "`trace_type_key`")
+        self.assertEqual(migrate_schema(self._db), [])
+        self.assertEqual(verify_schema(self._db), [])
@@ -0,0 +1,125 @@
+"""UNIT TESTS for the cache of generated workload files.
+
+ python -m unittest test_trace_cache
+
+"""
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from commonLib.filemanager import ensureDir
+from orchestration.definition import ExperimentDefinition
+from orchestration.running import ExperimentRunner
+from orchestration.trace_cache import TraceCache, get_trace_key
+
+
+class TestTraceCache(unittest.TestCase):
+    def setUp(self):
+        ensureDir("./tmp")
+        self._cache_dir = tempfile.mkdtemp(prefix="trace_cache", dir="./tmp")
+        self.addCleanup(shutil.rmtree, self._cache_dir, True)
+
+    def _get_definition(self, **kwargs):
+        values = dict(seed="seeeed",
+                      machine="edison",
+                      trace_type="single",
+                      manifest_list=[{"share": 1.0,
+                                      "manifest": "manifestSim.json"}],
+                      workflow_policy="period",
+                      workflow_period_s=5,
+                      workflow_handling="single",
+                      preload_time_s=20,
+                      start_date=datetime(2016, 1, 1),
+                      workload_duration_s=400)
+        values.update(kwargs)
+        return ExperimentDefinition(**values)
+
+    def _write_files(self, prefix, size):
+        routes = []
+        for ext in ["trace", "qos", "users"]:
+            route = os.path.join("./tmp", "{0}.{1}".format(prefix, ext))
+            f = open(route, "w")
+            f.write(ext[0] * size)
+            f.close()
+            routes.append(route)
+            self.addCleanup(os.remove, route)
+        return routes
+
+    def test_get_trace_key(self):
+        key = get_trace_key(self._get_definition())
+        self.assertEqual(key, get_trace_key(self._get_definition(
+                                                    workflow_period_s=5L)))
+        self.assertEqual(key, get_trace_key(self._get_definition(
+                                                    name="other_name")))
+        self.assertNotEqual(key, get_trace_key(self._get_definition(
+                                                    seed="other")))
+        self.assertNotEqual(key, get_trace_key(self._get_definition(
+                                                    workload_duration_s=500)))
+        self.assertNotEqual(key, get_trace_key(self._get_definition(
+                                                    overload_target=1.1)))
+        manifest = open(os.path.join(self._cache_dir, "manifestSim.json"),
+                        "w")
+        manifest.write("{}")
+        manifest.close()
+        self.assertNotEqual(key, get_trace_key(self._get_definition(),
+                                               manifest_folder=self._cache_dir))
+
+    def test_get_put(self):
+        cache = TraceCache(self._cache_dir, 1000)
+        orig = self._write_files("orig", 10)
+        dest = [x.replace("orig", "dest") for x in orig]
+        self.assertFalse(cache.get("key1", dest))
+        self.assertFalse(os.path.exists(dest[0]))
+
+        cache.put("key1", orig)
+        self.assertTrue(cache.get("key1", dest))
+        for route in dest:
+            self.addCleanup(os.remove, route)
+        self.assertEqual(open(dest[1]).read(), "q" * 10)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_evict(self):
+        cache = TraceCache(self._cache_dir, 100)
+        orig = self._write_files("orig", 15)
+        dest = [x.replace("orig", "dest") for x in orig]
+        cache.put("key1", orig)
+        cache.put("key2", orig)
+        os.utime(os.path.join(self._cache_dir, "key1"), (1000, 1000))
+        os.utime(os.path.join(self._cache_dir, "key2"), (2000, 2000))
+        self.assertTrue(cache.get("key1", dest))
+        for route in dest:
+            self.addCleanup(os.remove, route)
+
+        cache.put("key3", orig)
+        self.assertEqual(sorted(os.listdir(self._cache_dir)),
+                         ["key1", "key3"])
+        self.assertEqual(cache.evict(), [])
+
+    def test_generate_trace_files_cache(self):
+        ExperimentRunner.configure("tmp/trace_folder", "tmp", True,
+                                   "myhost", "myUser", drain_time=0,
+                                   trace_cache_dir=self._cache_dir)
+        self.addCleanup(ExperimentRunner.configure, "tmp/trace_folder",
+                        "tmp", True, "myhost", "myUser", drain_time=0)
+        ed = self._get_definition()
+        er = ExperimentRunner(ed)
+        file_names = er._generate_trace_files(ed)
+        routes = [os.path.join("tmp", x) for x in file_names]
+        contents = [open(x).read() for x in routes]
+        for route in routes:
+            os.remove(route)
+
+        other = self._get_definition(experiment_set="other_set")
+        other_names = er._generate_trace_files(other)
+        self.assertEqual(ExperimentRunner._trace_cache.hits, 1)
+        self.assertNotEqual(other_names, file_names)
+        for (route, content) in zip([os.path.join("tmp", x)
+                                     for x in other_names], contents):
+            self.assertEqual(open(route).read(), content)
+            os.remove(route)
+
+
+if __name__ == '__main__':
+    unittest.main()
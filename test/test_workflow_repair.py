@@ -5,7 +5,7 @@
 
 
 
-from commonLib.DBManager import DB
+from commonLib.DBManager import get_db
 from orchestration.running import ExperimentRunner
 from stats.trace import ResultTrace
 from stats.workflow_repair import StartTimeCorrector
@@ -18,7 +18,7 @@ from orchestration.definition import ExperimentDefinition
 class TestWorkflowRepair(unittest.TestCase):
     def setUp(self):
         ExperimentRunner.configure(manifest_folder="manifests")
-        self._db  = DB(os.getenv("TEST_DB_HOST", "127.0.0.1"),
+        self._db  = get_db(os.getenv("TEST_DB_HOST", "127.0.0.1"),
                    os.getenv("TEST_DB_NAME", "test"),
                    os.getenv("TEST_DB_USER", "root"),
                    os.getenv("TEST_DB_PASS", ""))
@@ -190,7 +190,8 @@ class TestWorkflowRepair(unittest.TestCase):
         stc._experiment._trace_id=trace_id
 
         # 应用新的开始时间
-        stc.apply_new_times(self._db,{1:20000-14340, 3:30000-3540})
+        self.assertEqual(stc.apply_new_times(self._db,
+                                             {1:20000-14340, 3:30000-3540}), 2)
 
         # 加载并验证更新后的数据
         new_rt=ResultTrace()
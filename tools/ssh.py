@@ -2,16 +2,62 @@
 
 
 
+import gzip
+import hashlib
+import pipes
+import shutil
 import subprocess
+import tempfile
 from getpass import getuser
+from os import path
 
 class SSH(object):
 
-    def __init__(self, hostname, username=None, password=None):
+    def __init__(self, hostname, username=None, password=None,
+                 persistent=False, persist_time=600):
+        """
+        Args:
+            hostname (str): 远程主机
+            username (str): 远程用户，默认为本地用户
+            persistent (bool): 为True时所有ssh和scp调用复用一个多路复用的
+                主连接（OpenSSH ControlMaster），只在第一次调用时握手。
+                使用完后调用close关闭。
+            persist_time (int): 主连接在最后一次使用后保持的秒数
+        """
         self._hostname = hostname;
         self._username=username
         if self._username is None:
             self._username = getuser()
+        self._persistent = persistent
+        self._persist_time = persist_time
+        self._control_dir = None
+
+    def _get_options(self):
+        """返回ssh和scp的多路复用选项，非持久会话时为空。第一次使用时
+        创建放置主连接套接字的目录（套接字路径长度有限，所以在临时目录中）。
+        ServerAliveInterval让失去连接（例如远程主机重启）的主连接退出。
+        """
+        if not self._persistent:
+            return []
+        if self._control_dir is None:
+            self._control_dir = tempfile.mkdtemp(prefix="ssh_")
+        return ["-o", "ControlMaster=auto",
+                "-o", "ControlPath={0}".format(path.join(self._control_dir,
+                                                         "%r@%h:%p")),
+                "-o", "ControlPersist={0}".format(self._persist_time),
+                "-o", "ServerAliveInterval=30"]
+
+    def close(self):
+        """关闭持久会话的主连接。之后的调用会建立新的主连接。"""
+        if self._control_dir is None:
+            return
+        command_list = (["ssh"] + self._get_options() +
+                        ["-O", "exit", self._username+"@"+self._hostname])
+        p = subprocess.Popen(command_list, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        p.communicate()
+        shutil.rmtree(self._control_dir, ignore_errors=True)
+        self._control_dir = None
  
     def push_file(self, origin_route, dest_route):
         """
@@ -23,8 +69,9 @@ class SSH(object):
         bool: 传输成功返回True，失败返回False
         """
         # 构造SCP命令行参数列表
-        command_list =  ["scp", origin_route, self._username + "@" +
-                         self._hostname + ":" + dest_route]
+        command_list =  (["scp"] + self._get_options() +
+                         [origin_route, self._username + "@" +
+                          self._hostname + ":" + dest_route])
         #print command_list
         # 执行子进程并等待完成
         p = subprocess.Popen(command_list, stdout=subprocess.PIPE)
@@ -35,6 +82,35 @@ class SSH(object):
             print "File push operation error", output, err
         return rc == 0
     
+    def push_file_compressed(self, origin_route, dest_route):
+        """
+        将本地文件压缩后推送到远程服务器。文件以gzip流的形式通过一次ssh调用
+        传输，远程主机将其解压到dest_route旁的临时文件，确认其sha1与本地文件
+        相同后重命名为dest_route，所以dest_route要么是完整的新文件，要么保持
+        不变。适用于大部分内容为填充零的工作负载文件。
+        参数:
+        origin_route (str): 需要传输的本地源文件路径
+        dest_route (str): 目标服务器上的存储路径(绝对路径)
+        返回值:
+        bool: 传输并校验成功返回True，失败返回False
+        """
+        command_list = (["ssh"] + self._get_options() +
+                        [self._username+"@"+self._hostname,
+                         get_unpack_command(dest_route,
+                                            get_file_sha1(origin_route))])
+        p = subprocess.Popen(command_list, stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE)
+        try:
+            write_compressed(origin_route, p.stdin)
+        except IOError as e:
+            # 远程命令提前退出时管道被关闭，错误由返回码报告
+            print "Compressed push write error", e
+        output, err = p.communicate()
+        rc = p.returncode
+        if (rc!=0):
+            print "Compressed file push operation error", output, err
+        return rc == 0
+
     def retrieve_file(self, origin_route, dest_route):
         """
         通过SCP协议从远程服务器检索文件到本地
@@ -44,8 +120,9 @@ class SSH(object):
         返回值:
         bool: 操作是否成功，True表示成功，False表示失败
         """
-        command_list =  ["scp", self._username + "@" +
-                 self._hostname + ":" + origin_route,  dest_route]
+        command_list =  (["scp"] + self._get_options() +
+                         [self._username + "@" + self._hostname + ":" +
+                          origin_route,  dest_route])
         #print command_list
         p = subprocess.Popen(command_list, stdout=subprocess.PIPE)
         output, err = p.communicate()
@@ -81,12 +158,14 @@ class SSH(object):
         output=None
         err=""
         if background:
-            command_list = ["ssh", self._username+"@"+self._hostname, 
-                        "nohup", command] + arg_list
+            command_list = (["ssh"] + self._get_options() +
+                            [self._username+"@"+self._hostname,
+                             "nohup", command] + arg_list)
             p = subprocess.Popen(command_list)
         else:
-            command_list = ["ssh", self._username+"@"+self._hostname, 
-                        command] + arg_list
+            command_list = (["ssh"] + self._get_options() +
+                            [self._username+"@"+self._hostname,
+                             command] + arg_list)
                         
             p = subprocess.Popen(command_list, stdout=subprocess.PIPE)
             output, err = p.communicate()
@@ -95,7 +174,62 @@ class SSH(object):
         rc = p.returncode
         return output, err, rc
     
+    def is_reachable(self, timeout=10):
+        """
+        检查是否可以通过ssh在远程主机上执行命令。使用新的连接（不复用
+        持久会话），连接和无响应的等待都不超过timeout秒。
+        参数:
+        timeout (int): 连接超时秒数
+        返回值:
+        bool: 远程命令执行成功返回True
+        """
+        command_list = ["ssh", "-o", "BatchMode=yes",
+                        "-o", "ConnectTimeout={0}".format(timeout),
+                        "-o", "ServerAliveInterval={0}".format(timeout),
+                        "-o", "ServerAliveCountMax=1",
+                        self._username+"@"+self._hostname, "true"]
+        p = subprocess.Popen(command_list, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        p.communicate()
+        return p.returncode == 0
+
     def get_home_dir(self):
         return self._home_dir
-    
 
+
+def get_file_sha1(file_route):
+    """返回文件内容的sha1十六进制摘要。"""
+    digest = hashlib.sha1()
+    f = open(file_route, "rb")
+    try:
+        for chunk in iter(lambda: f.read(1024*1024), ""):
+            digest.update(chunk)
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+
+def write_compressed(file_route, fileobj):
+    """将文件内容以gzip格式写入fileobj并关闭fileobj。"""
+    f = open(file_route, "rb")
+    try:
+        gz = gzip.GzipFile(filename="", mode="wb", fileobj=fileobj)
+        for chunk in iter(lambda: f.read(1024*1024), ""):
+            gz.write(chunk)
+        gz.close()
+    finally:
+        f.close()
+        fileobj.close()
+
+
+def get_unpack_command(dest_route, digest):
+    """
+    返回在远程主机上执行的shell命令：将标准输入的gzip流解压到临时文件，
+    其sha1为digest时将其重命名为dest_route，否则删除临时文件并以非零
+    返回码退出。
+    """
+    tmp_route = pipes.quote(dest_route + ".part")
+    return ("gzip -dc > {0} && "
+            "printf '%s  %s\\n' {1} {0} | sha1sum -c --status && "
+            "mv -f {0} {2}; rc=$?; rm -f {0}; exit $rc".format(
+                                tmp_route, digest, pipes.quote(dest_route)))